@@ -0,0 +1,89 @@
+"""
+Expansão de agendas a partir de um modelo semanal (tarefa em segundo plano).
+
+`POST /medicos/<id>/horarios/expandir` recebe o período, os dias da semana e
+as horas de atendimento e responde 202: gerar meses de agenda reescreve o
+documento do médico várias vezes e não deve prender a requisição. A tarefa
+só cria os horários que ainda não existem, então repeti-la (nova tentativa
+ou novo pedido) nunca apaga uma consulta marcada.
+"""
+from datetime import timedelta
+
+from bson import ObjectId
+
+import eventos
+import grade
+import tarefas
+from estatisticas import PeriodoInvalido, ler_periodo
+
+DIAS_POR_ESCRITA = 31
+
+
+class ModeloInvalido(ValueError):
+    pass
+
+
+def validar_modelo(dados):
+    """Confere o período do modelo (já validado por `validacao.ModeloAgenda`) e retorna os parâmetros da tarefa"""
+    try:
+        inicio, fim = ler_periodo(dados['de'], dados['ate'])
+    except PeriodoInvalido as e:
+        raise ModeloInvalido(str(e))
+
+    return {
+        'de': inicio.isoformat(),
+        'ate': fim.isoformat(),
+        'dias_semana': sorted(set(dados['dias_semana'])),
+        'horas': sorted(set(dados['horas'])),
+    }
+
+
+@tarefas.tarefa('expandir_agenda', concorrencia=2, timeout_s=600)
+def expandir(db, medico_id, de, ate, dias_semana, horas, clinica=None):
+    # Roda fora da requisição: a clínica dos eventos vem dos parâmetros gravados ao enfileirar
+    inicio, fim = ler_periodo(de, ate)
+    dias = []
+    dia = inicio
+    while dia <= fim:
+        if dia.weekday() in dias_semana:
+            dias.append(dia.isoformat())
+        dia += timedelta(days=1)
+
+    collection = db['medicos']
+    id = ObjectId(medico_id)
+    criados = 0
+    for i in range(0, len(dias), DIAS_POR_ESCRITA):
+        bloco = dias[i:i + DIAS_POR_ESCRITA]
+        # Lê só os dias do bloco, não a agenda inteira
+        medico = collection.find_one({"_id": id}, {f"horarios.{d}": 1 for d in bloco})
+        if medico is None:
+            raise tarefas.FalhaDefinitiva("Médico não encontrado")
+        existentes = medico.get('horarios', {})
+
+        novos = {}
+        condicao = {"_id": id}
+        alterados = []
+        for d in bloco:
+            atual = existentes.get(d)
+            slots = grade.expandir_dia(atual) or {}
+            faltando = [hora for hora in horas if hora not in slots]
+            if not faltando:
+                continue
+            alterados.append(d)
+            criados += len(faltando)
+            if grade.compacto(atual) or (atual is None and grade.formato == 'grade'):
+                # Dia compacto é regravado inteiro, com a condição de não ter mudado desde a leitura
+                slots = dict(slots, **{hora: dict(grade.LIVRE) for hora in faltando})
+                novos[f"horarios.{d}"] = grade.compactar_dia(slots) or slots
+                condicao[f"horarios.{d}"] = atual if atual is not None else {"$exists": False}
+            else:
+                for hora in faltando:
+                    novos[f"horarios.{d}.{hora}"] = dict(grade.LIVRE)
+        if novos:
+            if not collection.update_one(condicao, {"$set": novos}).matched_count:
+                # A tarefa é repetida e só cria o que ainda faltar
+                raise RuntimeError("Agenda alterada durante a expansão")
+            for d in alterados:
+                eventos.notificar(eventos.HORARIOS, 'criado', clinica=clinica, medico_id=medico_id, data=d)
+
+    return {"dias": len(dias), "horarios_criados": criados}
@@ -0,0 +1,204 @@
+"""
+Agrupamento das alterações de horários (write-behind), opcional.
+
+Nos picos de marcação, `PUT /medicos/<id>/horarios` faz um `update_one` por
+horário, e muitos deles caem no mesmo médico em poucos milissegundos. Com
+`HORARIOS_AGRUPAR_MS` > 0, as alterações de horários (PUT e DELETE com
+`hora`) entram numa fila e uma thread as grava a cada janela: as de um
+mesmo médico viram um único update com todos os `$set`/`$unset`, e os
+médicos da janela vão juntos num `bulk_write`. Se o mesmo horário muda duas
+vezes na janela, vale a última alteração.
+
+Confirmação por requisição: cada requisição recebe um `Future` que só é
+resolvido depois que o lote com a sua alteração foi gravado (com a write
+concern da classe `escrita`, ver consistencia.py). A rota espera por ele e
+responde 200/404 como antes, só com a latência da janela a mais. Quem
+envia `Prefer: respond-async` recebe 202 logo após a alteração entrar na
+fila; nesse caso uma falha do lote só aparece no log.
+
+A fila é esvaziada antes de remover um dia inteiro, e no encerramento do
+processo (`atexit`). Dias compactos (grade.py) e médicos inexistentes não
+casam com o update do lote; as alterações deles são refeitas uma a uma por
+`grade.alterar_horario`. Com `HORARIOS_FORMATO=grade` o agrupamento fica
+desligado, porque toda alteração já é uma leitura seguida de escrita
+condicional.
+"""
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+import grade
+import metrics
+
+load_dotenv('.cred')
+
+
+class _Pendentes:
+    """Alterações de um médico ainda não gravadas, na ordem em que chegaram"""
+
+    __slots__ = ('colecao', 'itens')
+
+    def __init__(self, colecao):
+        self.colecao = colecao
+        self.itens = []
+
+
+def operacao(id, itens):
+    """Filtro e update com as alterações de um médico: a última de cada horário prevalece"""
+    sets, unsets = {}, {}
+    for data, hora, info, _ in itens:
+        caminho = f"horarios.{data}.{hora}"
+        if info is None:
+            sets.pop(caminho, None)
+            unsets[caminho] = ""
+        else:
+            unsets.pop(caminho, None)
+            sets[caminho] = info
+    atualizacao = {}
+    if sets:
+        atualizacao["$set"] = sets
+    if unsets:
+        atualizacao["$unset"] = unsets
+    # Só dias no formato original: os compactos são regravados inteiros por grade.alterar_horario
+    filtro = {"_id": id}
+    for data in dict.fromkeys(item[0] for item in itens):
+        filtro[f"horarios.{data}.grade"] = {"$exists": False}
+    return filtro, atualizacao
+
+
+class AgrupadorHorarios:
+    """Fila de alterações de horários gravada em lotes por uma thread própria"""
+
+    def __init__(self, janela_ms=0, max_operacoes=500):
+        self.janela_s = janela_ms / 1000
+        self.max_operacoes = max_operacoes
+        self.habilitado = janela_ms > 0 and grade.formato != 'grade'
+        self._pendentes = {}
+        self._quantidade = 0
+        self._inicio = 0.0
+        self._gravando = 0
+        self._fechado = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            janela_ms=float(os.getenv('HORARIOS_AGRUPAR_MS', '0')),
+            max_operacoes=int(os.getenv('HORARIOS_AGRUPAR_MAX', '500')),
+        )
+
+    def alterar(self, colecao, id, data, hora, info=None):
+        """Enfileira a gravação (`info`) ou remoção (`info=None`) de um horário.
+
+        Retorna um Future com o resultado de `grade.alterar_horario` (False se o
+        médico não existe), resolvido depois que o lote foi gravado.
+        """
+        confirmacao = Future()
+        with self._cond:
+            if self._fechado:
+                raise RuntimeError("Agrupador de horários encerrado")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._executar, name='agrupador-horarios', daemon=True)
+                self._thread.start()
+                atexit.register(self.fechar)
+            chave = (colecao.full_name, id)
+            pendentes = self._pendentes.get(chave)
+            if pendentes is None:
+                pendentes = self._pendentes[chave] = _Pendentes(colecao)
+            pendentes.itens.append((data, hora, info, confirmacao))
+            if self._quantidade == 0:
+                self._inicio = time.monotonic()
+            self._quantidade += 1
+            self._cond.notify_all()
+        return confirmacao
+
+    def esvaziar(self, timeout=None):
+        """Espera até que tudo o que foi enfileirado antes da chamada esteja gravado"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            # Antecipa a janela atual em vez de esperar o prazo
+            self._inicio = float('-inf')
+            self._cond.notify_all()
+            while self._quantidade or self._gravando:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def fechar(self, timeout=10):
+        """Grava o que estiver pendente e encerra a thread (chamado no encerramento do processo)"""
+        with self._cond:
+            self._fechado = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                while not self._quantidade and not self._fechado:
+                    self._cond.wait()
+                if not self._quantidade:
+                    return
+                while not self._fechado and self._quantidade < self.max_operacoes:
+                    restante = self._inicio + self.janela_s - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                lote, self._pendentes = self._pendentes, {}
+                quantidade, self._quantidade = self._quantidade, 0
+                self._gravando += 1
+            try:
+                metrics.horarios_lote.observe(quantidade)
+                self._gravar(lote)
+            finally:
+                with self._cond:
+                    self._gravando -= 1
+                    self._cond.notify_all()
+
+    def _gravar(self, lote):
+        grupos = {}
+        for (nome, id), pendentes in lote.items():
+            grupos.setdefault(nome, []).append((id, pendentes))
+        for grupo in grupos.values():
+            try:
+                self._gravar_grupo(grupo)
+            except Exception as e:
+                print(f"Erro ao gravar lote de horários: {e}")
+                for _, pendentes in grupo:
+                    for *_, confirmacao in pendentes.itens:
+                        if not confirmacao.done():
+                            confirmacao.set_exception(e)
+
+    def _gravar_grupo(self, grupo):
+        colecao = grupo[0][1].colecao
+        operacoes = [operacao(id, pendentes.itens) for id, pendentes in grupo]
+        if len(operacoes) == 1:
+            gravados = {grupo[0][0]} if colecao.update_one(*operacoes[0]).matched_count else set()
+        else:
+            resultado = colecao.bulk_write([UpdateOne(*op) for op in operacoes], ordered=False)
+            if resultado.matched_count == len(operacoes):
+                gravados = {id for id, _ in grupo}
+            else:
+                # O bulk_write só informa o total: os médicos que casaram são os que ainda casam com o filtro
+                gravados = {m["_id"] for m in colecao.find({"$or": [filtro for filtro, _ in operacoes]}, {"_id": 1})}
+        for id, pendentes in grupo:
+            for data, hora, info, confirmacao in pendentes.itens:
+                if id in gravados:
+                    confirmacao.set_result(True)
+                    continue
+                try:
+                    confirmacao.set_result(grade.alterar_horario(colecao, id, data, hora, info))
+                except Exception as e:
+                    confirmacao.set_exception(e)
+
+
+agrupador = AgrupadorHorarios.from_env()
@@ -1,7 +1,6 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify, Response, send_from_directory
 from flask_cors import CORS
 import os
-from pymongo import MongoClient
 from dotenv import load_dotenv
 from bson import ObjectId  
 import time
@@ -10,102 +9,239 @@ from datetime import datetime, timedelta
 from functools import wraps
 from flask_bcrypt import Bcrypt
 
+import clinicas
+import consistencia
+import healthcheck
+import idempotencia
+import metrics
+import repositorios
+import slow_log
+import tarefas
+import validacao
+import versionamento
+from circuit_breaker import CircuitoAberto
+from database import banco, mongo_uri, db_name, max_pool_size, breaker, BancoProtegido, inicializar_banco
+from database import usa_sqlite, repositorio_sqlite, SomenteMongo
+import agenda
+import agrupamento
+import arquivamento
+import busca
+import estatisticas
+import eventos
+import exportacao
+import grade
+import migracoes
+import trigramas
+from utils import normalizar_texto
+from pymongo.errors import ConnectionFailure
+
 load_dotenv('.cred')
 
-mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
-db_name = os.getenv('DB_NAME', 'clinica')
 jwt_secret = os.getenv('JWT_SECRET', 'clinica_erp_secret_key_2025')
 
+def _clinica():
+    """Clínica da requisição (clinicas.py): do token, definida em `_verificar_token`, ou do cabeçalho"""
+    if 'clinica' not in g:
+        # Os health checks só pingam o servidor: não dependem de clínica
+        sem_clinica = request.endpoint in ('health', 'health_ready')
+        g.clinica = None if sem_clinica else clinicas.resolver(None, request.headers.get(clinicas.CABECALHO))
+    return g.clinica
+
 def connect_db():
+    if usa_sqlite:
+        raise SomenteMongo()
+    # Com o circuito aberto a requisição é recusada antes de tocar no banco (503)
+    breaker.permitir()
+    clinica = _clinica()
     try:
-        client = MongoClient(mongo_uri)
-        db = client[db_name]
+        # Read preference e concerns da classe da rota (consistencia.py)
+        g.classe_consistencia = consistencia.classe_da_rota(request.endpoint, request.method)
+        db = BancoProtegido(banco(g.classe_consistencia, clinica), breaker)
+        # Índices e campos derivados sempre pelo primário
+        inicializar_banco(BancoProtegido(banco('escrita', clinica), breaker), clinica)
         return db
     except Exception as e:
         print(f"Erro ao conectar ao MongoDB: {e}")
         return None
 
+def repositorio():
+    """Repositórios (repositorios.py) sobre o banco da requisição; None se não foi possível conectar"""
+    if usa_sqlite:
+        return repositorio_sqlite(_clinica())
+    db = connect_db()
+    return None if db is None else repositorios.Mongo(db)
+
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["ETag"])
 bcrypt = Bcrypt(app)
-
-def generate_token(username):
-    """Gera um token JWT para o usuário"""
+metrics.init_app(app)
+slow_log.init_app(app)
+readiness = healthcheck.ReadinessProbe.from_env(healthcheck.pool_stats, max_pool_size)
+
+@app.errorhandler(CircuitoAberto)
+def circuito_aberto(e):
+    """Banco considerado indisponível: falha rápida com Retry-After"""
+    return (
+        {"erro": "Banco de dados temporariamente indisponível"},
+        503,
+        {"Retry-After": e.retry_after_header},
+    )
+
+@app.errorhandler(clinicas.ClinicaInvalida)
+def clinica_invalida(e):
+    return {"erro": str(e)}, e.status
+
+@app.errorhandler(SomenteMongo)
+def somente_mongo(e):
+    return {"erro": "Recurso disponível apenas com o MongoDB (MONGO_URI=sqlite:// atende cadastro, horários e consultas)"}, 501
+
+@app.errorhandler(ConnectionFailure)
+def banco_inacessivel(e):
+    """Erros de conexão que não foram tratados pela rota (ex.: em token_required)"""
+    return circuito_aberto(CircuitoAberto(breaker.retry_after()))
+
+def generate_token(username, clinica=None):
+    """Gera um token JWT para o usuário (da clínica, com várias clínicas)"""
     payload = {
         'username': username,
         'exp': datetime.utcnow() + timedelta(hours=24),  # Token expira em 24 horas
         'iat': datetime.utcnow()
     }
+    if clinica is not None:
+        payload['clinica'] = clinica
     token = jwt.encode(payload, jwt_secret, algorithm='HS256')
     # Garante que retorna string (PyJWT 2.x retorna string diretamente)
     return token if isinstance(token, str) else token.decode('utf-8')
 
+def _incluir_arquivo():
+    """Se a leitura deve incluir os dias arquivados (`?incluir_arquivo=1`)"""
+    return request.args.get('incluir_arquivo') == '1'
+
+def _verificar_token():
+    """Valida o token da requisição atual.
+
+    Retorna None se o usuário é um admin válido, ou a resposta de erro.
+    """
+    token = None
+    
+    # Verifica se o token foi enviado no header
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        try:
+            # Formato esperado: "Bearer <token>"
+            token = auth_header.split(' ')[1]
+        except IndexError:
+            return jsonify({"erro": "Token inválido. Formato esperado: Bearer <token>"}), 401
+    
+    # O EventSource do navegador não envia cabeçalhos: no stream o token pode vir na query
+    if not token and request.path == '/eventos':
+        token = request.args.get('token')
+
+    if not token:
+        return jsonify({"erro": "Token de autenticação não fornecido"}), 401
+    
+    try:
+        # Decodifica e valida o token
+        data = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        current_user = data['username']
+
+        # O admin é procurado no banco da clínica do token
+        try:
+            g.clinica = clinicas.resolver(data.get('clinica'), request.headers.get(clinicas.CABECALHO))
+        except clinicas.ClinicaInvalida as e:
+            return jsonify({"erro": str(e)}), e.status
+        
+        # Verifica se o usuário existe no banco e é admin
+        repo = repositorio()
+        if repo is None:
+            return jsonify({"erro": "Erro ao conectar ao banco de dados"}), 500
+        
+        admin = repo.admins.buscar(current_user)
+        
+        if not admin:
+            return jsonify({"erro": "Acesso negado"}), 403
+            
+    except jwt.ExpiredSignatureError:
+        return jsonify({"erro": "Token expirado"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"erro": "Token inválido"}), 401
+    
+    return None
+
 def token_required(f):
     """Decorator para proteger rotas que requerem autenticação"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # Verifica se o token foi enviado no header
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                # Formato esperado: "Bearer <token>"
-                token = auth_header.split(' ')[1]
-            except IndexError:
-                return jsonify({"erro": "Token inválido. Formato esperado: Bearer <token>"}), 401
-        
-        if not token:
-            return jsonify({"erro": "Token de autenticação não fornecido"}), 401
-        
+        # Mede o custo da autenticação separadamente da rota
+        inicio = time.perf_counter()
+        resultado = 'excecao'
         try:
-            # Decodifica e valida o token
-            data = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-            current_user = data['username']
-            
-            # Verifica se o usuário existe no banco e é admin
-            db = connect_db()
-            if db is None:
-                return jsonify({"erro": "Erro ao conectar ao banco de dados"}), 500
-            
-            collection = db['admins']
-            admin = collection.find_one({"username": current_user, "role": "admin"})
-            
-            if not admin:
-                return jsonify({"erro": "Acesso negado"}), 403
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({"erro": "Token expirado"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"erro": "Token inválido"}), 401
+            erro = _verificar_token()
+            resultado = 'ok' if erro is None else str(erro[1])
+        finally:
+            metrics.auth_latency.observe(time.perf_counter() - inicio, resultado)
+        
+        if erro is not None:
+            return erro
         
         return f(*args, **kwargs)
     
     return decorated
 
+def idempotente(f):
+    """Decorator para POSTs que aceitam o cabeçalho Idempotency-Key.
+
+    Repetições com a mesma chave recebem a resposta da primeira execução.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        chave = request.headers.get('Idempotency-Key')
+        if not chave:
+            return f(*args, **kwargs)
+        if len(chave) > idempotencia.TAMANHO_MAXIMO_CHAVE:
+            return {"erro": "Idempotency-Key muito longa"}, 400
+
+        if usa_sqlite:
+            colecao = repositorio().idempotencia
+        else:
+            db = connect_db()
+            if db is None:
+                return {"erro": "Erro ao conectar ao banco de dados"}, 500
+            colecao = db['idempotencia']
+
+        try:
+            # Com várias clínicas, o cache em memória é compartilhado: a clínica entra na chave
+            prefixo = f"{g.clinica} " if g.get('clinica') else ""
+            return idempotencia.registro.processar(
+                colecao,
+                f"{prefixo}{request.method} {request.path} {chave}",
+                request.get_data(),
+                lambda: app.make_response(f(*args, **kwargs)),
+            )
+        except idempotencia.ChaveReutilizada:
+            return {"erro": "Idempotency-Key já usada com outro corpo de requisição"}, 422
+        except idempotencia.ChaveEmUso:
+            return {"erro": "Requisição com a mesma Idempotency-Key ainda em andamento"}, 409, {"Retry-After": "1"}
+
+    return decorated
+
 @app.route('/auth/login', methods=['POST'])
-def login():
+@validacao.validar(validacao.Login)
+def login(dados):
     """Endpoint de login para admin"""
+    # Clínica inválida responde pelo errorhandler (400/404), não como erro interno
+    clinica = _clinica()
     try:
-        dados = request.get_json()
-        
-        if not dados:
-            return jsonify({"erro": "Dados de login não fornecidos"}), 400
-        
-        username = dados.get('username')
-        password = dados.get('password')
-        
-        if not username or not password:
-            return jsonify({"erro": "Username e password são obrigatórios"}), 400
+        username = dados['username']
+        password = dados['password']
         
         # Conecta ao banco de dados
-        db = connect_db()
-        if db is None:
+        repo = repositorio()
+        if repo is None:
             return jsonify({"erro": "Erro ao conectar ao banco de dados"}), 500
         
         # Busca o admin no banco
-        collection = db['admins']
-        admin = collection.find_one({"username": username, "role": "admin"})
+        admin = repo.admins.buscar(username)
         
         if not admin:
             return jsonify({"erro": "Credenciais inválidas"}), 401
@@ -115,7 +251,7 @@ def login():
             return jsonify({"erro": "Credenciais inválidas"}), 401
         
         # Gera o token JWT
-        token = generate_token(username)
+        token = generate_token(username, clinica)
         return jsonify({
             "mensagem": "Login realizado com sucesso",
             "token": token,
@@ -132,9 +268,15 @@ def health():
     Returns JSON with service status and whether the DB is reachable.
     """
     
-    # quick DB connectivity check
-    db = connect_db()
-    db_ok = db is not None
+    if usa_sqlite:
+        return ({"status": "ok"}, 200) if repositorio().ping() else ({"status": "degraded"}, 500)
+
+    # DB connectivity check (cached ping, see /health/ready)
+    try:
+        db = connect_db()
+    except CircuitoAberto:
+        db = None
+    db_ok = db is not None and readiness.verificar(db)[0]["mongo"]["ok"]
 
     status = {
         "status": "ok" if db_ok else "degraded",
@@ -142,20 +284,73 @@ def health():
     code = 200 if db_ok else 500
     return status, code
 
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    """Liveness: o processo está de pé e atendendo requisições (não consulta o banco)"""
+    return {"status": "ok"}, 200
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness: ping no MongoDB (em cache), utilização do pool e latência do último ping.
+
+    Retorna 503 quando o banco não responde ou o pool está saturado, para que
+    o balanceador deixe de enviar tráfego para esta instância.
+    """
+    if usa_sqlite:
+        ok = repositorio().ping()
+        return {"status": "ok" if ok else "indisponivel", "sqlite": {"ok": ok}}, 200 if ok else 503
+    try:
+        db = connect_db()
+    except CircuitoAberto as e:
+        return {"status": "indisponivel", "circuito": breaker.estado}, 503, {"Retry-After": e.retry_after_header}
+    if db is None:
+        return {"status": "indisponivel", "circuito": breaker.estado}, 503
+    corpo, code = readiness.verificar(db)
+    corpo["circuito"] = breaker.estado
+    return corpo, code
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métricas no formato de texto do Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # Médicos
+@app.route('/eventos', methods=['GET'])
+@token_required
+def get_eventos():
+    """Stream SSE com as mudanças de horários e consultas"""
+    medico = request.args.get('medico')
+    if medico and not ObjectId.is_valid(medico):
+        return {"erro": "ID inválido"}, 400
+
+    tipos = request.args.get('tipos')
+    tipos = [t.strip() for t in tipos.split(',') if t.strip()] if tipos else None
+    if tipos and not set(tipos) <= {eventos.HORARIOS, eventos.CONSULTAS}:
+        return {"erro": "Tipos válidos: horarios, consultas"}, 400
+
+    ultimo_id = request.headers.get('Last-Event-ID', '')
+    barramento = eventos.barramentos.de(_clinica())
+    assinatura = barramento.assinar(medico, tipos, int(ultimo_id) if ultimo_id.isdigit() else None)
+    return Response(
+        eventos.transmitir(assinatura, barramento=barramento),
+        content_type='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.route('/medicos', methods=['GET'])
 @token_required
 def get_medicos():
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
-        collection = db['medicos']
-        medicos_cursor = collection.find({})  
+        medicos_cursor = repo.medicos.listar(request.args.get('especialidade'))
         medicos = []
         for medico in medicos_cursor:
             medico['_id'] = str(medico['_id'])  
+            if 'horarios' in medico:
+                medico['horarios'] = migracoes.ler('horarios', medico['horarios'])
             medicos.append(medico)
 
         if not medicos:
@@ -163,63 +358,100 @@ def get_medicos():
         return {"medicos": medicos}, 200
     except Exception as e:
         return {"erro": f"Erro ao consultar médicos: {str(e)}"}, 500
+
+@app.route('/especialidades', methods=['GET'])
+@token_required
+def get_especialidades():
+    """Especialidades distintas com a quantidade de médicos de cada uma"""
+    db = connect_db()
+    if db is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        especialidades = list(db['medicos'].aggregate(busca.PIPELINE_ESPECIALIDADES))
+        return {"especialidades": especialidades}, 200
+    except Exception as e:
+        return {"erro": f"Erro ao consultar especialidades: {str(e)}"}, 500
+
+@app.route('/estatisticas/ocupacao', methods=['GET'])
+@token_required
+def get_ocupacao():
+    """Horários oferecidos x ocupados no período, por médico, especialidade, dia e semana"""
+    try:
+        inicio, fim = estatisticas.ler_periodo(request.args.get('de'), request.args.get('ate'))
+    except estatisticas.PeriodoInvalido as e:
+        return {"erro": str(e)}, 400
+
+    medico_id = request.args.get('medico')
+    if medico_id and not ObjectId.is_valid(medico_id):
+        return {"erro": "ID inválido"}, 400
+
+    db = connect_db()
+    if db is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        ocupacao = estatisticas.calcular_ocupacao(
+            db['medicos'], inicio, fim,
+            medico_id=medico_id,
+            especialidade=request.args.get('especialidade'),
+            arquivo=db[arquivamento.MEDICOS.arquivo] if _incluir_arquivo() else None,
+        )
+        return ocupacao, 200
+    except Exception as e:
+        return {"erro": f"Erro ao calcular ocupação: {str(e)}"}, 500
     
 @app.route('/medicos/<string:id>', methods=['GET'])
 @token_required
 def get_medico_id(id):
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        collection = db['medicos']
-        medico = collection.find_one({"_id": ObjectId(id)})
+        medico = repo.medicos.obter(id, _incluir_arquivo())
 
         if not medico:
             return {"erro": "Médico não encontrado"}, 404
 
+        if 'horarios' in medico:
+            medico['horarios'] = migracoes.ler('horarios', medico['horarios'])
+
         medico['_id'] = str(medico['_id'])  
-        return {"medico": medico}, 200
+        return {"medico": medico}, 200, {"ETag": versionamento.etag(medico)}
     except Exception as e:
         return {"erro": f"Erro ao consultar médico: {str(e)}"}, 500
 @app.route('/medicos', methods=['POST'])
+@validacao.validar(validacao.NovoMedico)
 @token_required
-def post_medico():
-    db = connect_db()
-    if db is None:
+@idempotente
+def post_medico(dados):
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
-        dados = request.get_json()
-
-        campos_obrigatorios = ["nome", "cpf", "crm", "especialidade"]
-        for campo in campos_obrigatorios:
-            if campo not in dados or not dados[campo]:
-                return {"erro": f"Campo '{campo}' é obrigatório"}, 400
-
-        collection = db['medicos']
-
-        if collection.find_one({"cpf": dados["cpf"]}):
-            return {"erro": "Já existe um médico com esse CPF"}, 400
-        if collection.find_one({"crm": dados["crm"]}):
-            return {"erro": "Já existe um médico com esse CRM"}, 400
-
         novo_medico = {
             "nome": dados["nome"],
             "cpf": dados["cpf"],
             "crm": dados["crm"],
             "especialidade": dados["especialidade"],
-            "horarios": {} 
+            "horarios": {},
+            "versao": 1,
         }
+        novo_medico.update(busca.campos_de_busca_medico(novo_medico))
 
-        resultado = collection.insert_one(novo_medico)
+        try:
+            medico_id = repo.medicos.criar(novo_medico)
+        except repositorios.Duplicado as e:
+            return {"erro": f"Já existe um médico com esse {e.campo.upper()}"}, 400
 
         return {
             "mensagem": "Médico criado com sucesso",
-            "id": str(resultado.inserted_id)
+            "id": str(medico_id)
         }, 201
 
     except Exception as e:
@@ -227,38 +459,46 @@ def post_medico():
 
 
 @app.route('/medicos/<id>', methods=['PUT'])
+@validacao.validar(validacao.AlteracaoMedico)
 @token_required
-def put_medico(id):
-    db = connect_db()
-    if db is None:
+def put_medico(id, dados):
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        dados = request.get_json()
-        if not dados:
-            return {"erro": "O corpo da requisição deve conter os dados do médico"}, 400
-
         campos_validos = ["nome", "cpf", "crm", "especialidade"]
         atualizacoes = {k: v for k, v in dados.items() if k in campos_validos}
 
         if not atualizacoes:
             return {"erro": "Nenhum campo válido para atualização"}, 400
 
-        collection = db['medicos']
-        medico = collection.find_one({"_id": ObjectId(id)})
+        atualizacoes.update(busca.campos_de_busca_medico(atualizacoes))
 
-        if not medico:
-            return {"erro": "Médico não encontrado"}, 404
+        try:
+            esperada = versionamento.versao_esperada(request.headers, dados)
+        except versionamento.PrecondicaoInvalida as e:
+            return {"erro": str(e)}, 400
 
-        collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": atualizacoes}
-        )
+        try:
+            medico, versao = repo.medicos.atualizar(id, atualizacoes, esperada)
+        except repositorios.Duplicado as e:
+            return {"erro": f"Já existe um médico com esse {e.campo.upper()}"}, 400
 
-        return {"mensagem": "Dados do médico atualizados com sucesso"}, 200
+        if not medico:
+            if versao is None:
+                return {"erro": "Médico não encontrado"}, 404
+            return {"erro": "O médico foi alterado por outra requisição", "versao": versao}, 412, {"ETag": f'"{versao}"'}
+
+        medico['_id'] = str(medico['_id'])
+        return (
+            {"mensagem": "Dados do médico atualizados com sucesso", "medico": medico},
+            200,
+            {"ETag": versionamento.etag(medico)},
+        )
 
     except Exception as e:
         return {"erro": f"Erro ao atualizar médico: {str(e)}"}, 500
@@ -267,18 +507,15 @@ def put_medico(id):
 @app.route('/medicos/<id>', methods=['DELETE'])
 @token_required
 def delete_medico(id):
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        collection = db['medicos']
-        result = collection.delete_one({"_id": ObjectId(id)})
-
-        if result.deleted_count == 0:
+        if not repo.medicos.remover(id):
             return {"erro": "Médico não encontrado"}, 404
 
         return {"mensagem": "Médico deletado com sucesso"}, 200
@@ -290,13 +527,12 @@ def delete_medico(id):
 @app.route('/pacientes', methods=['GET'])
 @token_required
 def get_pacientes():
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
-        collection = db['pacientes']
-        pacientes_cursor = collection.find()
+        pacientes_cursor = repo.pacientes.listar()
         pacientes = []
         for p in pacientes_cursor:
             p['_id'] = str(p['_id'])
@@ -310,63 +546,97 @@ def get_pacientes():
         return {"erro": f"Erro ao consultar pacientes: {str(e)}"}, 500
 
 
+@app.route('/pacientes/busca', methods=['GET'])
+@token_required
+def buscar_pacientes():
+    """Autocompletar: prefixo de CPF/celular ou de nome (sem acentos/maiúsculas).
+
+    Com `fuzzy=1`, busca o nome por similaridade no índice de trigramas.
+    """
+    q = request.args.get('q', '').strip()
+    if len(q) < busca.TAMANHO_MINIMO:
+        return {"erro": f"Parâmetro 'q' deve ter ao menos {busca.TAMANHO_MINIMO} caracteres"}, 400
+
+    try:
+        limite = min(int(request.args.get('limite', busca.LIMITE_PADRAO)), busca.LIMITE_MAXIMO)
+    except ValueError:
+        return {"erro": "Parâmetro 'limite' deve ser um número inteiro"}, 400
+    if limite < 1:
+        return {"erro": "Parâmetro 'limite' deve ser positivo"}, 400
+
+    fuzzy = request.args.get('fuzzy', '0').lower() in ('1', 'true')
+
+    repo = repositorio()
+    if repo is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        pacientes = None
+        # O índice de trigramas é carregado do MongoDB; nos demais motores a busca é só por prefixo
+        if fuzzy and isinstance(repo, repositorios.Mongo):
+            pacientes = busca.buscar_aproximado(repo.db['pacientes'], q, limite, trigramas.indices.de(g.clinica))
+        if pacientes is None:
+            # índice de trigramas ainda carregando (ou busca normal)
+            fuzzy = False
+            pacientes = repo.pacientes.buscar(q, limite)
+        return {"pacientes": pacientes, "modo": "aproximado" if fuzzy else "prefixo"}, 200
+    except Exception as e:
+        return {"erro": f"Erro ao buscar pacientes: {str(e)}"}, 500
+
+
 @app.route('/pacientes/<id>', methods=['GET'])
 @token_required
 def get_paciente_id(id):
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
-        collection = db['pacientes']
-        paciente = collection.find_one({"_id": ObjectId(id)})
+        paciente = repo.pacientes.obter(id, _incluir_arquivo())
         if not paciente:
             return {"erro": "Paciente não encontrado"}, 404
 
         paciente['_id'] = str(paciente['_id'])
-        return {"paciente": paciente}, 200
+        return {"paciente": paciente}, 200, {"ETag": versionamento.etag(paciente)}
     except Exception as e:
         return {"erro": f"Erro ao buscar paciente: {str(e)}"}, 500
 
 
 @app.route('/pacientes', methods=['POST'])
+@validacao.validar(validacao.NovoPaciente)
 @token_required
-def post_paciente():
-    db = connect_db()
-    if db is None:
+@idempotente
+def post_paciente(dados):
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
-        data = request.get_json()
-        nome = data.get('nome')
-        cpf = data.get('cpf')
-        celular = data.get('celular')
-        idade = data.get('idade')
-
-        if not all([nome, cpf, celular, idade]):
-            return {"erro": "Todos os campos (nome, cpf, celular, idade) são obrigatórios"}, 400
-
+        nome = dados['nome']
         novo_paciente = {
             "nome": nome,
-            "cpf": cpf,
-            "celular": celular,
-            "idade": idade,
-            "consultas": {}
+            "cpf": dados['cpf'],
+            "celular": dados['celular'],
+            "idade": dados['idade'],
+            "consultas": {},
+            "versao": 1,
         }
+        novo_paciente.update(busca.campos_de_busca(novo_paciente))
 
-        collection = db['pacientes']
-        result = collection.insert_one(novo_paciente)
+        paciente_id = repo.pacientes.criar(novo_paciente)
+        busca.indexar_nome(paciente_id, nome, g.clinica)
 
-        return {"mensagem": "Paciente cadastrado com sucesso", "id": str(result.inserted_id)}, 201
+        return {"mensagem": "Paciente cadastrado com sucesso", "id": str(paciente_id)}, 201
     except Exception as e:
         return {"erro": f"Erro ao cadastrar pacient ,.l´ç76e: {str(e)}"}, 500
 
 
 @app.route('/pacientes/<id>', methods=['PUT'])
+@validacao.validar(validacao.AlteracaoPaciente)
 @token_required
-def put_paciente(id):
-    db = connect_db()
-    if db is None:
+def put_paciente(id, dados):
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
@@ -374,47 +644,52 @@ def put_paciente(id):
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        dados = request.get_json()
-        if not dados:
-            return {"erro": "O corpo da requisição deve conter os dados do paciente"}, 400
-
         campos_validos = ["nome", "cpf", "celular", "idade"]
         atualizacoes = {k: v for k, v in dados.items() if k in campos_validos}
 
         if not atualizacoes:
             return {"erro": "Nenhum campo válido para atualização"}, 400
 
-        collection = db['pacientes']
-        paciente = collection.find_one({"_id": ObjectId(id)})
+        atualizacoes.update(busca.campos_de_busca(atualizacoes))
+
+        try:
+            esperada = versionamento.versao_esperada(request.headers, dados)
+        except versionamento.PrecondicaoInvalida as e:
+            return {"erro": str(e)}, 400
+
+        paciente, versao = repo.pacientes.atualizar(id, atualizacoes, esperada)
 
         if not paciente:
-            return {"erro": "Paciente não encontrado"}, 404
+            if versao is None:
+                return {"erro": "Paciente não encontrado"}, 404
+            return {"erro": "O paciente foi alterado por outra requisição", "versao": versao}, 412, {"ETag": f'"{versao}"'}
 
-        collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": atualizacoes}
-        )
+        if "nome" in atualizacoes:
+            busca.indexar_nome(id, atualizacoes["nome"], g.clinica)
 
-        return {"mensagem": "Dados do paciente atualizados com sucesso"}, 200
+        paciente['_id'] = str(paciente['_id'])
+        return (
+            {"mensagem": "Dados do paciente atualizados com sucesso", "paciente": paciente},
+            200,
+            {"ETag": versionamento.etag(paciente)},
+        )
 
     except Exception as e:
         return {"erro": f"Erro ao atualizar paciente: {str(e)}"}, 500
 @app.route('/pacientes/<id>', methods=['DELETE'])
 @token_required
 def delete_paciente(id):
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        collection = db['pacientes']
-        result = collection.delete_one({"_id": ObjectId(id)})
-
-        if result.deleted_count == 0:
+        if not repo.pacientes.remover(id):
             return {"erro": "Paciente não encontrado"}, 404
+        busca.desindexar(id, g.clinica)
 
         return {"mensagem": "Paciente deletado com sucesso"}, 200
 
@@ -423,35 +698,25 @@ def delete_paciente(id):
 
 # MÉDICOS - HORÁRIOS
 @app.route('/medicos/<id>/horarios', methods=['POST'])
+@validacao.validar(validacao.Agenda)
 @token_required
-def post_horarios_medico(id):
+@idempotente
+def post_horarios_medico(id, dados):
     """Cria novos horários (ou dias inteiros) para o médico"""
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        dados = request.get_json()
-        if not dados or not isinstance(dados, dict):
-            return {"erro": "O corpo da requisição deve ser um dicionário JSON"}, 400
-
-        collection = db['medicos']
-        medico = collection.find_one({"_id": ObjectId(id)})
-
-        if not medico:
+        # adiciona ou substitui os dias inteiros
+        if not repo.horarios.adicionar_dias(id, dados):
             return {"erro": "Médico não encontrado"}, 404
 
-        horarios = medico.get("horarios", {})
-        for data, horarios_data in dados.items():
-            horarios[data] = horarios_data  # adiciona ou substitui o dia inteiro
-
-        collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": {"horarios": horarios}}
-        )
+        for data in dados:
+            eventos.notificar(eventos.HORARIOS, 'criado', medico_id=id, data=data)
 
         return {"mensagem": "Horários adicionados com sucesso"}, 201
 
@@ -463,53 +728,44 @@ def post_horarios_medico(id):
 @token_required
 def get_horarios_medico(id):
     """Retorna todos os horários de um médico"""
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        collection = db['medicos']
-        medico = collection.find_one({"_id": ObjectId(id)}, {"_id": 0, "horarios": 1})
+        horarios = repo.horarios.obter(id, _incluir_arquivo())
 
-        if not medico:
+        if horarios is None:
             return {"erro": "Médico não encontrado"}, 404
 
-        return {"horarios": medico.get("horarios", {})}, 200
+        return {"horarios": migracoes.ler('horarios', horarios)}, 200
 
     except Exception as e:
         return {"erro": f"Erro ao buscar horários: {str(e)}"}, 500
 
 
 @app.route('/medicos/<id>/horarios', methods=['PUT'])
+@validacao.validar(validacao.AlteracaoHorario)
 @token_required
-def put_horarios_medico(id):
+def put_horarios_medico(id, dados):
     """Atualiza apenas um horário específico sem alterar os demais"""
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        dados = request.get_json()
-        data = dados.get("data")
-        hora = dados.get("hora")
-        info = dados.get("info")
-
-        if not all([data, hora, info]):
-            return {"erro": "Campos 'data', 'hora' e 'info' são obrigatórios"}, 400
+        data, hora, info = dados["data"], dados["hora"], dados["info"]
 
-        collection = db['medicos']
-        result = collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": {f"horarios.{data}.{hora}": info}}
-        )
-
-        if result.matched_count == 0:
+        encontrado = _alterar_horario(repo, id, data, hora, info, 'atualizado')
+        if encontrado is None:
+            return {"mensagem": "Alteração de horário aceita"}, 202
+        if not encontrado:
             return {"erro": "Médico não encontrado"}, 404
 
         return {"mensagem": "Horário atualizado com sucesso"}, 200
@@ -518,46 +774,73 @@ def put_horarios_medico(id):
         return {"erro": f"Erro ao atualizar horário: {str(e)}"}, 500
 
 
+def _alterar_horario(repo, id, data, hora, info, acao):
+    """Grava (`info`) ou remove um horário e publica o evento.
+
+    Com o agrupamento ligado (agrupamento.py) espera a gravação do lote, a
+    menos que o cliente envie `Prefer: respond-async`: nesse caso retorna
+    None logo que a alteração entra na fila. Senão, retorna se o médico existe.
+    """
+    # A confirmação do agrupador pode chegar na thread dele, fora da requisição
+    clinica = g.get('clinica')
+
+    def notificar():
+        eventos.notificar(eventos.HORARIOS, acao, clinica=clinica, medico_id=id, data=data, hora=hora)
+
+    if not agrupamento.agrupador.habilitado:
+        encontrado = repo.horarios.alterar(id, data, hora, info)
+    else:
+        confirmacao = repo.horarios.enfileirar(agrupamento.agrupador, id, data, hora, info)
+        if 'respond-async' in request.headers.get('Prefer', ''):
+            confirmacao.add_done_callback(lambda f: f.exception() is None and f.result() and notificar())
+            return None
+        encontrado = confirmacao.result()
+    if encontrado:
+        notificar()
+    return encontrado
+
+
 @app.route('/medicos/<id>/horarios', methods=['DELETE'])
+@validacao.validar(validacao.Remocao)
 @token_required
-def delete_horarios_medico(id):
+def delete_horarios_medico(id, dados):
     """Remove um horário específico ou um dia inteiro"""
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        dados = request.get_json()
-        data = dados.get("data")
-        hora = dados.get("hora")
-
-        if not data:
-            return {"erro": "Campo 'data' é obrigatório"}, 400
-
-        collection = db['medicos']
+        data, hora = dados["data"], dados["hora"]
 
         if hora:
-            update = {"$unset": {f"horarios.{data}.{hora}": ""}}
+            encontrado = _alterar_horario(repo, id, data, hora, None, 'removido')
+            if encontrado is None:
+                return {"mensagem": "Remoção de horário aceita"}, 202
         else:
-            update = {"$unset": {f"horarios.{data}": ""}}
+            # Alterações ainda na fila do agrupador não podem recriar horários do dia removido
+            agrupamento.agrupador.esvaziar()
+            encontrado = repo.horarios.remover_dia(id, data)
+            if encontrado:
+                eventos.notificar(eventos.HORARIOS, 'removido', medico_id=id, data=data, hora=hora)
 
-        result = collection.update_one({"_id": ObjectId(id)}, update)
-
-        if result.matched_count == 0:
+        if not encontrado:
             return {"erro": "Médico não encontrado"}, 404
 
         return {"mensagem": "Horário removido com sucesso"}, 200
 
     except Exception as e:
         return {"erro": f"Erro ao deletar horário: {str(e)}"}, 500
-    
-# PACIENTES -  CONSULTAS
-@app.route('/pacientes/<id>/consultas', methods=['POST'])
+
+
+@app.route('/medicos/<id>/horarios/expandir', methods=['POST'])
+@validacao.validar(validacao.ModeloAgenda)
 @token_required
-def post_consultas_paciente(id):
+@idempotente
+def post_expandir_agenda(id, dados):
+    """Agenda a geração dos horários de um período a partir de um modelo semanal"""
     db = connect_db()
     if db is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
@@ -566,24 +849,78 @@ def post_consultas_paciente(id):
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        dados = request.get_json()
-        if not dados or not isinstance(dados, dict):
-            return {"erro": "O corpo da requisição deve ser um dicionário JSON"}, 400
+        try:
+            parametros = agenda.validar_modelo(dados)
+        except agenda.ModeloInvalido as e:
+            return {"erro": str(e)}, 400
 
-        collection = db['pacientes']
-        paciente = collection.find_one({"_id": ObjectId(id)})
+        if not db['medicos'].find_one({"_id": ObjectId(id)}, {"_id": 1}):
+            return {"erro": "Médico não encontrado"}, 404
 
-        if not paciente:
-            return {"erro": "Paciente não encontrado"}, 404
+        tarefa_id = tarefas.enfileirar(db, 'expandir_agenda', dict(parametros, medico_id=id, clinica=g.get('clinica')))
+        return (
+            {"mensagem": "Expansão da agenda agendada", "tarefa": tarefa_id},
+            202,
+            {"Location": f"/tarefas/{tarefa_id}"},
+        )
 
-        consultas = paciente.get("consultas", {})
-        for data, consultas_data in dados.items():
-            consultas[data] = consultas_data
+    except Exception as e:
+        return {"erro": f"Erro ao agendar expansão da agenda: {str(e)}"}, 500
 
-        collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": {"consultas": consultas}}
-        )
+
+@app.route('/horarios/livres', methods=['GET'])
+@token_required
+def get_horarios_livres():
+    """Horários livres no período, por médico, com filtros opcionais de especialidade, médico e hora"""
+    try:
+        inicio, fim = estatisticas.ler_periodo(request.args.get('de'), request.args.get('ate'))
+    except estatisticas.PeriodoInvalido as e:
+        return {"erro": str(e)}, 400
+
+    hora_de, hora_ate = request.args.get('hora_de'), request.args.get('hora_ate')
+    for hora in (hora_de, hora_ate):
+        if hora and not grade.HORA.match(hora):
+            return {"erro": "'hora_de' e 'hora_ate' devem estar no formato HH:MM"}, 400
+
+    filtro = {}
+    medico_id = request.args.get('medico')
+    if medico_id:
+        if not ObjectId.is_valid(medico_id):
+            return {"erro": "ID inválido"}, 400
+        filtro["_id"] = ObjectId(medico_id)
+    especialidade = request.args.get('especialidade')
+    if especialidade:
+        filtro["especialidade_normalizada"] = normalizar_texto(especialidade)
+
+    db = connect_db()
+    if db is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        medicos = grade.livres_no_periodo(db['medicos'], inicio.isoformat(), fim.isoformat(), filtro, hora_de, hora_ate)
+        return {"periodo": {"de": inicio.isoformat(), "ate": fim.isoformat()}, "medicos": medicos}, 200
+    except Exception as e:
+        return {"erro": f"Erro ao buscar horários livres: {str(e)}"}, 500
+    
+# PACIENTES -  CONSULTAS
+@app.route('/pacientes/<id>/consultas', methods=['POST'])
+@validacao.validar(validacao.Agenda)
+@token_required
+@idempotente
+def post_consultas_paciente(id, dados):
+    repo = repositorio()
+    if repo is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        if not ObjectId.is_valid(id):
+            return {"erro": "ID inválido"}, 400
+
+        if not repo.consultas.adicionar_dias(id, dados):
+            return {"erro": "Paciente não encontrado"}, 404
+
+        for data in dados:
+            eventos.notificar(eventos.CONSULTAS, 'criado', paciente_id=id, data=data)
 
         return {"mensagem": "Consultas adicionadas com sucesso"}, 201
 
@@ -594,31 +931,31 @@ def post_consultas_paciente(id):
 @app.route('/pacientes/<id>/consultas', methods=['GET'])
 @token_required
 def get_consultas_paciente(id):
-    db = connect_db()
-    if db is None:
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        collection = db['pacientes']
-        paciente = collection.find_one({"_id": ObjectId(id)}, {"_id": 0, "consultas": 1})
+        consultas = repo.consultas.obter(id, _incluir_arquivo())
 
-        if not paciente:
+        if consultas is None:
             return {"erro": "Paciente não encontrado"}, 404
 
-        return {"consultas": paciente.get("consultas", {})}, 200
+        return {"consultas": migracoes.ler('consultas', consultas)}, 200
 
     except Exception as e:
         return {"erro": f"Erro ao buscar consultas: {str(e)}"}, 500
 
 
 @app.route('/pacientes/<id>/consultas', methods=['PUT'])
+@validacao.validar(validacao.AlteracaoConsulta)
 @token_required
-def put_consultas_paciente(id):
-    db = connect_db()
-    if db is None:
+def put_consultas_paciente(id, dados):
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
@@ -626,22 +963,11 @@ def put_consultas_paciente(id):
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        data = request.get_json()
-        data_consulta = data.get("data")
-        hora_consulta = data.get("hora")
-        detalhes = data.get("detalhes")
-
-        if not all([data_consulta, hora_consulta, detalhes]):
-            return {"erro": "Campos 'data', 'hora' e 'detalhes' são obrigatórios"}, 400
+        data_consulta, hora_consulta, detalhes = dados["data"], dados["hora"], dados["detalhes"]
 
-        collection = db['pacientes']
-        result = collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": {f"consultas.{data_consulta}.{hora_consulta}": detalhes}}
-        )
-
-        if result.matched_count == 0:
+        if not repo.consultas.alterar(id, data_consulta, hora_consulta, detalhes):
             return {"erro": "Paciente não encontrado"}, 404
+        eventos.notificar(eventos.CONSULTAS, 'atualizado', paciente_id=id, data=data_consulta, hora=hora_consulta)
 
         return {"mensagem": "Consulta atualizada com sucesso"}, 200
 
@@ -650,34 +976,27 @@ def put_consultas_paciente(id):
 
 
 @app.route('/pacientes/<id>/consultas', methods=['DELETE'])
+@validacao.validar(validacao.Remocao)
 @token_required
-def delete_consulta_paciente(id):
-    db = connect_db()
-    if db is None:
+def delete_consulta_paciente(id, dados):
+    repo = repositorio()
+    if repo is None:
         return {"erro": "Erro ao conectar ao banco de dados"}, 500
 
     try:
         if not ObjectId.is_valid(id):
             return {"erro": "ID inválido"}, 400
 
-        dados = request.get_json()
-        data = dados.get("data")
-        hora = dados.get("hora")
-
-        if not data:
-            return {"erro": "Campo 'data' é obrigatório"}, 400
-
-        collection = db['pacientes']
+        data, hora = dados["data"], dados["hora"]
 
         if hora:
-            update = {"$unset": {f"consultas.{data}.{hora}": ""}}
+            encontrado = repo.consultas.alterar(id, data, hora, None)
         else:
-            update = {"$unset": {f"consultas.{data}": ""}}
+            encontrado = repo.consultas.remover_dia(id, data)
 
-        result = collection.update_one({"_id": ObjectId(id)}, update)
-
-        if result.matched_count == 0:
+        if not encontrado:
             return {"erro": "Paciente não encontrado"}, 404
+        eventos.notificar(eventos.CONSULTAS, 'removido', paciente_id=id, data=data, hora=hora)
 
         return {"mensagem": "Consulta removida com sucesso"}, 200
 
@@ -685,5 +1004,124 @@ def delete_consulta_paciente(id):
         return {"erro": f"Erro ao deletar consulta: {str(e)}"}, 500
 
 
+# EXPORTAÇÃO
+@app.route('/exportar/<tipo>', methods=['GET'])
+@token_required
+def get_exportacao(tipo):
+    """Exporta pacientes ou consultas em CSV/Parquet, em streaming ou como tarefa"""
+    if tipo not in exportacao.COLUNAS:
+        return {"erro": "Exportação não encontrada"}, 404
+
+    formato = request.args.get('formato', 'csv')
+    if formato not in exportacao.FORMATOS:
+        return {"erro": "Formato inválido (use csv ou parquet)"}, 400
+    de, ate = request.args.get('de'), request.args.get('ate')
+
+    db = connect_db()
+    if db is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        blocos = exportacao.exportar(db, tipo, formato, de, ate, incluir_arquivo=_incluir_arquivo())
+    except estatisticas.PeriodoInvalido as e:
+        return {"erro": str(e)}, 400
+    except exportacao.FormatoIndisponivel as e:
+        return {"erro": str(e)}, 501
+
+    if request.args.get('assincrono') == '1':
+        blocos.close()
+        tarefa_id = tarefas.enfileirar(db, 'exportar', {
+            "tipo": tipo, "formato": formato, "de": de, "ate": ate, "incluir_arquivo": _incluir_arquivo(),
+        })
+        return (
+            {"mensagem": "Exportação agendada", "tarefa": tarefa_id},
+            202,
+            {"Location": f"/tarefas/{tarefa_id}"},
+        )
+
+    nome = exportacao.nome_arquivo(tipo, formato, de, ate)
+    return Response(
+        blocos,
+        content_type=exportacao.FORMATOS[formato][0],
+        headers={"Content-Disposition": f'attachment; filename="{nome}"'},
+    )
+
+
+@app.route('/exportar/arquivos/<nome>', methods=['GET'])
+@token_required
+def get_arquivo_exportado(nome):
+    """Baixa o arquivo gerado por uma exportação em segundo plano"""
+    pasta = exportacao.pasta(clinicas.nome_do_banco(db_name, g.clinica))
+    return send_from_directory(os.path.abspath(pasta), nome, as_attachment=True)
+
+
+# TAREFAS EM SEGUNDO PLANO
+@app.route('/tarefas', methods=['GET'])
+@token_required
+def get_tarefas():
+    """Tarefas mais recentes, opcionalmente filtradas por estado e tipo"""
+    db = connect_db()
+    if db is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        filtro = {}
+        if request.args.get('estado'):
+            filtro['estado'] = request.args['estado']
+        if request.args.get('tipo'):
+            filtro['tipo'] = request.args['tipo']
+        limite = request.args.get('limite', '50')
+        if not limite.isdigit() or not 1 <= int(limite) <= 500:
+            return {"erro": "'limite' deve ser um número entre 1 e 500"}, 400
+
+        cursor = db['tarefas'].find(filtro).sort("criada_em", -1).limit(int(limite))
+        return {"tarefas": [tarefas.serializar(t) for t in cursor]}, 200
+    except Exception as e:
+        return {"erro": f"Erro ao listar tarefas: {str(e)}"}, 500
+
+
+@app.route('/tarefas/<id>', methods=['GET'])
+@token_required
+def get_tarefa(id):
+    db = connect_db()
+    if db is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        if not ObjectId.is_valid(id):
+            return {"erro": "ID inválido"}, 400
+
+        tarefa = db['tarefas'].find_one({"_id": ObjectId(id)})
+        if not tarefa:
+            return {"erro": "Tarefa não encontrada"}, 404
+
+        return {"tarefa": tarefas.serializar(tarefa)}, 200
+    except Exception as e:
+        return {"erro": f"Erro ao consultar tarefa: {str(e)}"}, 500
+
+
+@app.route('/tarefas/<id>', methods=['DELETE'])
+@token_required
+def delete_tarefa(id):
+    """Cancela uma tarefa que ainda não começou a executar"""
+    db = connect_db()
+    if db is None:
+        return {"erro": "Erro ao conectar ao banco de dados"}, 500
+
+    try:
+        if not ObjectId.is_valid(id):
+            return {"erro": "ID inválido"}, 400
+
+        if tarefas.cancelar(db, id):
+            return {"mensagem": "Tarefa cancelada com sucesso"}, 200
+
+        tarefa = db['tarefas'].find_one({"_id": ObjectId(id)}, {"estado": 1})
+        if not tarefa:
+            return {"erro": "Tarefa não encontrada"}, 404
+        return {"erro": f"A tarefa não pode ser cancelada (estado: {tarefa['estado']})"}, 409
+    except Exception as e:
+        return {"erro": f"Erro ao cancelar tarefa: {str(e)}"}, 500
+
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,190 @@
+"""
+Arquivamento dos dias passados de `medicos.horarios` e `pacientes.consultas`.
+
+Executa: python arquivamento.py [--horizonte 90] [--lote 200] [--clinica nome]
+
+Os mapas de agenda guardavam todos os dias desde o cadastro dentro do
+documento vivo, que crescia (e ficava mais lento para ler e reescrever) a
+cada mês. Os dias anteriores a `ARQUIVO_HORIZONTE_DIAS` são movidos para
+`horarios_arquivo` e `consultas_arquivo`, um documento por médico/paciente e
+mês, com o mesmo formato do documento original (`horarios`/`consultas` de
+data → hora), mais o id de origem e uma cópia dos campos usados em relatórios.
+
+O arquivamento roda como tarefa em segundo plano (`arquivar`), reagendada a
+cada `ARQUIVO_INTERVALO_S`. Cada passada percorre a collection em lotes por
+`_id` e grava o progresso na collection `arquivamento`, então pode ser
+interrompida e retomada. Cada dia é primeiro copiado (upsert) e só então
+removido do documento vivo, com a condição de que não tenha mudado desde a
+leitura: repetir um lote nunca perde nem duplica dados.
+
+As rotas de leitura só consultam o arquivo com `?incluir_arquivo=1`.
+"""
+import argparse
+import os
+from datetime import date, datetime, timedelta
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, IndexModel
+
+import tarefas
+
+load_dotenv('.cred')
+
+horizonte_dias = int(os.getenv('ARQUIVO_HORIZONTE_DIAS', '90'))
+intervalo_s = int(os.getenv('ARQUIVO_INTERVALO_S', '86400'))
+
+
+class Arquivo:
+    def __init__(self, colecao, campo, arquivo, chave, copiar):
+        self.colecao = colecao
+        self.campo = campo
+        self.arquivo = arquivo
+        self.chave = chave
+        self.copiar = copiar
+
+
+MEDICOS = Arquivo('medicos', 'horarios', 'horarios_arquivo', 'medico_id',
+                  ('nome', 'especialidade', 'especialidade_normalizada'))
+PACIENTES = Arquivo('pacientes', 'consultas', 'consultas_arquivo', 'paciente_id', ('nome', 'cpf'))
+ARQUIVOS = (MEDICOS, PACIENTES)
+
+INDICES = {
+    a.arquivo: [IndexModel([(a.chave, ASCENDING), ('mes', ASCENDING)]), IndexModel([('mes', ASCENDING)])]
+    for a in ARQUIVOS
+}
+
+
+def limite(hoje=None, horizonte=None):
+    """Primeiro dia que continua no documento vivo (AAAA-MM-DD)"""
+    horizonte = horizonte_dias if horizonte is None else horizonte
+    return ((hoje or date.today()) - timedelta(days=horizonte)).isoformat()
+
+
+def _dias_antigos(db, especificacao, limite, apos_id, lote):
+    """Próximo lote de documentos, só com os dias anteriores ao limite"""
+    filtro = {especificacao.campo: {"$type": "object"}}
+    if apos_id is not None:
+        filtro["_id"] = {"$gt": apos_id}
+    return list(db[especificacao.colecao].aggregate([
+        {"$match": filtro},
+        {"$sort": {"_id": 1}},
+        {"$limit": lote},
+        {"$project": dict(
+            {campo: 1 for campo in especificacao.copiar},
+            dias={"$filter": {
+                "input": {"$objectToArray": f"${especificacao.campo}"},
+                "as": "d",
+                "cond": {"$lt": ["$$d.k", limite]},
+            }},
+        )},
+    ]))
+
+
+def _arquivar_documento(db, especificacao, documento):
+    """Copia os dias antigos para o arquivo e os remove do documento vivo; retorna quantos dias saíram"""
+    dias = {d["k"]: d["v"] for d in documento["dias"]}
+    if not dias:
+        return 0
+    id = documento["_id"]
+    copiados = {campo: documento.get(campo) for campo in especificacao.copiar}
+    agora = datetime.utcnow()
+
+    por_mes = {}
+    for dia, conteudo in dias.items():
+        por_mes.setdefault(dia[:7], {})[f"{especificacao.campo}.{dia}"] = conteudo
+    for mes, conteudo in por_mes.items():
+        # Upsert idempotente: repetir depois de uma interrupção só regrava o mesmo conteúdo
+        db[especificacao.arquivo].update_one(
+            {"_id": f"{id}:{mes}"},
+            {"$set": dict(conteudo, **copiados, **{especificacao.chave: id, "mes": mes, "arquivado_em": agora})},
+            upsert=True,
+        )
+
+    caminhos = {f"{especificacao.campo}.{dia}": conteudo for dia, conteudo in dias.items()}
+    resultado = db[especificacao.colecao].update_one(
+        dict(caminhos, _id=id),
+        {"$unset": {caminho: "" for caminho in caminhos}},
+    )
+    # Se algum dia mudou depois da leitura nada é removido; a próxima passada arquiva a versão nova
+    return len(dias) if resultado.modified_count else 0
+
+
+def arquivar_colecao(db, especificacao, limite, lote=200, max_lotes=None):
+    """Avança a passada de uma collection a partir do checkpoint; retorna (dias_arquivados, terminou)"""
+    progresso = db['arquivamento']
+    checkpoint = progresso.find_one({"_id": especificacao.colecao}) or {}
+    apos_id = checkpoint.get("apos_id")
+    arquivados = 0
+    lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        documentos = _dias_antigos(db, especificacao, limite, apos_id, lote)
+        for documento in documentos:
+            arquivados += _arquivar_documento(db, especificacao, documento)
+        lotes += 1
+        if len(documentos) < lote:
+            progresso.update_one({"_id": especificacao.colecao}, {"$set": {
+                "apos_id": None, "limite": limite, "concluido_em": datetime.utcnow(),
+            }}, upsert=True)
+            return arquivados, True
+        apos_id = documentos[-1]["_id"]
+        progresso.update_one({"_id": especificacao.colecao}, {"$set": {
+            "apos_id": apos_id, "limite": limite, "atualizado_em": datetime.utcnow(),
+        }}, upsert=True)
+    return arquivados, False
+
+
+@tarefas.tarefa('arquivar', concorrencia=1, timeout_s=1800)
+def arquivar(db, lote=200, max_lotes=50):
+    """Uma etapa do arquivamento; se não terminou, agenda a continuação imediatamente"""
+    corte = limite()
+    resultado = {"limite": corte}
+    terminou = True
+    for especificacao in ARQUIVOS:
+        arquivados, fim = arquivar_colecao(db, especificacao, corte, lote, max_lotes)
+        resultado[especificacao.campo] = arquivados
+        terminou = terminou and fim
+    tarefas.enfileirar_unica(db, 'arquivar', {"lote": lote, "max_lotes": max_lotes},
+                             atraso_s=0 if not terminou else intervalo_s)
+    return dict(resultado, terminou=terminou)
+
+
+def agendar(db):
+    """Garante que há um arquivamento na fila (chamado na inicialização)"""
+    if horizonte_dias > 0:
+        tarefas.enfileirar_unica(db, 'arquivar')
+
+
+def mesclar(db, especificacao, id, mapa):
+    """Acrescenta ao mapa data → hora os dias arquivados do documento `id`"""
+    arquivados = {}
+    for documento in db[especificacao.arquivo].find({especificacao.chave: ObjectId(id)}, {especificacao.campo: 1}):
+        arquivados.update(documento.get(especificacao.campo) or {})
+    # Um dia alterado depois de arquivado aparece também no documento vivo: vale o vivo
+    arquivados.update(mapa or {})
+    return dict(sorted(arquivados.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--horizonte', type=int, default=horizonte_dias, help='dias mantidos nos documentos vivos')
+    parser.add_argument('--lote', type=int, default=200)
+    parser.add_argument('--clinica', help='só esta clínica, com várias clínicas (padrão: todas)')
+    args = parser.parse_args()
+
+    import clinicas
+    from database import banco, garantir_indices
+
+    selecionadas = [clinicas.resolver(args.clinica)] if args.clinica else sorted(clinicas.clinicas) or [None]
+    corte = limite(horizonte=args.horizonte)
+    for clinica in selecionadas:
+        db = banco('escrita', clinica)
+        garantir_indices(db)
+        for especificacao in ARQUIVOS:
+            arquivados, _ = arquivar_colecao(db, especificacao, corte, args.lote)
+            print(f"{db.name}.{especificacao.colecao}: {arquivados} dias anteriores a {corte} "
+                  f"arquivados em {especificacao.arquivo}")
+
+
+if __name__ == '__main__':
+    main()
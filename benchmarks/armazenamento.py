@@ -0,0 +1,129 @@
+"""
+Operações por segundo de cada motor de armazenamento (repositorios.py).
+
+Executa: python -m benchmarks.armazenamento [--banco mongomock|mongod|uri] [--medicos 200]
+                                            [--dias 30] [--operacoes 5000] [--clientes 1]
+
+Mede, pelos mesmos repositórios que as rotas usam, o cadastro de médicos, a
+criação das agendas (`POST /medicos/<id>/horarios`), a alteração de um
+horário (`PUT .../horarios`), a leitura da agenda de um médico e a listagem
+de médicos, com o SQLite (arquivo temporário, repositorios_sqlite.py), o
+MongoDB e o motor em memória como referência. `--clientes` threads dividem
+as alterações e leituras.
+
+Com `--banco mongomock` o "MongoDB" roda em Python no próprio processo e o
+resultado não diz nada sobre um mongod; para comparar de verdade use
+`--banco mongod` (pymongo_inmemory) ou `--banco uri` com MONGO_URI. O banco
+usado é descartável (`--db`, recriado a cada execução).
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.carga import _configurar_banco
+
+HORAS = [f"{8 + i // 2:02d}:{30 * (i % 2):02d}" for i in range(20)]
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+
+
+def _agenda(dias):
+    return {f"2025-{11 + d // 30:02d}-{1 + d % 30:02d}": {hora: dict(LIVRE) for hora in HORAS} for d in range(dias)}
+
+
+def _em_paralelo(funcao, total, clientes, seed):
+    """Executa `funcao(rng)` `total` vezes divididas entre as threads; retorna operações/s"""
+    por_cliente = total // clientes
+
+    def cliente(i):
+        rng = random.Random(seed + i)
+        for _ in range(por_cliente):
+            funcao(rng)
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return por_cliente * clientes / (time.perf_counter() - inicio)
+
+
+def _cronometrar(funcao, quantidade):
+    inicio = time.perf_counter()
+    funcao()
+    return quantidade / (time.perf_counter() - inicio)
+
+
+def medir(repo, args):
+    """Operações por segundo de cada etapa, na ordem"""
+    import busca
+
+    resultado = {}
+    medicos = []
+    for i in range(args.medicos):
+        medico = {"nome": f"Dr. {i}", "cpf": f"{i:011d}", "crm": f"{i}-SP", "especialidade": "Cardiologia",
+                  "horarios": {}, "versao": 1}
+        medico.update(busca.campos_de_busca_medico(medico))
+        medicos.append(medico)
+    ids = []
+    resultado["cadastrar médico"] = _cronometrar(lambda: ids.extend(repo.medicos.criar(m) for m in medicos),
+                                                 args.medicos)
+    agenda = _agenda(args.dias)
+    datas = list(agenda)
+    resultado["criar agenda"] = _cronometrar(lambda: [repo.horarios.adicionar_dias(id, agenda) for id in ids],
+                                             args.medicos)
+    ocupado = {"status": "ocupado", "paciente": "Paciente"}
+    resultado["alterar horário"] = _em_paralelo(
+        lambda rng: repo.horarios.alterar(rng.choice(ids), rng.choice(datas), rng.choice(HORAS), ocupado),
+        args.operacoes, args.clientes, args.seed,
+    )
+    resultado["ler agenda"] = _em_paralelo(
+        lambda rng: repo.horarios.obter(rng.choice(ids)), args.operacoes, args.clientes, args.seed,
+    )
+    resultado["listar médicos"] = _cronometrar(lambda: list(repo.medicos.listar()), 1)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--banco', choices=('mongomock', 'mongod', 'uri'), default='mongomock')
+    parser.add_argument('--db', default='clinica_armazenamento')
+    parser.add_argument('--medicos', type=int, default=200)
+    parser.add_argument('--dias', type=int, default=30)
+    parser.add_argument('--operacoes', type=int, default=5000)
+    parser.add_argument('--clientes', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    mongod = _configurar_banco(args)
+    try:
+        import database
+        import repositorios
+        import repositorios_sqlite
+
+        db = database.get_client()[args.db]
+        for nome in ('medicos', 'pacientes', 'admins'):
+            db[nome].drop()
+        with tempfile.TemporaryDirectory() as pasta:
+            motores = {
+                "sqlite": repositorios_sqlite.Sqlite(os.path.join(pasta, 'clinica.db')),
+                f"mongo ({args.banco})": repositorios.Mongo(db),
+                "memória": repositorios.Memoria(),
+            }
+            resultados = {nome: medir(repo, args) for nome, repo in motores.items()}
+    finally:
+        if mongod is not None:
+            mongod.stop()
+
+    print(f"{args.medicos} médicos, {args.dias} dias de {len(HORAS)} horários, "
+          f"{args.operacoes} operações, {args.clientes} cliente(s) (operações/s)")
+    print(f"  {'':18}" + "".join(f"{nome:>20}" for nome in resultados))
+    for etapa in next(iter(resultados.values())):
+        print(f"  {etapa:18}" + "".join(f"{r[etapa]:20.0f}" for r in resultados.values()))
+
+
+if __name__ == '__main__':
+    main()
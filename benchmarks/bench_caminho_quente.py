@@ -0,0 +1,161 @@
+"""
+Micro-benchmarks do caminho quente das requisições (pytest-benchmark).
+
+Executa: python -m pytest benchmarks/bench_caminho_quente.py --benchmark-only
+
+Cada benchmark isola uma parte do custo de uma requisição, com dados
+sintéticos de tamanho fixo e sem rede: o banco é substituído por objetos que
+devolvem documentos prontos (ver `_Colecao`), então o tempo medido é o da
+aplicação e não o do MongoDB. Os benchmarks com o motor em memória
+(`repositorios.Memoria`) medem a requisição inteira pelo cliente de teste.
+
+Para salvar um baseline e comparar com ele (falha se a mediana piorar mais de 25%):
+
+    python -m pytest benchmarks/bench_caminho_quente.py --benchmark-only \\
+        --benchmark-storage=file://benchmarks/baselines --benchmark-save=caminho_quente
+    python -m pytest benchmarks/bench_caminho_quente.py --benchmark-only \\
+        --benchmark-storage=file://benchmarks/baselines --benchmark-compare \\
+        --benchmark-compare-fail=median:25%
+"""
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import bson
+import pytest
+from bson import ObjectId
+
+import app as aplicacao
+import repositorios
+
+TAMANHOS_LISTA = [100, 1000, 10000]
+DIAS_AGENDA = 90
+DIAS_POR_POST = 7
+HORAS = [f"{h:02d}:{m:02d}" for h in range(8, 18) for m in (0, 30)]
+ADMIN = {"_id": ObjectId(), "username": "admin", "role": "admin"}
+
+
+class _Colecao:
+    """Collection em memória.
+
+    `find` devolve cópias rasas, para medir só o laço da rota; `find_one` e
+    `update_one` decodificam/codificam BSON como o driver faria, já que na
+    mescla de horários o custo está em ler e reenviar a agenda inteira.
+    """
+
+    def __init__(self, documentos=(), um=None):
+        self.documentos = list(documentos)
+        self.um = bson.encode(um) if um is not None else None
+
+    def find(self, filtro=None, projecao=None):
+        return (dict(d) for d in self.documentos)
+
+    def find_one(self, filtro=None, projecao=None):
+        return bson.decode(self.um) if self.um is not None else None
+
+    def update_one(self, filtro, atualizacao):
+        bson.encode(atualizacao)
+        return SimpleNamespace(matched_count=1, modified_count=1)
+
+
+class _Banco(dict):
+    def __missing__(self, nome):
+        return _Colecao()
+
+
+def _agenda(dias, inicio=date(2025, 11, 3)):
+    return {
+        (inicio + timedelta(days=i)).isoformat(): {
+            hora: {"status": "disponível", "paciente": "nenhum"} for hora in HORAS
+        }
+        for i in range(dias)
+    }
+
+
+def _pacientes(n):
+    return [
+        {"_id": ObjectId(), "nome": f"Paciente {i}", "cpf": f"{i:011d}", "celular": "(11) 99999-0000",
+         "idade": i % 100, "consultas": {}}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def banco():
+    banco = _Banco(admins=_Colecao(um=ADMIN))
+    with patch.object(aplicacao, "connect_db", return_value=banco):
+        yield banco
+
+
+@pytest.fixture
+def cabecalho():
+    return {"Authorization": f"Bearer {aplicacao.generate_token('admin')}"}
+
+
+def test_generate_token(benchmark):
+    token = benchmark(aplicacao.generate_token, "admin")
+    assert token.count('.') == 2
+
+
+def test_verificar_token(benchmark, banco, cabecalho):
+    """JWT decode + consulta do admin"""
+    with aplicacao.app.test_request_context('/medicos', headers=cabecalho):
+        assert benchmark(aplicacao._verificar_token) is None
+
+
+def test_token_required(benchmark, banco, cabecalho):
+    """Decorator completo, incluindo a métrica de latência da autenticação"""
+    protegida = aplicacao.token_required(lambda: ({}, 200))
+    with aplicacao.app.test_request_context('/medicos', headers=cabecalho):
+        assert benchmark(protegida) == ({}, 200)
+
+
+@pytest.mark.parametrize("n", TAMANHOS_LISTA)
+def test_listar_pacientes(benchmark, banco, n):
+    """Laço que converte `_id` em string em GET /pacientes"""
+    banco['pacientes'] = _Colecao(_pacientes(n))
+    listar = aplicacao.get_pacientes.__wrapped__
+    with aplicacao.app.test_request_context('/pacientes'):
+        corpo, status = benchmark(listar)
+    assert status == 200 and len(corpo["pacientes"]) == n
+
+
+@pytest.mark.parametrize("n", TAMANHOS_LISTA)
+def test_listar_medicos(benchmark, banco, n):
+    banco['medicos'] = _Colecao([
+        {"_id": ObjectId(), "nome": f"Dr. {i}", "cpf": f"{i:011d}", "crm": f"{i}-SP",
+         "especialidade": "Cardiologia", "horarios": {}}
+        for i in range(n)
+    ])
+    listar = aplicacao.get_medicos.__wrapped__
+    with aplicacao.app.test_request_context('/medicos'):
+        corpo, status = benchmark(listar)
+    assert status == 200 and len(corpo["medicos"]) == n
+
+
+def test_mesclar_horarios(benchmark, banco):
+    """Leitura da agenda inteira + mescla dos dias enviados em POST /medicos/<id>/horarios"""
+    id = ObjectId()
+    banco['medicos'] = _Colecao(um={"_id": id, "nome": "Dr. Agenda", "horarios": _agenda(DIAS_AGENDA)})
+    novos = _agenda(DIAS_POR_POST, inicio=date(2026, 3, 2))
+    mesclar = aplicacao.post_horarios_medico.__wrapped__
+    with aplicacao.app.test_request_context(f'/medicos/{id}/horarios', method='POST', json=novos):
+        assert benchmark(mesclar, str(id))[1] == 201
+
+
+@pytest.fixture
+def memoria():
+    """Motor em memória (repositorios.py): a rota inteira, com autenticação e validação, sem banco"""
+    repo = repositorios.Memoria()
+    repo.admins.criar(dict(ADMIN))
+    with patch.object(aplicacao, "repositorio", return_value=repo):
+        yield repo
+
+
+def test_alterar_horario_em_memoria(benchmark, memoria, cabecalho):
+    """PUT /medicos/<id>/horarios completo, do JWT à resposta"""
+    id = memoria.medicos.criar({"nome": "Dr. Agenda", "cpf": "1", "crm": "1-SP", "horarios": _agenda(DIAS_AGENDA)})
+    corpo = {"data": "2025-11-05", "hora": "09:00", "info": {"status": "ocupado", "paciente": "Ana"}}
+    with aplicacao.app.test_client() as cliente:
+        resposta = benchmark(cliente.put, f"/medicos/{id}/horarios", json=corpo, headers=cabecalho)
+    assert resposta.status_code == 200
@@ -0,0 +1,95 @@
+"""
+Latência da busca de pacientes por prefixo (/pacientes/busca) em escala.
+
+Executa: python -m benchmarks.busca_pacientes [--pacientes 100000] [--consultas 2000]
+
+Usa o MongoDB de MONGO_URI e um banco descartável (`clinica_bench` por
+padrão), que é recriado a cada execução. Mostra p50/p95/p99 por tipo de
+termo e o plano usado por cada critério, para confirmar que nenhum faz COLLSCAN.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from pymongo import MongoClient
+
+import busca
+from benchmarks.nomes import NOMES, SOBRENOMES
+from database import INDICES, mongo_uri
+from slow_log import resumir_plano
+
+
+
+def _paciente(rng):
+    nome = f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+    cpf = ''.join(rng.choices('0123456789', k=11))
+    paciente = {
+        "nome": nome,
+        "cpf": f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}",
+        "celular": f"(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        "idade": rng.randint(0, 100),
+        "consultas": {},
+    }
+    paciente.update(busca.campos_de_busca(paciente))
+    return paciente
+
+
+def _percentis(amostras):
+    ordenadas = sorted(amostras)
+    def p(q):
+        return ordenadas[min(len(ordenadas) - 1, int(q * len(ordenadas)))] * 1000
+    return p(0.5), p(0.95), p(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pacientes', type=int, default=100000)
+    parser.add_argument('--consultas', type=int, default=2000)
+    parser.add_argument('--banco', default='clinica_bench')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    client = MongoClient(mongo_uri)
+    client.drop_database(args.banco)
+    collection = client[args.banco]['pacientes']
+    collection.create_indexes(INDICES['pacientes'])
+
+    inicio = time.perf_counter()
+    lote = []
+    for _ in range(args.pacientes):
+        lote.append(_paciente(rng))
+        if len(lote) == 10000:
+            collection.insert_many(lote, ordered=False)
+            lote = []
+    if lote:
+        collection.insert_many(lote, ordered=False)
+    print(f"{args.pacientes} pacientes inseridos em {time.perf_counter() - inicio:.1f}s")
+
+    termos = {
+        'nome': lambda: rng.choice(NOMES)[:rng.randint(2, 5)],
+        'nome_completo': lambda: f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)[:3]}",
+        'cpf': lambda: ''.join(rng.choices('0123456789', k=rng.randint(3, 6))),
+        'celular': lambda: f"(11) 9{rng.randint(10, 99)}",
+    }
+    for tipo, gerar in termos.items():
+        amostras = []
+        for _ in range(args.consultas):
+            q = gerar()
+            t0 = time.perf_counter()
+            busca.buscar_por_prefixo(collection, q)
+            amostras.append(time.perf_counter() - t0)
+        p50, p95, p99 = _percentis(amostras)
+        print(f"{tipo:14s} p50={p50:6.2f}ms p95={p95:6.2f}ms p99={p99:6.2f}ms "
+              f"média={statistics.mean(amostras) * 1000:6.2f}ms")
+
+    for campo, valor in (('nome_normalizado', 'jo'), ('cpf_digitos', '123'), ('celular_digitos', '119')):
+        plano = collection.find({campo: busca._prefixo(valor)}).sort(campo, 1).limit(10).explain()
+        print(f"plano {campo}: {resumir_plano(plano)}")
+
+    client.drop_database(args.banco)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Teste de carga HTTP: sobe a API num servidor local e mede throughput e latência por rota.
+
+Executa: python -m benchmarks.carga [--banco mongomock|mongod|uri] [--duracao 30] [--clientes 16]
+                                    [--salvar ARQUIVO] [--comparar ARQUIVO]
+
+O banco pode ser:
+
+- `mongomock` (padrão): banco em memória no próprio processo (`MONGO_URI=mongomock://`);
+  não precisa de nada instalado além das dependências de teste, mas mede a
+  aplicação e não o MongoDB. O mongomock não é totalmente thread-safe, então
+  listagens concorrentes com escritas podem dar alguns 500 esporádicos;
+- `mongod`: um mongod descartável iniciado pelo `pymongo_inmemory` (baixa o
+  binário na primeira execução);
+- `uri`: o MongoDB de MONGO_URI, num banco descartável (`--db`, recriado a cada execução).
+
+Os dados vêm de `gerar_dados.py` com `--seed` fixo, e cada cliente é uma thread com
+conexão keep-alive que sorteia as requisições de `MIX` pelos pesos. O
+resultado pode ser salvo em JSON (`--salvar`) e comparado com uma execução
+anterior (`--comparar`): a saída é 1 se o p95 de alguma rota piorou ou o
+throughput caiu mais que `--tolerancia`, ou se a taxa de erros subiu mais
+de um ponto percentual.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.nomes import NOMES
+from gerar_dados import HORAS_SEMANA as HORAS, gerar_medicos, gerar_pacientes
+
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'Admin@123'
+INICIO_AGENDA = date(2025, 11, 3)
+
+# (rota, método, peso); a rota é o padrão usado no relatório e no baseline
+MIX = [
+    ('/auth/login', 'POST', 2),
+    ('/medicos', 'GET', 10),
+    ('/medicos/<id>', 'GET', 15),
+    ('/medicos/<id>/horarios', 'GET', 15),
+    ('/medicos/<id>/horarios', 'PUT', 5),
+    ('/pacientes', 'GET', 5),
+    ('/pacientes/<id>', 'GET', 18),
+    ('/pacientes/<id>/consultas', 'GET', 20),
+    ('/pacientes/<id>/consultas', 'PUT', 10),
+]
+
+
+def _configurar_banco(args):
+    """Aponta MONGO_URI/DB_NAME para o banco escolhido antes de importar a aplicação"""
+    if args.banco == 'mongomock':
+        os.environ['MONGO_URI'] = 'mongomock://'
+        return None
+    if args.banco == 'mongod':
+        try:
+            from pymongo_inmemory import Mongod
+        except ImportError:
+            sys.exit("--banco mongod precisa do pacote pymongo_inmemory (pip install pymongo_inmemory)")
+        mongod = Mongod()
+        mongod.start()
+        os.environ['MONGO_URI'] = mongod.connection_string
+        return mongod
+    if 'MONGO_URI' not in os.environ:
+        sys.exit("--banco uri precisa de MONGO_URI definida")
+    return None
+
+
+def _semear(db, args):
+    from flask_bcrypt import Bcrypt
+
+    for nome in ('admins', 'medicos', 'pacientes'):
+        db[nome].drop()
+    db['admins'].insert_one({
+        "username": ADMIN_USERNAME,
+        "password": Bcrypt().generate_password_hash(ADMIN_PASSWORD).decode('utf-8'),
+        "role": "admin",
+        "created_at": datetime.utcnow(),
+    })
+
+    fim = INICIO_AGENDA + timedelta(days=args.dias - 1)
+    medicos, consultas = gerar_medicos(args.medicos, args.pacientes, INICIO_AGENDA, fim, args.seed)
+    ids_medicos = db['medicos'].insert_many(medicos).inserted_ids
+    ids_pacientes = db['pacientes'].insert_many(gerar_pacientes(args.pacientes, consultas, args.seed)).inserted_ids
+    dias = sorted({dia for medico in medicos for dia in medico["horarios"]})
+    return [str(i) for i in ids_medicos], [str(i) for i in ids_pacientes], dias
+
+
+def _requisicao(rota, metodo, rng, ids_medicos, ids_pacientes, dias):
+    """Caminho e corpo de uma requisição sorteada"""
+    if rota == '/auth/login':
+        return rota, {"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}
+    if rota.startswith('/medicos/<id>'):
+        caminho = rota.replace('<id>', rng.choice(ids_medicos))
+        if metodo == 'PUT':
+            status = rng.choice(("ocupado", "disponível"))
+            return caminho, {"data": rng.choice(dias), "hora": rng.choice(HORAS),
+                             "info": {"status": status, "paciente": rng.choice(NOMES)}}
+        return caminho, None
+    if rota.startswith('/pacientes/<id>'):
+        caminho = rota.replace('<id>', rng.choice(ids_pacientes))
+        if metodo == 'PUT':
+            return caminho, {"data": rng.choice(dias), "hora": rng.choice(HORAS),
+                             "detalhes": {"medico": "Dr(a). Carga", "status": "confirmado"}}
+        return caminho, None
+    return rota, None
+
+
+class _Cliente(threading.Thread):
+    def __init__(self, porta, token, fim, seed, dados, amostras):
+        super().__init__(daemon=True)
+        self.porta = porta
+        self.token = token
+        self.fim = fim
+        self.rng = random.Random(seed)
+        self.dados = dados
+        self.amostras = amostras
+        self.rotas = [(rota, metodo) for rota, metodo, _ in MIX]
+        self.pesos = [peso for _, _, peso in MIX]
+
+    def run(self):
+        conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=30)
+        headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
+        while time.perf_counter() < self.fim:
+            rota, metodo = self.rng.choices(self.rotas, self.pesos)[0]
+            caminho, corpo = _requisicao(rota, metodo, self.rng, *self.dados)
+            inicio = time.perf_counter()
+            try:
+                conexao.request(metodo, caminho, body=json.dumps(corpo) if corpo else None, headers=headers)
+                resposta = conexao.getresponse()
+                resposta.read()
+                status = resposta.status
+            except (OSError, http.client.HTTPException):
+                conexao.close()
+                conexao = http.client.HTTPConnection('127.0.0.1', self.porta, timeout=30)
+                status = 0
+            self.amostras.append((f"{metodo} {rota}", time.perf_counter() - inicio, status))
+        conexao.close()
+
+
+def _login(porta):
+    conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+    conexao.request('POST', '/auth/login', body=json.dumps({"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}),
+                    headers={"Content-Type": "application/json"})
+    resposta = conexao.getresponse()
+    corpo = json.loads(resposta.read())
+    conexao.close()
+    if resposta.status != 200:
+        sys.exit(f"Login falhou ({resposta.status}): {corpo}")
+    return corpo["token"]
+
+
+def _resumir(amostras, duracao):
+    por_rota = {}
+    for rota, segundos, status in amostras:
+        por_rota.setdefault(rota, []).append((segundos, status))
+
+    def estatisticas(itens):
+        tempos = sorted(s for s, _ in itens)
+        def p(q):
+            return round(tempos[min(len(tempos) - 1, int(q * len(tempos)))] * 1000, 2)
+        return {
+            "requisicoes": len(itens),
+            "rps": round(len(itens) / duracao, 1),
+            "erros": sum(1 for _, status in itens if status == 0 or status >= 500),
+            "p50_ms": p(0.5),
+            "p95_ms": p(0.95),
+            "p99_ms": p(0.99),
+        }
+
+    rotas = {rota: estatisticas(itens) for rota, itens in sorted(por_rota.items())}
+    total = estatisticas([(s, status) for _, s, status in amostras]) if amostras else {}
+    return rotas, total
+
+
+def _imprimir(rotas, total):
+    print(f"{'rota':<36} {'req':>7} {'req/s':>8} {'erros':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for rota, e in list(rotas.items()) + [('TOTAL', total)]:
+        print(f"{rota:<36} {e['requisicoes']:>7} {e['rps']:>8} {e['erros']:>6} "
+              f"{e['p50_ms']:>8} {e['p95_ms']:>8} {e['p99_ms']:>8}")
+
+
+def comparar(atual, baseline, tolerancia):
+    """Lista as regressões de `atual` em relação a `baseline` (dicionários do JSON salvo)"""
+    regressoes = []
+    for rota, base in baseline["rotas"].items():
+        agora = atual["rotas"].get(rota)
+        if agora is None:
+            continue
+        if agora["p95_ms"] > base["p95_ms"] * (1 + tolerancia):
+            regressoes.append(f"{rota}: p95 {base['p95_ms']} -> {agora['p95_ms']} ms")
+        if agora["rps"] < base["rps"] * (1 - tolerancia):
+            regressoes.append(f"{rota}: req/s {base['rps']} -> {agora['rps']}")
+        taxa_base = base["erros"] / max(1, base["requisicoes"])
+        taxa_agora = agora["erros"] / max(1, agora["requisicoes"])
+        if taxa_agora > taxa_base + 0.01:
+            regressoes.append(f"{rota}: erros {taxa_base:.1%} -> {taxa_agora:.1%}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--banco', choices=('mongomock', 'mongod', 'uri'), default='mongomock')
+    parser.add_argument('--db', default='clinica_carga')
+    parser.add_argument('--duracao', type=float, default=30)
+    parser.add_argument('--aquecimento', type=float, default=3)
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--medicos', type=int, default=50)
+    parser.add_argument('--pacientes', type=int, default=2000)
+    parser.add_argument('--dias', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--salvar')
+    parser.add_argument('--comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    args = parser.parse_args()
+
+    mongod = _configurar_banco(args)
+    os.environ['DB_NAME'] = args.db
+    # Os dados sintéticos são de datas fixas: sem isso o arquivamento os tiraria da agenda durante o teste
+    os.environ.setdefault('ARQUIVO_HORIZONTE_DIAS', '0')
+    try:
+        from werkzeug.serving import make_server
+
+        import app as aplicacao
+        import database
+
+        dados = _semear(database.get_client()[args.db], args)
+
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        servidor = make_server('127.0.0.1', 0, aplicacao.app, threaded=True)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        token = _login(servidor.port)
+
+        for fase, duracao in (('aquecimento', args.aquecimento), ('medição', args.duracao)):
+            amostras = []
+            fim = time.perf_counter() + duracao
+            clientes = [_Cliente(servidor.port, token, fim, args.seed + i, dados, amostras)
+                        for i in range(args.clientes)]
+            inicio = time.perf_counter()
+            for cliente in clientes:
+                cliente.start()
+            for cliente in clientes:
+                cliente.join()
+            decorrido = time.perf_counter() - inicio
+        servidor.shutdown()
+    finally:
+        if mongod is not None:
+            mongod.stop()
+
+    rotas, total = _resumir(amostras, decorrido)
+    _imprimir(rotas, total)
+    resultado = {
+        "meta": {
+            "banco": args.banco,
+            "clientes": args.clientes,
+            "duracao_s": round(decorrido, 1),
+            "medicos": args.medicos,
+            "pacientes": args.pacientes,
+            "dias": args.dias,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "data": datetime.now().isoformat(timespec='seconds'),
+        },
+        "rotas": rotas,
+        "total": total,
+    }
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"Resultado salvo em {args.salvar}")
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            baseline = json.load(arquivo)
+        for chave in ('banco', 'clientes', 'medicos', 'pacientes', 'dias'):
+            if baseline["meta"].get(chave) != resultado["meta"][chave]:
+                print(f"AVISO: {chave} difere do baseline ({baseline['meta'].get(chave)} x {resultado['meta'][chave]})")
+        regressoes = comparar(resultado, baseline, args.tolerancia)
+        for regressao in regressoes:
+            print(f"REGRESSÃO {regressao}")
+        if regressoes:
+            sys.exit(1)
+        print(f"Sem regressões em relação a {args.comparar} (tolerância {args.tolerancia:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Tamanho em BSON e tempo de busca de horários livres: formato original x grade compacta.
+
+Executa: python -m benchmarks.grade [--medicos 200] [--dias 90] [--horas 20] [--repeticoes 20]
+
+Não precisa de banco: as agendas são sintéticas (`--horas` horários de 30
+minutos por dia a partir das 08:00, cerca de 60% ocupados). O tamanho é o
+do documento do médico codificado em BSON; a busca procura os horários
+livres de todos os médicos no período inteiro, pela manhã, percorrendo os
+mapas (formato original) ou com `grade.horarios_livres` (dias compactos).
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import bson
+
+import grade
+
+
+def _agenda(rng, dias, horas):
+    inicio = date(2025, 11, 3)
+    agenda = {}
+    for d in range(dias):
+        slots = {}
+        for i in range(horas):
+            hora = grade.HORAS[16 + i]
+            if rng.random() < 0.6:
+                slots[hora] = {"status": "ocupado", "paciente": f"Paciente {rng.randrange(100000)}"}
+            else:
+                slots[hora] = dict(grade.LIVRE)
+        agenda[(inicio + timedelta(days=d)).isoformat()] = slots
+    return agenda
+
+
+def _livres_no_mapa(medicos, hora_ate):
+    resultado = {}
+    for i, horarios in enumerate(medicos):
+        for data, dia in horarios.items():
+            horas = [h for h, info in dia.items() if grade.livre(info) and h <= hora_ate]
+            if horas:
+                resultado.setdefault(i, {})[data] = sorted(horas)
+    return resultado
+
+
+def _livres_na_grade(medicos, hora_ate):
+    return grade.horarios_livres(
+        ((i, data, dia) for i, horarios in enumerate(medicos) for data, dia in horarios.items()),
+        hora_ate=hora_ate,
+    )
+
+
+def _tempo(funcao, medicos, repeticoes):
+    amostras = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        resultado = funcao(medicos, '12:00')
+        amostras.append(time.perf_counter() - t0)
+    amostras.sort()
+    return resultado, amostras[len(amostras) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--medicos', type=int, default=200)
+    parser.add_argument('--dias', type=int, default=90)
+    parser.add_argument('--horas', type=int, default=20, help='horários por dia (máx. 32)')
+    parser.add_argument('--repeticoes', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    mapas = [_agenda(rng, args.dias, args.horas) for _ in range(args.medicos)]
+    grades = [{data: grade.compactar_dia(dia) for data, dia in horarios.items()} for horarios in mapas]
+
+    def tamanho(horarios):
+        return len(bson.encode({"_id": bson.ObjectId(), "nome": "Dr. Fulano", "horarios": horarios}))
+
+    for nome, medicos in (("original", mapas), ("grade", grades)):
+        total = sum(tamanho(horarios) for horarios in medicos)
+        print(f"{nome:>8}: {total / len(medicos) / 1024:8.1f} KB/médico | "
+              f"{total / len(medicos) / args.dias:7.0f} B/dia | total {total / 2**20:7.1f} MB")
+
+    esperado, mapa_ms = _tempo(_livres_no_mapa, mapas, args.repeticoes)
+    obtido, grade_ms = _tempo(_livres_na_grade, grades, args.repeticoes)
+    assert obtido == esperado
+    dias = args.medicos * args.dias
+    print(f"livres até 12:00 em {dias} dias: original {mapa_ms:8.2f}ms | grade {grade_ms:8.2f}ms "
+          f"({mapa_ms / grade_ms:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
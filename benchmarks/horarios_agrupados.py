@@ -0,0 +1,126 @@
+"""
+Alterações de horários por segundo, com e sem o agrupador (agrupamento.py).
+
+Executa: python -m benchmarks.horarios_agrupados [--banco mongomock|mongod|uri] [--clientes 32]
+                                                 [--medicos 20] [--duracao 5] [--janela-ms 5] [--rtt-ms 1]
+
+Cada cliente é uma thread que altera horários de médicos sorteados, como
+`PUT /medicos/<id>/horarios` faz: sem agrupamento chamando
+`grade.alterar_horario`, com agrupamento esperando a confirmação do lote
+(`AgrupadorHorarios.alterar(...).result()`). Poucos médicos e muitos
+clientes reproduzem o pico de marcações da manhã.
+
+Com `--banco mongomock` o banco roda no próprio processo e não há ida e
+volta pela rede, que é justamente o que o agrupamento economiza: cada
+comando espera `--rtt-ms` antes de ir ao banco. Com `mongod`/`uri` use
+`--rtt-ms 0`. O banco usado é descartável (`--db`, recriado a cada execução).
+O mongomock gasta CPU do próprio processo em cada comando, então com ele o
+número mais estável é o de comandos enviados por alteração.
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.carga import _configurar_banco
+
+HORAS = [f"{8 + i // 2:02d}:{30 * (i % 2):02d}" for i in range(20)]
+DATAS = [f"2025-11-{d:02d}" for d in range(3, 8)]
+
+
+class _ComLatencia:
+    """Collection que conta os comandos e faz cada um esperar um tempo de ida e volta pela rede"""
+
+    def __init__(self, colecao, rtt_s):
+        self._colecao = colecao
+        self._rtt_s = rtt_s
+        self.full_name = colecao.full_name
+        self.comandos = 0
+
+    def __getattr__(self, nome):
+        metodo = getattr(self._colecao, nome)
+
+        def chamada(*args, **kwargs):
+            self.comandos += 1
+            time.sleep(self._rtt_s)
+            return metodo(*args, **kwargs)
+        return chamada
+
+
+def _compatibilizar_mongomock():
+    """O mongomock 4.3 não aceita o `sort` que o UpdateOne do PyMongo 4.11+ repassa ao bulk"""
+    from mongomock.collection import BulkOperationBuilder
+
+    original = BulkOperationBuilder.add_update
+
+    def add_update(self, selector, doc, *args, sort=None, **kwargs):
+        return original(self, selector, doc, *args, **kwargs)
+    BulkOperationBuilder.add_update = add_update
+
+
+def _medir(alterar, colecao, ids, clientes, duracao, seed):
+    """Alterações por segundo e comandos enviados ao banco por alteração"""
+    colecao.comandos = 0
+    contagens = [0] * clientes
+    fim = time.perf_counter() + duracao
+
+    def cliente(i):
+        rng = random.Random(seed + i)
+        while time.perf_counter() < fim:
+            alterar(rng.choice(ids), rng.choice(DATAS), rng.choice(HORAS),
+                    {"status": "ocupado", "paciente": f"Paciente {rng.randrange(1000)}"})
+            contagens[i] += 1
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total = sum(contagens)
+    return total / (time.perf_counter() - inicio), colecao.comandos / max(total, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--banco', choices=('mongomock', 'mongod', 'uri'), default='mongomock')
+    parser.add_argument('--db', default='clinica_agrupamento')
+    parser.add_argument('--clientes', type=int, default=32)
+    parser.add_argument('--medicos', type=int, default=20)
+    parser.add_argument('--duracao', type=float, default=5)
+    parser.add_argument('--janela-ms', type=float, default=5)
+    parser.add_argument('--rtt-ms', type=float, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    mongod = _configurar_banco(args)
+    try:
+        import agrupamento
+        import database
+        import grade
+
+        if args.banco == 'mongomock':
+            _compatibilizar_mongomock()
+        db = database.get_client()[args.db]
+        db['medicos'].drop()
+        ids = db['medicos'].insert_many([{"nome": f"Dr. {i}", "horarios": {}} for i in range(args.medicos)]).inserted_ids
+        colecao = _ComLatencia(db['medicos'], args.rtt_ms / 1000)
+
+        sem = _medir(lambda *a: grade.alterar_horario(colecao, *a), colecao, ids, args.clientes, args.duracao,
+                     args.seed)
+        agrupador = agrupamento.AgrupadorHorarios(janela_ms=args.janela_ms)
+        com = _medir(lambda *a: agrupador.alterar(colecao, *a).result(), colecao, ids, args.clientes, args.duracao,
+                     args.seed)
+        agrupador.fechar()
+    finally:
+        if mongod is not None:
+            mongod.stop()
+
+    print(f"{args.clientes} clientes, {args.medicos} médicos, rtt {args.rtt_ms}ms")
+    print(f"  sem agrupamento: {sem[0]:9.0f} alterações/s | {sem[1]:5.2f} comandos/alteração")
+    print(f"  com agrupamento: {com[0]:9.0f} alterações/s | {com[1]:5.2f} comandos/alteração "
+          f"(janela {args.janela_ms}ms, {com[0] / sem[0]:4.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
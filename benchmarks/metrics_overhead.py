@@ -0,0 +1,74 @@
+"""
+Mede o custo adicionado pelas métricas ao caminho de cada requisição.
+
+Executa: python -m benchmarks.metrics_overhead [--requisicoes 20000]
+
+Compara duas aplicações Flask idênticas (com e sem `metrics.init_app`) e
+também o custo isolado de `Histogram.observe` e do par started/succeeded do
+listener de comandos do PyMongo.
+"""
+import argparse
+import time
+import timeit
+from types import SimpleNamespace
+
+from flask import Flask
+
+import metrics
+
+
+def _criar_app(com_metricas):
+    app = Flask(__name__)
+
+    @app.route('/medicos/<id>')
+    def rota(id):
+        return {"id": id}, 200
+
+    if com_metricas:
+        metrics.init_app(app)
+    return app
+
+
+def _tempo_por_requisicao(app, requisicoes):
+    client = app.test_client()
+    for _ in range(500):  # aquecimento
+        client.get('/medicos/1')
+    inicio = time.perf_counter()
+    for i in range(requisicoes):
+        client.get(f'/medicos/{i}')
+    return (time.perf_counter() - inicio) / requisicoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requisicoes', type=int, default=20000)
+    args = parser.parse_args()
+
+    hist = metrics.Histogram('bench_seconds', 'bench', ('method', 'route'))
+    n = 200000
+    observe = timeit.timeit(lambda: hist.observe(0.0042, 'GET', '/medicos/<id>'), number=n) / n
+
+    listener = metrics.CommandTimer()
+    started = SimpleNamespace(command_name='find', command={'find': 'medicos'},
+                              connection_id=('localhost', 27017), request_id=1)
+    succeeded = SimpleNamespace(command_name='find', connection_id=('localhost', 27017),
+                                request_id=1, duration_micros=800)
+
+    def par_de_eventos():
+        listener.started(started)
+        listener.succeeded(succeeded)
+
+    comando = timeit.timeit(par_de_eventos, number=n) / n
+
+    sem = _tempo_por_requisicao(_criar_app(False), args.requisicoes)
+    com = _tempo_por_requisicao(_criar_app(True), args.requisicoes)
+
+    print(f'Histogram.observe:            {observe * 1e9:8.0f} ns')
+    print(f'listener started+succeeded:   {comando * 1e9:8.0f} ns')
+    print(f'requisição sem métricas:      {sem * 1e6:8.1f} us')
+    print(f'requisição com métricas:      {com * 1e6:8.1f} us')
+    print(f'overhead por requisição:      {(com - sem) * 1e6:8.1f} us ({(com - sem) / sem:.1%})')
+
+
+if __name__ == '__main__':
+    main()
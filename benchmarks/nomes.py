@@ -0,0 +1,6 @@
+"""Nomes usados pelos benchmarks para gerar pessoas sintéticas"""
+
+NOMES = ['João', 'José', 'Maria', 'Ana', 'Antônio', 'Francisco', 'Luíza', 'Márcia', 'Paulo', 'Pedro',
+         'Lucas', 'Letícia', 'Gabriel', 'Júlia', 'Rafael', 'Beatriz', 'Carlos', 'Fernanda', 'Álvaro', 'Cecília']
+SOBRENOMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima',
+              'Gomes', 'Conceição', 'Araújo', 'Ribeiro', 'Carvalho', 'Almeida', 'Lopes', 'Simões', 'Brandão']
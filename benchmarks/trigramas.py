@@ -0,0 +1,80 @@
+"""
+Memória, tempo de carga e latência do índice de trigramas (busca fuzzy).
+
+Executa: python -m benchmarks.trigramas [--tamanhos 100000 1000000] [--consultas 500]
+
+Não precisa de banco: os nomes são sintéticos e as consultas são nomes
+existentes com um erro de digitação e, em parte delas, sobrenomes trocados.
+A memória é medida com tracemalloc durante a carga.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+from benchmarks.nomes import NOMES, SOBRENOMES
+from trigramas import TrigramIndex
+from utils import normalizar_texto
+
+
+def _nome(rng):
+    partes = [rng.choice(NOMES)]
+    if rng.random() < 0.4:
+        partes.append(rng.choice(NOMES))
+    partes.extend(rng.sample(SOBRENOMES, rng.choice((1, 2, 2, 3))))
+    return ' '.join(partes)
+
+
+def _com_erro(rng, nome):
+    palavras = nome.split()
+    if len(palavras) > 2 and rng.random() < 0.3:
+        palavras[-1], palavras[-2] = palavras[-2], palavras[-1]
+    i = rng.randrange(len(palavras))
+    palavra = palavras[i]
+    if len(palavra) > 3:
+        j = rng.randrange(1, len(palavra))
+        palavras[i] = palavra[:j] + palavra[j + 1:]
+    return ' '.join(palavras)
+
+
+def _medir(tamanho, consultas, rng):
+    nomes = [_nome(rng) for _ in range(tamanho)]
+    ids = [ObjectId() for _ in range(tamanho)]
+    indice = TrigramIndex()
+
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    for oid, nome in zip(ids, nomes):
+        indice._inserir(oid, normalizar_texto(nome))
+    carga = time.perf_counter() - inicio
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    amostras = []
+    for _ in range(consultas):
+        q = _com_erro(rng, rng.choice(nomes))
+        t0 = time.perf_counter()
+        indice.buscar(q, limite=10)
+        amostras.append(time.perf_counter() - t0)
+    amostras.sort()
+    p = lambda q: amostras[min(len(amostras) - 1, int(q * len(amostras)))] * 1000
+
+    print(f"{tamanho:>9} nomes: carga {carga:6.1f}s | memória {memoria / 2**20:7.1f} MB "
+          f"({memoria / tamanho:5.0f} B/nome) | busca p50={p(0.5):6.2f}ms p95={p(0.95):6.2f}ms p99={p(0.99):6.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--consultas', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    for tamanho in args.tamanhos:
+        _medir(tamanho, args.consultas, random.Random(args.seed))
+
+
+if __name__ == '__main__':
+    main()
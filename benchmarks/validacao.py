@@ -0,0 +1,84 @@
+"""
+Custo da validação dos corpos das rotas de escrita (validacao.py), por rota.
+
+Executa: python -m benchmarks.validacao [--repeticoes 20000] [--dias 30]
+
+Não precisa de banco nem de servidor: mede `validacao.decodificar` com o
+mesmo esquema de cada rota, para um corpo válido e um inválido (que é
+recusado com 400). Os POSTs de agenda usam `--dias` dias de 20 horários.
+"""
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+import msgspec
+
+import validacao
+
+
+def _agenda(dias):
+    inicio = date(2025, 11, 3)
+    return {
+        (inicio + timedelta(days=d)).isoformat(): {
+            f"{8 + i // 2:02d}:{30 * (i % 2):02d}": {"status": "disponível", "paciente": "nenhum"} for i in range(20)
+        }
+        for d in range(dias)
+    }
+
+
+def _rotas(dias):
+    agenda = _agenda(dias)
+    invalida = dict(agenda, **{"2025-11-03": {"8h": "livre"}})
+    return [
+        ("POST /auth/login", validacao.Login,
+         {"username": "admin", "password": "Admin@123"}, {"username": "admin"}),
+        ("POST /medicos", validacao.NovoMedico,
+         {"nome": "Dr. Pedro", "cpf": "111.222.333-44", "crm": "5555-SP", "especialidade": "Ortopedia"},
+         {"nome": "Dr. Pedro", "cpf": 11122233344, "crm": "5555-SP", "especialidade": "Ortopedia"}),
+        ("PUT /medicos/<id>", validacao.AlteracaoMedico, {"especialidade": "Neurologia", "versao": 3}, {"nome": ""}),
+        ("POST /pacientes", validacao.NovoPaciente,
+         {"nome": "Maria Silva", "cpf": "123.456.789-00", "celular": "(11) 99999-0000", "idade": 30},
+         {"nome": "Maria Silva", "cpf": "123.456.789-00", "celular": "(11) 99999-0000", "idade": "30"}),
+        ("PUT /pacientes/<id>", validacao.AlteracaoPaciente, {"idade": 31}, {"idade": -1}),
+        (f"POST /medicos/<id>/horarios ({dias} dias)", validacao.Agenda, agenda, invalida),
+        ("PUT /medicos/<id>/horarios", validacao.AlteracaoHorario,
+         {"data": "2025-11-05", "hora": "10:00", "info": {"status": "ocupado", "paciente": "Ana"}},
+         {"data": "2025-11-05", "hora": "10h", "info": "Ana"}),
+        ("DELETE /medicos/<id>/horarios", validacao.Remocao, {"data": "2025-11-05", "hora": "10:00"}, {"hora": "10:00"}),
+        ("POST /medicos/<id>/horarios/expandir", validacao.ModeloAgenda,
+         {"de": "2025-11-03", "ate": "2026-01-30", "dias_semana": [0, 2, 4], "horas": ["08:00", "08:30", "09:00"]},
+         {"de": "2025-11-03", "ate": "2026-01-30", "dias_semana": [7], "horas": ["08:00"]}),
+        ("PUT /pacientes/<id>/consultas", validacao.AlteracaoConsulta,
+         {"data": "2025-11-06", "hora": "14:00", "detalhes": {"medico": "Dr. João", "status": "confirmado"}},
+         {"data": "06/11/2025", "hora": "14:00", "detalhes": "x"}),
+    ]
+
+
+def _medir(decodificador, corpo, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        try:
+            validacao.decodificar(decodificador, corpo)
+        except msgspec.ValidationError:
+            pass
+    return (time.perf_counter() - inicio) / repeticoes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeticoes', type=int, default=20000)
+    parser.add_argument('--dias', type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"{'rota':<42} {'bytes':>7} {'válido (µs)':>12} {'inválido (µs)':>14}")
+    for rota, esquema, valido, invalido in _rotas(args.dias):
+        decodificador = validacao.decoder(esquema)
+        corpo_valido, corpo_invalido = json.dumps(valido).encode(), json.dumps(invalido).encode()
+        repeticoes = max(100, args.repeticoes * 200 // max(len(corpo_valido), 200))
+        print(f"{rota:<42} {len(corpo_valido):>7} {_medir(decodificador, corpo_valido, repeticoes):>12.2f} "
+              f"{_medir(decodificador, corpo_invalido, repeticoes):>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Busca de pacientes para o campo de autocompletar da recepção.
+
+Cada paciente guarda campos derivados só para a busca (`nome_normalizado`,
+`cpf_digitos`, `celular_digitos`), mantidos por `post_paciente`/`put_paciente`
+e indexados (ver `database.INDICES`). A busca usa regex ancorada no início
+(`^prefixo`), que o MongoDB resolve como um intervalo no índice; cada critério
+é uma consulta pequena ordenada pelo próprio campo indexado e com `limit`, de
+modo que o custo não depende do tamanho da collection.
+
+Os médicos seguem a mesma ideia com `especialidade_normalizada`, usada pelo
+filtro `GET /medicos?especialidade=` e pela agregação de `GET /especialidades`.
+
+A busca aproximada (`fuzzy=1`) usa o índice de trigramas em memória de
+`trigramas.py`, que também é atualizado pelas rotas de escrita de pacientes.
+"""
+import re
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+import trigramas
+from utils import normalizar_texto, somente_digitos
+
+LIMITE_PADRAO = 10
+LIMITE_MAXIMO = 50
+TAMANHO_MINIMO = 2
+
+# Só o necessário para a lista de sugestões (sem o mapa de consultas)
+PROJECAO_BUSCA = {"nome": 1, "cpf": 1, "celular": 1, "idade": 1}
+# Campos internos que não aparecem nas respostas da API
+PROJECAO_SEM_CAMPOS_DE_BUSCA = {"nome_normalizado": 0, "cpf_digitos": 0, "celular_digitos": 0}
+PROJECAO_MEDICO_SEM_CAMPOS_DE_BUSCA = {"especialidade_normalizada": 0}
+
+# Especialidades distintas com a quantidade de médicos. O $sort pelo campo
+# indexado antes do $group permite ao MongoDB percorrer o índice em ordem.
+PIPELINE_ESPECIALIDADES = [
+    {"$match": {"especialidade_normalizada": {"$nin": [None, ""]}}},
+    {"$sort": {"especialidade_normalizada": 1}},
+    {"$group": {
+        "_id": "$especialidade_normalizada",
+        "especialidade": {"$first": "$especialidade"},
+        "medicos": {"$sum": 1},
+    }},
+    {"$sort": {"_id": 1}},
+    {"$project": {"_id": 0, "chave": "$_id", "especialidade": 1, "medicos": 1}},
+]
+
+_SEPARADORES_NUMERICOS = re.compile(r'[\s.\-/()+]')
+
+
+def campos_de_busca(dados):
+    """Campos derivados a gravar junto com os dados informados do paciente"""
+    campos = {}
+    if 'nome' in dados:
+        campos['nome_normalizado'] = normalizar_texto(dados['nome'])
+    if 'cpf' in dados:
+        campos['cpf_digitos'] = somente_digitos(dados['cpf'])
+    if 'celular' in dados:
+        campos['celular_digitos'] = somente_digitos(dados['celular'])
+    return campos
+
+
+def _prefixo(valor):
+    return {"$regex": "^" + re.escape(valor)}
+
+
+def buscar_por_prefixo(collection, q, limite=LIMITE_PADRAO):
+    """Retorna até `limite` pacientes ordenados por relevância (ver `buscar_por_prefixo_em`)"""
+    def consultar(campo, valor):
+        return collection.find(
+            {campo: _prefixo(valor)},
+            dict(PROJECAO_BUSCA, **{campo: 1}),
+        ).sort(campo, 1).limit(limite)
+
+    return buscar_por_prefixo_em(consultar, q, limite)
+
+
+def buscar_por_prefixo_em(consultar, q, limite=LIMITE_PADRAO):
+    """Busca por prefixo sobre `consultar(campo, prefixo)`, que devolve até `limite`
+    pacientes cujo `campo` começa por `prefixo`, em ordem de `campo`, com os
+    campos de `PROJECAO_BUSCA` e o próprio `campo`.
+
+    Termos numéricos (com ou sem pontuação) buscam por CPF e celular; os
+    demais buscam pelo nome sem acentos e sem diferenciar maiúsculas.
+    Ordem: correspondência exata de CPF/celular, prefixo de CPF, prefixo de
+    celular, nome exato e prefixo de nome.
+    """
+    criterios = []
+    if _SEPARADORES_NUMERICOS.sub('', q).isdigit():
+        digitos = somente_digitos(q)
+        criterios.append(('cpf_digitos', digitos, 0, 2))
+        criterios.append(('celular_digitos', digitos, 1, 3))
+    else:
+        nome = normalizar_texto(q)
+        if nome:
+            criterios.append(('nome_normalizado', nome, 4, 5))
+
+    encontrados = {}
+    for campo, valor, rank_exato, rank_prefixo in criterios:
+        for paciente in consultar(campo, valor):
+            chave = paciente.get(campo, '')
+            rank = rank_exato if chave == valor else rank_prefixo
+            atual = encontrados.get(paciente['_id'])
+            if atual is None or rank < atual[0]:
+                encontrados[paciente['_id']] = (rank, len(chave), chave, paciente)
+
+    ordenados = sorted(encontrados.values(), key=lambda item: item[:3])[:limite]
+    resultado = []
+    for rank, _, _, paciente in ordenados:
+        paciente = {k: v for k, v in paciente.items() if k in PROJECAO_BUSCA or k == '_id'}
+        paciente['_id'] = str(paciente['_id'])
+        resultado.append(paciente)
+    return resultado
+
+
+def buscar_aproximado(collection, q, limite=LIMITE_PADRAO, indice=None):
+    """Busca por similaridade de nome no índice de trigramas.
+
+    O índice devolve os ids e a similaridade; os dados vêm do MongoDB numa
+    única consulta por `_id`. Retorna None se o índice ainda não foi carregado.
+    """
+    if indice is None:
+        indice = trigramas.indice
+    if not indice.pronto:
+        return None
+    candidatos = indice.buscar(q, limite)
+    if not candidatos:
+        return []
+    documentos = {
+        str(p['_id']): p
+        for p in collection.find({"_id": {"$in": [ObjectId(id) for id, _ in candidatos]}}, PROJECAO_BUSCA)
+    }
+    resultado = []
+    for id, similaridade in candidatos:
+        paciente = documentos.get(id)
+        if paciente is not None:
+            paciente['_id'] = id
+            paciente['similaridade'] = similaridade
+            resultado.append(paciente)
+    return resultado
+
+
+def indexar_nome(id, nome, clinica=None):
+    """Mantém o índice de trigramas da clínica em dia após gravar o nome de um paciente"""
+    indice = trigramas.indices.de(clinica)
+    if trigramas.habilitado and indice.ativo:
+        indice.adicionar(id, nome)
+
+
+def desindexar(id, clinica=None):
+    indice = trigramas.indices.de(clinica)
+    if trigramas.habilitado and indice.ativo:
+        indice.remover(id)
+
+
+def campos_de_busca_medico(dados):
+    """Campo derivado usado pelo filtro de especialidade em GET /medicos"""
+    if 'especialidade' in dados:
+        return {'especialidade_normalizada': normalizar_texto(dados['especialidade'])}
+    return {}
+
+
+def _preencher(collection, campo, origem, derivar, lote):
+    pendentes = collection.find(
+        {campo: {"$exists": False}},
+        {k: 1 for k in origem},
+    ).batch_size(lote)
+    operacoes = []
+    total = 0
+    for documento in pendentes:
+        campos = derivar({k: documento.get(k) for k in origem})
+        operacoes.append(UpdateOne({"_id": documento["_id"]}, {"$set": campos}))
+        if len(operacoes) >= lote:
+            total += collection.bulk_write(operacoes, ordered=False).modified_count
+            operacoes = []
+    if operacoes:
+        total += collection.bulk_write(operacoes, ordered=False).modified_count
+    return total
+
+
+def preencher_campos_de_busca(collection, lote=1000):
+    """Preenche os campos derivados de pacientes cadastrados antes da busca existir"""
+    return _preencher(collection, "nome_normalizado", ('nome', 'cpf', 'celular'), campos_de_busca, lote)
+
+
+def preencher_especialidade_normalizada(collection, lote=1000):
+    """Preenche `especialidade_normalizada` de médicos cadastrados antes do filtro existir"""
+    return _preencher(collection, "especialidade_normalizada", ('especialidade',), campos_de_busca_medico, lote)
@@ -0,0 +1,97 @@
+"""
+Circuit breaker para o acesso ao MongoDB.
+
+Depois de `limite_falhas` falhas de conexão seguidas o circuito abre e as
+requisições passam a ser recusadas imediatamente (503 com `Retry-After`), em
+vez de cada uma esperar o timeout de seleção de servidor. Passado
+`tempo_aberto_s`, o circuito fica meio-aberto e deixa passar até
+`tentativas_meio_aberto` requisições de teste por janela: um sucesso fecha o
+circuito, uma falha o abre de novo.
+"""
+import math
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv('.cred')
+
+FECHADO = 'fechado'
+ABERTO = 'aberto'
+MEIO_ABERTO = 'meio_aberto'
+
+
+class CircuitoAberto(Exception):
+    """O banco foi considerado indisponível; tente de novo após `retry_after` segundos"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Circuito aberto; tente novamente em {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class CircuitBreaker:
+    def __init__(self, limite_falhas=5, tempo_aberto_s=10.0, tentativas_meio_aberto=1, relogio=time.monotonic):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto_s = tempo_aberto_s
+        self.tentativas_meio_aberto = tentativas_meio_aberto
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self.estado = FECHADO
+        self.falhas = 0
+        self._reabrir_em = 0.0
+        self._janela_fim = 0.0
+        self._tentativas = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            limite_falhas=int(os.getenv('MONGO_CIRCUIT_FALHAS', '5')),
+            tempo_aberto_s=float(os.getenv('MONGO_CIRCUIT_ABERTO_S', '10')),
+            tentativas_meio_aberto=int(os.getenv('MONGO_CIRCUIT_TENTATIVAS', '1')),
+        )
+
+    def permitir(self):
+        """Levanta `CircuitoAberto` se a chamada não deve chegar ao banco"""
+        if self.estado == FECHADO:
+            return
+        with self._lock:
+            agora = self._relogio()
+            if self.estado == ABERTO:
+                if agora < self._reabrir_em:
+                    raise CircuitoAberto(self._reabrir_em - agora)
+                self.estado = MEIO_ABERTO
+                self._janela_fim = agora
+            if self.estado == MEIO_ABERTO:
+                # nova janela de teste quando a anterior expirou sem resposta
+                if agora >= self._janela_fim:
+                    self._janela_fim = agora + self.tempo_aberto_s
+                    self._tentativas = 0
+                if self._tentativas >= self.tentativas_meio_aberto:
+                    raise CircuitoAberto(self._janela_fim - agora)
+                self._tentativas += 1
+
+    def registrar_sucesso(self):
+        if self.estado == FECHADO and self.falhas == 0:
+            return
+        with self._lock:
+            self.estado = FECHADO
+            self.falhas = 0
+            self._tentativas = 0
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.estado == MEIO_ABERTO or self.falhas >= self.limite_falhas:
+                self.estado = ABERTO
+                self._reabrir_em = self._relogio() + self.tempo_aberto_s
+
+    def retry_after(self):
+        """Segundos até a próxima tentativa (usado quando a falha não passou por `permitir`)"""
+        if self.estado == FECHADO:
+            return self.tempo_aberto_s
+        return max(0.0, max(self._reabrir_em, self._janela_fim) - self._relogio())
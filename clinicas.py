@@ -0,0 +1,104 @@
+"""
+Várias clínicas (tenants) atendidas pelo mesmo processo.
+
+Com `CLINICAS` vazia (padrão) a API atende uma única clínica, no banco
+`DB_NAME`, como sempre. Com `CLINICAS=centro,norte,sul` cada clínica tem o
+seu próprio banco no mesmo cluster (`<DB_NAME>_<clinica>`), acessado pelo
+mesmo `MongoClient` e pelo mesmo pool de conexões. A clínica de
+`CLINICA_PADRAO` continua no banco `DB_NAME`, então uma instalação existente
+vira uma das clínicas sem mover dados.
+
+A clínica da requisição vem do token (`clinica`, gravada no login) ou do
+cabeçalho `X-Clinica`; os dois precisam concordar quando vêm juntos. O login
+usa o cabeçalho (ou a clínica padrão) para saber em qual banco procurar o
+admin. Índices, índice de trigramas, barramento de eventos e caches em
+memória são separados por clínica (`PorClinica`).
+"""
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv('.cred')
+
+CABECALHO = 'X-Clinica'
+NOME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,31}$')
+
+
+class ClinicaInvalida(Exception):
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def _ler_clinicas(valor):
+    nomes = [nome.strip().lower() for nome in valor.split(',') if nome.strip()]
+    invalidos = [nome for nome in nomes if not NOME.match(nome)]
+    if invalidos:
+        raise ValueError(f"Nomes de clínica inválidos em CLINICAS: {', '.join(invalidos)}")
+    return frozenset(nomes)
+
+
+clinicas = _ler_clinicas(os.getenv('CLINICAS', ''))
+padrao = os.getenv('CLINICA_PADRAO', '').strip().lower() or None
+if padrao is not None and padrao not in clinicas:
+    raise ValueError(f"CLINICA_PADRAO ({padrao}) não está em CLINICAS")
+habilitado = bool(clinicas)
+
+
+def resolver(do_token=None, do_cabecalho=None):
+    """Clínica da requisição, ou None com uma única clínica.
+
+    Levanta ClinicaInvalida se a clínica é desconhecida, se token e cabeçalho
+    discordam ou se nenhuma foi informada e não há clínica padrão.
+    """
+    if not habilitado:
+        return None
+    do_cabecalho = (do_cabecalho or '').strip().lower() or None
+    if do_token and do_cabecalho and do_token != do_cabecalho:
+        raise ClinicaInvalida("A clínica do cabeçalho X-Clinica não corresponde à do token", 403)
+    clinica = do_token or do_cabecalho or padrao
+    if clinica is None:
+        raise ClinicaInvalida("Informe a clínica no cabeçalho X-Clinica")
+    if clinica not in clinicas:
+        raise ClinicaInvalida(f"Clínica desconhecida: {clinica}", 404)
+    return clinica
+
+
+def nome_do_banco(db_name, clinica):
+    """Banco de uma clínica: o próprio `db_name` para a padrão (ou sem clínicas)"""
+    if clinica is None or clinica == padrao:
+        return db_name
+    return f"{db_name}_{clinica}"
+
+
+def rotulo(clinica):
+    """Valor do rótulo `clinica` das métricas"""
+    return clinica or '-'
+
+
+class PorClinica:
+    """Um objeto por clínica, criado no primeiro uso.
+
+    A clínica padrão (e a única, sem clínicas) usa o objeto que o módulo já
+    tinha, devolvido por `obter_padrao()`; as demais recebem um novo, criado
+    por `criar()`.
+    """
+
+    def __init__(self, criar, obter_padrao):
+        self._criar = criar
+        self._obter_padrao = obter_padrao
+        self._itens = {}
+        self._lock = threading.Lock()
+
+    def de(self, clinica):
+        if clinica is None or clinica == padrao:
+            return self._obter_padrao()
+        item = self._itens.get(clinica)
+        if item is None:
+            with self._lock:
+                item = self._itens.get(clinica)
+                if item is None:
+                    item = self._itens[clinica] = self._criar()
+        return item
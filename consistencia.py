@@ -0,0 +1,101 @@
+"""
+Read preference, read concern e write concern por classe de rota.
+
+Por padrão tudo vai para o primário com as concerns padrão do servidor. Em
+replica sets, as leituras que toleram dados alguns segundos atrasados (as
+listagens e as agendas) podem ir para os secundários e as cargas em lote
+(`gerar_dados.py`) podem usar uma write concern mais leve. Cada classe é
+configurada por variáveis de ambiente:
+
+    MONGO_<CLASSE>_READ_PREFERENCE   primary | primaryPreferred | secondary | secondaryPreferred | nearest
+    MONGO_<CLASSE>_MAX_STALENESS_S   atraso máximo aceito de um secundário (>= 90; -1 = sem limite)
+    MONGO_<CLASSE>_READ_CONCERN      local | available | majority | linearizable (vazio = padrão do servidor)
+    MONGO_<CLASSE>_WRITE_CONCERN     majority | 0 | 1 | 2 ... (vazio = padrão do servidor)
+
+A classe de uma requisição vem do endpoint (`ROTAS`); as demais rotas são
+`leitura` (GET) ou `escrita`. Leituras por id continuam em `leitura`, no
+primário: o ETag que elas devolvem vai para o `If-Match` de um PUT.
+"""
+import os
+
+from dotenv import load_dotenv
+from pymongo.errors import ConfigurationError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from pymongo.write_concern import WriteConcern
+
+load_dotenv('.cred')
+
+CLASSES = ('leitura', 'listas', 'agenda', 'relatorios', 'escrita', 'importacao')
+
+ROTAS = {
+    'get_medicos': 'listas',
+    'get_pacientes': 'listas',
+    'get_especialidades': 'listas',
+    'buscar_pacientes': 'listas',
+    'get_horarios_medico': 'agenda',
+    'get_consultas_paciente': 'agenda',
+    'get_horarios_livres': 'agenda',
+    'get_ocupacao': 'relatorios',
+    'get_exportacao': 'relatorios',
+}
+
+READ_CONCERNS = ('local', 'available', 'majority', 'linearizable')
+
+
+class ConfiguracaoInvalida(ValueError):
+    pass
+
+
+class Opcoes:
+    """Opções de `MongoClient.get_database` de uma classe de rota"""
+
+    def __init__(self, read_preference='primary', max_staleness_s=-1, read_concern=None, write_concern=None):
+        try:
+            modo = read_pref_mode_from_name(read_preference)
+            self.read_preference = make_read_preference(modo, None, max_staleness=max_staleness_s)
+        except (ValueError, ConfigurationError) as e:
+            raise ConfiguracaoInvalida(f"Read preference inválida ({read_preference}, {max_staleness_s}): {e}")
+        if read_concern is not None and read_concern not in READ_CONCERNS:
+            raise ConfiguracaoInvalida(f"Read concern inválida: {read_concern}")
+        self.read_concern = ReadConcern(read_concern)
+        if write_concern is None:
+            self.write_concern = WriteConcern()
+        else:
+            w = write_concern if write_concern == 'majority' else _inteiro(write_concern, 'Write concern')
+            try:
+                self.write_concern = WriteConcern(w=w)
+            except (ValueError, ConfigurationError) as e:
+                raise ConfiguracaoInvalida(f"Write concern inválida: {e}")
+
+    @classmethod
+    def from_env(cls, classe):
+        prefixo = f'MONGO_{classe.upper()}_'
+        return cls(
+            read_preference=os.getenv(prefixo + 'READ_PREFERENCE') or 'primary',
+            max_staleness_s=_inteiro(os.getenv(prefixo + 'MAX_STALENESS_S') or '-1', prefixo + 'MAX_STALENESS_S'),
+            read_concern=os.getenv(prefixo + 'READ_CONCERN') or None,
+            write_concern=os.getenv(prefixo + 'WRITE_CONCERN') or None,
+        )
+
+    def kwargs(self):
+        return {
+            'read_preference': self.read_preference,
+            'read_concern': self.read_concern,
+            'write_concern': self.write_concern,
+        }
+
+
+def _inteiro(valor, nome):
+    try:
+        return int(valor)
+    except ValueError:
+        raise ConfiguracaoInvalida(f"{nome} deve ser um número inteiro: {valor!r}")
+
+
+# Lidas uma vez, na importação: configuração inválida impede a API de subir
+opcoes = {classe: Opcoes.from_env(classe) for classe in CLASSES}
+
+
+def classe_da_rota(endpoint, metodo):
+    return ROTAS.get(endpoint) or ('leitura' if metodo in ('GET', 'HEAD') else 'escrita')
@@ -1,19 +1,27 @@
 """
 Script para criar o usuário admin no banco de dados MongoDB.
-Executa: python create_admin.py
+Executa: python create_admin.py [clinica]
+
+Com várias clínicas (CLINICAS), o admin é criado no banco da clínica indicada.
+Com MONGO_URI=sqlite:///<arquivo>, o admin é criado no arquivo SQLite.
 """
 import os
+import sys
 from pymongo import MongoClient
 from dotenv import load_dotenv
 from flask_bcrypt import Bcrypt
 from datetime import datetime
 
+import clinicas
+
 # Carrega variáveis de ambiente
 load_dotenv('.cred')
 
 # Configurações do banco de dados
 mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 db_name = os.getenv('DB_NAME', 'clinica')
+clinica = clinicas.resolver(sys.argv[1]) if len(sys.argv) > 1 else None
+db_name = clinicas.nome_do_banco(db_name, clinica)
 
 # Credenciais do admin
 ADMIN_USERNAME = 'admin'
@@ -29,11 +37,36 @@ def connect_db():
         print(f"Erro ao conectar ao MongoDB: {e}")
         return None
 
+def create_admin_sqlite():
+    """Cria o usuário admin no armazenamento SQLite (repositorios_sqlite.py)"""
+    import database
+    from repositorios import Duplicado
+
+    repo = database.repositorio_sqlite(clinica)
+    print(f"Arquivo SQLite: {repo.caminho}")
+    try:
+        repo.admins.criar({
+            "username": ADMIN_USERNAME,
+            "password": Bcrypt().generate_password_hash(ADMIN_PASSWORD).decode('utf-8'),
+            "role": "admin",
+            "created_at": datetime.utcnow(),
+        })
+    except Duplicado:
+        print(f"Admin '{ADMIN_USERNAME}' já existe no banco de dados.")
+        print("   Script idempotente: não será criado novamente.")
+        return True
+    print(f"Admin criado com sucesso!")
+    print(f"   Username: {ADMIN_USERNAME}")
+    return True
+
 def create_admin():
     """Cria o usuário admin no banco de dados"""
     print("=" * 50)
     print("Script de Criação do Admin")
     print("=" * 50)
+
+    if mongo_uri.startswith('sqlite://'):
+        return create_admin_sqlite()
     
     # Conecta ao banco
     db = connect_db()
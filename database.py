@@ -0,0 +1,258 @@
+"""
+Acesso compartilhado ao MongoDB.
+
+O `MongoClient` mantém seu próprio pool de conexões e é thread-safe, então a
+aplicação inteira usa uma única instância criada sob demanda. É aqui também
+que os listeners de monitoramento do PyMongo são registrados.
+
+Cada rota usa o banco com as opções de consistência da sua classe
+(`banco(classe)`, ver consistencia.py).
+
+Todo acesso das rotas passa por `BancoProtegido`, que informa ao circuit
+breaker o resultado de cada operação: erros de conexão contam como falha,
+qualquer resposta do servidor (inclusive erros como chave duplicada) conta
+como sucesso.
+
+Com `MONGO_URI=sqlite:///<arquivo>` não há MongoDB: as rotas de cadastro,
+horários, consultas e o login usam o armazenamento SQLite
+(repositorios_sqlite.py, um arquivo por clínica) e as demais recebem
+`SomenteMongo`.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, IndexModel, MongoClient
+from pymongo.collection import Collection
+from pymongo.command_cursor import CommandCursor
+from pymongo.cursor import Cursor
+from pymongo.errors import ConnectionFailure
+
+from circuit_breaker import CircuitBreaker
+
+import arquivamento
+import clinicas
+import consistencia
+import healthcheck
+import idempotencia
+import metrics
+import slow_log
+import tarefas
+
+load_dotenv('.cred')
+
+mongo_uri = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
+db_name = os.getenv('DB_NAME', 'clinica')
+max_pool_size = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+# Timeouts curtos: com o banco fora do ar a requisição falha em segundos, não em 30s
+server_selection_timeout_ms = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '2000'))
+connect_timeout_ms = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '2000'))
+socket_timeout_ms = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '5000'))
+
+breaker = CircuitBreaker.from_env()
+
+usa_sqlite = mongo_uri.startswith('sqlite://')
+
+
+class SomenteMongo(Exception):
+    """Rota que depende do MongoDB chamada com o armazenamento SQLite"""
+
+# Índices criados na inicialização (create_indexes é idempotente)
+INDICES = {
+    'admins': [IndexModel([('username', ASCENDING)])],
+    'medicos': [
+        IndexModel([('especialidade_normalizada', ASCENDING)]),
+        IndexModel([('cpf', ASCENDING)]),
+        IndexModel([('crm', ASCENDING)]),
+    ],
+    'pacientes': [
+        IndexModel([('nome_normalizado', ASCENDING)]),
+        IndexModel([('cpf_digitos', ASCENDING)]),
+        IndexModel([('celular_digitos', ASCENDING)]),
+    ],
+    'tarefas': tarefas.INDICES,
+    **arquivamento.INDICES,
+    # Respostas guardadas por Idempotency-Key expiram sozinhas (mudar o TTL exige collMod)
+    'idempotencia': [IndexModel([('criado_em', ASCENDING)], expireAfterSeconds=idempotencia.registro.ttl_s)],
+}
+
+_inicializacao_lock = threading.Lock()
+# Nomes dos bancos já inicializados e em inicialização (um por clínica)
+_inicializados = set()
+_inicializando = set()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Retorna o cliente MongoDB compartilhado, criando-o na primeira chamada"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None and mongo_uri.startswith('mongomock://'):
+                # Banco em memória, para o teste de carga e desenvolvimento sem MongoDB
+                import mongomock
+                _client = mongomock.MongoClient()
+            elif _client is None:
+                _client = MongoClient(
+                    mongo_uri,
+                    maxPoolSize=max_pool_size,
+                    serverSelectionTimeoutMS=server_selection_timeout_ms,
+                    connectTimeoutMS=connect_timeout_ms,
+                    socketTimeoutMS=socket_timeout_ms,
+                    event_listeners=[
+                        metrics.command_listener,
+                        metrics.server_roles,
+                        slow_log.command_listener,
+                        healthcheck.pool_stats,
+                    ],
+                )
+    return _client
+
+
+_sqlite = {}
+_sqlite_lock = threading.Lock()
+
+
+def repositorio_sqlite(clinica=None):
+    """Repositórios SQLite da clínica, um por arquivo e por processo"""
+    import repositorios_sqlite
+
+    base, extensao = os.path.splitext(mongo_uri[len('sqlite:///'):])
+    caminho = clinicas.nome_do_banco(base, clinica) + extensao
+    repo = _sqlite.get(caminho)
+    if repo is None:
+        with _sqlite_lock:
+            repo = _sqlite.get(caminho)
+            if repo is None:
+                repo = _sqlite[caminho] = repositorios_sqlite.Sqlite(caminho)
+    return repo
+
+
+def banco(classe='escrita', clinica=None):
+    """`Database` da clínica com a read preference e as concerns da classe de rota (consistencia.py)"""
+    return get_client().get_database(clinicas.nome_do_banco(db_name, clinica), **consistencia.opcoes[classe].kwargs())
+
+
+def garantir_indices(db):
+    for collection, indices in INDICES.items():
+        db[collection].create_indexes(indices)
+
+
+def _inicializar(db, clinica):
+    from busca import preencher_campos_de_busca, preencher_especialidade_normalizada
+    import eventos
+    import trigramas
+    import versionamento
+
+    try:
+        garantir_indices(db)
+        preencher_campos_de_busca(db['pacientes'])
+        preencher_especialidade_normalizada(db['medicos'])
+        versionamento.preencher_versao(db['medicos'])
+        versionamento.preencher_versao(db['pacientes'])
+        if trigramas.habilitado:
+            threading.Thread(
+                target=trigramas.manter_atualizado, args=(db['pacientes'], trigramas.indices.de(clinica)),
+                name=f'indice-trigramas-{clinicas.rotulo(clinica)}', daemon=True,
+            ).start()
+        tarefas.iniciar_na_api(db)
+        arquivamento.agendar(db)
+        if eventos.usar_change_streams:
+            threading.Thread(
+                target=eventos.observar_mudancas, args=(db, eventos.barramentos.de(clinica)),
+                name=f'eventos-change-stream-{clinicas.rotulo(clinica)}', daemon=True,
+            ).start()
+        _inicializados.add(db.name)
+    except Exception as e:
+        print(f"Erro ao inicializar o banco de dados {db.name}: {e}")
+    finally:
+        _inicializando.discard(db.name)
+
+
+def inicializar_banco(db, clinica=None):
+    """Cria índices e preenche campos derivados, uma vez por processo e por clínica.
+
+    Roda em segundo plano para não atrasar a primeira requisição; se o banco
+    estiver fora do ar, uma nova tentativa é feita na próxima conexão.
+    """
+    nome = db.name
+    if nome in _inicializados or nome in _inicializando:
+        return
+    with _inicializacao_lock:
+        if nome in _inicializados or nome in _inicializando:
+            return
+        _inicializando.add(nome)
+    threading.Thread(target=_inicializar, args=(db, clinica), name='inicializar-banco', daemon=True).start()
+
+
+def _envolver(valor, breaker):
+    if isinstance(valor, Collection):
+        return ColecaoProtegida(valor, breaker)
+    if isinstance(valor, (Cursor, CommandCursor)):
+        return CursorProtegido(valor, breaker)
+    return valor
+
+
+class _Protegido:
+    """Base dos wrappers: delega atributos e registra o resultado das chamadas"""
+
+    __slots__ = ('_alvo', '_breaker')
+
+    def __init__(self, alvo, breaker):
+        self._alvo = alvo
+        self._breaker = breaker
+
+    def _chamar(self, funcao, *args, **kwargs):
+        try:
+            resultado = funcao(*args, **kwargs)
+        except ConnectionFailure:
+            self._breaker.registrar_falha()
+            raise
+        if not isinstance(resultado, Cursor):
+            # find() não faz I/O; o resultado do cursor é registrado na iteração
+            self._breaker.registrar_sucesso()
+        return _envolver(resultado, self._breaker)
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._alvo, nome)
+        if callable(atributo) and not isinstance(atributo, Collection):
+            def chamada(*args, **kwargs):
+                return self._chamar(atributo, *args, **kwargs)
+            return chamada
+        return _envolver(atributo, self._breaker)
+
+
+class BancoProtegido(_Protegido):
+    """`Database` cujas collections passam pelo circuit breaker"""
+
+    __slots__ = ()
+
+    def __getitem__(self, nome):
+        return ColecaoProtegida(self._alvo[nome], self._breaker)
+
+
+class ColecaoProtegida(_Protegido):
+    __slots__ = ()
+
+
+class CursorProtegido(_Protegido):
+    """Cursor preguiçoso: as falhas aparecem na iteração, não no `find()`"""
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            documento = next(self._alvo)
+        except StopIteration:
+            self._breaker.registrar_sucesso()
+            raise
+        except ConnectionFailure:
+            self._breaker.registrar_falha()
+            raise
+        self._breaker.registrar_sucesso()
+        return documento
@@ -0,0 +1,291 @@
+"""
+Estatísticas de ocupação da agenda (`GET /estatisticas/ocupacao`).
+
+A agenda continua no formato aninhado `medicos.horarios[data][hora]`, então
+o cálculo é feito inteiramente no MongoDB: `$objectToArray` transforma o
+mapa de dias em documentos, o filtro de período compara as chaves
+`AAAA-MM-DD` como texto e um segundo `$objectToArray` conta os horários
+oferecidos e os livres de cada dia (nos dias no formato compacto de
+`grade.py`, a contagem é feita sobre os bits). Um `$facet` agrupa o resultado por
+médico, especialidade, dia e semana (com `$bucket` nas segundas-feiras do
+período) numa única ida ao banco.
+
+Um horário conta como ocupado quando o `status` não é um dos valores de
+horário livre (`LIVRES`). Dias que já passaram não mudam mais, então os
+resultados de períodos fechados (`ate` anterior a hoje) ficam em cache no
+processo.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from bson import ObjectId
+
+from utils import normalizar_texto
+
+# Períodos maiores que isso são recusados (400)
+MAX_DIAS = 366
+# Status (já em minúsculas) que indicam horário livre
+LIVRES = ["disponível", "disponivel", "livre"]
+
+
+class PeriodoInvalido(ValueError):
+    pass
+
+
+def ler_periodo(de, ate):
+    """Valida os parâmetros `de`/`ate` (AAAA-MM-DD) e retorna as datas"""
+    if not de or not ate:
+        raise PeriodoInvalido("Parâmetros 'de' e 'ate' são obrigatórios (AAAA-MM-DD)")
+    try:
+        inicio, fim = date.fromisoformat(de), date.fromisoformat(ate)
+    except ValueError:
+        raise PeriodoInvalido("Datas devem estar no formato AAAA-MM-DD")
+    if fim < inicio:
+        raise PeriodoInvalido("'ate' deve ser igual ou posterior a 'de'")
+    if (fim - inicio).days + 1 > MAX_DIAS:
+        raise PeriodoInvalido(f"O período máximo é de {MAX_DIAS} dias")
+    return inicio, fim
+
+
+def _segundas(inicio, fim):
+    """Limites dos buckets semanais: as segundas-feiras que cobrem o período"""
+    segunda = inicio - timedelta(days=inicio.weekday())
+    limites = []
+    while segunda <= fim:
+        limites.append(segunda.isoformat())
+        segunda += timedelta(days=7)
+    limites.append(segunda.isoformat())
+    return limites
+
+
+def _totais(chave):
+    return {
+        "_id": chave,
+        "oferecidos": {"$sum": "$oferecidos"},
+        "ocupados": {"$sum": "$ocupados"},
+    }
+
+
+def pipeline_ocupacao(inicio, fim, filtro=None, arquivo=False, vivos='medicos'):
+    """Pipeline sobre `medicos` ou, com `arquivo`, sobre `horarios_arquivo`.
+
+    Os documentos do arquivo têm o mesmo mapa `horarios` de um mês e o id do
+    médico em `medico_id`; o mês permite usar o índice antes de abrir os mapas.
+    Um dia que também está no documento vivo do médico (collection `vivos`)
+    fica de fora: vale o vivo, como em `arquivamento.mesclar`.
+    """
+    import grade  # grade usa LIVRES deste módulo
+
+    de, ate = inicio.isoformat(), fim.isoformat()
+    # Dias no formato compacto (ver grade.py) são contados pelos bits, os demais pelo mapa
+    compacto = {"$ifNull": ["$dia.grade", False]}
+    medico = {"nome": 1, "especialidade": 1, "especialidade_normalizada": 1, "medico_id": 1}
+    filtro = dict(filtro or {}, horarios={"$type": "object"})
+    periodo = {"dias.k": {"$gte": de, "$lte": ate}, "dias.v": {"$type": "object"}}
+    if arquivo:
+        filtro["mes"] = {"$gte": de[:7], "$lte": ate[:7]}
+        # O arquivamento copia o dia antes de removê-lo do vivo; uma falha entre os
+        # dois passos deixa o dia nos dois lugares
+        origem = [
+            {"$lookup": {"from": vivos, "localField": "medico_id", "foreignField": "_id", "as": "vivo"}},
+            {"$project": dict(medico, dias={"$objectToArray": "$horarios"}, vivos={"$map": {
+                "input": {"$objectToArray": {"$ifNull": [{"$arrayElemAt": ["$vivo.horarios", 0]}, {}]}},
+                "as": "d",
+                "in": "$$d.k",
+            }})},
+        ]
+        periodo["$expr"] = {"$eq": [{"$in": ["$dias.k", "$vivos"]}, False]}
+    else:
+        origem = [{"$project": dict(medico, medico_id="$_id", dias={"$objectToArray": "$horarios"})}]
+    return [
+        {"$match": filtro},
+        *origem,
+        {"$unwind": "$dias"},
+        {"$match": periodo},
+        {"$project": dict(medico, data="$dias.k", dia="$dias.v", horarios={"$objectToArray": "$dias.v"})},
+        {"$project": dict(
+            medico,
+            data=1,
+            oferecidos={"$cond": [
+                compacto,
+                {"$toInt": {"$add": [grade.contar_bits("$dia.livres"), grade.contar_bits("$dia.ocupados")]}},
+                {"$size": "$horarios"},
+            ]},
+            livres={"$cond": [
+                compacto,
+                {"$toInt": grade.contar_bits("$dia.livres")},
+                {"$size": {"$filter": {
+                    "input": "$horarios",
+                    "as": "h",
+                    "cond": {"$in": [{"$toLower": "$$h.v.status"}, LIVRES]},
+                }}},
+            ]},
+        )},
+        {"$addFields": {"ocupados": {"$subtract": ["$oferecidos", "$livres"]}}},
+        {"$facet": {
+            "por_medico": [
+                {"$group": dict(
+                    _totais("$medico_id"),
+                    nome={"$first": "$nome"},
+                    especialidade={"$first": "$especialidade"},
+                )},
+                {"$sort": {"nome": 1, "_id": 1}},
+            ],
+            "por_especialidade": [
+                {"$group": dict(
+                    _totais("$especialidade_normalizada"),
+                    especialidade={"$first": "$especialidade"},
+                    medicos={"$addToSet": "$medico_id"},
+                )},
+                {"$sort": {"_id": 1}},
+            ],
+            "por_dia": [
+                {"$group": _totais("$data")},
+                {"$sort": {"_id": 1}},
+            ],
+            "por_semana": [
+                {"$bucket": {
+                    "groupBy": "$data",
+                    "boundaries": _segundas(inicio, fim),
+                    "output": {
+                        "oferecidos": {"$sum": "$oferecidos"},
+                        "ocupados": {"$sum": "$ocupados"},
+                    },
+                }},
+            ],
+        }},
+    ]
+
+
+def _mesclar(resultados):
+    """Soma os resultados de `medicos` e do arquivo (sem os dias repetidos no vivo), faceta por faceta"""
+    mesclado = {}
+    for faceta in ("por_medico", "por_especialidade", "por_dia", "por_semana"):
+        itens = {}
+        for resultado in resultados:
+            for item in resultado[faceta]:
+                atual = itens.get(item["_id"])
+                if atual is None:
+                    itens[item["_id"]] = dict(item)
+                    continue
+                atual["oferecidos"] += item["oferecidos"]
+                atual["ocupados"] += item["ocupados"]
+                if "medicos" in item:
+                    atual["medicos"] = list(set(atual["medicos"]) | set(item["medicos"]))
+        if faceta == "por_medico":
+            mesclado[faceta] = sorted(itens.values(), key=lambda m: (m.get("nome") or "", str(m["_id"])))
+        else:
+            mesclado[faceta] = sorted(itens.values(), key=lambda i: i["_id"])
+    return mesclado
+
+
+def _taxa(item):
+    oferecidos, ocupados = item["oferecidos"], item["ocupados"]
+    item["ocupacao"] = round(ocupados / oferecidos, 4) if oferecidos else 0.0
+    return item
+
+
+def _formatar(resultado, inicio, fim):
+    por_medico = [
+        _taxa({
+            "medico_id": str(m["_id"]),
+            "nome": m.get("nome"),
+            "especialidade": m.get("especialidade"),
+            "oferecidos": m["oferecidos"],
+            "ocupados": m["ocupados"],
+        })
+        for m in resultado["por_medico"]
+    ]
+    por_especialidade = [
+        _taxa({
+            "chave": e["_id"],
+            "especialidade": e.get("especialidade"),
+            "medicos": len(e["medicos"]),
+            "oferecidos": e["oferecidos"],
+            "ocupados": e["ocupados"],
+        })
+        for e in resultado["por_especialidade"]
+    ]
+    por_dia = [
+        _taxa({"data": d["_id"], "oferecidos": d["oferecidos"], "ocupados": d["ocupados"]})
+        for d in resultado["por_dia"]
+    ]
+    por_semana = [
+        _taxa({"inicio": s["_id"], "oferecidos": s["oferecidos"], "ocupados": s["ocupados"]})
+        for s in resultado["por_semana"]
+    ]
+    total = _taxa({
+        "oferecidos": sum(d["oferecidos"] for d in por_dia),
+        "ocupados": sum(d["ocupados"] for d in por_dia),
+    })
+    return {
+        "periodo": {"de": inicio.isoformat(), "ate": fim.isoformat()},
+        "total": total,
+        "por_medico": por_medico,
+        "por_especialidade": por_especialidade,
+        "por_dia": por_dia,
+        "por_semana": por_semana,
+    }
+
+
+class CacheOcupacao:
+    """LRU por processo para os resultados de períodos fechados"""
+
+    def __init__(self, capacidade=256):
+        self.capacidade = capacidade
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+cache = CacheOcupacao()
+
+
+def calcular_ocupacao(collection, inicio, fim, medico_id=None, especialidade=None, hoje=None, arquivo=None):
+    """Oferecidos x ocupados no período, por médico, especialidade, dia e semana.
+
+    Filtros opcionais por médico e por especialidade (este pelo campo
+    indexado `especialidade_normalizada`). Com `arquivo` (a collection
+    `horarios_arquivo`) os dias arquivados também são contados.
+    """
+    filtro = {}
+    if especialidade:
+        filtro["especialidade_normalizada"] = normalizar_texto(especialidade)
+
+    fechado = fim < (hoje or date.today())
+    # O nome completo da collection separa o cache de cada clínica (um banco por clínica)
+    chave = (collection.full_name, inicio, fim, medico_id, filtro.get("especialidade_normalizada"), arquivo is not None)
+    if fechado:
+        em_cache = cache.obter(chave)
+        if em_cache is not None:
+            return em_cache
+
+    filtro_vivos = dict(filtro, _id=ObjectId(medico_id)) if medico_id else filtro
+    resultado = list(collection.aggregate(pipeline_ocupacao(inicio, fim, filtro_vivos)))[0]
+    if arquivo is not None:
+        filtro_arquivo = dict(filtro, medico_id=ObjectId(medico_id)) if medico_id else filtro
+        arquivados = list(arquivo.aggregate(
+            pipeline_ocupacao(inicio, fim, filtro_arquivo, arquivo=True, vivos=collection.name)))[0]
+        resultado = _mesclar([resultado, arquivados])
+    ocupacao = _formatar(resultado, inicio, fim)
+    if fechado:
+        cache.guardar(chave, ocupacao)
+    return ocupacao
@@ -0,0 +1,246 @@
+"""
+Feed de mudanças da agenda para `GET /eventos` (Server-Sent Events).
+
+As telas da recepção recebem as alterações de horários e consultas assim que
+acontecem, em vez de consultar `/medicos/<id>/horarios` a cada poucos
+segundos. Há duas fontes de eventos:
+
+- change streams do MongoDB (`observar_mudancas`), que veem as escritas de
+  todos os workers, mas só existem em replica sets;
+- sem change streams, as próprias rotas de escrita publicam o evento
+  (`notificar`), e cada worker só vê as escritas que ele atendeu.
+
+Cada cliente tem um buffer limitado; se ele não consumir a tempo (rede lenta,
+aba em segundo plano), é desconectado em vez de fazer a memória crescer ou
+atrasar os demais. O `EventSource` do navegador reconecta sozinho e, com o
+`Last-Event-ID`, recebe o que perdeu enquanto isso ainda estiver no
+histórico do worker.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+from flask import g, has_app_context
+from pymongo.errors import OperationFailure, PyMongoError
+
+import clinicas
+import metrics
+
+load_dotenv('.cred')
+
+HORARIOS = 'horarios'
+CONSULTAS = 'consultas'
+
+
+class AssinaturaEncerrada(Exception):
+    def __init__(self, motivo):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+class Assinatura:
+    """Fila de eventos de um cliente, com filtro por médico e por tipo"""
+
+    def __init__(self, medico=None, tipos=None, capacidade=100):
+        self.medico = medico
+        self.tipos = set(tipos) if tipos else None
+        self.capacidade = capacidade
+        self.motivo_encerramento = None
+        self._fila = deque()
+        self._cond = threading.Condition()
+
+    def aceita(self, evento):
+        if self.tipos is not None and evento['tipo'] not in self.tipos:
+            return False
+        return self.medico is None or evento.get('medico_id') == self.medico
+
+    def entregar(self, evento):
+        """Enfileira sem bloquear; retorna False se o cliente foi descartado"""
+        with self._cond:
+            if self.motivo_encerramento is not None:
+                return False
+            if len(self._fila) >= self.capacidade:
+                self.motivo_encerramento = 'consumidor_lento'
+                self._fila.clear()
+                self._cond.notify()
+                return False
+            self._fila.append(evento)
+            self._cond.notify()
+            return True
+
+    def proximo(self, timeout=None):
+        """Próximo evento, ou None se nada chegou dentro de `timeout`"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._fila or self.motivo_encerramento, timeout)
+            if self._fila:
+                return self._fila.popleft()
+            if self.motivo_encerramento is not None:
+                raise AssinaturaEncerrada(self.motivo_encerramento)
+            return None
+
+
+class EventBus:
+    """Distribui os eventos para as assinaturas do processo"""
+
+    def __init__(self, capacidade_cliente=100, historico=1000):
+        self.capacidade_cliente = capacidade_cliente
+        self.fonte = 'local'
+        self._assinaturas = set()
+        self._historico = deque(maxlen=historico)
+        self._sequencia = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            capacidade_cliente=int(os.getenv('EVENTOS_BUFFER_CLIENTE', '100')),
+            historico=int(os.getenv('EVENTOS_HISTORICO', '1000')),
+        )
+
+    def __len__(self):
+        return len(self._assinaturas)
+
+    def assinar(self, medico=None, tipos=None, ultimo_id=None):
+        """Nova assinatura; com `ultimo_id`, reenvia o que o cliente perdeu.
+
+        Se o que foi perdido não cabe no buffer (ou já saiu do histórico), o
+        cliente recebe um único evento `ressincronizar` e deve recarregar a agenda.
+        """
+        assinatura = Assinatura(medico, tipos, self.capacidade_cliente)
+        with self._lock:
+            if ultimo_id is not None and ultimo_id < self._sequencia:
+                perdidos = [e for e in self._historico if e['id'] > ultimo_id and assinatura.aceita(e)]
+                completo = not self._historico or self._historico[0]['id'] <= ultimo_id + 1
+                if completo and len(perdidos) < self.capacidade_cliente:
+                    for evento in perdidos:
+                        assinatura.entregar(evento)
+                else:
+                    assinatura.entregar({'id': self._sequencia, 'tipo': 'ressincronizar'})
+            self._assinaturas.add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+    def publicar(self, evento):
+        with self._lock:
+            self._sequencia += 1
+            evento = dict(evento, id=self._sequencia)
+            self._historico.append(evento)
+            descartadas = [
+                a for a in self._assinaturas
+                if a.aceita(evento) and not a.entregar(evento)
+            ]
+            self._assinaturas.difference_update(descartadas)
+        metrics.sse_events.inc(evento['tipo'], self.fonte)
+        if descartadas:
+            metrics.sse_evictions.inc(amount=len(descartadas))
+        return evento
+
+
+def evento(tipo, acao, medico_id=None, paciente_id=None, data=None, hora=None):
+    return {
+        'tipo': tipo,
+        'acao': acao,
+        'medico_id': medico_id,
+        'paciente_id': paciente_id,
+        'data': data,
+        'hora': hora,
+        'em': time.time(),
+    }
+
+
+def formatar_sse(evento):
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+
+
+intervalo_heartbeat_s = float(os.getenv('EVENTOS_HEARTBEAT_S', '15'))
+usar_change_streams = os.getenv('EVENTOS_CHANGE_STREAMS', '1') == '1'
+bus = EventBus.from_env()
+# Cada clínica tem seu próprio barramento (e sua sequência de ids); `bus` é o da clínica padrão
+barramentos = clinicas.PorClinica(EventBus.from_env, lambda: bus)
+
+
+def notificar(tipo, acao, clinica=None, **campos):
+    """Chamado pelas rotas de escrita; ignorado quando os change streams estão ativos.
+
+    Sem `clinica`, usa a da requisição atual.
+    """
+    if clinica is None and has_app_context():
+        clinica = g.get('clinica')
+    barramento = barramentos.de(clinica)
+    if barramento.fonte == 'local':
+        barramento.publicar(evento(tipo, acao, **campos))
+
+
+def transmitir(assinatura, heartbeat_s=None, barramento=None):
+    """Gera o corpo do stream SSE de uma assinatura até o cliente sair ou ser descartado"""
+    heartbeat_s = heartbeat_s or intervalo_heartbeat_s
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                evento = assinatura.proximo(heartbeat_s)
+            except AssinaturaEncerrada as e:
+                yield f"event: encerrado\ndata: {json.dumps({'motivo': e.motivo})}\n\n"
+                return
+            # O comentário periódico mantém proxies abertos e revela clientes desconectados
+            yield ": ping\n\n" if evento is None else formatar_sse(evento)
+    finally:
+        (bus if barramento is None else barramento).cancelar(assinatura)
+
+
+def eventos_da_mudanca(mudanca):
+    """Traduz um evento de change stream em eventos de agenda"""
+    tipo = HORARIOS if mudanca['ns']['coll'] == 'medicos' else CONSULTAS
+    chave = 'medico_id' if tipo == HORARIOS else 'paciente_id'
+    id = str(mudanca['documentKey']['_id'])
+    descricao = mudanca.get('updateDescription') or {}
+    alteracoes = [(campo, 'atualizado') for campo in descricao.get('updatedFields', {})]
+    alteracoes += [(campo, 'removido') for campo in descricao.get('removedFields', [])]
+
+    resultado = []
+    for campo, acao in alteracoes:
+        partes = campo.split('.')
+        if partes[0] != tipo:
+            continue
+        data = partes[1] if len(partes) > 1 else None
+        hora = partes[2] if len(partes) > 2 else None
+        resultado.append(evento(tipo, acao, **{chave: id}, data=data, hora=hora))
+    return resultado
+
+
+def observar_mudancas(db, barramento=None, espera_s=5):
+    """Publica as mudanças de horários e consultas vindas de change streams (thread própria).
+
+    Se o servidor não suporta change streams (não é replica set), volta para
+    a publicação pelas rotas e termina.
+    """
+    if barramento is None:
+        barramento = barramentos.de(None)
+    pipeline = [{'$match': {
+        'operationType': 'update',
+        'ns.coll': {'$in': ['medicos', 'pacientes']},
+    }}]
+    retomar = None
+    while True:
+        try:
+            with db.watch(pipeline, resume_after=retomar) as stream:
+                barramento.fonte = 'change_stream'
+                for mudanca in stream:
+                    retomar = stream.resume_token
+                    for item in eventos_da_mudanca(mudanca):
+                        barramento.publicar(item)
+        except (OperationFailure, NotImplementedError) as e:
+            # NotImplementedError: mongomock, usado no teste de carga
+            barramento.fonte = 'local'
+            print(f"Change streams indisponíveis, eventos publicados pelas rotas: {e}")
+            return
+        except PyMongoError as e:
+            barramento.fonte = 'local'
+            print(f"Change stream interrompido, tentando de novo em {espera_s}s: {e}")
+            time.sleep(espera_s)
@@ -0,0 +1,273 @@
+"""
+Exportação de pacientes e consultas em CSV ou Parquet.
+
+Executa: python exportacao.py consultas --de 2025-11-01 --ate 2025-11-30 [--formato csv|parquet] [--saida arquivo]
+                              [--clinica nome]
+
+Para os extratos mensais dos analistas, que antes achatavam o JSON de
+`/pacientes`. Os documentos são lidos de um cursor em lotes e cada mapa
+`consultas` (data → hora → consulta) vira uma linha por consulta durante a
+leitura, então a memória usada não depende do tamanho da exportação: o CSV
+sai em blocos de alguns KB e o Parquet em row groups de `lote` linhas.
+
+A API expõe o mesmo conteúdo em `GET /exportar/<tipo>` (streaming) e, para
+extratos grandes, como tarefa em segundo plano que grava o arquivo em
+`EXPORTACAO_DIR`. Parquet precisa do pacote opcional `pyarrow`.
+"""
+import argparse
+import csv
+import io
+import itertools
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+import clinicas
+import tarefas
+from estatisticas import ler_periodo
+
+load_dotenv('.cred')
+
+diretorio = os.getenv('EXPORTACAO_DIR', 'exportacoes')
+
+COLUNAS = {
+    'pacientes': ['id', 'nome', 'cpf', 'celular', 'idade'],
+    'consultas': ['paciente_id', 'paciente_nome', 'paciente_cpf', 'data', 'hora', 'medico', 'especialidade', 'status'],
+}
+FORMATOS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+TAMANHO_BLOCO = 64 * 1024
+
+
+class FormatoIndisponivel(Exception):
+    pass
+
+
+def periodo(de, ate):
+    """Valida o período opcional da exportação (levanta PeriodoInvalido)"""
+    if de is None and ate is None:
+        return None, None
+    inicio, fim = ler_periodo(de, ate)
+    return inicio.isoformat(), fim.isoformat()
+
+
+def linhas_pacientes(collection, lote=1000):
+    projecao = {"nome": 1, "cpf": 1, "celular": 1, "idade": 1}
+    for paciente in collection.find({}, projecao, batch_size=lote):
+        yield {
+            'id': str(paciente['_id']),
+            'nome': paciente.get('nome'),
+            'cpf': paciente.get('cpf'),
+            'celular': paciente.get('celular'),
+            'idade': paciente.get('idade'),
+        }
+
+
+def linhas_consultas(collection, de=None, ate=None, lote=1000, arquivo=False):
+    """Uma linha por consulta, com as datas entre `de` e `ate` (AAAA-MM-DD já validadas) se informadas.
+
+    Com `arquivo`, `collection` é `consultas_arquivo`: mesmo mapa `consultas`,
+    com o paciente em `paciente_id` e um documento por mês.
+    """
+    filtro = {"consultas": {"$type": "object", "$ne": {}}}
+    if arquivo and de is not None:
+        filtro["mes"] = {"$gte": de[:7], "$lte": ate[:7]}
+    projecao = {"nome": 1, "cpf": 1, "consultas": 1, "paciente_id": 1}
+    ordem = [("paciente_id", 1), ("mes", 1)] if arquivo else None
+    for paciente in collection.find(filtro, projecao, sort=ordem, batch_size=lote):
+        paciente_id = paciente['paciente_id'] if arquivo else paciente['_id']
+        for data in sorted(paciente['consultas']):
+            if de is not None and not de <= data <= ate:
+                continue
+            consultas_do_dia = paciente['consultas'][data]
+            if not isinstance(consultas_do_dia, dict):
+                continue
+            for hora in sorted(consultas_do_dia):
+                consulta = consultas_do_dia[hora] if isinstance(consultas_do_dia[hora], dict) else {}
+                yield {
+                    'paciente_id': str(paciente_id),
+                    'paciente_nome': paciente.get('nome'),
+                    'paciente_cpf': paciente.get('cpf'),
+                    'data': data,
+                    'hora': hora,
+                    'medico': consulta.get('medico'),
+                    'especialidade': consulta.get('especialidade'),
+                    'status': consulta.get('status'),
+                }
+
+
+def linhas(db, tipo, de=None, ate=None, lote=1000, incluir_arquivo=False):
+    if tipo == 'pacientes':
+        return linhas_pacientes(db['pacientes'], lote)
+    vivas = linhas_consultas(db['pacientes'], de, ate, lote)
+    if not incluir_arquivo:
+        return vivas
+    # As consultas arquivadas (mais antigas) vêm antes das do documento vivo
+    return itertools.chain(linhas_consultas(db['consultas_arquivo'], de, ate, lote, arquivo=True), vivas)
+
+
+def csv_em_blocos(linhas, colunas):
+    """Gera o CSV em blocos de bytes de ~TAMANHO_BLOCO"""
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=colunas, lineterminator='\n')
+    escritor.writeheader()
+    for linha in linhas:
+        escritor.writerow(linha)
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _Saida:
+    """Arquivo só de escrita que entrega os bytes já escritos a quem está transmitindo"""
+
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def write(self, dados):
+        dados = bytes(dados)
+        self._partes.append(dados)
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        # Posição absoluta: o writer do Parquet a usa para os offsets do rodapé
+        return self._posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def retirar(self):
+        dados = b''.join(self._partes)
+        self._partes = []
+        return dados
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise FormatoIndisponivel("Exportação em Parquet precisa do pacote pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def parquet_em_blocos(linhas, colunas, lote=10000):
+    """Gera o Parquet em blocos de bytes, um row group a cada `lote` linhas"""
+    pa = _pyarrow()
+    esquema = pa.schema([
+        (coluna, pa.int64() if coluna == 'idade' else pa.string()) for coluna in colunas
+    ])
+    saida = _Saida()
+    escritor = pa.parquet.ParquetWriter(saida, esquema)
+    try:
+        pendentes = []
+        for linha in linhas:
+            pendentes.append(linha)
+            if len(pendentes) >= lote:
+                escritor.write_table(pa.Table.from_pylist(pendentes, schema=esquema))
+                pendentes = []
+                yield saida.retirar()
+        if pendentes:
+            escritor.write_table(pa.Table.from_pylist(pendentes, schema=esquema))
+    finally:
+        escritor.close()
+    yield saida.retirar()
+
+
+def exportar(db, tipo, formato='csv', de=None, ate=None, lote=1000, incluir_arquivo=False):
+    """Gerador de blocos de bytes com a exportação completa.
+
+    Formato e período são validados aqui, antes de qualquer byte ser gerado.
+    """
+    de, ate = periodo(de, ate)
+    if formato == 'parquet':
+        _pyarrow()
+        return parquet_em_blocos(linhas(db, tipo, de, ate, lote, incluir_arquivo), COLUNAS[tipo], max(lote, 1000))
+    return csv_em_blocos(linhas(db, tipo, de, ate, lote, incluir_arquivo), COLUNAS[tipo])
+
+
+def nome_arquivo(tipo, formato, de=None, ate=None):
+    sufixo = f"_{de}_{ate}" if de else ""
+    return f"{tipo}{sufixo}.{FORMATOS[formato][1]}"
+
+
+def gravar(blocos, caminho):
+    """Grava os blocos num arquivo temporário e o renomeia no fim, para nunca expor arquivo pela metade"""
+    os.makedirs(os.path.dirname(caminho) or '.', exist_ok=True)
+    temporario = caminho + '.parcial'
+    tamanho = 0
+    with open(temporario, 'wb') as arquivo:
+        for bloco in blocos:
+            arquivo.write(bloco)
+            tamanho += len(bloco)
+    os.replace(temporario, caminho)
+    return tamanho
+
+
+def pasta(nome_banco):
+    """Diretório dos arquivos exportados; com várias clínicas, um subdiretório por banco"""
+    return os.path.join(diretorio, nome_banco) if clinicas.habilitado else diretorio
+
+
+@tarefas.tarefa('exportar', concorrencia=1, timeout_s=3600)
+def exportar_em_arquivo(db, tipo, formato='csv', de=None, ate=None, incluir_arquivo=False):
+    carimbo = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+    nome = f"{carimbo}_{nome_arquivo(tipo, formato, de, ate)}"
+    try:
+        blocos = exportar(db, tipo, formato, de, ate, incluir_arquivo=incluir_arquivo)
+    except FormatoIndisponivel as e:
+        raise tarefas.FalhaDefinitiva(str(e))
+    tamanho = gravar(blocos, os.path.join(pasta(db.name), nome))
+    return {"arquivo": nome, "bytes": tamanho, "url": f"/exportar/arquivos/{nome}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('tipo', choices=sorted(COLUNAS))
+    parser.add_argument('--formato', choices=sorted(FORMATOS), default='csv')
+    parser.add_argument('--de')
+    parser.add_argument('--ate')
+    parser.add_argument('--saida', help='arquivo de saída (padrão: stdout)')
+    parser.add_argument('--lote', type=int, default=1000)
+    parser.add_argument('--incluir-arquivo', action='store_true', help='inclui as consultas arquivadas')
+    parser.add_argument('--clinica', help='clínica, com várias clínicas (CLINICAS)')
+    args = parser.parse_args()
+
+    import clinicas
+    from database import banco
+
+    db = banco('relatorios', clinicas.resolver(args.clinica))
+    try:
+        blocos = exportar(db, args.tipo, args.formato, args.de, args.ate, args.lote, args.incluir_arquivo)
+    except (FormatoIndisponivel, ValueError) as e:
+        sys.exit(str(e))
+    if args.saida:
+        tamanho = gravar(blocos, args.saida)
+        print(f"{tamanho} bytes gravados em {args.saida}", file=sys.stderr)
+    else:
+        for bloco in blocos:
+            sys.stdout.buffer.write(bloco)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Gera uma clínica sintética (médicos, agendas, pacientes e consultas) para testes de desempenho.
+
+Executa: python gerar_dados.py --medicos 200 --pacientes 1000000 [--de 2025-11-03 --ate 2026-01-30]
+                               [--saida mongo|ndjson] [--dir dados] [--seed 42] [--limpar]
+
+Os dados são determinísticos para a mesma seed e parecidos com os reais:
+CPFs com dígitos verificadores válidos, CRMs e celulares com UF/DDD
+ponderados, especialidades e frequência de consultas com distribuição
+desigual (poucos pacientes concentram muitas consultas) e médicos com
+dias de atendimento e taxa de ocupação próprios. Cada horário ocupado da
+agenda de um médico aparece também nas `consultas` do paciente.
+
+Os documentos já trazem os campos derivados usados pela busca. Com
+`--saida mongo` são gravados com `insert_many` em lotes no banco de
+MONGO_URI/DB_NAME; com `--saida ndjson` são escritos `medicos.ndjson` e `pacientes.ndjson`, um
+documento por linha (importáveis com `mongoimport`). O admin continua sendo
+criado por `create_admin.py`.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+
+from dotenv import load_dotenv
+
+from benchmarks.nomes import NOMES, SOBRENOMES
+from busca import campos_de_busca, campos_de_busca_medico
+
+load_dotenv('.cred')
+
+ESPECIALIDADES = {
+    'Clínica Geral': 30, 'Pediatria': 15, 'Ginecologia': 12, 'Cardiologia': 10, 'Ortopedia': 10,
+    'Dermatologia': 8, 'Oftalmologia': 6, 'Psiquiatria': 5, 'Neurologia': 4,
+}
+UFS = {'SP': 60, 'RJ': 12, 'MG': 10, 'PR': 6, 'RS': 6, 'BA': 6}
+DDDS = {'11': 55, '12': 5, '13': 5, '19': 5, '21': 12, '31': 10, '41': 8}
+HORAS_SEMANA = [f"{h:02d}:{m:02d}" for h in range(8, 18) for m in (0, 30)]
+HORAS_SABADO = HORAS_SEMANA[:8]
+
+
+def _pesos(opcoes):
+    return list(opcoes), list(accumulate(opcoes.values()))
+
+
+_ESPECIALIDADES = _pesos(ESPECIALIDADES)
+_UFS = _pesos(UFS)
+_DDDS = _pesos(DDDS)
+# Nomes mais comuns primeiro: o peso cai com a posição na lista (lei de Zipf)
+_PESOS_NOMES = list(accumulate(1 / (i + 1) for i in range(len(NOMES))))
+_PESOS_SOBRENOMES = list(accumulate(1 / (i + 1) for i in range(len(SOBRENOMES))))
+
+
+def _escolher(rng, opcoes):
+    valores, acumulados = opcoes
+    return rng.choices(valores, cum_weights=acumulados)[0]
+
+
+def cpf(rng):
+    """CPF formatado com dígitos verificadores válidos"""
+    digitos = [rng.randrange(10) for _ in range(9)]
+    for tamanho in (9, 10):
+        soma = sum(d * (tamanho + 1 - i) for i, d in enumerate(digitos))
+        digitos.append(soma * 10 % 11 % 10)
+    d = ''.join(map(str, digitos))
+    return f"{d[:3]}.{d[3:6]}.{d[6:9]}-{d[9:]}"
+
+
+def cpf_valido(valor):
+    digitos = [int(c) for c in valor if c.isdigit()]
+    if len(digitos) != 11 or len(set(digitos)) == 1:
+        return False
+    for tamanho in (9, 10):
+        soma = sum(d * (tamanho + 1 - i) for i, d in enumerate(digitos[:tamanho]))
+        if soma * 10 % 11 % 10 != digitos[tamanho]:
+            return False
+    return True
+
+
+def _nome(rng):
+    partes = rng.choices(NOMES, cum_weights=_PESOS_NOMES, k=2 if rng.random() < 0.3 else 1)
+    partes += rng.choices(SOBRENOMES, cum_weights=_PESOS_SOBRENOMES, k=rng.choice((1, 2, 2, 3)))
+    return ' '.join(dict.fromkeys(partes))
+
+
+def _rng(seed, tipo, i):
+    # Um gerador por documento: o paciente i é o mesmo qualquer que seja a ordem de geração
+    return random.Random((seed * 1_000_003 + tipo) * 10_000_019 + i)
+
+
+def nome_paciente(seed, i):
+    return _nome(_rng(seed, 1, i))
+
+
+def dias_do_periodo(de, ate):
+    dias = []
+    dia = de
+    while dia <= ate:
+        dias.append(dia)
+        dia += timedelta(days=1)
+    return dias
+
+
+def _sortear_paciente(rng, pacientes):
+    # 80% das consultas ficam com 20% dos pacientes
+    if not pacientes:
+        return None
+    if rng.random() < 0.8:
+        return rng.randrange(max(1, pacientes // 5))
+    return rng.randrange(pacientes)
+
+
+def gerar_medicos(quantidade, pacientes, de, ate, seed=42):
+    """Médicos com agendas completas no período.
+
+    Retorna (medicos, consultas_por_paciente), em que o segundo mapeia o
+    índice do paciente para as consultas que ocupam horários dos médicos.
+    Um paciente nunca ocupa dois horários na mesma data e hora.
+    """
+    rng = random.Random(seed)
+    dias = dias_do_periodo(de, ate)
+    medicos = []
+    consultas = {}
+    ocupados = set()
+    for i in range(quantidade):
+        especialidade = _escolher(rng, _ESPECIALIDADES)
+        nome = f"{'Dra.' if rng.random() < 0.5 else 'Dr.'} {_nome(rng)}"
+        # Cada médico atende de 2 a 5 dias úteis por semana, alguns também no sábado
+        dias_semana = set(rng.sample(range(5), rng.randint(2, 5)))
+        if rng.random() < 0.3:
+            dias_semana.add(5)
+        ocupacao = rng.betavariate(5, 3)
+        horarios = {}
+        for dia in dias:
+            if dia.weekday() not in dias_semana:
+                continue
+            agenda = {}
+            for hora in HORAS_SABADO if dia.weekday() == 5 else HORAS_SEMANA:
+                paciente = _sortear_paciente(rng, pacientes) if rng.random() < ocupacao else None
+                if paciente is not None and (paciente, dia, hora) not in ocupados:
+                    ocupados.add((paciente, dia, hora))
+                    agenda[hora] = {"status": "ocupado", "paciente": nome_paciente(seed, paciente)}
+                    consultas.setdefault(paciente, []).append((dia.isoformat(), hora, nome, especialidade))
+                else:
+                    agenda[hora] = {"status": "disponível", "paciente": "nenhum"}
+            horarios[dia.isoformat()] = agenda
+        medico = {
+            "nome": nome,
+            "cpf": cpf(rng),
+            "crm": f"{rng.randint(10000, 299999)}-{_escolher(rng, _UFS)}",
+            "especialidade": especialidade,
+            "horarios": horarios,
+            "versao": 1,
+        }
+        medico.update(campos_de_busca_medico(medico))
+        medicos.append(medico)
+    return medicos, consultas
+
+
+def gerar_paciente(seed, i, consultas=()):
+    rng = _rng(seed, 1, i)
+    nome = _nome(rng)
+    idade = min(100, int(rng.triangular(0, 100, 35)))
+    numero = rng.randrange(10 ** 8)
+    paciente = {
+        "nome": nome,
+        "cpf": cpf(rng),
+        "celular": f"({_escolher(rng, _DDDS)}) 9{numero // 10000:04d}-{numero % 10000:04d}",
+        "idade": idade,
+        "consultas": {},
+        "versao": 1,
+    }
+    for data, hora, medico, especialidade in consultas:
+        paciente["consultas"].setdefault(data, {})[hora] = {
+            "medico": medico, "especialidade": especialidade, "status": "confirmado",
+        }
+    paciente.update(campos_de_busca(paciente))
+    return paciente
+
+
+def gerar_pacientes(quantidade, consultas_por_paciente, seed=42):
+    for i in range(quantidade):
+        yield gerar_paciente(seed, i, consultas_por_paciente.get(i, ()))
+
+
+def _em_lotes(documentos, lote):
+    atual = []
+    for documento in documentos:
+        atual.append(documento)
+        if len(atual) >= lote:
+            yield atual
+            atual = []
+    if atual:
+        yield atual
+
+
+def gravar_mongo(db, medicos, pacientes, lote=10000, limpar=False):
+    from database import garantir_indices
+
+    if limpar:
+        db['medicos'].drop()
+        db['pacientes'].drop()
+    total = {"medicos": 0, "pacientes": 0}
+    for nome, documentos in (("medicos", medicos), ("pacientes", pacientes)):
+        # Médicos têm agendas grandes: lotes menores para não passar do limite de mensagem
+        tamanho = max(1, lote // 100) if nome == "medicos" else lote
+        for parte in _em_lotes(documentos, tamanho):
+            db[nome].insert_many(parte, ordered=False)
+            total[nome] += len(parte)
+    garantir_indices(db)
+    return total
+
+
+def gravar_ndjson(diretorio, medicos, pacientes):
+    os.makedirs(diretorio, exist_ok=True)
+    total = {}
+    for nome, documentos in (("medicos", medicos), ("pacientes", pacientes)):
+        with open(os.path.join(diretorio, f"{nome}.ndjson"), 'w', encoding='utf-8') as arquivo:
+            total[nome] = 0
+            for documento in documentos:
+                arquivo.write(json.dumps(documento, ensure_ascii=False))
+                arquivo.write('\n')
+                total[nome] += 1
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--medicos', type=int, default=100)
+    parser.add_argument('--pacientes', type=int, default=10000)
+    parser.add_argument('--de', type=date.fromisoformat, default=date(2025, 11, 3))
+    parser.add_argument('--ate', type=date.fromisoformat, default=date(2026, 1, 30))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--saida', choices=('mongo', 'ndjson'), default='mongo')
+    parser.add_argument('--dir', default='dados')
+    parser.add_argument('--lote', type=int, default=10000)
+    parser.add_argument('--limpar', action='store_true', help='apaga médicos e pacientes antes de gravar')
+    parser.add_argument('--clinica', help='clínica de destino, com várias clínicas (CLINICAS)')
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    medicos, consultas = gerar_medicos(args.medicos, args.pacientes, args.de, args.ate, args.seed)
+    pacientes = gerar_pacientes(args.pacientes, consultas, args.seed)
+    if args.saida == 'mongo':
+        import clinicas
+        from database import banco
+        db = banco('importacao', clinicas.resolver(args.clinica))
+        total = gravar_mongo(db, medicos, pacientes, args.lote, args.limpar)
+        destino = f"banco {db.name}"
+    else:
+        total = gravar_ndjson(args.dir, medicos, pacientes)
+        destino = args.dir
+    agendados = sum(len(c) for c in consultas.values())
+    print(f"{total['medicos']} médicos, {total['pacientes']} pacientes e {agendados} consultas "
+          f"gravados em {destino} em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Formato compacto dos dias de `medicos.horarios` (grade de horários em bits).
+
+No formato original cada horário é uma entrada do mapa do dia
+(`"14:30": {"status": ..., "paciente": ...}`), então um dia com 48 horários
+ocupa alguns KB de BSON e saber quais estão livres exige percorrer o mapa.
+No formato compacto o dia é uma grade fixa de `GRADE_MINUTOS` em
+`GRADE_MINUTOS` minutos a partir de 00:00, guardada como dois inteiros de bits
+(bit i = horário i da grade):
+
+    {"grade": 30, "livres": <bits>, "ocupados": <bits>, "detalhes": {"14:30": {...}}}
+
+`detalhes` só guarda os horários cujo conteúdo não é o padrão de horário
+livre (`LIVRE`), como os ocupados com o nome do paciente. Livre ou ocupado
+segue a mesma regra das estatísticas (`estatisticas.LIVRES`).
+
+O formato é opcional (`HORARIOS_FORMATO=grade`) e vale dia a dia: as
+leituras aceitam os dois e a API sempre responde no formato original. Dias
+com horários fora da grade (ex.: 08:15 numa grade de 30 minutos) continuam
+no formato original.
+"""
+import os
+import re
+
+import numpy as np
+from dotenv import load_dotenv
+
+from estatisticas import LIVRES
+
+load_dotenv('.cred')
+
+formato = os.getenv('HORARIOS_FORMATO', 'mapa')
+MINUTOS = int(os.getenv('GRADE_MINUTOS', '30'))
+# `contar_bits` separa os bits com $divide/$floor, em double: exato só até 2**53
+MAX_SLOTS = 53
+
+
+def _slots(minutos):
+    """Horários por dia de uma grade de `minutos`; ValueError se ela não cabe no formato compacto"""
+    if (24 * 60) % minutos or 24 * 60 // minutos > MAX_SLOTS:
+        raise ValueError(f"GRADE_MINUTOS deve dividir o dia em no máximo {MAX_SLOTS} horários (ex.: 30, 45, 60)")
+    return 24 * 60 // minutos
+
+
+SLOTS = _slots(MINUTOS)
+
+HORA = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$')
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+HORAS = [f"{i * MINUTOS // 60:02d}:{i * MINUTOS % 60:02d}" for i in range(SLOTS)]
+_INDICE = {hora: i for i, hora in enumerate(HORAS)}
+# Tentativas de regravar um dia compacto alterado por outra requisição entre a leitura e a escrita
+TENTATIVAS = 5
+
+
+def compacto(dia):
+    return isinstance(dia, dict) and 'grade' in dia
+
+
+def livre(info):
+    return isinstance(info, dict) and str(info.get('status', '')).lower() in LIVRES
+
+
+def compactar_dia(slots):
+    """Mapa hora → horário para o formato compacto; None se algum horário está fora da grade"""
+    livres = ocupados = 0
+    detalhes = {}
+    for hora, info in slots.items():
+        i = _INDICE.get(hora)
+        if i is None:
+            return None
+        if livre(info):
+            livres |= 1 << i
+        else:
+            ocupados |= 1 << i
+        if info != LIVRE:
+            detalhes[hora] = info
+    return {"grade": MINUTOS, "livres": livres, "ocupados": ocupados, "detalhes": detalhes}
+
+
+def expandir_dia(dia):
+    """Dia compacto (de qualquer grade) de volta para o mapa hora → horário, em ordem de hora"""
+    if not compacto(dia):
+        return dia
+    minutos = dia['grade']
+    oferecidos = dia['livres'] | dia['ocupados']
+    detalhes = dia.get('detalhes') or {}
+    slots = {}
+    i = 0
+    while oferecidos >> i:
+        if oferecidos >> i & 1:
+            hora = f"{i * minutos // 60:02d}:{i * minutos % 60:02d}"
+            slots[hora] = detalhes.get(hora, dict(LIVRE))
+        i += 1
+    return slots
+
+
+def expandir(horarios):
+    """Mapa data → dia no formato da API (dias compactos expandidos, os demais intactos)"""
+    if not horarios:
+        return horarios
+    return {data: expandir_dia(dia) for data, dia in horarios.items()}
+
+
+def armazenar(slots):
+    """Como um dia recebido pela API é gravado, conforme `HORARIOS_FORMATO`"""
+    if formato != 'grade' or not isinstance(slots, dict):
+        return slots
+    return compactar_dia(slots) or slots
+
+
+def mascara_livres(dia):
+    """Bits dos horários livres do dia na grade atual; None se o dia não cabe nela"""
+    if compacto(dia) and dia['grade'] == MINUTOS:
+        return dia['livres']
+    if not isinstance(dia, dict):
+        return None
+    dia = compactar_dia(expandir_dia(dia))
+    return dia['livres'] if dia is not None else None
+
+
+def mascara_janela(hora_de=None, hora_ate=None):
+    """Bits dos horários da grade entre `hora_de` e `hora_ate` (inclusive)"""
+    inicio = _minutos(hora_de) if hora_de else 0
+    fim = _minutos(hora_ate) if hora_ate else 24 * 60 - 1
+    mascara = 0
+    for i in range(SLOTS):
+        if inicio <= i * MINUTOS <= fim:
+            mascara |= 1 << i
+    return mascara
+
+
+def _minutos(hora):
+    horas, minutos = hora.split(':')
+    return int(horas) * 60 + int(minutos)
+
+
+def horarios_livres(dias, hora_de=None, hora_ate=None):
+    """Horários livres de uma lista de dias [(chave, data, dia)] → {chave: {data: [horas]}}.
+
+    As máscaras de todos os dias são combinadas com a janela de horas e
+    abertas em bits de uma vez com numpy; só os dias fora da grade percorrem
+    o mapa. Chaves e datas sem horário livre não aparecem.
+    """
+    resultado = {}
+    mascaras = []
+    posicoes = []
+    for chave, data, dia in dias:
+        mascara = mascara_livres(dia)
+        if mascara is not None:
+            mascaras.append(mascara)
+            posicoes.append((chave, data))
+            continue
+        if not isinstance(dia, dict):
+            continue
+        inicio = _minutos(hora_de) if hora_de else 0
+        fim = _minutos(hora_ate) if hora_ate else 24 * 60 - 1
+        horas = sorted(h for h, info in dia.items() if HORA.match(h) and livre(info) and inicio <= _minutos(h) <= fim)
+        if horas:
+            resultado.setdefault(chave, {})[data] = horas
+
+    if mascaras:
+        bits = np.array(mascaras, dtype='<u8') & np.uint64(mascara_janela(hora_de, hora_ate))
+        abertos = np.unpackbits(bits.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')[:, :SLOTS]
+        linhas, colunas = np.nonzero(abertos)
+        for linha, coluna in zip(linhas.tolist(), colunas.tolist()):
+            chave, data = posicoes[linha]
+            resultado.setdefault(chave, {}).setdefault(data, []).append(HORAS[coluna])
+    return resultado
+
+
+def contar_bits(campo):
+    """Expressão de agregação com a quantidade de bits 1 de um campo inteiro da grade"""
+    return {"$add": [
+        {"$mod": [{"$floor": {"$divide": [campo, 2 ** i]}}, 2]} for i in range(SLOTS)
+    ]}
+
+
+def alterar_dia(atual, hora, info=None):
+    """Dia com o horário gravado (`info`) ou removido, no formato em que deve ser regravado"""
+    slots = dict(expandir_dia(atual) or {})
+    if info is None:
+        slots.pop(hora, None)
+    else:
+        slots[hora] = info
+    novo = compactar_dia(slots) if compacto(atual) or formato == 'grade' else None
+    return slots if novo is None else novo
+
+
+def alterar_horario(collection, id, data, hora, info=None):
+    """Grava (`info`) ou remove (`info=None`) um horário, em qualquer formato do dia.
+
+    Retorna False se o médico não existe. Dias no formato original são
+    alterados pelo caminho do campo, numa única escrita; dias compactos (ou
+    novos, com `HORARIOS_FORMATO=grade`) são lidos, alterados e regravados
+    com a condição de que não tenham mudado desde a leitura.
+    """
+    caminho = f"horarios.{data}"
+    if formato != 'grade':
+        operacao = {"$set": {f"{caminho}.{hora}": info}} if info is not None else {"$unset": {f"{caminho}.{hora}": ""}}
+        resultado = collection.update_one({"_id": id, f"{caminho}.grade": {"$exists": False}}, operacao)
+        if resultado.matched_count:
+            return True
+
+    for _ in range(TENTATIVAS):
+        medico = collection.find_one({"_id": id}, {caminho: 1})
+        if medico is None:
+            return False
+        atual = (medico.get('horarios') or {}).get(data)
+        if info is None and not compacto(atual):
+            collection.update_one({"_id": id}, {"$unset": {f"{caminho}.{hora}": ""}})
+            return True
+        novo = alterar_dia(atual, hora, info)
+        condicao = {caminho: atual} if atual is not None else {caminho: {"$exists": False}}
+        if collection.update_one(dict(condicao, _id=id), {"$set": {caminho: novo}}).matched_count:
+            return True
+    raise RuntimeError("O dia foi alterado por outra requisição; tente novamente")
+
+
+def livres_no_periodo(collection, de, ate, filtro=None, hora_de=None, hora_ate=None):
+    """Médicos com horários livres entre as datas `de` e `ate` (AAAA-MM-DD), em ordem de nome.
+
+    O servidor devolve só os dias do período; a busca dos livres é feita por
+    `horarios_livres` sobre todos os dias de todos os médicos de uma vez.
+    """
+    medicos = list(collection.aggregate([
+        {"$match": dict(filtro or {}, horarios={"$type": "object"})},
+        {"$project": {
+            "nome": 1,
+            "especialidade": 1,
+            "dias": {"$filter": {
+                "input": {"$objectToArray": "$horarios"},
+                "as": "d",
+                "cond": {"$and": [{"$gte": ["$$d.k", de]}, {"$lte": ["$$d.k", ate]}]},
+            }},
+        }},
+        {"$sort": {"nome": 1, "_id": 1}},
+    ]))
+    livres = horarios_livres(
+        ((i, d["k"], d["v"]) for i, medico in enumerate(medicos) for d in medico["dias"]),
+        hora_de, hora_ate,
+    )
+    resultado = []
+    for i, medico in enumerate(medicos):
+        if i not in livres:
+            continue
+        dias = dict(sorted(livres[i].items()))
+        resultado.append({
+            "medico_id": str(medico["_id"]),
+            "nome": medico.get("nome"),
+            "especialidade": medico.get("especialidade"),
+            "livres": dias,
+            "total": sum(len(horas) for horas in dias.values()),
+        })
+    return resultado
@@ -0,0 +1,185 @@
+"""
+Health checks de liveness e readiness.
+
+O `MongoClient` conecta de forma preguiçosa, então só um comando real
+(`ping`) diz se o banco está acessível. Para que cada probe do orquestrador
+não vire um `ping` no banco, o resultado fica em cache por
+`HEALTH_CACHE_S` segundos e apenas uma thread por vez refaz a verificação
+(as demais recebem o último resultado).
+"""
+import os
+import threading
+import time
+
+import pymongo
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+load_dotenv('.cred')
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Contabiliza conexões abertas e em uso nos pools do PyMongo.
+
+    O PyMongo mantém um pool por servidor (com réplicas, um por membro) e o
+    `maxPoolSize` vale para cada um, então as contagens são por endereço.
+    """
+
+    def __init__(self):
+        self._abertas = {}
+        self._em_uso = {}
+        self._lock = threading.Lock()
+
+    def _somar(self, contagens, endereco, delta):
+        with self._lock:
+            contagens[endereco] = max(0, contagens.get(endereco, 0) + delta)
+
+    @property
+    def abertas(self):
+        with self._lock:
+            return sum(self._abertas.values())
+
+    @property
+    def em_uso(self):
+        with self._lock:
+            return sum(self._em_uso.values())
+
+    @property
+    def em_uso_max(self):
+        """Conexões em uso no pool do servidor mais ocupado"""
+        with self._lock:
+            return max(self._em_uso.values(), default=0)
+
+    def connection_created(self, event):
+        self._somar(self._abertas, event.address, 1)
+
+    def connection_closed(self, event):
+        self._somar(self._abertas, event.address, -1)
+
+    def connection_checked_out(self, event):
+        self._somar(self._em_uso, event.address, 1)
+
+    def connection_checked_in(self, event):
+        self._somar(self._em_uso, event.address, -1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+
+class ReadinessProbe:
+    """Verificação de prontidão com `ping` em cache"""
+
+    def __init__(self, pool_stats, max_pool_size, cache_s=2.0, timeout_s=0.5, limite_saturacao=0.9):
+        self.pool_stats = pool_stats
+        self.max_pool_size = max_pool_size
+        self.cache_s = cache_s
+        self.timeout_s = timeout_s
+        self.limite_saturacao = limite_saturacao
+        # `_lock` deixa uma thread por vez refazer o ping; `_estado` protege o par
+        # (resultado, momento), lido por todas sem esperar o ping em andamento
+        self._lock = threading.Lock()
+        self._estado = threading.Lock()
+        self._ultimo = None
+        self._verificado_em = None
+
+    @classmethod
+    def from_env(cls, pool_stats, max_pool_size):
+        return cls(
+            pool_stats,
+            max_pool_size,
+            cache_s=float(os.getenv('HEALTH_CACHE_S', '2')),
+            timeout_s=float(os.getenv('HEALTH_PING_TIMEOUT_S', '0.5')),
+            limite_saturacao=float(os.getenv('HEALTH_POOL_SATURADO', '0.9')),
+        )
+
+    def invalidar(self):
+        with self._estado:
+            self._ultimo = None
+            self._verificado_em = None
+
+    def _ler(self):
+        with self._estado:
+            return self._ultimo, self._verificado_em
+
+    def _ping(self, db):
+        inicio = time.perf_counter()
+        try:
+            with pymongo.timeout(self.timeout_s):
+                db.command('ping')
+        except Exception as e:
+            return {'ok': False, 'erro': str(e), 'ping_ms': None}
+        return {'ok': True, 'ping_ms': round((time.perf_counter() - inicio) * 1000, 3)}
+
+    def _resultado_ping(self, db):
+        ultimo, verificado_em = self._ler()
+        agora = time.monotonic()
+        if ultimo is not None and agora - verificado_em < self.cache_s:
+            return ultimo, agora - verificado_em
+        # Só uma thread refaz o ping; as outras usam o último resultado, se houver
+        if not self._lock.acquire(blocking=ultimo is None):
+            return ultimo, agora - verificado_em
+        try:
+            ultimo, verificado_em = self._ler()
+            if ultimo is not None and time.monotonic() - verificado_em < self.cache_s:
+                return ultimo, time.monotonic() - verificado_em
+            resultado = self._ping(db)
+            with self._estado:
+                self._ultimo = resultado
+                self._verificado_em = time.monotonic()
+            return resultado, 0.0
+        finally:
+            self._lock.release()
+
+    def pool(self):
+        # maxPoolSize é por servidor: a utilização é a do pool mais ocupado
+        em_uso_max = self.pool_stats.em_uso_max
+        return {
+            'max': self.max_pool_size,
+            'abertas': self.pool_stats.abertas,
+            'em_uso': self.pool_stats.em_uso,
+            'utilizacao': round(em_uso_max / self.max_pool_size, 3) if self.max_pool_size else 0.0,
+        }
+
+    def verificar(self, db):
+        """Retorna (corpo, status_http) da verificação de prontidão"""
+        ping, idade = self._resultado_ping(db)
+        pool = self.pool()
+        if not ping['ok']:
+            status = 'indisponivel'
+        elif pool['utilizacao'] >= self.limite_saturacao:
+            status = 'saturado'
+        else:
+            status = 'ok'
+        corpo = {
+            'status': status,
+            'mongo': {
+                'ok': ping['ok'],
+                'ping_ms': ping['ping_ms'],
+                'verificado_ha_s': round(idade, 3),
+            },
+            'pool': pool,
+        }
+        if 'erro' in ping:
+            corpo['mongo']['erro'] = ping['erro']
+        return corpo, 200 if status == 'ok' else 503
+
+
+pool_stats = PoolStats()
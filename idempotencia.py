@@ -0,0 +1,188 @@
+"""
+Suporte ao cabeçalho `Idempotency-Key` nos POSTs.
+
+Com a rede instável da clínica o front-end repete `POST /pacientes` e
+`POST /medicos/<id>/horarios`, e cada repetição criava um paciente duplicado.
+Agora a primeira resposta de cada chave é guardada na collection
+`idempotencia` (com índice TTL, ver `database.INDICES`) e num cache em
+memória na frente dela; as repetições recebem a mesma resposta, com
+`Idempotent-Replayed: true`, sem executar a rota de novo.
+
+Repetições que chegam enquanto a primeira ainda está executando esperam por
+ela (até `espera_s`): no mesmo processo por um `threading.Event`, entre
+processos consultando o registro `em_andamento` no banco. Respostas 5xx não
+são guardadas, para que a repetição possa dar certo. Reusar a chave com outro
+corpo é erro do cliente (`ChaveReutilizada`).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+from flask import Response
+from pymongo.errors import DuplicateKeyError
+
+load_dotenv('.cred')
+
+TAMANHO_MAXIMO_CHAVE = 255
+
+
+class ChaveEmUso(Exception):
+    """A requisição original com a mesma chave ainda não terminou"""
+
+
+class ChaveReutilizada(Exception):
+    """A chave já foi usada com outro corpo de requisição"""
+
+
+class _CacheRespostas:
+    """LRU com expiração para as respostas já concluídas"""
+
+    def __init__(self, capacidade, ttl_s, relogio=time.monotonic):
+        self.capacidade = capacidade
+        self.ttl_s = ttl_s
+        self._relogio = relogio
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, registro = item
+            if expira_em <= self._relogio():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return registro
+
+    def guardar(self, chave, registro):
+        with self._lock:
+            self._itens[chave] = (self._relogio() + self.ttl_s, registro)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+
+
+class RegistroIdempotencia:
+    def __init__(self, ttl_s=86400, espera_s=10.0, prazo_execucao_s=60.0, capacidade_cache=1000):
+        self.ttl_s = ttl_s
+        self.espera_s = espera_s
+        # Registros em andamento mais antigos que isso são de processos que caíram
+        self.prazo_execucao_s = prazo_execucao_s
+        self.cache = _CacheRespostas(capacidade_cache, ttl_s)
+        self._locais = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl_s=int(os.getenv('IDEMPOTENCIA_TTL_S', '86400')),
+            espera_s=float(os.getenv('IDEMPOTENCIA_ESPERA_S', '10')),
+            prazo_execucao_s=float(os.getenv('IDEMPOTENCIA_PRAZO_S', '60')),
+            capacidade_cache=int(os.getenv('IDEMPOTENCIA_CACHE', '1000')),
+        )
+
+    def processar(self, colecao, chave, corpo, executar):
+        """Executa `executar()` (que retorna um `Response`) uma única vez por chave"""
+        impressao = hashlib.sha256(corpo or b'').hexdigest()
+        limite = time.monotonic() + self.espera_s
+        while True:
+            registro = self.cache.obter(chave)
+            if registro is not None:
+                return self._repetir(registro, impressao)
+            with self._lock:
+                evento = self._locais.get(chave)
+                dono = evento is None
+                if dono:
+                    evento = self._locais[chave] = threading.Event()
+            if dono:
+                break
+            # Mesma chave executando neste processo: espera e tenta de novo
+            restante = limite - time.monotonic()
+            if restante <= 0 or not evento.wait(restante):
+                raise ChaveEmUso()
+
+        try:
+            return self._processar_no_banco(colecao, chave, impressao, executar, limite)
+        finally:
+            with self._lock:
+                del self._locais[chave]
+            evento.set()
+
+    def _processar_no_banco(self, colecao, chave, impressao, executar, limite):
+        agora = datetime.utcnow()
+        try:
+            colecao.insert_one({"_id": chave, "impressao": impressao, "estado": "em_andamento", "criado_em": agora})
+        except DuplicateKeyError:
+            registro = self._aguardar(colecao, chave, limite)
+            if registro is not None:
+                self.cache.guardar(chave, registro)
+                return self._repetir(registro, impressao)
+            if not self._assumir(colecao, chave, impressao):
+                raise ChaveEmUso()
+
+        try:
+            resposta = executar()
+        except Exception:
+            colecao.delete_one({"_id": chave})
+            raise
+        if resposta.status_code >= 500:
+            colecao.delete_one({"_id": chave})
+            return resposta
+
+        registro = {
+            "impressao": impressao,
+            "status": resposta.status_code,
+            "corpo": resposta.get_data(as_text=True),
+            "content_type": resposta.content_type,
+        }
+        colecao.update_one({"_id": chave}, {"$set": dict(registro, estado="concluido")})
+        self.cache.guardar(chave, registro)
+        return resposta
+
+    def _aguardar(self, colecao, chave, limite):
+        """Espera o registro de outro processo ficar concluído; None se não ficar a tempo"""
+        intervalo = 0.05
+        while True:
+            registro = colecao.find_one({"_id": chave})
+            if registro is None or registro.get("estado") == "concluido":
+                return registro
+            if time.monotonic() + intervalo > limite:
+                return None
+            time.sleep(intervalo)
+            intervalo = min(intervalo * 2, 0.5)
+
+    def _assumir(self, colecao, chave, impressao):
+        """Assume um registro em andamento abandonado (o processo dono caiu)"""
+        antigo = datetime.utcnow() - timedelta(seconds=self.prazo_execucao_s)
+        resultado = colecao.update_one(
+            {"_id": chave, "estado": "em_andamento", "criado_em": {"$lt": antigo}},
+            {"$set": {"impressao": impressao, "criado_em": datetime.utcnow()}},
+        )
+        if resultado.modified_count:
+            return True
+        # O registro expirou ou foi apagado (resposta 5xx) enquanto esperávamos
+        try:
+            colecao.insert_one({"_id": chave, "impressao": impressao, "estado": "em_andamento",
+                                "criado_em": datetime.utcnow()})
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def _repetir(self, registro, impressao):
+        if registro["impressao"] != impressao:
+            raise ChaveReutilizada()
+        return Response(
+            registro["corpo"],
+            status=registro["status"],
+            content_type=registro["content_type"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+registro = RegistroIdempotencia.from_env()
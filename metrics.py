@@ -0,0 +1,269 @@
+"""
+Métricas da API no formato de texto do Prometheus.
+
+Implementação mínima de contadores e histogramas, sem dependências externas,
+pensada para ter custo baixo no caminho de cada requisição: cada observação é
+uma busca binária nos limites dos buckets e alguns incrementos sob um lock.
+Os valores cumulativos exigidos pelo formato só são calculados em `render()`.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_app_context, request
+from pymongo import monitoring
+
+# Limites (em segundos) usados pelos histogramas de latência
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pares = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pares.extend(f'{n}="{v}"' for n, v in extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monotônico com rótulos"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            yield self.name + '_total', _format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    """Histograma de durações com buckets fixos"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        indice = bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(labelvalues)
+            if serie is None:
+                # contagens por bucket (+Inf no final), soma e total
+                serie = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            serie[indice] += 1
+            serie[-2] += value
+            serie[-1] += 1
+
+    def count(self, *labelvalues):
+        serie = self._series.get(labelvalues)
+        return serie[-1] if serie else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        limites = self.buckets + (float('inf'),)
+        for labelvalues, serie in items:
+            acumulado = 0
+            for limite, contagem in zip(limites, serie):
+                acumulado += contagem
+                labels = _format_labels(self.labelnames, labelvalues, [('le', _format_value(float(limite)))])
+                yield self.name + '_bucket', labels, acumulado
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield self.name + '_sum', labels, serie[-2]
+            yield self.name + '_count', labels, serie[-1]
+
+
+class Registry:
+    """Conjunto de métricas expostas em `/metrics`"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        linhas = []
+        for metric in self._metrics:
+            linhas.append(f'# HELP {metric.name} {metric.documentation}')
+            linhas.append(f'# TYPE {metric.name} {metric.kind}')
+            for nome, labels, valor in metric.samples():
+                linhas.append(f'{nome}{labels} {_format_value(valor)}')
+        return '\n'.join(linhas) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'http_requests', 'Requisições HTTP atendidas', ('method', 'route', 'status')))
+http_latency = registry.register(Histogram(
+    'http_request_duration_seconds', 'Latência das requisições HTTP por rota', ('method', 'route')))
+auth_latency = registry.register(Histogram(
+    'auth_check_duration_seconds', 'Tempo gasto em token_required (JWT + verificação do admin)', ('result',)))
+mongo_latency = registry.register(Histogram(
+    'mongo_command_duration_seconds', 'Duração dos comandos MongoDB', ('collection', 'command')))
+mongo_failures = registry.register(Counter(
+    'mongo_command_failures', 'Comandos MongoDB que falharam', ('collection', 'command')))
+mongo_commands = registry.register(Counter(
+    'mongo_commands', 'Comandos MongoDB por classe de rota e servidor que os recebeu', ('classe', 'servidor', 'papel')))
+sse_events = registry.register(Counter(
+    'sse_events', 'Eventos de agenda publicados em /eventos', ('tipo', 'fonte')))
+sse_evictions = registry.register(Counter(
+    'sse_clients_evicted', 'Clientes de /eventos desconectados por não consumirem a tempo'))
+tasks = registry.register(Counter(
+    'tasks', 'Tarefas em segundo plano executadas', ('tipo', 'resultado')))
+task_duration = registry.register(Histogram(
+    'task_duration_seconds', 'Duração das tarefas em segundo plano', ('tipo',),
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)))
+
+clinica_requests = registry.register(Counter(
+    'clinica_http_requests', 'Requisições HTTP por clínica (CLINICAS)', ('clinica', 'status')))
+clinica_latency = registry.register(Histogram(
+    'clinica_http_request_duration_seconds', 'Latência das requisições HTTP por clínica', ('clinica',)))
+clinica_mongo_latency = registry.register(Histogram(
+    'clinica_mongo_command_duration_seconds', 'Duração dos comandos MongoDB por clínica', ('clinica',)))
+horarios_lote = registry.register(Histogram(
+    'horarios_lote_operacoes', 'Alterações de horários gravadas por lote do agrupador (HORARIOS_AGRUPAR_MS)', (),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def render():
+    """Serializa todas as métricas registradas no formato do Prometheus"""
+    return registry.render()
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Listener do PyMongo que mede a duração de cada comando por collection.
+
+    O nome da collection só aparece no evento `started`; ele fica guardado
+    até o `succeeded`/`failed` correspondente, identificado pela conexão e
+    pelo request_id do protocolo.
+    """
+
+    def __init__(self):
+        self._pendentes = {}
+
+    def started(self, event):
+        comando = event.command_name
+        if comando == 'getMore':
+            collection = event.command.get('collection', '')
+        else:
+            collection = event.command.get(comando, '')
+        if not isinstance(collection, str):
+            collection = ''
+        self._pendentes[(event.connection_id, event.request_id)] = collection
+        # Classe de consistência da requisição (app.connect_db); comandos fora de requisições são "outra"
+        classe = g.get('classe_consistencia', 'outra') if has_app_context() else 'outra'
+        host, porta = event.connection_id
+        mongo_commands.inc(classe, f'{host}:{porta}', server_roles.papel(event.connection_id))
+
+    def succeeded(self, event):
+        collection = self._pendentes.pop((event.connection_id, event.request_id), '')
+        mongo_latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+        clinica = g.get('clinica') if has_app_context() else None
+        if clinica is not None:
+            clinica_mongo_latency.observe(event.duration_micros / 1e6, clinica)
+
+    def failed(self, event):
+        collection = self._pendentes.pop((event.connection_id, event.request_id), '')
+        mongo_latency.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_failures.inc(collection, event.command_name)
+
+
+command_listener = CommandTimer()
+
+PAPEIS = {
+    'RSPrimary': 'primario',
+    'RSSecondary': 'secundario',
+    'Standalone': 'standalone',
+    'Mongos': 'mongos',
+}
+
+
+class ServerRoles(monitoring.ServerListener):
+    """Papel atual de cada servidor, acompanhado pelo monitoramento do PyMongo.
+
+    Permite saber se as leituras configuradas para secundários (consistencia.py)
+    de fato chegam a eles.
+    """
+
+    def __init__(self):
+        self._papeis = {}
+
+    def opened(self, event):
+        pass
+
+    def description_changed(self, event):
+        self._papeis[event.server_address] = PAPEIS.get(event.new_description.server_type_name, 'desconhecido')
+
+    def closed(self, event):
+        self._papeis.pop(event.server_address, None)
+
+    def papel(self, endereco):
+        return self._papeis.get(endereco, 'desconhecido')
+
+
+server_roles = ServerRoles()
+
+
+def _iniciar_cronometro():
+    g._metrics_inicio = time.perf_counter()
+
+
+def _registrar_requisicao(response):
+    inicio = g.pop('_metrics_inicio', None)
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule is not None else '<nao_encontrada>'
+        duracao = time.perf_counter() - inicio
+        http_latency.observe(duracao, request.method, rota)
+        http_requests.inc(request.method, rota, str(response.status_code))
+        # Só com várias clínicas (clinicas.py) a requisição tem uma
+        clinica = g.get('clinica')
+        if clinica is not None:
+            clinica_latency.observe(duracao, clinica)
+            clinica_requests.inc(clinica, str(response.status_code))
+    return response
+
+
+def init_app(app):
+    """Registra os hooks que medem cada requisição da aplicação Flask.
+
+    O rótulo `route` usa o padrão da regra (`/medicos/<id>`) e não o caminho
+    concreto, para que a cardinalidade não cresça com os IDs.
+    """
+    app.before_request(_iniciar_cronometro)
+    app.after_request(_registrar_requisicao)
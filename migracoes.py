@@ -0,0 +1,280 @@
+"""
+Migrações versionadas do formato de `medicos.horarios` e `pacientes.consultas`.
+
+Executa: python migracoes.py [status|simular|executar] [--versao N] [--lote 200]
+                             [--por-segundo 0] [--amostra 1000] [--clinica nome]
+
+Uma migração converte, dia a dia, os mapas data → dia de uma collection para
+um novo formato, com a API no ar. Cada migração tem um número de versão e
+roda uma única vez, em ordem: a versão N só começa depois que a N-1 terminou.
+
+A passada percorre a collection em lotes por `_id` e grava o progresso na
+collection `migracoes` (um documento por versão), então pode ser interrompida
+e retomada do último lote. Cada documento é regravado só nos dias que mudam,
+com a condição de que eles não tenham sido alterados pela API desde a
+leitura; se foram, o documento é relido e convertido de novo. Por isso a
+função de conversão precisa ser idempotente (converter um dia já convertido
+não muda nada). `--por-segundo` limita os documentos processados por segundo
+para não disputar o primário com as rotas.
+
+Enquanto uma migração está em andamento o mesmo mapa tem dias nos dois
+formatos. As rotas leem os mapas por `ler`, que aplica a leitura de cada
+migração registrada (da mais nova para a mais antiga) e devolve sempre o
+formato da API; o `ler` de uma migração deve aceitar os dois formatos.
+
+`simular` não grava nada: conta os documentos pendentes, converte em memória
+uma amostra e estima quantos dias mudariam e quanto tempo a passada levaria.
+"""
+import argparse
+import time
+from datetime import datetime
+
+import grade
+
+COLECAO = 'migracoes'
+EM_ANDAMENTO = 'em_andamento'
+CONCLUIDA = 'concluida'
+
+
+class Migracao:
+    def __init__(self, versao, nome, colecao, campo, migrar, ler):
+        self.versao = versao
+        self.nome = nome
+        self.colecao = colecao
+        self.campo = campo
+        self.migrar = migrar
+        self.ler = ler
+
+
+migracoes = {}
+# Leitores de cada campo, da migração mais nova para a mais antiga
+_leitores = {}
+
+
+def migracao(versao, nome, colecao, campo, ler):
+    """Registra `migrar(dia) → dia` como a migração `versao` de `colecao.campo`"""
+    def registrar(migrar):
+        if versao in migracoes:
+            raise ValueError(f"Migração {versao} já registrada")
+        migracoes[versao] = Migracao(versao, nome, colecao, campo, migrar, ler)
+        _leitores[campo] = [m.ler for m in sorted(migracoes.values(), key=lambda m: -m.versao) if m.campo == campo]
+        return migrar
+    return registrar
+
+
+def ler(campo, mapa):
+    """Mapa data → dia no formato da API, com os dias em qualquer formato das migrações do campo"""
+    leitores = _leitores.get(campo)
+    if not mapa or not leitores:
+        return mapa
+    resultado = {}
+    for data, dia in mapa.items():
+        for ler_dia in leitores:
+            dia = ler_dia(dia)
+        resultado[data] = dia
+    return resultado
+
+
+class Limitador:
+    """Limita a passada a `por_segundo` documentos/s, dormindo entre os lotes (0 não limita)"""
+
+    def __init__(self, por_segundo, relogio=time.monotonic, dormir=time.sleep):
+        self.por_segundo = por_segundo
+        self.relogio = relogio
+        self.dormir = dormir
+        self.inicio = relogio()
+        self.total = 0
+
+    def aguardar(self, quantidade):
+        if not self.por_segundo:
+            return
+        self.total += quantidade
+        adiantado = self.total / self.por_segundo - (self.relogio() - self.inicio)
+        if adiantado > 0:
+            self.dormir(adiantado)
+
+
+def _filtro(migracao, apos_id):
+    filtro = {migracao.campo: {"$type": "object"}}
+    if apos_id is not None:
+        filtro["_id"] = {"$gt": apos_id}
+    return filtro
+
+
+def _converter(migracao, documento):
+    """Caminhos dos dias que mudam → (dia atual, dia convertido)"""
+    alterados = {}
+    for data, dia in (documento.get(migracao.campo) or {}).items():
+        novo = migracao.migrar(dia)
+        if novo != dia:
+            alterados[f"{migracao.campo}.{data}"] = (dia, novo)
+    return alterados
+
+
+def _migrar_documento(colecao, migracao, documento):
+    """Regrava os dias do documento que mudam; retorna quantos dias foram convertidos"""
+    for _ in range(grade.TENTATIVAS):
+        alterados = _converter(migracao, documento)
+        if not alterados:
+            return 0
+        condicao = {caminho: atual for caminho, (atual, _) in alterados.items()}
+        resultado = colecao.update_one(
+            dict(condicao, _id=documento["_id"]),
+            {"$set": {caminho: novo for caminho, (_, novo) in alterados.items()}},
+        )
+        if resultado.matched_count:
+            return len(alterados)
+        # Algum dia mudou (ou o documento foi removido) depois da leitura
+        documento = colecao.find_one({"_id": documento["_id"]}, {migracao.campo: 1})
+        if documento is None:
+            return 0
+    raise RuntimeError(f"Documento {documento['_id']} alterado a cada tentativa; execute a migração de novo")
+
+
+def pendentes(db):
+    """Migrações registradas ainda não concluídas neste banco, em ordem de versão"""
+    concluidas = {p["_id"] for p in db[COLECAO].find({"estado": CONCLUIDA}, {"_id": 1})}
+    return [migracoes[v] for v in sorted(migracoes) if v not in concluidas]
+
+
+def migrar_colecao(db, migracao, lote=200, por_segundo=0, max_lotes=None, limitador=None):
+    """Avança a migração a partir do checkpoint; retorna (documentos, dias convertidos, terminou)"""
+    progresso = db[COLECAO]
+    colecao = db[migracao.colecao]
+    checkpoint = progresso.find_one({"_id": migracao.versao}) or {}
+    if checkpoint.get("estado") == CONCLUIDA:
+        return 0, 0, True
+    progresso.update_one({"_id": migracao.versao}, {
+        "$set": {"nome": migracao.nome, "colecao": migracao.colecao, "estado": EM_ANDAMENTO},
+        "$setOnInsert": {"iniciada_em": datetime.utcnow(), "documentos": 0, "dias": 0},
+    }, upsert=True)
+
+    limitador = limitador or Limitador(por_segundo)
+    apos_id = checkpoint.get("apos_id")
+    documentos = dias = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        lido = list(colecao.find(_filtro(migracao, apos_id), {migracao.campo: 1}, sort=[("_id", 1)], limit=lote))
+        convertidos = sum(_migrar_documento(colecao, migracao, documento) for documento in lido)
+        documentos += len(lido)
+        dias += convertidos
+        lotes += 1
+        if lido:
+            apos_id = lido[-1]["_id"]
+        terminou = len(lido) < lote
+        progresso.update_one({"_id": migracao.versao}, {
+            "$set": dict({"apos_id": apos_id, "atualizada_em": datetime.utcnow()},
+                         **({"estado": CONCLUIDA, "concluida_em": datetime.utcnow()} if terminou else {})),
+            "$inc": {"documentos": len(lido), "dias": convertidos},
+        })
+        if terminou:
+            return documentos, dias, True
+        limitador.aguardar(len(lido))
+    return documentos, dias, False
+
+
+def executar(db, ate=None, lote=200, por_segundo=0, max_lotes=None):
+    """Executa as migrações pendentes até a versão `ate`; retorna o resumo de cada uma"""
+    resumo = []
+    limitador = Limitador(por_segundo)
+    for migracao in pendentes(db):
+        if ate is not None and migracao.versao > ate:
+            break
+        documentos, dias, terminou = migrar_colecao(db, migracao, lote, max_lotes=max_lotes, limitador=limitador)
+        resumo.append({"versao": migracao.versao, "nome": migracao.nome, "documentos": documentos,
+                       "dias": dias, "terminou": terminou})
+        if not terminou:
+            break
+    return resumo
+
+
+def simular(db, migracao, amostra=1000, por_segundo=0):
+    """Contagens e duração estimada da migração a partir do checkpoint, sem gravar nada.
+
+    A amostra mede só a leitura e a conversão: o tempo das escritas não entra
+    na estimativa, que por isso é um piso (com `por_segundo` o limite costuma
+    dominar).
+    """
+    colecao = db[migracao.colecao]
+    checkpoint = db[COLECAO].find_one({"_id": migracao.versao}) or {}
+    filtro = _filtro(migracao, checkpoint.get("apos_id"))
+    total = colecao.count_documents(filtro) if checkpoint.get("estado") != CONCLUIDA else 0
+
+    inicio = time.perf_counter()
+    lidos = alterados = dias = 0
+    if total:
+        for documento in colecao.find(filtro, {migracao.campo: 1}, sort=[("_id", 1)], limit=amostra):
+            convertidos = len(_converter(migracao, documento))
+            lidos += 1
+            alterados += bool(convertidos)
+            dias += convertidos
+    decorrido = time.perf_counter() - inicio
+
+    escala = total / lidos if lidos else 0
+    por_documento = max(decorrido / lidos if lidos else 0, 1 / por_segundo if por_segundo else 0)
+    return {
+        "versao": migracao.versao,
+        "nome": migracao.nome,
+        "estado": checkpoint.get("estado", "pendente"),
+        "documentos": total,
+        "amostra": lidos,
+        "documentos_alterados": round(alterados * escala),
+        "dias_convertidos": round(dias * escala),
+        "duracao_estimada_s": round(total * por_documento, 1),
+    }
+
+
+def status(db):
+    """Estado de cada migração registrada neste banco"""
+    progresso = {p["_id"]: p for p in db[COLECAO].find()}
+    resultado = []
+    for versao in sorted(migracoes):
+        p = progresso.get(versao, {})
+        resultado.append({"versao": versao, "nome": migracoes[versao].nome, "estado": p.get("estado", "pendente"),
+                          "documentos": p.get("documentos", 0), "dias": p.get("dias", 0)})
+    return resultado
+
+
+@migracao(1, "horários no formato compacto", 'medicos', 'horarios', ler=grade.expandir_dia)
+def compactar_horarios(dia):
+    """Dia de horários na grade atual (grade.py); dias que não cabem nela ficam como estão"""
+    if not isinstance(dia, dict) or (grade.compacto(dia) and dia['grade'] == grade.MINUTOS):
+        return dia
+    return grade.compactar_dia(grade.expandir_dia(dia)) or dia
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('acao', nargs='?', choices=('status', 'simular', 'executar'), default='status')
+    parser.add_argument('--versao', type=int, help='última versão a executar/simular (padrão: todas)')
+    parser.add_argument('--lote', type=int, default=200)
+    parser.add_argument('--por-segundo', type=float, default=0, help='máximo de documentos por segundo (0 não limita)')
+    parser.add_argument('--amostra', type=int, default=1000, help='documentos convertidos em memória no simular')
+    parser.add_argument('--clinica', help='clínica, com várias clínicas (CLINICAS)')
+    args = parser.parse_args()
+
+    import clinicas
+    import database
+
+    if database.usa_sqlite:
+        parser.error("as migrações só se aplicam ao MongoDB")
+    db = database.banco('importacao', clinicas.resolver(args.clinica))
+
+    if args.acao == 'status':
+        for m in status(db):
+            print(f"{m['versao']:>3}  {m['nome']:40} {m['estado']:13} {m['documentos']} documentos, {m['dias']} dias")
+    elif args.acao == 'simular':
+        for migracao in pendentes(db):
+            if args.versao is not None and migracao.versao > args.versao:
+                break
+            s = simular(db, migracao, args.amostra, args.por_segundo)
+            print(f"{s['versao']:>3}  {s['nome']}: {s['documentos']} documentos pendentes, "
+                  f"~{s['documentos_alterados']} a alterar, ~{s['dias_convertidos']} dias "
+                  f"(amostra de {s['amostra']}), duração estimada {s['duracao_estimada_s']}s")
+    else:
+        for m in executar(db, args.versao, args.lote, args.por_segundo):
+            fim = "concluída" if m['terminou'] else "interrompida"
+            print(f"{m['versao']:>3}  {m['nome']}: {m['documentos']} documentos, {m['dias']} dias convertidos, {fim}")
+
+
+if __name__ == '__main__':
+    main()
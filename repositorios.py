@@ -0,0 +1,412 @@
+"""
+Repositórios: as operações que as rotas fazem em médicos, pacientes, horários,
+consultas e admins, independentes do driver.
+
+Há dois motores com a mesma semântica:
+
+- `Mongo(db)`: o banco da requisição, com as mesmas consultas que as rotas
+  sempre fizeram (versão otimista de versionamento.py, dias compactos de
+  grade.py, dias arquivados de arquivamento.py).
+- `Memoria()`: dicionários do próprio processo, para testar e medir a lógica
+  das rotas sem banco. CPF e CRM de médico e username de admin são únicos
+  no cadastro (como as rotas conferem no Mongo), `versao` é conferida e
+  incrementada como no `find_one_and_update`, e as alterações de um horário
+  ou consulta mexem só na data/hora informada, como o `$set`/`$unset` com
+  caminho de campo.
+
+Os ids são os mesmos nos dois (ObjectId; as funções aceitam a string). Os
+documentos lidos não trazem os campos derivados de busca (busca.py) e são
+cópias: alterá-los não altera o que está guardado.
+"""
+import copy
+import threading
+from concurrent.futures import Future
+from functools import cached_property
+
+from bson import ObjectId
+
+import arquivamento
+import busca
+import grade
+import versionamento
+from utils import normalizar_texto
+
+
+class Duplicado(ValueError):
+    """Já existe um documento com o mesmo valor num campo único (`campo`)"""
+
+    def __init__(self, campo):
+        super().__init__(f"Valor duplicado em '{campo}'")
+        self.campo = campo
+
+
+# MONGO
+
+class _MongoMedicos:
+    def __init__(self, db):
+        self._db = db
+        self._colecao = db['medicos']
+
+    def listar(self, especialidade=None):
+        filtro = {}
+        if especialidade:
+            filtro["especialidade_normalizada"] = normalizar_texto(especialidade)
+        return self._colecao.find(filtro, busca.PROJECAO_MEDICO_SEM_CAMPOS_DE_BUSCA)
+
+    def obter(self, id, incluir_arquivo=False):
+        medico = self._colecao.find_one({"_id": ObjectId(id)}, busca.PROJECAO_MEDICO_SEM_CAMPOS_DE_BUSCA)
+        if medico is not None and incluir_arquivo:
+            medico['horarios'] = arquivamento.mesclar(self._db, arquivamento.MEDICOS, id, medico.get('horarios'))
+        return medico
+
+    def criar(self, medico):
+        if self._colecao.find_one({"cpf": medico["cpf"]}):
+            raise Duplicado("cpf")
+        if self._colecao.find_one({"crm": medico["crm"]}):
+            raise Duplicado("crm")
+        return self._colecao.insert_one(medico).inserted_id
+
+    def atualizar(self, id, atualizacoes, esperada=None):
+        return versionamento.atualizar(
+            self._colecao, ObjectId(id), atualizacoes, esperada, busca.PROJECAO_MEDICO_SEM_CAMPOS_DE_BUSCA
+        )
+
+    def remover(self, id):
+        return self._colecao.delete_one({"_id": ObjectId(id)}).deleted_count > 0
+
+
+class _MongoPacientes:
+    def __init__(self, db):
+        self._db = db
+        self._colecao = db['pacientes']
+
+    def listar(self):
+        return self._colecao.find({}, busca.PROJECAO_SEM_CAMPOS_DE_BUSCA)
+
+    def obter(self, id, incluir_arquivo=False):
+        paciente = self._colecao.find_one({"_id": ObjectId(id)}, busca.PROJECAO_SEM_CAMPOS_DE_BUSCA)
+        if paciente is not None and incluir_arquivo:
+            paciente['consultas'] = arquivamento.mesclar(
+                self._db, arquivamento.PACIENTES, id, paciente.get('consultas')
+            )
+        return paciente
+
+    def criar(self, paciente):
+        return self._colecao.insert_one(paciente).inserted_id
+
+    def buscar(self, q, limite=busca.LIMITE_PADRAO):
+        """Autocompletar por prefixo de nome, CPF ou celular (busca.py)"""
+        return busca.buscar_por_prefixo(self._colecao, q, limite)
+
+    def atualizar(self, id, atualizacoes, esperada=None):
+        return versionamento.atualizar(
+            self._colecao, ObjectId(id), atualizacoes, esperada, busca.PROJECAO_SEM_CAMPOS_DE_BUSCA
+        )
+
+    def remover(self, id):
+        return self._colecao.delete_one({"_id": ObjectId(id)}).deleted_count > 0
+
+
+class _MongoDias:
+    """Mapa data → hora → conteúdo guardado dentro de outro documento (`horarios` ou `consultas`)"""
+
+    def __init__(self, db, especificacao):
+        self._db = db
+        self._especificacao = especificacao
+        self._campo = especificacao.campo
+        self._colecao = db[especificacao.colecao]
+
+    def obter(self, id, incluir_arquivo=False):
+        """Mapa guardado (dias compactos como estão), ou None se o documento não existe"""
+        documento = self._colecao.find_one({"_id": ObjectId(id)}, {"_id": 0, self._campo: 1})
+        if documento is None:
+            return None
+        dias = documento.get(self._campo, {})
+        if incluir_arquivo:
+            dias = arquivamento.mesclar(self._db, self._especificacao, id, dias)
+        return dias
+
+    def adicionar_dias(self, id, dias):
+        """Acrescenta ou substitui dias inteiros; False se o documento não existe"""
+        documento = self._colecao.find_one({"_id": ObjectId(id)})
+        if not documento:
+            return False
+        atuais = documento.get(self._campo, {})
+        for data, dia in dias.items():
+            atuais[data] = self._armazenar(dia)
+        self._colecao.update_one({"_id": ObjectId(id)}, {"$set": {self._campo: atuais}})
+        return True
+
+    def alterar(self, id, data, hora, info=None):
+        """Grava (`info`) ou remove um horário do dia; False se o documento não existe"""
+        caminho = f"{self._campo}.{data}.{hora}"
+        operacao = {"$set": {caminho: info}} if info is not None else {"$unset": {caminho: ""}}
+        return self._colecao.update_one({"_id": ObjectId(id)}, operacao).matched_count > 0
+
+    def remover_dia(self, id, data):
+        return self._colecao.update_one(
+            {"_id": ObjectId(id)}, {"$unset": {f"{self._campo}.{data}": ""}}
+        ).matched_count > 0
+
+    def _armazenar(self, dia):
+        return dia
+
+
+class _MongoHorarios(_MongoDias):
+    def __init__(self, db):
+        super().__init__(db, arquivamento.MEDICOS)
+
+    def alterar(self, id, data, hora, info=None):
+        # Dias compactos são regravados inteiros (grade.py)
+        return grade.alterar_horario(self._colecao, ObjectId(id), data, hora, info)
+
+    def enfileirar(self, agrupador, id, data, hora, info=None):
+        """Alteração pelo agrupador (agrupamento.py): Future com o resultado de `alterar`"""
+        return agrupador.alterar(self._colecao, ObjectId(id), data, hora, info)
+
+    def _armazenar(self, dia):
+        return grade.armazenar(dia)
+
+
+class _MongoAdmins:
+    def __init__(self, db):
+        self._colecao = db['admins']
+
+    def buscar(self, username):
+        return self._colecao.find_one({"username": username, "role": "admin"})
+
+    def criar(self, admin):
+        if self._colecao.find_one({"username": admin["username"]}):
+            raise Duplicado("username")
+        return self._colecao.insert_one(admin).inserted_id
+
+
+class Mongo:
+    """Repositórios sobre um banco do PyMongo (o de `connect_db`).
+
+    Cada repositório abre a sua collection só quando é usado.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @cached_property
+    def medicos(self):
+        return _MongoMedicos(self.db)
+
+    @cached_property
+    def pacientes(self):
+        return _MongoPacientes(self.db)
+
+    @cached_property
+    def horarios(self):
+        return _MongoHorarios(self.db)
+
+    @cached_property
+    def consultas(self):
+        return _MongoDias(self.db, arquivamento.PACIENTES)
+
+    @cached_property
+    def admins(self):
+        return _MongoAdmins(self.db)
+
+
+# MEMÓRIA
+
+class _Tabela:
+    """Documentos de uma coleção por `_id`, com índices únicos opcionais"""
+
+    def __init__(self, lock, unicos=()):
+        self.lock = lock
+        self.documentos = {}
+        self.unicos = unicos
+
+    def inserir(self, documento):
+        documento = copy.deepcopy(documento)
+        documento.setdefault("_id", ObjectId())
+        with self.lock:
+            self._conferir_unicos(documento)
+            if documento["_id"] in self.documentos:
+                raise Duplicado("_id")
+            self.documentos[documento["_id"]] = documento
+        return documento["_id"]
+
+    def _conferir_unicos(self, documento):
+        for campo in self.unicos:
+            if campo in documento and any(outro.get(campo) == documento[campo] for outro in self.documentos.values()):
+                raise Duplicado(campo)
+
+
+def _excluidos(projecao):
+    # Só as exclusões: o mongomock acrescenta `_id: 1` às projeções que recebe
+    return frozenset(campo for campo, incluir in projecao.items() if not incluir)
+
+
+def _sem(documento, campos):
+    """Cópia do documento sem os campos (projeção de exclusão)"""
+    return {k: copy.deepcopy(v) for k, v in documento.items() if k not in campos}
+
+
+class _MemoriaCadastro:
+    """Médicos ou pacientes em memória"""
+
+    def __init__(self, tabela, ocultos):
+        self._tabela = tabela
+        self._ocultos = ocultos
+
+    def listar(self):
+        with self._tabela.lock:
+            return [_sem(d, self._ocultos) for d in self._tabela.documentos.values()]
+
+    def obter(self, id, incluir_arquivo=False):
+        # Sem arquivo em memória: `incluir_arquivo` não acrescenta nada
+        with self._tabela.lock:
+            documento = self._tabela.documentos.get(ObjectId(id))
+            return _sem(documento, self._ocultos) if documento is not None else None
+
+    def criar(self, documento):
+        return self._tabela.inserir(documento)
+
+    def atualizar(self, id, atualizacoes, esperada=None):
+        campo = versionamento.CAMPO
+        with self._tabela.lock:
+            documento = self._tabela.documentos.get(ObjectId(id))
+            if documento is None:
+                return None, None
+            if esperada is not None and documento.get(campo) != esperada:
+                return None, documento.get(campo, 1)
+            documento.update(copy.deepcopy(atualizacoes))
+            documento[campo] = documento.get(campo, 0) + 1
+            return _sem(documento, self._ocultos), documento[campo]
+
+    def remover(self, id):
+        with self._tabela.lock:
+            return self._tabela.documentos.pop(ObjectId(id), None) is not None
+
+
+class _MemoriaMedicos(_MemoriaCadastro):
+    def listar(self, especialidade=None):
+        if not especialidade:
+            return super().listar()
+        chave = normalizar_texto(especialidade)
+        with self._tabela.lock:
+            return [_sem(d, self._ocultos) for d in self._tabela.documentos.values()
+                    if d.get("especialidade_normalizada") == chave]
+
+
+class _MemoriaPacientes(_MemoriaCadastro):
+    def buscar(self, q, limite=busca.LIMITE_PADRAO):
+        def consultar(campo, valor):
+            with self._tabela.lock:
+                encontrados = sorted(
+                    (d for d in self._tabela.documentos.values() if str(d.get(campo, '')).startswith(valor)),
+                    key=lambda d: d[campo],
+                )[:limite]
+                return [{k: copy.deepcopy(d[k]) for k in ('_id', campo, *busca.PROJECAO_BUSCA) if k in d}
+                        for d in encontrados]
+
+        return busca.buscar_por_prefixo_em(consultar, q, limite)
+
+
+class _MemoriaDias:
+    def __init__(self, tabela, campo):
+        self._tabela = tabela
+        self._campo = campo
+
+    def obter(self, id, incluir_arquivo=False):
+        with self._tabela.lock:
+            documento = self._tabela.documentos.get(ObjectId(id))
+            return copy.deepcopy(documento.get(self._campo, {})) if documento is not None else None
+
+    def adicionar_dias(self, id, dias):
+        with self._tabela.lock:
+            documento = self._tabela.documentos.get(ObjectId(id))
+            if documento is None:
+                return False
+            atuais = documento.setdefault(self._campo, {})
+            for data, dia in dias.items():
+                atuais[data] = self._armazenar(copy.deepcopy(dia))
+            return True
+
+    def alterar(self, id, data, hora, info=None):
+        with self._tabela.lock:
+            documento = self._tabela.documentos.get(ObjectId(id))
+            if documento is None:
+                return False
+            if self._campo not in documento:
+                if info is None:
+                    return True
+                documento[self._campo] = {}
+            self._alterar_dia(documento[self._campo], data, hora, copy.deepcopy(info))
+            return True
+
+    def remover_dia(self, id, data):
+        with self._tabela.lock:
+            documento = self._tabela.documentos.get(ObjectId(id))
+            if documento is None:
+                return False
+            documento.get(self._campo, {}).pop(data, None)
+            return True
+
+    def _alterar_dia(self, dias, data, hora, info):
+        # Como `$set`/`$unset` num caminho: remover de um dia inexistente não cria o dia
+        if info is None:
+            if isinstance(dias.get(data), dict):
+                dias[data].pop(hora, None)
+        else:
+            dias.setdefault(data, {})[hora] = info
+
+    def _armazenar(self, dia):
+        return dia
+
+
+class _MemoriaHorarios(_MemoriaDias):
+    def __init__(self, tabela):
+        super().__init__(tabela, 'horarios')
+
+    def enfileirar(self, agrupador, id, data, hora, info=None):
+        # Sem ida e volta ao banco não há o que agrupar: a alteração é feita na hora
+        confirmacao = Future()
+        confirmacao.set_result(self.alterar(id, data, hora, info))
+        return confirmacao
+
+    def _alterar_dia(self, dias, data, hora, info):
+        atual = dias.get(data)
+        # Mesmas regras de grade.alterar_horario: dias compactos (ou gravados com a grade) são regravados inteiros
+        if grade.compacto(atual) or (info is not None and grade.formato == 'grade'):
+            dias[data] = grade.alterar_dia(atual, hora, info)
+        else:
+            super()._alterar_dia(dias, data, hora, info)
+
+    def _armazenar(self, dia):
+        return grade.armazenar(dia)
+
+
+class _MemoriaAdmins:
+    def __init__(self, tabela):
+        self._tabela = tabela
+
+    def buscar(self, username):
+        with self._tabela.lock:
+            for admin in self._tabela.documentos.values():
+                if admin.get("username") == username and admin.get("role") == "admin":
+                    return copy.deepcopy(admin)
+        return None
+
+    def criar(self, admin):
+        return self._tabela.inserir(admin)
+
+
+class Memoria:
+    """Repositórios em memória, com a semântica do motor `Mongo`"""
+
+    def __init__(self):
+        lock = threading.Lock()
+        medicos = _Tabela(lock, unicos=("cpf", "crm"))
+        pacientes = _Tabela(lock)
+        admins = _Tabela(lock, unicos=("username",))
+        self.medicos = _MemoriaMedicos(medicos, _excluidos(busca.PROJECAO_MEDICO_SEM_CAMPOS_DE_BUSCA))
+        self.pacientes = _MemoriaPacientes(pacientes, _excluidos(busca.PROJECAO_SEM_CAMPOS_DE_BUSCA))
+        self.horarios = _MemoriaHorarios(medicos)
+        self.consultas = _MemoriaDias(pacientes, 'consultas')
+        self.admins = _MemoriaAdmins(admins)
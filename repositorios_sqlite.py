@@ -0,0 +1,483 @@
+"""
+Armazenamento SQLite, para clínicas pequenas que rodam a API num único computador.
+
+Com `MONGO_URI=sqlite:///clinica.db` (caminho relativo; `sqlite:////var/clinica.db`
+para absoluto) as rotas de médicos, pacientes, horários, consultas e o login
+usam `Sqlite`, que implementa os mesmos repositórios de repositorios.py
+num arquivo local, sem servidor, e a tabela `idempotencia` guarda as
+respostas de `Idempotency-Key`. A busca de pacientes é só por prefixo (sem
+o índice de trigramas). As demais rotas (especialidades, estatísticas,
+exportação, tarefas, eventos) dependem do MongoDB e respondem 501.
+
+Cada horário e cada consulta é uma linha (`horarios`/`consultas`, chave
+`(dono, data, hora)`), então alterar um horário é um upsert de uma linha e
+não regrava a agenda. Uma linha com `hora = ''` marca que o dia existe, para
+que um dia sem horários continue aparecendo como `{}`. Os campos conhecidos
+de médicos, pacientes e admins são colunas (com índices em cpf, crm,
+especialidade, nome, username e data); os demais ficam em `extras`, em JSON.
+Os dias são sempre guardados hora a hora: `HORARIOS_FORMATO` não se aplica.
+
+O arquivo usa WAL (leituras não esperam a escrita em andamento) e
+`synchronous=NORMAL`. Cada thread tem a sua conexão, com o cache de
+statements preparados do módulo sqlite3; toda escrita é uma transação
+`BEGIN IMMEDIATE`, o que torna atômica a conferência de `versao`. CPF e CRM
+dos médicos têm índice UNIQUE, e o erro de integridade vira `Duplicado`.
+"""
+import json
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import busca
+import idempotencia
+import versionamento
+from repositorios import Duplicado
+from utils import normalizar_texto
+
+# Linha que marca a existência de um dia em `horarios`/`consultas`
+DIA = ''
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS medicos (
+    id TEXT PRIMARY KEY,
+    nome TEXT,
+    cpf TEXT,
+    crm TEXT,
+    especialidade TEXT,
+    especialidade_normalizada TEXT,
+    versao INTEGER,
+    extras TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS medicos_cpf ON medicos (cpf);
+CREATE UNIQUE INDEX IF NOT EXISTS medicos_crm ON medicos (crm);
+CREATE INDEX IF NOT EXISTS medicos_especialidade ON medicos (especialidade_normalizada);
+
+CREATE TABLE IF NOT EXISTS horarios (
+    dono TEXT NOT NULL REFERENCES medicos (id) ON DELETE CASCADE,
+    data TEXT NOT NULL,
+    hora TEXT NOT NULL,
+    valor TEXT,
+    PRIMARY KEY (dono, data, hora)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS horarios_data ON horarios (data);
+
+CREATE TABLE IF NOT EXISTS pacientes (
+    id TEXT PRIMARY KEY,
+    nome TEXT,
+    cpf TEXT,
+    celular TEXT,
+    idade INTEGER,
+    nome_normalizado TEXT,
+    cpf_digitos TEXT,
+    celular_digitos TEXT,
+    versao INTEGER,
+    extras TEXT
+);
+CREATE INDEX IF NOT EXISTS pacientes_cpf ON pacientes (cpf_digitos);
+CREATE INDEX IF NOT EXISTS pacientes_nome ON pacientes (nome_normalizado);
+CREATE INDEX IF NOT EXISTS pacientes_celular ON pacientes (celular_digitos);
+
+CREATE TABLE IF NOT EXISTS consultas (
+    dono TEXT NOT NULL REFERENCES pacientes (id) ON DELETE CASCADE,
+    data TEXT NOT NULL,
+    hora TEXT NOT NULL,
+    valor TEXT,
+    PRIMARY KEY (dono, data, hora)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS consultas_data ON consultas (data);
+
+CREATE TABLE IF NOT EXISTS admins (
+    id TEXT PRIMARY KEY,
+    username TEXT,
+    password TEXT,
+    role TEXT,
+    extras TEXT
+);
+CREATE INDEX IF NOT EXISTS admins_username ON admins (username);
+
+CREATE TABLE IF NOT EXISTS idempotencia (
+    chave TEXT PRIMARY KEY,
+    impressao TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    status INTEGER,
+    corpo TEXT,
+    content_type TEXT
+);
+CREATE INDEX IF NOT EXISTS idempotencia_criado_em ON idempotencia (criado_em);
+"""
+
+
+def _id(id):
+    # Mesma validação dos outros motores: id inválido levanta InvalidId
+    return str(ObjectId(id))
+
+
+def _json(valor):
+    return json.dumps(valor, ensure_ascii=False, default=str)
+
+
+class _Conexoes:
+    """Uma conexão por thread com o arquivo, todas com WAL"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._local = threading.local()
+        # executescript faz o próprio COMMIT: fora de `transacao()`
+        self.conexao().executescript(ESQUEMA)
+
+    def conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=10, isolation_level=None, cached_statements=256)
+            conexao.execute("PRAGMA journal_mode = WAL")
+            conexao.execute("PRAGMA synchronous = NORMAL")
+            conexao.execute("PRAGMA foreign_keys = ON")
+            self._local.conexao = conexao
+        return conexao
+
+    @contextmanager
+    def transacao(self, escrita=True):
+        """Transação; as de leitura só garantem que todas as consultas vejam o mesmo instante"""
+        conexao = self.conexao()
+        conexao.execute("BEGIN IMMEDIATE" if escrita else "BEGIN")
+        try:
+            yield conexao
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        conexao.execute("COMMIT")
+
+
+class _Tabela:
+    """Conversão entre documento e linha de uma tabela de cadastro"""
+
+    def __init__(self, nome, colunas, ocultas=(), unicos=()):
+        self.nome = nome
+        self.colunas = colunas
+        self.ocultas = frozenset(ocultas)
+        self.unicos = unicos
+        todas = ('id',) + colunas + ('extras',)
+        self.colunas_select = ', '.join(todas)
+        self.select = f"SELECT {self.colunas_select} FROM {nome}"
+        self.insert = f"INSERT INTO {nome} ({', '.join(todas)}) VALUES ({', '.join('?' * len(todas))})"
+
+    def linha(self, id, documento):
+        extras = {k: v for k, v in documento.items() if k not in self.colunas and k != '_id'}
+        return (id, *(documento.get(c) for c in self.colunas), _json(extras) if extras else None)
+
+    def duplicado(self, erro):
+        """Duplicado do campo único violado ('UNIQUE constraint failed: medicos.cpf')"""
+        campo = str(erro).rsplit('.', 1)[-1]
+        return Duplicado(campo if campo in self.unicos else "_id")
+
+    def documento(self, linha):
+        documento = {"_id": ObjectId(linha[0])}
+        for coluna, valor in zip(self.colunas, linha[1:]):
+            if valor is not None and coluna not in self.ocultas:
+                documento[coluna] = valor
+        if linha[-1]:
+            documento.update(json.loads(linha[-1]))
+        return documento
+
+
+def _agenda(tabela, dono):
+    """Subconsulta com o mapa data → hora → valor de um dono, montado em JSON pelo próprio SQLite.
+
+    Um único `json.loads` por documento em vez de um por horário: é o que
+    mais pesa ao ler agendas de centenas de horários.
+    """
+    return (
+        f"SELECT json_group_object(data, json(dia)) FROM ("
+        f"SELECT data, json_group_object(hora, json(valor)) FILTER (WHERE hora != '{DIA}') AS dia "
+        f"FROM {tabela} WHERE dono = {dono} GROUP BY data ORDER BY data)"
+    )
+
+
+class _SqliteDias:
+    def __init__(self, conexoes, tabela, dono):
+        self._conexoes = conexoes
+        self._tabela = tabela
+        self._existe = f"SELECT 1 FROM {dono} WHERE id = ?"
+        self._select = f"SELECT ({_agenda(tabela, f'{dono}.id')}) FROM {dono} WHERE id = ?"
+        self._marcar = f"INSERT OR IGNORE INTO {tabela} (dono, data, hora) VALUES (?, ?, '{DIA}')"
+        self._gravar = f"INSERT OR REPLACE INTO {tabela} (dono, data, hora, valor) VALUES (?, ?, ?, ?)"
+        self._remover = f"DELETE FROM {tabela} WHERE dono = ? AND data = ? AND hora = ?"
+        self._remover_dia = f"DELETE FROM {tabela} WHERE dono = ? AND data = ?"
+
+    def obter(self, id, incluir_arquivo=False):
+        # Sem arquivo no SQLite: `incluir_arquivo` não acrescenta nada
+        linha = self._conexoes.conexao().execute(self._select, (_id(id),)).fetchone()
+        return json.loads(linha[0]) if linha is not None else None
+
+    def adicionar_dias(self, id, dias):
+        id = _id(id)
+        with self._conexoes.transacao() as conexao:
+            if conexao.execute(self._existe, (id,)).fetchone() is None:
+                return False
+            for data, dia in dias.items():
+                conexao.execute(self._remover_dia, (id, data))
+                conexao.execute(self._marcar, (id, data))
+                conexao.executemany(self._gravar, ((id, data, hora, _json(valor)) for hora, valor in dia.items()))
+            return True
+
+    def alterar(self, id, data, hora, info=None):
+        id = _id(id)
+        with self._conexoes.transacao() as conexao:
+            if conexao.execute(self._existe, (id,)).fetchone() is None:
+                return False
+            if info is None:
+                conexao.execute(self._remover, (id, data, hora))
+            else:
+                conexao.execute(self._marcar, (id, data))
+                conexao.execute(self._gravar, (id, data, hora, _json(info)))
+            return True
+
+    def remover_dia(self, id, data):
+        id = _id(id)
+        with self._conexoes.transacao() as conexao:
+            if conexao.execute(self._existe, (id,)).fetchone() is None:
+                return False
+            conexao.execute(self._remover_dia, (id, data))
+            return True
+
+
+class _SqliteHorarios(_SqliteDias):
+    def __init__(self, conexoes):
+        super().__init__(conexoes, 'horarios', 'medicos')
+
+    def enfileirar(self, agrupador, id, data, hora, info=None):
+        # Escrita local, sem ida e volta pela rede: não há o que agrupar
+        confirmacao = Future()
+        confirmacao.set_result(self.alterar(id, data, hora, info))
+        return confirmacao
+
+
+class _SqliteCadastro:
+    """Médicos ou pacientes, com o mapa de dias (`horarios`/`consultas`) montado na leitura"""
+
+    def __init__(self, conexoes, tabela, dias, campo):
+        self._conexoes = conexoes
+        self._tabela = tabela
+        self._campo = campo
+        self._dias = dias
+        # Colunas do cadastro + o mapa de dias, numa única consulta
+        self._select = f"SELECT {tabela.colunas_select}, ({_agenda(dias, f'{tabela.nome}.id')}) FROM {tabela.nome}"
+
+    def _documento(self, linha):
+        documento = self._tabela.documento(linha[:-1])
+        documento[self._campo] = json.loads(linha[-1])
+        return documento
+
+    def listar(self, **filtro):
+        sql, parametros = f"{self._select} ORDER BY rowid", ()
+        if filtro:
+            (coluna, valor), = filtro.items()
+            # O nome da coluna entra no SQL: só as colunas da tabela
+            if coluna not in self._tabela.colunas:
+                raise ValueError(f"Filtro desconhecido: {coluna}")
+            sql, parametros = f"{self._select} WHERE {coluna} = ? ORDER BY rowid", (valor,)
+        return [self._documento(linha) for linha in self._conexoes.conexao().execute(sql, parametros)]
+
+    def obter(self, id, incluir_arquivo=False):
+        linha = self._conexoes.conexao().execute(f"{self._select} WHERE id = ?", (_id(id),)).fetchone()
+        return self._documento(linha) if linha is not None else None
+
+    def criar(self, documento):
+        documento = dict(documento)
+        dias = documento.pop(self._campo, None) or {}
+        id = _id(documento.get("_id") or ObjectId())
+        with self._conexoes.transacao() as conexao:
+            # Os campos únicos têm índice UNIQUE: a própria inserção recusa o duplicado
+            try:
+                conexao.execute(self._tabela.insert, self._tabela.linha(id, documento))
+            except sqlite3.IntegrityError as e:
+                raise self._tabela.duplicado(e)
+            for data, dia in dias.items():
+                conexao.execute(f"INSERT INTO {self._dias} (dono, data, hora) VALUES (?, ?, ?)", (id, data, DIA))
+                conexao.executemany(
+                    f"INSERT INTO {self._dias} (dono, data, hora, valor) VALUES (?, ?, ?, ?)",
+                    ((id, data, hora, _json(valor)) for hora, valor in dia.items()),
+                )
+        return ObjectId(id)
+
+    def atualizar(self, id, atualizacoes, esperada=None):
+        id = _id(id)
+        campo = versionamento.CAMPO
+        colunas = {k: v for k, v in atualizacoes.items() if k in self._tabela.colunas}
+        extras = {k: v for k, v in atualizacoes.items() if k not in self._tabela.colunas}
+        with self._conexoes.transacao() as conexao:
+            linha = conexao.execute(f"SELECT {campo}, extras FROM {self._tabela.nome} WHERE id = ?", (id,)).fetchone()
+            if linha is None:
+                return None, None
+            if esperada is not None and linha[0] != esperada:
+                return None, linha[0] or 1
+            atribuicoes = [f"{coluna} = ?" for coluna in colunas] + [f"{campo} = COALESCE({campo}, 0) + 1"]
+            parametros = list(colunas.values())
+            if extras:
+                atribuicoes.append("extras = ?")
+                parametros.append(_json(dict(json.loads(linha[1] or '{}'), **extras)))
+            try:
+                conexao.execute(f"UPDATE {self._tabela.nome} SET {', '.join(atribuicoes)} WHERE id = ?",
+                                (*parametros, id))
+            except sqlite3.IntegrityError as e:
+                raise self._tabela.duplicado(e)
+            # Lido na mesma transação: devolve exatamente a versão gravada
+            documento = self._documento(conexao.execute(f"{self._select} WHERE id = ?", (id,)).fetchone())
+        return documento, documento.get(campo)
+
+    def remover(self, id):
+        with self._conexoes.transacao() as conexao:
+            return conexao.execute(f"DELETE FROM {self._tabela.nome} WHERE id = ?", (_id(id),)).rowcount > 0
+
+
+class _SqliteMedicos(_SqliteCadastro):
+    def listar(self, especialidade=None):
+        if especialidade:
+            return super().listar(especialidade_normalizada=normalizar_texto(especialidade))
+        return super().listar()
+
+
+class _SqlitePacientes(_SqliteCadastro):
+    def buscar(self, q, limite=busca.LIMITE_PADRAO):
+        """Autocompletar por prefixo de nome, CPF ou celular, com a mesma ordem do MongoDB (busca.py)"""
+        conexao = self._conexoes.conexao()
+
+        def consultar(campo, valor):
+            # Intervalo [prefixo, prefixo + U+FFFF): percorrido no índice do campo, como a regex ancorada no MongoDB
+            linhas = conexao.execute(
+                f"SELECT id, {campo}, {', '.join(busca.PROJECAO_BUSCA)} FROM pacientes "
+                f"WHERE {campo} >= ? AND {campo} < ? ORDER BY {campo} LIMIT ?",
+                (valor, valor + '\uffff', limite),
+            )
+            return [{k: v for k, v in zip(('_id', campo, *busca.PROJECAO_BUSCA), linha) if v is not None}
+                    for linha in linhas]
+
+        return busca.buscar_por_prefixo_em(consultar, q, limite)
+
+
+class _SqliteAdmins:
+    def __init__(self, conexoes, tabela):
+        self._conexoes = conexoes
+        self._tabela = tabela
+
+    def buscar(self, username):
+        linha = self._conexoes.conexao().execute(
+            f"{self._tabela.select} WHERE username = ? AND role = 'admin'", (username,)
+        ).fetchone()
+        return self._tabela.documento(linha) if linha is not None else None
+
+    def criar(self, admin):
+        id = _id(admin.get("_id") or ObjectId())
+        with self._conexoes.transacao() as conexao:
+            if conexao.execute("SELECT 1 FROM admins WHERE username = ?", (admin["username"],)).fetchone():
+                raise Duplicado("username")
+            conexao.execute(self._tabela.insert, self._tabela.linha(id, admin))
+        return ObjectId(id)
+
+
+class _SqliteIdempotencia:
+    """Tabela `idempotencia` com as operações de collection que `idempotencia.RegistroIdempotencia` usa.
+
+    Os filtros aceitos são os do registro: `_id`, `estado` e `criado_em`
+    com `$lt`. Como no índice TTL do MongoDB, os registros mais antigos que
+    `IDEMPOTENCIA_TTL_S` são apagados, a cada registro novo.
+    """
+
+    COLUNAS = ('impressao', 'estado', 'criado_em', 'status', 'corpo', 'content_type')
+
+    def __init__(self, conexoes):
+        self._conexoes = conexoes
+
+    @staticmethod
+    def _valor(valor):
+        return valor.timestamp() if isinstance(valor, datetime) else valor
+
+    def _onde(self, filtro):
+        condicoes, parametros = [], []
+        for campo, valor in filtro.items():
+            coluna = 'chave' if campo == '_id' else campo
+            if isinstance(valor, dict):
+                (operador, valor), = valor.items()
+                if operador != '$lt':
+                    raise ValueError(f"Operador não suportado: {operador}")
+                condicoes.append(f"{coluna} < ?")
+            else:
+                condicoes.append(f"{coluna} = ?")
+            parametros.append(self._valor(valor))
+        return ' AND '.join(condicoes), parametros
+
+    def insert_one(self, documento):
+        vencidos = datetime.utcnow() - timedelta(seconds=idempotencia.registro.ttl_s)
+        with self._conexoes.transacao() as conexao:
+            conexao.execute("DELETE FROM idempotencia WHERE criado_em < ?", (vencidos.timestamp(),))
+            try:
+                conexao.execute(
+                    f"INSERT INTO idempotencia (chave, {', '.join(self.COLUNAS)}) VALUES (?{', ?' * len(self.COLUNAS)})",
+                    (documento["_id"], *(self._valor(documento.get(c)) for c in self.COLUNAS)),
+                )
+            except sqlite3.IntegrityError:
+                raise DuplicateKeyError(f"Chave duplicada: {documento['_id']}", 11000)
+
+    def find_one(self, filtro):
+        onde, parametros = self._onde(filtro)
+        linha = self._conexoes.conexao().execute(
+            f"SELECT chave, {', '.join(self.COLUNAS)} FROM idempotencia WHERE {onde}", parametros
+        ).fetchone()
+        if linha is None:
+            return None
+        registro = {"_id": linha[0]}
+        registro.update((c, v) for c, v in zip(self.COLUNAS, linha[1:]) if v is not None)
+        registro["criado_em"] = datetime.fromtimestamp(registro["criado_em"])
+        return registro
+
+    def update_one(self, filtro, atualizacao):
+        onde, parametros = self._onde(filtro)
+        campos = atualizacao["$set"]
+        with self._conexoes.transacao() as conexao:
+            alterados = conexao.execute(
+                f"UPDATE idempotencia SET {', '.join(f'{c} = ?' for c in campos)} WHERE {onde}",
+                (*(self._valor(v) for v in campos.values()), *parametros),
+            ).rowcount
+        return SimpleNamespace(matched_count=alterados, modified_count=alterados)
+
+    def delete_one(self, filtro):
+        onde, parametros = self._onde(filtro)
+        with self._conexoes.transacao() as conexao:
+            removidos = conexao.execute(f"DELETE FROM idempotencia WHERE {onde}", parametros).rowcount
+        return SimpleNamespace(deleted_count=removidos)
+
+
+MEDICOS = _Tabela('medicos', ('nome', 'cpf', 'crm', 'especialidade', 'especialidade_normalizada', 'versao'),
+                  ocultas=('especialidade_normalizada',), unicos=('cpf', 'crm'))
+PACIENTES = _Tabela('pacientes', ('nome', 'cpf', 'celular', 'idade', 'nome_normalizado', 'cpf_digitos',
+                                  'celular_digitos', 'versao'),
+                    ocultas=('nome_normalizado', 'cpf_digitos', 'celular_digitos'))
+ADMINS = _Tabela('admins', ('username', 'password', 'role'))
+
+
+class Sqlite:
+    """Repositórios num arquivo SQLite, com a semântica do motor `Mongo`"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._conexoes = _Conexoes(caminho)
+        self.medicos = _SqliteMedicos(self._conexoes, MEDICOS, 'horarios', 'horarios')
+        self.pacientes = _SqlitePacientes(self._conexoes, PACIENTES, 'consultas', 'consultas')
+        self.horarios = _SqliteHorarios(self._conexoes)
+        self.consultas = _SqliteDias(self._conexoes, 'consultas', 'pacientes')
+        self.admins = _SqliteAdmins(self._conexoes, ADMINS)
+        self.idempotencia = _SqliteIdempotencia(self._conexoes)
+
+    def ping(self):
+        try:
+            self._conexoes.conexao().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
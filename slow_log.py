@@ -0,0 +1,310 @@
+"""
+Log de operações lentas com captura automática do plano de execução.
+
+Comandos MongoDB e requisições HTTP que passam de `SLOW_OP_MS` são gravados
+em um arquivo JSON (uma linha por evento) com rotação por tamanho. Para os
+comandos, o formato do filtro é registrado com os valores redigidos (nenhum
+dado de paciente vai para o log) junto com o resumo do `explain()`, que diz se
+a consulta usou índice ou fez um COLLSCAN. Até o comando terminar, fica em
+memória só a parte que o explain usa (`reduzir`), nunca os documentos
+gravados.
+
+O `explain()` e a escrita em disco acontecem numa thread separada, alimentada
+por uma fila limitada: se a fila enche, o evento é descartado em vez de
+atrasar a requisição. Operações repetidas com o mesmo formato são registradas
+no máximo uma vez a cada `SLOW_LOG_INTERVALO_S` segundos.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from dotenv import load_dotenv
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+load_dotenv('.cred')
+
+# Campos do comando que o explain precisa para escolher o mesmo plano; o resto
+# (sessão, documentos de insert, valores de $set) não fica nem em memória
+_CAMPOS_DO_EXPLAIN = ('filter', 'sort', 'projection', 'hint', 'limit', 'skip', 'collation',
+                      'query', 'pipeline', 'key')
+# Campos que descrevem o formato da consulta (os valores são redigidos)
+_CAMPOS_DE_FORMATO = ('filter', 'sort', 'projection', 'query', 'pipeline', 'updates', 'deletes', 'key')
+# Comandos que não fazem sentido explicar
+_COMANDOS_IGNORADOS = {'explain', 'getMore', 'killCursors', 'endSessions', 'hello', 'isMaster', 'ping'}
+
+
+def redigir(valor):
+    """Mantém a estrutura (chaves e operadores) e substitui os valores por '?'.
+
+    Listas viram uma lista com o formato do primeiro elemento, para que
+    `{"$in": [...]}` com tamanhos diferentes gere o mesmo formato.
+    """
+    if isinstance(valor, dict):
+        return {k: redigir(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [redigir(valor[0])] if valor else []
+    return '?'
+
+
+def reduzir(nome, comando):
+    """O comando só com o que o explain precisa: a consulta com os valores reais e a alteração redigida"""
+    reduzido = {nome: comando.get(nome)}
+    reduzido.update({c: comando[c] for c in _CAMPOS_DO_EXPLAIN if c in comando})
+    if 'updates' in comando:
+        reduzido['updates'] = [
+            dict({k: u[k] for k in ('multi', 'upsert') if k in u}, q=u.get('q', {}), u=redigir(u.get('u', {})))
+            for u in comando['updates']
+        ]
+    if 'deletes' in comando:
+        reduzido['deletes'] = [{'q': d.get('q', {}), 'limit': d.get('limit', 0)} for d in comando['deletes']]
+    return reduzido
+
+
+def resumir_plano(explain):
+    """Resume o plano vencedor do explain, ex.: 'FETCH <- IXSCAN(cpf_1)'"""
+    planner = _procurar(explain, 'queryPlanner')
+    if planner is None:
+        return None
+    plano = planner.get('winningPlan', {})
+    # MongoDB 7+ com o engine SBE aninha o plano em 'queryPlan'
+    plano = plano.get('queryPlan', plano)
+    estagios = []
+    while plano:
+        nome = plano.get('stage', '?')
+        if plano.get('indexName'):
+            nome += f"({plano['indexName']})"
+        estagios.append(nome)
+        if 'inputStage' in plano:
+            plano = plano['inputStage']
+        elif plano.get('inputStages'):
+            plano = plano['inputStages'][0]
+        else:
+            plano = None
+    return {
+        'estagios': ' <- '.join(estagios),
+        'collscan': any(e.startswith('COLLSCAN') for e in estagios),
+    }
+
+
+def _procurar(documento, chave):
+    if isinstance(documento, dict):
+        if chave in documento:
+            return documento[chave]
+        for valor in documento.values():
+            achado = _procurar(valor, chave)
+            if achado is not None:
+                return achado
+    elif isinstance(documento, list):
+        for valor in documento:
+            achado = _procurar(valor, chave)
+            if achado is not None:
+                return achado
+    return None
+
+
+class SlowOpLog:
+    """Fila de operações lentas processada por uma thread em segundo plano"""
+
+    def __init__(self, limite_ms, arquivo, max_bytes=5 * 1024 * 1024, backups=3,
+                 intervalo_s=60.0, capacidade=1000):
+        self.limite_ms = limite_ms
+        self.arquivo = arquivo
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.intervalo_s = intervalo_s
+        self.descartados = 0
+        self._fila = queue.Queue(maxsize=capacidade)
+        self._ultimos = {}
+        self._suprimidos = {}
+        self._lock = threading.Lock()
+        self._logger = None
+        self._thread = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            limite_ms=float(os.getenv('SLOW_OP_MS', '200')),
+            arquivo=os.getenv('SLOW_LOG_FILE', 'slow_ops.log'),
+            max_bytes=int(os.getenv('SLOW_LOG_MAX_BYTES', str(5 * 1024 * 1024))),
+            backups=int(os.getenv('SLOW_LOG_BACKUPS', '3')),
+            intervalo_s=float(os.getenv('SLOW_LOG_INTERVALO_S', '60')),
+        )
+
+    def _liberado(self, assinatura):
+        """Aplica o limite de frequência por assinatura; retorna quantos foram suprimidos"""
+        agora = time.monotonic()
+        with self._lock:
+            ultimo = self._ultimos.get(assinatura)
+            if ultimo is not None and agora - ultimo < self.intervalo_s:
+                self._suprimidos[assinatura] = self._suprimidos.get(assinatura, 0) + 1
+                return None
+            self._ultimos[assinatura] = agora
+            return self._suprimidos.pop(assinatura, 0)
+
+    def _enfileirar(self, item):
+        try:
+            self._fila.put_nowait(item)
+        except queue.Full:
+            self.descartados += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._executar, name='slow-ops-log', daemon=True)
+                    self._thread.start()
+
+    def registrar_comando(self, database, collection, comando, documento, duracao_ms, caminho=None):
+        formato = {c: redigir(documento[c]) for c in _CAMPOS_DE_FORMATO if c in documento}
+        assinatura = (collection, comando, json.dumps(formato, sort_keys=True))
+        suprimidos = self._liberado(assinatura)
+        if suprimidos is None:
+            return
+        self._enfileirar({
+            'tipo': 'comando',
+            'caminho': caminho,
+            'database': database,
+            'collection': collection,
+            'comando': comando,
+            'formato': formato,
+            'duracao_ms': round(duracao_ms, 3),
+            'suprimidos': suprimidos,
+            # consulta com os valores reais fica só em memória, para o explain
+            '_documento': documento,
+        })
+
+    def registrar_requisicao(self, metodo, rota, caminho, status, duracao_ms, mongo_ms):
+        suprimidos = self._liberado(('requisicao', metodo, rota))
+        if suprimidos is None:
+            return
+        self._enfileirar({
+            'tipo': 'requisicao',
+            'metodo': metodo,
+            'rota': rota,
+            'caminho': caminho,
+            'status': status,
+            'duracao_ms': round(duracao_ms, 3),
+            'mongo_ms': round(mongo_ms, 3),
+            'suprimidos': suprimidos,
+        })
+
+    def _executar(self):
+        while True:
+            item = self._fila.get()
+            try:
+                self.processar(item)
+            except Exception as e:
+                print(f"Erro ao registrar operação lenta: {e}")
+            finally:
+                self._fila.task_done()
+
+    def processar(self, item):
+        documento = item.pop('_documento', None)
+        if documento is not None:
+            item['plano'] = self._explicar(item['database'], documento)
+        item['em'] = datetime.now(timezone.utc).isoformat()
+        self._obter_logger().info(json.dumps(item, ensure_ascii=False, default=str))
+
+    def _explicar(self, database, documento):
+        from database import get_client
+
+        try:
+            explain = get_client()[database].command(
+                {'explain': documento, 'verbosity': 'queryPlanner'}
+            )
+        except Exception as e:
+            return {'erro': str(e)}
+        return resumir_plano(explain)
+
+    def _obter_logger(self):
+        if self._logger is None:
+            logger = logging.getLogger(f'clinica.slow_ops:{os.path.abspath(self.arquivo)}')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            if not logger.handlers:
+                handler = RotatingFileHandler(
+                    self.arquivo, maxBytes=self.max_bytes, backupCount=self.backups, encoding='utf-8'
+                )
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def aguardar(self):
+        """Bloqueia até a fila ser processada (usado em testes e no shutdown)"""
+        self._fila.join()
+
+
+class SlowCommandListener(monitoring.CommandListener):
+    """Encaminha para o `SlowOpLog` os comandos acima do limite.
+
+    Também acumula, no contexto da requisição, o tempo total gasto no
+    MongoDB, para distinguir rota lenta por banco de rota lenta por outro motivo.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self._pendentes = {}
+
+    def started(self, event):
+        if event.command_name not in _COMANDOS_IGNORADOS:
+            # Ainda não se sabe se vai ser lento: guarda só o que o explain usa
+            self._pendentes[(event.connection_id, event.request_id)] = reduzir(event.command_name, event.command)
+
+    def _finalizar(self, event):
+        documento = self._pendentes.pop((event.connection_id, event.request_id), None)
+        duracao_ms = event.duration_micros / 1000
+        em_requisicao = has_request_context()
+        if em_requisicao:
+            g._slow_mongo_ms = g.get('_slow_mongo_ms', 0.0) + duracao_ms
+        if documento is None or duracao_ms < self.log.limite_ms:
+            return
+        comando = event.command_name
+        collection = documento.get(comando)
+        self.log.registrar_comando(
+            event.database_name,
+            collection if isinstance(collection, str) else '',
+            comando,
+            documento,
+            duracao_ms,
+            caminho=request.path if em_requisicao else None,
+        )
+
+    def succeeded(self, event):
+        self._finalizar(event)
+
+    def failed(self, event):
+        self._finalizar(event)
+
+
+slow_ops = SlowOpLog.from_env()
+command_listener = SlowCommandListener(slow_ops)
+
+
+def _iniciar_cronometro():
+    g._slow_inicio = time.perf_counter()
+
+
+def _verificar_requisicao(response):
+    inicio = g.pop('_slow_inicio', None)
+    if inicio is None:
+        return response
+    duracao_ms = (time.perf_counter() - inicio) * 1000
+    if duracao_ms >= slow_ops.limite_ms:
+        rota = request.url_rule.rule if request.url_rule is not None else None
+        slow_ops.registrar_requisicao(
+            request.method, rota, request.path, response.status_code,
+            duracao_ms, g.get('_slow_mongo_ms', 0.0),
+        )
+    return response
+
+
+def init_app(app):
+    """Registra os hooks que detectam requisições lentas"""
+    app.before_request(_iniciar_cronometro)
+    app.after_request(_verificar_requisicao)
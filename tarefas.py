@@ -0,0 +1,364 @@
+"""
+Tarefas em segundo plano para operações demoradas.
+
+Executa (processo dedicado): python tarefas.py [--threads 4]
+
+Operações pesadas (expandir agendas, exportações, importações, limpezas) não
+devem prender um worker HTTP. A rota grava a tarefa na collection `tarefas`
+com `enfileirar` e responde 202 com o id; `GET /tarefas/<id>` mostra o
+andamento e o resultado.
+
+As tarefas são executadas por `Trabalhadores`, um conjunto de threads que
+pode rodar dentro da própria API (`TAREFAS_THREADS`, padrão 2) ou num
+processo separado com este script (use `TAREFAS_THREADS=0` na API). Cada
+thread reserva a próxima tarefa com um único `find_one_and_update`, então
+vários processos podem consumir a mesma fila sem executar nada duas vezes.
+
+- Falhas são repetidas até `max_tentativas`, com espera exponencial.
+- Cada tipo tem um limite de execuções simultâneas por processo
+  (`concorrencia`), para que uma exportação grande não ocupe todas as threads.
+- A reserva tem prazo (`timeout_s`): se o processo cair no meio, a tarefa
+  volta para a fila quando o prazo vence.
+- Tarefas terminadas são apagadas pelo índice TTL depois de `TAREFAS_RETENCAO_S`.
+
+Novos tipos são registrados com o decorator `@tarefa('nome')`; a função
+recebe o banco e os parâmetros da tarefa e retorna o resultado (JSON).
+"""
+import argparse
+import importlib
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+import metrics
+from circuit_breaker import CircuitoAberto
+
+load_dotenv('.cred')
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDA = 'concluida'
+FALHOU = 'falhou'
+CANCELADA = 'cancelada'
+TERMINADAS = [CONCLUIDA, FALHOU, CANCELADA]
+
+threads_padrao = int(os.getenv('TAREFAS_THREADS', '2'))
+intervalo_s = float(os.getenv('TAREFAS_INTERVALO_S', '1'))
+retencao_s = int(os.getenv('TAREFAS_RETENCAO_S', str(7 * 86400)))
+
+INDICES = [
+    IndexModel([('estado', ASCENDING), ('executar_apos', ASCENDING)]),
+    # Só tarefas terminadas têm `terminada_em`: as pendentes nunca expiram
+    IndexModel([('terminada_em', ASCENDING)], expireAfterSeconds=retencao_s),
+    # Só tarefas únicas ainda pendentes têm `unica` (o tipo): uma por tipo
+    IndexModel([('unica', ASCENDING)], unique=True, sparse=True),
+]
+
+
+class FalhaDefinitiva(Exception):
+    """Erro que não adianta repetir (ex.: o registro alvo não existe mais)"""
+
+
+class Tipo:
+    def __init__(self, nome, funcao, concorrencia=1, max_tentativas=3, timeout_s=300, espera_base_s=5):
+        self.nome = nome
+        self.funcao = funcao
+        self.concorrencia = concorrencia
+        self.max_tentativas = max_tentativas
+        self.timeout_s = timeout_s
+        self.espera_base_s = espera_base_s
+
+    def espera(self, tentativas):
+        """Espera antes da próxima tentativa: exponencial com jitter"""
+        base = self.espera_base_s * 2 ** (tentativas - 1)
+        return base * random.uniform(0.5, 1.5)
+
+
+tipos = {}
+_novas = threading.Event()
+# Módulos que registram tipos de tarefa ao serem importados
+MODULOS = ('agenda', 'arquivamento', 'exportacao')
+
+
+def registrar_tipos():
+    for modulo in MODULOS:
+        importlib.import_module(modulo)
+
+
+def tarefa(nome, **opcoes):
+    """Registra uma função como tipo de tarefa"""
+    def registrar(funcao):
+        tipos[nome] = Tipo(nome, funcao, **opcoes)
+        return funcao
+    return registrar
+
+
+def enfileirar(db, tipo, parametros=None, atraso_s=0):
+    """Grava a tarefa e retorna o id (string)"""
+    if tipo not in tipos:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    agora = datetime.utcnow()
+    resultado = db['tarefas'].insert_one({
+        "tipo": tipo,
+        "parametros": parametros or {},
+        "estado": PENDENTE,
+        "tentativas": 0,
+        "criada_em": agora,
+        "executar_apos": agora + timedelta(seconds=atraso_s),
+    })
+    # Acorda as threads deste processo sem esperar o próximo intervalo
+    _novas.set()
+    return str(resultado.inserted_id)
+
+
+def enfileirar_unica(db, tipo, parametros=None, atraso_s=0):
+    """Como `enfileirar`, mas não cria outra tarefa se já há uma do tipo pendente.
+
+    Para tarefas periódicas, que se reagendam e também são agendadas na
+    inicialização de cada processo. Retorna o id criado ou None.
+
+    A tarefa pendente leva o campo `unica`, com índice único: se dois
+    processos fazem o upsert ao mesmo tempo, o segundo recebe
+    DuplicateKeyError em vez de criar outra. O campo sai quando a tarefa é
+    reservada ou cancelada.
+    """
+    if tipo not in tipos:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    agora = datetime.utcnow()
+    try:
+        resultado = db['tarefas'].update_one(
+            {"unica": tipo},
+            {"$setOnInsert": {
+                "tipo": tipo,
+                "parametros": parametros or {},
+                "estado": PENDENTE,
+                "tentativas": 0,
+                "criada_em": agora,
+                "executar_apos": agora + timedelta(seconds=atraso_s),
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return None
+    _novas.set()
+    return str(resultado.upserted_id) if resultado.upserted_id is not None else None
+
+
+def cancelar(db, id):
+    """Cancela uma tarefa que ainda não começou; retorna False se ela não está pendente"""
+    resultado = db['tarefas'].update_one(
+        {"_id": ObjectId(id), "estado": PENDENTE},
+        {"$set": {"estado": CANCELADA, "terminada_em": datetime.utcnow()}, "$unset": {"unica": ""}},
+    )
+    return resultado.modified_count == 1
+
+
+def serializar(documento):
+    documento = dict(documento)
+    documento['id'] = str(documento.pop('_id'))
+    for campo in ('criada_em', 'executar_apos', 'iniciada_em', 'terminada_em'):
+        if documento.get(campo) is not None:
+            documento[campo] = documento[campo].isoformat() + 'Z'
+    return documento
+
+
+class Trabalhadores:
+    """Threads que executam as tarefas da fila.
+
+    Com várias clínicas (clinicas.py) as mesmas threads atendem a fila de
+    cada banco, adicionado com `adicionar`, em rodízio.
+    """
+
+    def __init__(self, db, threads=2, intervalo_s=1.0):
+        self.db = db
+        self.bancos = [db]
+        self._proximo_banco = 0
+        self.threads = threads
+        self.intervalo_s = intervalo_s
+        self.nome = f"{socket.gethostname()}:{os.getpid()}"
+        self._em_execucao = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._threads = []
+
+    def iniciar(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._laco, name=f'tarefas-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def adicionar(self, db):
+        with self._lock:
+            if all(b.name != db.name for b in self.bancos):
+                self.bancos.append(db)
+        _novas.set()
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        _novas.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _laco(self):
+        while not self._parar.is_set():
+            try:
+                if self.executar_uma():
+                    continue
+            except (PyMongoError, CircuitoAberto) as e:
+                print(f"Erro ao buscar tarefas, tentando de novo: {e}")
+            _novas.wait(self.intervalo_s)
+            _novas.clear()
+
+    def _reservar(self):
+        """Próxima tarefa disponível e o banco dela, ou (None, None)"""
+        # Sob o lock só a contagem: uma vaga de cada tipo disponível fica com esta
+        # thread enquanto ela consulta os bancos, sem prender as demais
+        with self._lock:
+            disponiveis = [
+                tipo for nome, tipo in tipos.items()
+                if self._em_execucao.get(nome, 0) < tipo.concorrencia
+            ]
+            for tipo in disponiveis:
+                self._em_execucao[tipo.nome] = self._em_execucao.get(tipo.nome, 0) + 1
+            inicio = self._proximo_banco
+            self._proximo_banco = (inicio + 1) % len(self.bancos)
+            bancos = self.bancos[inicio:] + self.bancos[:inicio]
+        db = documento = None
+        try:
+            for db in bancos if disponiveis else []:
+                documento = self._reservar_em(db, disponiveis)
+                if documento is not None:
+                    break
+        finally:
+            # Devolve as vagas dos tipos que não vieram
+            with self._lock:
+                for tipo in disponiveis:
+                    if documento is None or tipo.nome != documento['tipo']:
+                        self._em_execucao[tipo.nome] -= 1
+        if documento is None:
+            return None, None
+        return db, documento
+
+    def _reservar_em(self, db, disponiveis):
+        agora = datetime.utcnow()
+        return db['tarefas'].find_one_and_update(
+            {"$or": [
+                {"estado": PENDENTE, "executar_apos": {"$lte": agora}, "tipo": {"$in": [t.nome for t in disponiveis]}},
+            ] + [
+                # Execução além do prazo: o processo que a reservou caiu
+                {"estado": EXECUTANDO, "tipo": t.nome, "iniciada_em": {"$lt": agora - timedelta(seconds=t.timeout_s)}}
+                for t in disponiveis
+            ]},
+            {
+                "$set": {"estado": EXECUTANDO, "trabalhador": self.nome, "iniciada_em": agora},
+                # Reservada, deixa de contar como a pendente única do tipo; se falhar,
+                # volta para a fila sem a marca
+                "$unset": {"unica": ""},
+                "$inc": {"tentativas": 1},
+            },
+            sort=[("executar_apos", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def executar_uma(self):
+        """Executa a próxima tarefa disponível; retorna False se não havia nenhuma"""
+        db, documento = self._reservar()
+        if documento is None:
+            return False
+        tipo = tipos[documento['tipo']]
+        inicio = time.perf_counter()
+        try:
+            if documento['tentativas'] > tipo.max_tentativas:
+                # Reservada de novo depois de derrubar o processo em todas as tentativas
+                raise RuntimeError("Tempo de execução esgotado em todas as tentativas")
+            resultado = tipo.funcao(db, **documento['parametros'])
+        except Exception as e:
+            self._falhar(db, documento, tipo, e)
+        else:
+            db['tarefas'].update_one({"_id": documento['_id']}, {"$set": {
+                "estado": CONCLUIDA,
+                "resultado": resultado,
+                "terminada_em": datetime.utcnow(),
+            }})
+            metrics.tasks.inc(tipo.nome, CONCLUIDA)
+        finally:
+            metrics.task_duration.observe(time.perf_counter() - inicio, tipo.nome)
+            with self._lock:
+                self._em_execucao[tipo.nome] -= 1
+        return True
+
+    def _falhar(self, db, documento, tipo, erro):
+        print(f"Tarefa {documento['_id']} ({tipo.nome}) falhou na tentativa {documento['tentativas']}: {erro}")
+        if not isinstance(erro, FalhaDefinitiva):
+            traceback.print_exc()
+        agora = datetime.utcnow()
+        if isinstance(erro, FalhaDefinitiva) or documento['tentativas'] >= tipo.max_tentativas:
+            atualizacao = {"estado": FALHOU, "erro": str(erro), "terminada_em": agora}
+            metrics.tasks.inc(tipo.nome, FALHOU)
+        else:
+            atualizacao = {
+                "estado": PENDENTE,
+                "erro": str(erro),
+                "executar_apos": agora + timedelta(seconds=tipo.espera(documento['tentativas'])),
+            }
+            metrics.tasks.inc(tipo.nome, 'repetida')
+        db['tarefas'].update_one({"_id": documento['_id']}, {"$set": atualizacao})
+
+
+trabalhadores = None
+_trabalhadores_lock = threading.Lock()
+
+
+def iniciar_na_api(db):
+    """Inicia as threads de tarefas dentro do processo da API (uma vez por processo).
+
+    Os bancos das demais clínicas são acrescentados às mesmas threads.
+    """
+    global trabalhadores
+    registrar_tipos()
+    if threads_padrao <= 0:
+        return
+    with _trabalhadores_lock:
+        if trabalhadores is None:
+            trabalhadores = Trabalhadores(db, threads_padrao, intervalo_s).iniciar()
+        else:
+            trabalhadores.adicionar(db)
+
+
+def main():
+    import clinicas
+    from database import BancoProtegido, banco, breaker, garantir_indices
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=max(threads_padrao, 1))
+    args = parser.parse_args()
+
+    registrar_tipos()
+    bancos = [BancoProtegido(banco('escrita', clinica), breaker) for clinica in sorted(clinicas.clinicas) or [None]]
+    for db in bancos:
+        garantir_indices(db)
+    trabalhadores = Trabalhadores(bancos[0], args.threads, intervalo_s)
+    for db in bancos[1:]:
+        trabalhadores.adicionar(db)
+    trabalhadores.iniciar()
+    print(f"{args.threads} threads executando tarefas de {', '.join(db.name for db in bancos)}: "
+          f"{', '.join(sorted(tipos))}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        trabalhadores.parar(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
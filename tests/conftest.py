@@ -0,0 +1,46 @@
+# tests/conftest.py
+from datetime import datetime, timedelta
+
+import jwt
+import mongomock
+import pytest
+
+import app as flask_app_module
+import slow_log
+from app import app as flask_app
+
+
+def make_token(username="admin", hours=24):
+    payload = {
+        "username": username,
+        "iat": datetime.utcnow(),
+        "exp": datetime.utcnow() + timedelta(hours=hours)
+    }
+    token = jwt.encode(payload, flask_app_module.jwt_secret, algorithm="HS256")
+    return token if isinstance(token, str) else token.decode("utf-8")
+
+
+@pytest.fixture(autouse=True, scope="session")
+def slow_ops_temporario(tmp_path_factory):
+    """Operações lentas dos testes vão para um diretório temporário, não para a raiz do repositório"""
+    slow_log.slow_ops.arquivo = str(tmp_path_factory.mktemp("slow_ops") / "slow_ops.log")
+
+
+@pytest.fixture
+def db():
+    """Banco mongomock com o admin dos tokens de `make_token`; os módulos acrescentam os próprios dados"""
+    db = mongomock.MongoClient()["clinica"]
+    db["admins"].insert_one({"username": "admin", "role": "admin"})
+    return db
+
+
+@pytest.fixture
+def client():
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def headers():
+    return {"Authorization": f"Bearer {make_token('admin')}"}
@@ -0,0 +1,110 @@
+# tests/test_agrupamento.py
+from unittest.mock import patch
+
+import mongomock
+import pytest
+from mongomock.collection import BulkOperationBuilder
+
+import agrupamento
+import grade
+from app import app as flask_app
+
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+OCUPADO = {"status": "ocupado", "paciente": "Ana"}
+
+
+@pytest.fixture
+def agrupador():
+    agrupador = agrupamento.AgrupadorHorarios(janela_ms=50)
+    yield agrupador
+    agrupador.fechar()
+
+
+@pytest.fixture
+def bulk_write_mongomock():
+    """O mongomock 4.3 não aceita o `sort` que o UpdateOne do PyMongo 4.11+ repassa ao bulk"""
+    original = BulkOperationBuilder.add_update
+
+    def add_update(self, selector, doc, *args, sort=None, **kwargs):
+        return original(self, selector, doc, *args, **kwargs)
+
+    with patch.object(BulkOperationBuilder, "add_update", add_update):
+        yield
+
+
+def _medico(db, horarios=None):
+    return db["medicos"].insert_one({"nome": "Dr. João", "horarios": horarios or {}}).inserted_id
+
+
+def test_ultima_alteracao_do_horario_prevalece():
+    itens = [("2025-11-05", "09:00", OCUPADO, None), ("2025-11-05", "09:30", LIVRE, None),
+             ("2025-11-05", "09:00", None, None), ("2025-11-06", "10:00", LIVRE, None)]
+    filtro, atualizacao = agrupamento.operacao(1, itens)
+    assert atualizacao == {
+        "$set": {"horarios.2025-11-05.09:30": LIVRE, "horarios.2025-11-06.10:00": LIVRE},
+        "$unset": {"horarios.2025-11-05.09:00": ""},
+    }
+    assert filtro == {"_id": 1, "horarios.2025-11-05.grade": {"$exists": False},
+                      "horarios.2025-11-06.grade": {"$exists": False}}
+
+
+def test_alteracoes_do_mesmo_medico_viram_uma_escrita(db, agrupador):
+    id = _medico(db, {"2025-11-05": {"09:00": LIVRE}})
+    colecao = db["medicos"]
+    with patch.object(colecao, "update_one", wraps=colecao.update_one) as update_one:
+        confirmacoes = [agrupador.alterar(colecao, id, "2025-11-05", f"{h:02d}:00", OCUPADO) for h in range(9, 14)]
+        confirmacoes.append(agrupador.alterar(colecao, id, "2025-11-05", "13:00"))
+        assert [c.result(timeout=5) for c in confirmacoes] == [True] * 6
+    assert update_one.call_count == 1
+    dia = db["medicos"].find_one({"_id": id})["horarios"]["2025-11-05"]
+    assert dia == {f"{h:02d}:00": OCUPADO for h in range(9, 13)}
+
+
+def test_lote_com_varios_medicos(db, agrupador, bulk_write_mongomock, monkeypatch):
+    normal = _medico(db, {"2025-11-05": {"09:00": LIVRE}})
+    monkeypatch.setattr(grade, "formato", "grade")
+    compacto = _medico(db, {"2025-11-05": grade.compactar_dia({"09:00": LIVRE, "09:30": LIVRE})})
+    monkeypatch.setattr(grade, "formato", "mapa")
+    inexistente = mongomock.ObjectId()
+    colecao = db["medicos"]
+    confirmacoes = [agrupador.alterar(colecao, id, "2025-11-05", "09:00", OCUPADO)
+                    for id in (normal, compacto, inexistente)]
+    assert [c.result(timeout=5) for c in confirmacoes] == [True, True, False]
+    assert db["medicos"].find_one({"_id": normal})["horarios"]["2025-11-05"]["09:00"] == OCUPADO
+    # o dia compacto foi regravado por grade.alterar_horario e continua compacto
+    dia = db["medicos"].find_one({"_id": compacto})["horarios"]["2025-11-05"]
+    assert grade.compacto(dia)
+    assert grade.expandir_dia(dia) == {"09:00": OCUPADO, "09:30": LIVRE}
+
+
+def test_fechar_grava_o_que_estiver_pendente(db):
+    agrupador = agrupamento.AgrupadorHorarios(janela_ms=60_000)
+    id = _medico(db)
+    confirmacao = agrupador.alterar(db["medicos"], id, "2025-11-05", "09:00", OCUPADO)
+    agrupador.fechar()
+    assert confirmacao.result(timeout=0) is True
+    assert db["medicos"].find_one({"_id": id})["horarios"] == {"2025-11-05": {"09:00": OCUPADO}}
+    with pytest.raises(RuntimeError):
+        agrupador.alterar(db["medicos"], id, "2025-11-05", "09:30", OCUPADO)
+
+
+def test_rotas_com_agrupamento(db, agrupador, headers):
+    id = _medico(db, {"2025-11-05": {"09:00": LIVRE, "09:30": LIVRE}})
+    url = f"/medicos/{id}/horarios"
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), patch("agrupamento.agrupador", agrupador), \
+            flask_app.test_client() as client:
+        resp = client.put(url, json={"data": "2025-11-05", "hora": "09:00", "info": OCUPADO}, headers=headers)
+        assert resp.status_code == 200
+        assert db["medicos"].find_one({"_id": id})["horarios"]["2025-11-05"]["09:00"] == OCUPADO
+
+        resp = client.delete(url, json={"data": "2025-11-05", "hora": "09:30"},
+                             headers=dict(headers, Prefer="respond-async"))
+        assert resp.status_code == 202
+        assert agrupador.esvaziar(timeout=5)
+        assert db["medicos"].find_one({"_id": id})["horarios"]["2025-11-05"] == {"09:00": OCUPADO}
+
+        resp = client.put(f"/medicos/{mongomock.ObjectId()}/horarios",
+                          json={"data": "2025-11-05", "hora": "09:00", "info": OCUPADO}, headers=headers)
+        assert resp.status_code == 404
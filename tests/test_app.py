@@ -116,6 +116,7 @@ def test_put_medico_update(mock_connect_db, client):
     mock_coll = MagicMock()
     mock_coll.find_one.return_value = {"_id": "507f1f77bcf86cd799439011", "nome": "Dr. João"}
     mock_coll.update_one.return_value = MagicMock(matched_count=1)
+    mock_coll.find_one_and_update.return_value = {"_id": "507f1f77bcf86cd799439011", "nome": "Dr. João", "especialidade": "Neurologia", "versao": 2}
     mock_admins_coll = MagicMock()
     mock_admins_coll.find_one.return_value = {"username": "admin", "role": "admin"}
     def getitem(name):
@@ -304,6 +305,7 @@ def test_put_paciente_update(mock_connect_db, client):
     mock_coll = MagicMock()
     mock_coll.find_one.return_value = {"_id": "507f1f77bcf86cd799439011", "nome": "Ana"}
     mock_coll.update_one.return_value = MagicMock(matched_count=1)
+    mock_coll.find_one_and_update.return_value = {"_id": "507f1f77bcf86cd799439011", "nome": "Ana", "idade": 31, "versao": 2}
     mock_admins_coll = MagicMock()
     mock_admins_coll.find_one.return_value = {"username": "admin", "role": "admin"}
     def getitem(name):
@@ -0,0 +1,137 @@
+# tests/test_arquivamento.py
+import csv
+import io
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+import arquivamento
+import estatisticas
+import tarefas
+from app import app as flask_app
+
+LIMITE = "2025-03-01"
+
+
+def _dia(*status):
+    return {f"{8 + i:02d}:00": {"status": s, "paciente": "Ana" if s == "ocupado" else "nenhum"}
+            for i, s in enumerate(status)}
+
+
+@pytest.fixture
+def medicos(db):
+    ids = db["medicos"].insert_many([
+        {"nome": f"Dr. {i}", "especialidade": "Cardiologia", "especialidade_normalizada": "cardiologia", "horarios": {
+            "2025-01-06": _dia("ocupado", "disponível"),
+            "2025-01-20": _dia("ocupado"),
+            "2025-02-03": _dia("disponível"),
+            "2025-03-10": _dia("ocupado", "disponível"),
+        }}
+        for i in range(3)
+    ]).inserted_ids
+    return [str(i) for i in ids]
+
+
+def test_passada_em_lotes_retomavel(db, medicos):
+    arquivados, terminou = arquivamento.arquivar_colecao(db, arquivamento.MEDICOS, LIMITE, lote=2, max_lotes=1)
+    assert (arquivados, terminou) == (6, False)
+    assert db["arquivamento"].find_one({"_id": "medicos"})["apos_id"] is not None
+
+    arquivados, terminou = arquivamento.arquivar_colecao(db, arquivamento.MEDICOS, LIMITE, lote=2)
+    assert (arquivados, terminou) == (3, True)
+    assert db["arquivamento"].find_one({"_id": "medicos"})["apos_id"] is None
+
+    for medico in db["medicos"].find():
+        assert list(medico["horarios"]) == ["2025-03-10"]
+    janeiro = db["horarios_arquivo"].find_one({"_id": f"{medicos[0]}:2025-01"})
+    assert sorted(janeiro["horarios"]) == ["2025-01-06", "2025-01-20"]
+    assert (janeiro["nome"], janeiro["mes"], str(janeiro["medico_id"])) == ("Dr. 0", "2025-01", medicos[0])
+    assert db["horarios_arquivo"].count_documents({}) == 6
+
+    # uma nova passada não encontra mais nada
+    assert arquivamento.arquivar_colecao(db, arquivamento.MEDICOS, LIMITE) == (0, True)
+
+
+def test_dia_alterado_durante_o_arquivamento(db, medicos):
+    colecao = db["medicos"]
+    documento = arquivamento._dias_antigos(db, arquivamento.MEDICOS, LIMITE, None, 1)[0]
+    colecao.update_one({"_id": documento["_id"]}, {"$set": {"horarios.2025-01-20.09:00": {"status": "ocupado"}}})
+
+    assert arquivamento._arquivar_documento(db, arquivamento.MEDICOS, documento) == 0
+    assert "2025-01-20" in colecao.find_one({"_id": documento["_id"]})["horarios"]
+
+    # a próxima passada arquiva a versão nova
+    arquivamento.arquivar_colecao(db, arquivamento.MEDICOS, LIMITE)
+    arquivado = db["horarios_arquivo"].find_one({"_id": f"{documento['_id']}:2025-01"})
+    assert "09:00" in arquivado["horarios"]["2025-01-20"]
+
+
+def test_leituras_com_incluir_arquivo(db, medicos, headers):
+    db["pacientes"].insert_one({"nome": "Ana", "cpf": "111", "consultas": {
+        "2025-01-06": {"08:00": {"medico": "Dr. 0", "especialidade": "Cardiologia", "status": "confirmado"}},
+        "2025-03-10": {"08:00": {"medico": "Dr. 0", "especialidade": "Cardiologia", "status": "confirmado"}},
+    }})
+    for especificacao in arquivamento.ARQUIVOS:
+        arquivamento.arquivar_colecao(db, especificacao, LIMITE)
+    paciente_id = str(db["pacientes"].find_one()["_id"])
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        url = f"/medicos/{medicos[0]}/horarios"
+        assert list(client.get(url, headers=headers).get_json()["horarios"]) == ["2025-03-10"]
+        completos = client.get(f"{url}?incluir_arquivo=1", headers=headers).get_json()["horarios"]
+        assert list(completos) == ["2025-01-06", "2025-01-20", "2025-02-03", "2025-03-10"]
+        medico = client.get(f"/medicos/{medicos[0]}?incluir_arquivo=1", headers=headers).get_json()["medico"]
+        assert len(medico["horarios"]) == 4
+
+        consultas = client.get(f"/pacientes/{paciente_id}/consultas?incluir_arquivo=1", headers=headers)
+        assert list(consultas.get_json()["consultas"]) == ["2025-01-06", "2025-03-10"]
+        paciente = client.get(f"/pacientes/{paciente_id}", headers=headers).get_json()["paciente"]
+        assert list(paciente["consultas"]) == ["2025-03-10"]
+
+        csv_completo = client.get("/exportar/consultas?incluir_arquivo=1", headers=headers).data.decode()
+        linhas = list(csv.DictReader(io.StringIO(csv_completo)))
+        assert [(l["paciente_id"], l["data"]) for l in linhas] == [(paciente_id, "2025-01-06"), (paciente_id, "2025-03-10")]
+
+        estatisticas.cache.limpar()
+        periodo = "/estatisticas/ocupacao?de=2025-01-01&ate=2025-03-31"
+        assert client.get(periodo, headers=headers).get_json()["total"]["oferecidos"] == 6
+        completo = client.get(f"{periodo}&incluir_arquivo=1", headers=headers).get_json()
+        assert completo["total"] == {"oferecidos": 18, "ocupados": 9, "ocupacao": 0.5}
+        assert [m["oferecidos"] for m in completo["por_medico"]] == [6, 6, 6]
+        assert completo["por_especialidade"][0]["medicos"] == 3
+
+
+def test_ocupacao_nao_conta_duas_vezes_o_dia_arquivado_e_vivo(db, medicos):
+    arquivamento.arquivar_colecao(db, arquivamento.MEDICOS, LIMITE)
+    # falha entre a cópia para o arquivo e a remoção do vivo: o dia fica nos dois lugares
+    db["medicos"].update_one({"_id": db["horarios_arquivo"].find_one()["medico_id"]},
+                             {"$set": {"horarios.2025-01-06": _dia("ocupado", "ocupado", "disponível")}})
+
+    estatisticas.cache.limpar()
+    ocupacao = estatisticas.calcular_ocupacao(db["medicos"], date(2025, 1, 1), date(2025, 3, 31),
+                                              hoje=date(2025, 6, 1), arquivo=db["horarios_arquivo"])
+    # vale a versão viva do dia (3 horários, 2 ocupados) no lugar da arquivada (2 e 1)
+    assert ocupacao["total"] == {"oferecidos": 19, "ocupados": 10, "ocupacao": 0.5263}
+    assert ocupacao["por_dia"][0] == {"data": "2025-01-06", "oferecidos": 7, "ocupados": 4, "ocupacao": 0.5714}
+
+
+def test_tarefa_se_reagenda(db, medicos, monkeypatch):
+    monkeypatch.setattr(arquivamento, "horizonte_dias", (date.today() - date(2025, 3, 1)).days)
+    arquivamento.agendar(db)
+    arquivamento.agendar(db)
+    assert db["tarefas"].count_documents({"tipo": "arquivar", "estado": "pendente"}) == 1
+
+    db["tarefas"].update_one({"tipo": "arquivar"}, {"$set": {"parametros": {"lote": 1, "max_lotes": 1}}})
+    trabalhadores = tarefas.Trabalhadores(db, threads=0)
+    assert trabalhadores.executar_uma()
+    resultado = db["tarefas"].find_one({"estado": "concluida"})["resultado"]
+    assert (resultado["horarios"], resultado["terminou"]) == (3, False)
+
+    # a continuação foi agendada para já; ao terminar, a próxima fica para o intervalo
+    while not db["tarefas"].find_one({"estado": "concluida", "resultado.terminou": True}):
+        assert trabalhadores.executar_uma()
+    pendente = db["tarefas"].find_one({"estado": "pendente"})
+    assert (pendente["executar_apos"] - pendente["criada_em"]).total_seconds() == arquivamento.intervalo_s
+    assert db["horarios_arquivo"].count_documents({}) == 6
@@ -0,0 +1,69 @@
+# tests/test_busca.py
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import busca
+from utils import normalizar_texto, somente_digitos
+
+
+@pytest.fixture
+def db(db):
+    pacientes = [
+        {"nome": "João da Silva", "cpf": "123.456.789-00", "celular": "(11) 98888-7777", "idade": 40},
+        {"nome": "Joana Souza", "cpf": "987.654.321-00", "celular": "11977776666", "idade": 31},
+        {"nome": "JOÃO", "cpf": "111.222.333-44", "celular": "21912345678", "idade": 22},
+        {"nome": "Maria Joaquina", "cpf": "12399988877", "celular": "11955554444", "idade": 55},
+    ]
+    for p in pacientes:
+        p.update(busca.campos_de_busca(p))
+    db["pacientes"].insert_many(pacientes)
+    return db
+
+
+def test_normalizacao():
+    assert normalizar_texto("  João   DA  Silva ") == "joao da silva"
+    assert somente_digitos("123.456.789-00") == "12345678900"
+
+
+def test_busca_por_nome_ignora_acentos_e_ordena_exato_primeiro(db):
+    resultado = busca.buscar_por_prefixo(db["pacientes"], "joao")
+    assert [p["nome"] for p in resultado] == ["JOÃO", "João da Silva"]
+    assert set(resultado[0]) == {"_id", "nome", "cpf", "celular", "idade"}
+
+
+def test_busca_por_cpf_e_celular_com_pontuacao(db):
+    resultado = busca.buscar_por_prefixo(db["pacientes"], "123.4")
+    assert [p["nome"] for p in resultado] == ["João da Silva"]
+    resultado = busca.buscar_por_prefixo(db["pacientes"], "11 9")
+    assert {p["nome"] for p in resultado} == {"João da Silva", "Joana Souza", "Maria Joaquina"}
+
+
+def test_preencher_campos_de_busca():
+    collection = MagicMock()
+    collection.find.return_value.batch_size.return_value = [
+        {"_id": 1, "nome": "Ênio Árvore", "cpf": "555.1", "celular": "666"},
+        {"_id": 2, "nome": "Ana", "cpf": "777", "celular": "888"},
+    ]
+    collection.bulk_write.return_value = MagicMock(modified_count=2)
+    assert busca.preencher_campos_de_busca(collection, lote=10) == 2
+    operacoes = collection.bulk_write.call_args[0][0]
+    assert operacoes[0]._doc == {"$set": {
+        "nome_normalizado": "enio arvore", "cpf_digitos": "5551", "celular_digitos": "666",
+    }}
+
+
+def test_endpoint_busca(db, client, headers):
+    with patch("app.connect_db", return_value=db):
+        resp = client.get("/pacientes/busca?q=Jo&limite=2", headers=headers)
+        assert resp.status_code == 200
+        assert len(resp.get_json()["pacientes"]) == 2
+        assert client.get("/pacientes/busca?q=j", headers=headers).status_code == 400
+        assert client.get("/pacientes/busca?q=jo&limite=x", headers=headers).status_code == 400
+
+        # POST mantém os campos de busca e eles não aparecem no GET
+        resp = client.post("/pacientes", json={"nome": "Érica", "cpf": "1", "celular": "2", "idade": 3}, headers=headers)
+        novo_id = resp.get_json()["id"]
+        assert db["pacientes"].find_one({"nome": "Érica"})["nome_normalizado"] == "erica"
+        resp = client.get(f"/pacientes/{novo_id}", headers=headers)
+        assert "nome_normalizado" not in resp.get_json()["paciente"]
@@ -0,0 +1,23 @@
+# tests/test_carga.py
+from benchmarks.carga import comparar
+
+
+def _resultado(p95, rps, erros=0):
+    return {"rotas": {"GET /medicos": {"requisicoes": 1000, "rps": rps, "erros": erros, "p95_ms": p95}}}
+
+
+def test_comparar_aponta_regressoes_acima_da_tolerancia():
+    baseline = _resultado(p95=100, rps=50)
+    assert comparar(_resultado(p95=115, rps=45), baseline, 0.2) == []
+    regressoes = comparar(_resultado(p95=130, rps=30, erros=50), baseline, 0.2)
+    assert regressoes == [
+        "GET /medicos: p95 100 -> 130 ms",
+        "GET /medicos: req/s 50 -> 30",
+        "GET /medicos: erros 0.0% -> 5.0%",
+    ]
+
+
+def test_comparar_ignora_rotas_novas():
+    atual = _resultado(p95=100, rps=50)
+    atual["rotas"]["GET /especialidades"] = {"requisicoes": 1, "rps": 1, "erros": 1, "p95_ms": 999}
+    assert comparar(atual, _resultado(p95=100, rps=50), 0.2) == []
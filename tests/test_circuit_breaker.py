@@ -0,0 +1,87 @@
+# tests/test_circuit_breaker.py
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import ServerSelectionTimeoutError, DuplicateKeyError
+
+import app as flask_app_module
+from circuit_breaker import CircuitBreaker, CircuitoAberto, ABERTO, FECHADO, MEIO_ABERTO
+from database import BancoProtegido
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+
+def test_breaker_opens_after_repeated_failures_and_recovers_via_half_open():
+    relogio = Relogio()
+    breaker = CircuitBreaker(limite_falhas=3, tempo_aberto_s=10, relogio=relogio)
+    for _ in range(3):
+        breaker.permitir()
+        breaker.registrar_falha()
+    assert breaker.estado == ABERTO
+    with pytest.raises(CircuitoAberto) as exc:
+        breaker.permitir()
+    assert exc.value.retry_after_header == "10"
+
+    relogio.agora = 10.5
+    breaker.permitir()  # requisição de teste
+    assert breaker.estado == MEIO_ABERTO
+    with pytest.raises(CircuitoAberto):
+        breaker.permitir()  # só uma tentativa por janela
+    breaker.registrar_falha()
+    assert breaker.estado == ABERTO
+
+    relogio.agora = 21
+    breaker.permitir()
+    breaker.registrar_sucesso()
+    assert breaker.estado == FECHADO
+    breaker.permitir()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(limite_falhas=2)
+    breaker.registrar_falha()
+    breaker.registrar_sucesso()
+    breaker.registrar_falha()
+    assert breaker.estado == FECHADO
+
+
+def test_protected_db_counts_connection_errors_but_not_server_errors():
+    breaker = CircuitBreaker(limite_falhas=2)
+    client = MongoClient("mongodb://127.0.0.1:1/", serverSelectionTimeoutMS=50, connect=False)
+    db = BancoProtegido(client["clinica"], breaker)
+    try:
+        with pytest.raises(ServerSelectionTimeoutError):
+            db["pacientes"].find_one({"cpf": "1"})
+        with pytest.raises(ServerSelectionTimeoutError):
+            list(db["pacientes"].find({}))  # falha só aparece ao iterar o cursor
+    finally:
+        client.close()
+    assert breaker.estado == ABERTO
+
+    breaker = CircuitBreaker(limite_falhas=1)
+
+    class Colecao:
+        def insert_one(self, doc):
+            raise DuplicateKeyError("E11000")
+
+    from database import ColecaoProtegida
+    with pytest.raises(DuplicateKeyError):
+        ColecaoProtegida(Colecao(), breaker).insert_one({})
+    assert breaker.estado == FECHADO
+
+
+def test_open_circuit_returns_503_with_retry_after(monkeypatch, client, headers):
+    breaker = CircuitBreaker(limite_falhas=1, tempo_aberto_s=30)
+    breaker.registrar_falha()
+    monkeypatch.setattr(flask_app_module, "breaker", breaker)
+    resp = client.get("/medicos", headers=headers)
+    assert resp.status_code == 503
+    assert int(resp.headers["Retry-After"]) == 30
+    resp = client.get("/health/ready")
+    assert resp.status_code == 503
+    assert resp.get_json()["circuito"] == ABERTO
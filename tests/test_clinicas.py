@@ -0,0 +1,170 @@
+# tests/test_clinicas.py
+from unittest.mock import patch
+
+import jwt
+import mongomock
+import pytest
+
+import app as flask_app_module
+import arquivamento
+import clinicas
+import eventos
+import metrics
+import tarefas
+import trigramas
+from app import app as flask_app
+
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+
+
+@pytest.fixture
+def varias_clinicas(monkeypatch):
+    monkeypatch.setattr(clinicas, "clinicas", frozenset({"centro", "norte"}))
+    monkeypatch.setattr(clinicas, "padrao", "centro")
+    monkeypatch.setattr(clinicas, "habilitado", True)
+
+
+@pytest.fixture
+def cliente_mongo(varias_clinicas):
+    """Um único cliente para todas as clínicas, como na API"""
+    cliente = mongomock.MongoClient()
+    senha = flask_app_module.bcrypt.generate_password_hash("Admin@123").decode("utf-8")
+    for banco in ("clinica", "clinica_norte"):
+        cliente[banco]["admins"].insert_one({"username": "admin", "password": senha, "role": "admin"})
+    cliente["clinica"]["medicos"].insert_one({"nome": "Dr. Centro", "especialidade": "Cardiologia"})
+    cliente["clinica_norte"]["medicos"].insert_one({"nome": "Dr. Norte", "especialidade": "Pediatria"})
+    return cliente
+
+
+@pytest.fixture
+def client(cliente_mongo):
+    flask_app.config["TESTING"] = True
+    with patch("database.get_client", return_value=cliente_mongo), patch("app.inicializar_banco"), \
+            flask_app.test_client() as client:
+        yield client
+
+
+def _login(client, clinica=None):
+    headers = {clinicas.CABECALHO: clinica} if clinica else {}
+    resp = client.post("/auth/login", json={"username": "admin", "password": "Admin@123"}, headers=headers)
+    assert resp.status_code == 200
+    return {"Authorization": f"Bearer {resp.get_json()['token']}"}
+
+
+def test_resolver(varias_clinicas):
+    assert clinicas.resolver("norte") == "norte"
+    assert clinicas.resolver(None, " Norte ") == "norte"
+    assert clinicas.resolver() == "centro"
+    with pytest.raises(clinicas.ClinicaInvalida) as e:
+        clinicas.resolver("norte", "centro")
+    assert e.value.status == 403
+    with pytest.raises(clinicas.ClinicaInvalida) as e:
+        clinicas.resolver(None, "sul")
+    assert e.value.status == 404
+    assert clinicas.nome_do_banco("clinica", "centro") == "clinica"
+    assert clinicas.nome_do_banco("clinica", "norte") == "clinica_norte"
+
+
+def test_uma_unica_clinica_por_padrao():
+    assert not clinicas.habilitado
+    assert clinicas.resolver(None, "norte") is None
+    assert clinicas.nome_do_banco("clinica", None) == "clinica"
+
+
+def test_cada_clinica_ve_o_proprio_banco(client):
+    norte = _login(client, "norte")
+    token = jwt.decode(norte["Authorization"].split()[1], options={"verify_signature": False})
+    assert token["clinica"] == "norte"
+
+    resp = client.get("/medicos", headers=norte)
+    assert [m["nome"] for m in resp.get_json()["medicos"]] == ["Dr. Norte"]
+    # sem cabeçalho no login: clínica padrão, no banco DB_NAME
+    resp = client.get("/medicos", headers=_login(client))
+    assert [m["nome"] for m in resp.get_json()["medicos"]] == ["Dr. Centro"]
+
+    resp = client.post("/medicos", json={"nome": "Dra. Nova", "cpf": "1", "crm": "2", "especialidade": "Ortopedia"},
+                       headers=norte)
+    assert resp.status_code == 201
+    medicos = client.get("/medicos", headers=_login(client, "centro")).get_json()["medicos"]
+    assert [m["nome"] for m in medicos] == ["Dr. Centro"]
+
+
+def test_token_de_uma_clinica_nao_acessa_outra(client):
+    norte = _login(client, "norte")
+    resp = client.get("/medicos", headers=dict(norte, **{clinicas.CABECALHO: "centro"}))
+    assert resp.status_code == 403
+    resp = client.post("/auth/login", json={"username": "admin", "password": "Admin@123"},
+                       headers={clinicas.CABECALHO: "sul"})
+    assert resp.status_code == 404
+    # health checks não dependem de clínica
+    with patch.object(flask_app_module.readiness, "verificar", return_value=({"mongo": {"ok": True}}, 200)):
+        assert client.get("/health").status_code == 200
+
+
+def test_metricas_por_clinica(client):
+    norte = _login(client, "norte")
+    antes = metrics.clinica_requests.value("norte", "200")
+    client.get("/medicos", headers=norte)
+    assert metrics.clinica_requests.value("norte", "200") == antes + 1
+    assert 'clinica_http_request_duration_seconds_count{clinica="norte"}' in metrics.render()
+
+
+def test_indices_e_eventos_separados_por_clinica(varias_clinicas):
+    assert trigramas.indices.de("centro") is trigramas.indice
+    assert trigramas.indices.de("norte") is trigramas.indices.de("norte") is not trigramas.indice
+    norte = eventos.barramentos.de("norte").assinar()
+    centro = eventos.barramentos.de(None).assinar()
+    eventos.notificar(eventos.HORARIOS, "criado", clinica="norte", medico_id="a", data="2025-11-05")
+    assert norte.proximo(0)["medico_id"] == "a"
+    assert centro.proximo(0) is None
+
+
+def test_trabalhadores_atendem_todas_as_clinicas():
+    cliente = mongomock.MongoClient()
+    centro, norte = cliente["clinica"], cliente["clinica_norte"]
+    executadas = []
+
+    @tarefas.tarefa("teste_clinicas")
+    def registrar(db, valor):
+        executadas.append((db.name, valor))
+
+    try:
+        trabalhadores = tarefas.Trabalhadores(centro, threads=0)
+        trabalhadores.adicionar(norte)
+        trabalhadores.adicionar(norte)
+        assert [db.name for db in trabalhadores.bancos] == ["clinica", "clinica_norte"]
+        tarefas.enfileirar(norte, "teste_clinicas", {"valor": 1})
+        tarefas.enfileirar(centro, "teste_clinicas", {"valor": 2})
+        assert trabalhadores.executar_uma() and trabalhadores.executar_uma()
+        assert not trabalhadores.executar_uma()
+    finally:
+        del tarefas.tipos["teste_clinicas"]
+    assert sorted(executadas) == [("clinica", 2), ("clinica_norte", 1)]
+
+
+def test_expansao_em_segundo_plano_notifica_a_clinica_do_medico(client, cliente_mongo):
+    norte = _login(client, "norte")
+    id = cliente_mongo["clinica_norte"]["medicos"].find_one()["_id"]
+    modelo = {"de": "2025-11-03", "ate": "2025-11-03", "dias_semana": [0], "horas": ["08:00"]}
+    assert client.post(f"/medicos/{id}/horarios/expandir", json=modelo, headers=norte).status_code == 202
+
+    assinatura_norte = eventos.barramentos.de("norte").assinar()
+    assinatura_centro = eventos.barramentos.de("centro").assinar()
+    # o trabalhador roda fora de qualquer requisição
+    assert tarefas.Trabalhadores(cliente_mongo["clinica_norte"], threads=0).executar_uma()
+    assert assinatura_norte.proximo(0)["medico_id"] == str(id)
+    assert assinatura_centro.proximo(0) is None
+
+
+def test_arquivamento_por_linha_de_comando_passa_por_todas_as_clinicas(cliente_mongo, monkeypatch, capsys):
+    for banco in ("clinica", "clinica_norte"):
+        cliente_mongo[banco]["medicos"].update_many({}, {"$set": {"horarios": {"2020-01-06": {"08:00": LIVRE}}}})
+    monkeypatch.setattr("sys.argv", ["arquivamento.py", "--horizonte", "30"])
+    with patch("database.get_client", return_value=cliente_mongo):
+        arquivamento.main()
+        assert [cliente_mongo[banco]["horarios_arquivo"].count_documents({}) for banco in ("clinica", "clinica_norte")] == [1, 1]
+
+        cliente_mongo["clinica_norte"]["medicos"].update_many({}, {"$set": {"horarios.2020-01-07": {"08:00": LIVRE}}})
+        monkeypatch.setattr("sys.argv", ["arquivamento.py", "--clinica", "norte"])
+        arquivamento.main()
+    assert "clinica_norte.medicos: 1 dias" in capsys.readouterr().out.splitlines()[-2]
@@ -0,0 +1,113 @@
+# tests/test_consistencia.py
+from unittest.mock import patch
+
+import pytest
+from flask import g
+from pymongo import MongoClient, monitoring
+from pymongo.hello import Hello
+from pymongo.server_description import ServerDescription
+
+import consistencia
+import metrics
+from app import app as flask_app, connect_db
+
+PRIMARIO = ("p", 27017)
+SECUNDARIO = ("s", 27018)
+
+
+@pytest.fixture
+def replica_set():
+    """Cliente de um replica set que nunca conecta: só as opções e os eventos importam"""
+    client = MongoClient("mongodb://p:27017,s:27018/?replicaSet=rs0", connect=False)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def opcoes():
+    configuradas = {
+        "listas": consistencia.Opcoes("secondaryPreferred", 90, "local"),
+        "relatorios": consistencia.Opcoes("secondary", read_concern="majority"),
+        "escrita": consistencia.Opcoes(write_concern="majority"),
+        "importacao": consistencia.Opcoes(write_concern="1"),
+    }
+    with patch.dict(consistencia.opcoes, configuradas):
+        yield
+
+
+def _servidor(endereco, hello):
+    return ServerDescription(endereco, Hello({"ok": 1, "setName": "rs0", "maxWireVersion": 21, **hello}))
+
+
+def test_opcoes_invalidas_recusadas():
+    with pytest.raises(consistencia.ConfiguracaoInvalida):
+        consistencia.Opcoes("secundario")
+    with pytest.raises(consistencia.ConfiguracaoInvalida):
+        consistencia.Opcoes("primary", max_staleness_s=90)
+    with pytest.raises(consistencia.ConfiguracaoInvalida):
+        consistencia.Opcoes(read_concern="forte")
+    with pytest.raises(consistencia.ConfiguracaoInvalida):
+        consistencia.Opcoes(write_concern="todos")
+
+
+def test_opcoes_lidas_do_ambiente(monkeypatch):
+    monkeypatch.setenv("MONGO_AGENDA_READ_PREFERENCE", "nearest")
+    monkeypatch.setenv("MONGO_AGENDA_MAX_STALENESS_S", "120")
+    monkeypatch.setenv("MONGO_AGENDA_WRITE_CONCERN", "majority")
+    opcoes = consistencia.Opcoes.from_env("agenda")
+    assert opcoes.read_preference.mongos_mode == "nearest"
+    assert opcoes.read_preference.max_staleness == 120
+    assert opcoes.write_concern.document == {"w": "majority"}
+    # sem variáveis: primário e padrões do servidor
+    padrao = consistencia.Opcoes.from_env("leitura")
+    assert padrao.read_preference.mongos_mode == "primary"
+    assert padrao.read_concern.level is None and padrao.write_concern.document == {}
+
+
+@pytest.mark.parametrize("metodo, url, classe, modo", [
+    ("GET", "/medicos", "listas", "secondaryPreferred"),
+    ("GET", "/medicos/507f1f77bcf86cd799439011", "leitura", "primary"),
+    ("GET", "/estatisticas/ocupacao", "relatorios", "secondary"),
+    ("PUT", "/medicos/507f1f77bcf86cd799439011/horarios", "escrita", "primary"),
+])
+def test_connect_db_aplica_opcoes_da_classe(replica_set, opcoes, metodo, url, classe, modo):
+    with patch("database.get_client", return_value=replica_set), patch("app.inicializar_banco"), \
+            flask_app.test_request_context(url, method=metodo):
+        db = connect_db()
+        assert g.classe_consistencia == classe
+        colecao = db["medicos"]._alvo
+        assert colecao.read_preference.mongos_mode == modo
+        esperado = consistencia.opcoes[classe]
+        assert colecao.read_concern == esperado.read_concern
+        assert colecao.write_concern == esperado.write_concern
+
+
+def test_importacao_usa_write_concern_propria(replica_set, opcoes):
+    import database
+    with patch("database.get_client", return_value=replica_set):
+        db = database.banco("importacao")
+    assert db.write_concern.document == {"w": 1}
+    assert db.read_preference.mongos_mode == "primary"
+
+
+def test_metricas_mostram_onde_os_comandos_chegam():
+    """Topologia simulada com os eventos de monitoramento do PyMongo"""
+    papeis = metrics.ServerRoles()
+    vazio = ServerDescription(PRIMARIO)
+    papeis.description_changed(monitoring.ServerDescriptionChangedEvent(
+        vazio, _servidor(PRIMARIO, {"isWritablePrimary": True, "hosts": ["p:27017", "s:27018"]}), PRIMARIO, None))
+    papeis.description_changed(monitoring.ServerDescriptionChangedEvent(
+        vazio, _servidor(SECUNDARIO, {"secondary": True, "hosts": ["p:27017", "s:27018"]}), SECUNDARIO, None))
+    assert (papeis.papel(PRIMARIO), papeis.papel(SECUNDARIO)) == ("primario", "secundario")
+
+    listener = metrics.CommandTimer()
+    antes = metrics.mongo_commands.value("listas", "s:27018", "secundario")
+    antes_outra = metrics.mongo_commands.value("outra", "p:27017", "primario")
+    with patch.object(metrics, "server_roles", papeis):
+        with flask_app.test_request_context("/medicos"):
+            g.classe_consistencia = "listas"
+            listener.started(monitoring.CommandStartedEvent({"find": "medicos"}, "clinica", 1, SECUNDARIO, 1))
+        listener.started(monitoring.CommandStartedEvent({"insert": "tarefas"}, "clinica", 2, PRIMARIO, 2))
+    assert metrics.mongo_commands.value("listas", "s:27018", "secundario") == antes + 1
+    assert metrics.mongo_commands.value("outra", "p:27017", "primario") == antes_outra + 1
+    assert 'mongo_commands_total{classe="listas",servidor="s:27018",papel="secundario"}' in metrics.render()
@@ -0,0 +1,56 @@
+# tests/test_especialidades.py
+from unittest.mock import patch
+
+import pytest
+
+import busca
+
+
+@pytest.fixture
+def db(db):
+    medicos = [
+        {"nome": "Dr. João", "cpf": "1", "crm": "1", "especialidade": "Cardiologia"},
+        {"nome": "Dra. Ana", "cpf": "2", "crm": "2", "especialidade": "cardiologia "},
+        {"nome": "Dr. Pedro", "cpf": "3", "crm": "3", "especialidade": "Pediatria"},
+        {"nome": "Dra. Lúcia", "cpf": "4", "crm": "4", "especialidade": "Clínica Geral"},
+    ]
+    for m in medicos:
+        m["horarios"] = {}
+        m.update(busca.campos_de_busca_medico(m))
+    db["medicos"].insert_many(medicos)
+    return db
+
+
+def test_filtro_especialidade_ignora_acentos_e_maiusculas(db, client, headers):
+    with patch("app.connect_db", return_value=db):
+        resp = client.get("/medicos?especialidade=CARDIOLOGIA", headers=headers)
+        assert resp.status_code == 200
+        medicos = resp.get_json()["medicos"]
+        assert {m["nome"] for m in medicos} == {"Dr. João", "Dra. Ana"}
+        assert "especialidade_normalizada" not in medicos[0]
+
+        resp = client.get("/medicos?especialidade=clinica%20geral", headers=headers)
+        assert [m["nome"] for m in resp.get_json()["medicos"]] == ["Dra. Lúcia"]
+
+        assert client.get("/medicos?especialidade=Ortopedia", headers=headers).status_code == 404
+
+
+def test_especialidades_agrupadas_com_contagem(db, client, headers):
+    with patch("app.connect_db", return_value=db):
+        resp = client.get("/especialidades", headers=headers)
+    assert resp.status_code == 200
+    especialidades = resp.get_json()["especialidades"]
+    assert [(e["chave"], e["medicos"]) for e in especialidades] == [
+        ("cardiologia", 2), ("clinica geral", 1), ("pediatria", 1),
+    ]
+    assert especialidades[0]["especialidade"] == "Cardiologia"
+
+
+def test_post_e_put_medico_mantem_campo_normalizado(db, client, headers):
+    with patch("app.connect_db", return_value=db):
+        resp = client.post("/medicos", json={
+            "nome": "Dr. Caio", "cpf": "9", "crm": "9", "especialidade": "Ortopedia",
+        }, headers=headers)
+        id = resp.get_json()["id"]
+        client.put(f"/medicos/{id}", json={"especialidade": "Neurologia Clínica"}, headers=headers)
+    assert db["medicos"].find_one({"cpf": "9"})["especialidade_normalizada"] == "neurologia clinica"
@@ -0,0 +1,91 @@
+# tests/test_estatisticas.py
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import busca
+import estatisticas
+from app import app as flask_app
+
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+OCUPADO = {"status": "ocupado", "paciente": "Maria"}
+
+
+@pytest.fixture(autouse=True)
+def limpar_cache():
+    estatisticas.cache.limpar()
+    yield
+    estatisticas.cache.limpar()
+
+
+@pytest.fixture
+def db(db):
+    medicos = [
+        {"nome": "Dr. João", "especialidade": "Cardiologia", "horarios": {
+            "2025-11-03": {"08:00": OCUPADO, "08:30": LIVRE, "09:00": {"status": "Livre"}, "09:30": OCUPADO},
+            "2025-11-10": {"08:00": OCUPADO, "08:30": OCUPADO},
+            "2025-12-01": {"08:00": OCUPADO},
+        }},
+        {"nome": "Dra. Ana", "especialidade": "Pediatria", "horarios": {
+            "2025-11-04": {"10:00": LIVRE, "10:30": OCUPADO},
+        }},
+        {"nome": "Dr. Sem Agenda", "especialidade": "Pediatria", "horarios": {}},
+    ]
+    for m in medicos:
+        m.update(busca.campos_de_busca_medico(m))
+    db["medicos"].insert_many(medicos)
+    return db
+
+
+def test_ler_periodo_valida_datas():
+    assert estatisticas.ler_periodo("2025-11-01", "2025-11-30") == (date(2025, 11, 1), date(2025, 11, 30))
+    for de, ate in [(None, "2025-11-30"), ("01/11/2025", "2025-11-30"),
+                    ("2025-11-30", "2025-11-01"), ("2024-01-01", "2025-12-31")]:
+        with pytest.raises(estatisticas.PeriodoInvalido):
+            estatisticas.ler_periodo(de, ate)
+
+
+def test_ocupacao_por_medico_especialidade_dia_e_semana(db):
+    resultado = estatisticas.calcular_ocupacao(
+        db["medicos"], date(2025, 11, 1), date(2025, 11, 30), hoje=date(2026, 1, 1))
+
+    assert resultado["total"] == {"oferecidos": 8, "ocupados": 5, "ocupacao": 0.625}
+    assert [(m["nome"], m["oferecidos"], m["ocupados"]) for m in resultado["por_medico"]] == [
+        ("Dr. João", 6, 4), ("Dra. Ana", 2, 1),
+    ]
+    assert [(e["chave"], e["medicos"], e["ocupacao"]) for e in resultado["por_especialidade"]] == [
+        ("cardiologia", 1, 0.6667), ("pediatria", 1, 0.5),
+    ]
+    assert [d["data"] for d in resultado["por_dia"]] == ["2025-11-03", "2025-11-04", "2025-11-10"]
+    assert [(s["inicio"], s["oferecidos"], s["ocupados"]) for s in resultado["por_semana"]] == [
+        ("2025-11-03", 6, 3), ("2025-11-10", 2, 2),
+    ]
+
+
+def test_periodo_fechado_fica_em_cache(db):
+    periodo = (date(2025, 11, 1), date(2025, 11, 30))
+    collection = MagicMock(wraps=db["medicos"])
+    estatisticas.calcular_ocupacao(collection, *periodo, hoje=date(2026, 1, 1))
+    estatisticas.calcular_ocupacao(collection, *periodo, hoje=date(2026, 1, 1))
+    assert collection.aggregate.call_count == 1
+
+    # período que inclui hoje é sempre recalculado
+    estatisticas.calcular_ocupacao(collection, *periodo, hoje=date(2025, 11, 15))
+    estatisticas.calcular_ocupacao(collection, *periodo, hoje=date(2025, 11, 15))
+    assert collection.aggregate.call_count == 3
+
+
+def test_endpoint_ocupacao(db, headers):
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        resp = client.get("/estatisticas/ocupacao?de=2025-11-01&ate=2025-11-30&especialidade=pediatria",
+                          headers=headers)
+        assert resp.status_code == 200
+        corpo = resp.get_json()
+        assert corpo["periodo"] == {"de": "2025-11-01", "ate": "2025-11-30"}
+        assert [m["nome"] for m in corpo["por_medico"]] == ["Dra. Ana"]
+
+        assert client.get("/estatisticas/ocupacao?de=2025-11-01", headers=headers).status_code == 400
+        assert client.get("/estatisticas/ocupacao?de=2025-11-01&ate=2025-11-30&medico=x",
+                          headers=headers).status_code == 400
@@ -0,0 +1,121 @@
+# tests/test_eventos.py
+import json
+from unittest.mock import patch
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+import eventos
+import metrics
+from app import app as flask_app
+from tests.test_app import make_token
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = eventos.EventBus(capacidade_cliente=3, historico=10)
+    monkeypatch.setattr(eventos, "bus", bus)
+    monkeypatch.setattr(eventos, "intervalo_heartbeat_s", 0.05)
+    return bus
+
+
+def _horario(medico_id, hora="08:00"):
+    return eventos.evento(eventos.HORARIOS, "atualizado", medico_id=medico_id, data="2025-11-05", hora=hora)
+
+
+def test_filtro_por_medico_e_tipo(bus):
+    do_medico = bus.assinar(medico="a")
+    so_consultas = bus.assinar(tipos=[eventos.CONSULTAS])
+    bus.publicar(_horario("b"))
+    bus.publicar(_horario("a"))
+    bus.publicar(eventos.evento(eventos.CONSULTAS, "criado", paciente_id="p", data="2025-11-05"))
+
+    assert do_medico.proximo(0)["medico_id"] == "a"
+    assert do_medico.proximo(0) is None
+    assert so_consultas.proximo(0)["paciente_id"] == "p"
+
+
+def test_consumidor_lento_e_descartado(bus):
+    lento = bus.assinar()
+    rapido = bus.assinar()
+    antes = metrics.sse_evictions.value()
+    for i in range(4):
+        bus.publicar(_horario("a", hora=f"0{i}:00"))
+        rapido.proximo(0)
+
+    with pytest.raises(eventos.AssinaturaEncerrada) as erro:
+        lento.proximo(0)
+    assert erro.value.motivo == "consumidor_lento"
+    assert len(bus) == 1
+    assert metrics.sse_evictions.value() == antes + 1
+
+
+def test_reconexao_com_last_event_id(bus):
+    ids = [bus.publicar(_horario("a", hora=f"0{i}:00"))["id"] for i in range(3)]
+    retomada = bus.assinar(ultimo_id=ids[0])
+    assert [retomada.proximo(0)["id"], retomada.proximo(0)["id"]] == ids[1:]
+
+    # mais eventos perdidos do que cabem no buffer: o cliente deve recarregar tudo
+    for i in range(5):
+        bus.publicar(_horario("a"))
+    assert bus.assinar(ultimo_id=ids[0]).proximo(0)["tipo"] == "ressincronizar"
+
+
+def test_eventos_da_mudanca():
+    id = ObjectId()
+    mudanca = {
+        "ns": {"db": "clinica", "coll": "medicos"},
+        "documentKey": {"_id": id},
+        "updateDescription": {
+            "updatedFields": {"horarios.2025-11-05.08:00": {"status": "ocupado"}, "nome": "x"},
+            "removedFields": ["horarios.2025-11-06"],
+        },
+    }
+    resultado = eventos.eventos_da_mudanca(mudanca)
+    assert [(e["acao"], e["medico_id"], e["data"], e["hora"]) for e in resultado] == [
+        ("atualizado", str(id), "2025-11-05", "08:00"),
+        ("removido", str(id), "2025-11-06", None),
+    ]
+
+
+def test_notificar_ignorado_com_change_streams(bus):
+    assinatura = bus.assinar()
+    bus.fonte = "change_stream"
+    eventos.notificar(eventos.HORARIOS, "criado", medico_id="a", data="2025-11-05")
+    assert assinatura.proximo(0) is None
+
+
+def test_endpoint_eventos_recebe_escritas(bus):
+    db = mongomock.MongoClient()["clinica"]
+    db["admins"].insert_one({"username": "admin", "role": "admin"})
+    id = str(db["medicos"].insert_one({"nome": "Dr. João", "horarios": {}}).inserted_id)
+    outro = str(ObjectId())
+    token = make_token("admin")
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        # EventSource não envia cabeçalhos: o token vai na query
+        resp = client.get(f"/eventos?medico={id}&token={token}", buffered=False)
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/event-stream"
+        stream = iter(resp.response)
+        assert next(stream) == b"retry: 3000\n\n"
+
+        headers = {"Authorization": f"Bearer {token}"}
+        bus.publicar(_horario(outro))
+        client.put(f"/medicos/{id}/horarios", json={
+            "data": "2025-11-05", "hora": "08:00", "info": {"status": "ocupado"},
+        }, headers=headers)
+
+        bloco = next(stream).decode()
+        assert bloco.startswith("id: 2\nevent: horarios\n")
+        evento = json.loads(bloco.split("data: ", 1)[1])
+        assert (evento["medico_id"], evento["acao"], evento["hora"]) == (id, "atualizado", "08:00")
+        assert next(stream) == b": ping\n\n"
+        resp.close()
+        assert len(bus) == 0
+
+        assert client.get(f"/eventos?token={token}&tipos=outros").status_code == 400
+        # o token na query só vale para o stream
+        assert client.get(f"/pacientes?token={token}").status_code == 401
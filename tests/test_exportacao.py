@@ -0,0 +1,97 @@
+# tests/test_exportacao.py
+import csv
+import io
+from unittest.mock import patch
+
+import pytest
+
+import exportacao
+import tarefas
+from app import app as flask_app
+
+
+@pytest.fixture
+def db(db):
+    db["pacientes"].insert_many([
+        {"nome": "Ana Souza", "cpf": "111.222.333-44", "celular": "(11) 98888-7777", "idade": 30,
+         "nome_normalizado": "ana souza", "consultas": {
+             "2025-11-05": {"14:00": {"medico": "Dr. João", "especialidade": "Cardiologia", "status": "confirmado"},
+                            "09:00": {"medico": "Dra. Lia", "especialidade": "Pediatria", "status": "cancelado"}},
+             "2025-12-01": {"10:00": {"medico": "Dr. João", "especialidade": "Cardiologia", "status": "confirmado"}},
+         }},
+        {"nome": "Bruno Lima", "cpf": "555.666.777-88", "celular": "(21) 97777-6666", "idade": 41, "consultas": {}},
+    ])
+    return db
+
+
+def _ler_csv(dados):
+    return list(csv.DictReader(io.StringIO(dados.decode("utf-8"))))
+
+
+def test_consultas_achatadas_por_periodo(db, headers):
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        resp = client.get("/exportar/consultas?de=2025-11-01&ate=2025-11-30", headers=headers)
+        assert resp.status_code == 200
+        assert resp.mimetype == "text/csv"
+        assert 'filename="consultas_2025-11-01_2025-11-30.csv"' in resp.headers["Content-Disposition"]
+        linhas = _ler_csv(resp.data)
+        assert [(l["data"], l["hora"], l["medico"], l["status"]) for l in linhas] == [
+            ("2025-11-05", "09:00", "Dra. Lia", "cancelado"),
+            ("2025-11-05", "14:00", "Dr. João", "confirmado"),
+        ]
+        assert linhas[0]["paciente_nome"] == "Ana Souza"
+
+        assert len(_ler_csv(client.get("/exportar/consultas", headers=headers).data)) == 3
+        pacientes = _ler_csv(client.get("/exportar/pacientes", headers=headers).data)
+        assert list(pacientes[0]) == exportacao.COLUNAS["pacientes"]
+        assert [p["nome"] for p in pacientes] == ["Ana Souza", "Bruno Lima"]
+
+        assert client.get("/exportar/consultas?de=2025-11-01", headers=headers).status_code == 400
+        assert client.get("/exportar/pacientes?formato=xlsx", headers=headers).status_code == 400
+        assert client.get("/exportar/medicos", headers=headers).status_code == 404
+
+
+def test_csv_em_blocos_limitados(monkeypatch):
+    monkeypatch.setattr(exportacao, "TAMANHO_BLOCO", 256)
+    linhas = ({"id": str(i), "nome": f"Paciente {i}", "cpf": "", "celular": "", "idade": i} for i in range(1000))
+    blocos = list(exportacao.csv_em_blocos(linhas, exportacao.COLUNAS["pacientes"]))
+    assert len(blocos) > 50
+    assert max(len(b) for b in blocos) < 512
+    assert len(_ler_csv(b"".join(blocos))) == 1000
+
+
+def test_parquet_sem_pyarrow(db, monkeypatch, headers):
+    def ausente():
+        raise exportacao.FormatoIndisponivel("pyarrow ausente")
+    monkeypatch.setattr(exportacao, "_pyarrow", ausente)
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        assert client.get("/exportar/pacientes?formato=parquet", headers=headers).status_code == 501
+
+
+def test_parquet():
+    pq = pytest.importorskip("pyarrow.parquet")
+    linhas = ({"id": str(i), "nome": f"P{i}", "cpf": None, "celular": None, "idade": i} for i in range(2500))
+    dados = b"".join(exportacao.parquet_em_blocos(linhas, exportacao.COLUNAS["pacientes"], lote=1000))
+    tabela = pq.read_table(io.BytesIO(dados))
+    assert tabela.num_rows == 2500
+    assert pq.ParquetFile(io.BytesIO(dados)).num_row_groups == 3
+
+
+def test_exportacao_em_segundo_plano(db, tmp_path, monkeypatch, headers):
+    monkeypatch.setattr(exportacao, "diretorio", str(tmp_path))
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        resp = client.get("/exportar/consultas?assincrono=1", headers=headers)
+        assert resp.status_code == 202
+
+        assert tarefas.Trabalhadores(db, threads=0).executar_uma()
+        tarefa = client.get(resp.headers["Location"], headers=headers).get_json()["tarefa"]
+        assert tarefa["estado"] == "concluida"
+        assert not list(tmp_path.glob("*.parcial"))
+
+        arquivo = client.get(tarefa["resultado"]["url"], headers=headers)
+        assert arquivo.status_code == 200
+        assert len(_ler_csv(arquivo.data)) == 3
+        assert len(arquivo.data) == tarefa["resultado"]["bytes"]
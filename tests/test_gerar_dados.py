@@ -0,0 +1,54 @@
+# tests/test_gerar_dados.py
+import random
+from datetime import date
+
+import mongomock
+
+import gerar_dados
+
+DE, ATE = date(2025, 11, 3), date(2025, 11, 16)
+
+
+def test_cpf_com_digitos_verificadores_validos():
+    rng = random.Random(1)
+    assert all(gerar_dados.cpf_valido(gerar_dados.cpf(rng)) for _ in range(200))
+    assert gerar_dados.cpf_valido("529.982.247-25")
+    assert not gerar_dados.cpf_valido("529.982.247-26")
+    assert not gerar_dados.cpf_valido("111.111.111-11")
+
+
+def test_geracao_deterministica():
+    primeira = gerar_dados.gerar_medicos(5, 100, DE, ATE, seed=7)
+    segunda = gerar_dados.gerar_medicos(5, 100, DE, ATE, seed=7)
+    assert primeira == segunda
+    assert gerar_dados.gerar_paciente(7, 42) == gerar_dados.gerar_paciente(7, 42)
+    assert gerar_dados.gerar_medicos(5, 100, DE, ATE, seed=8) != primeira
+
+
+def test_agenda_e_consultas_consistentes():
+    medicos, consultas = gerar_dados.gerar_medicos(10, 50, DE, ATE, seed=3)
+    pacientes = list(gerar_dados.gerar_pacientes(50, consultas, seed=3))
+
+    ocupados = 0
+    for medico in medicos:
+        assert gerar_dados.cpf_valido(medico["cpf"])
+        assert medico["especialidade_normalizada"]
+        for data, agenda in medico["horarios"].items():
+            assert date.fromisoformat(data).weekday() != 6
+            for hora, info in agenda.items():
+                if info["status"] == "ocupado":
+                    ocupados += 1
+                    donos = [p for p in pacientes
+                             if p["consultas"].get(data, {}).get(hora, {}).get("medico") == medico["nome"]]
+                    assert [p["nome"] for p in donos] == [info["paciente"]]
+    assert ocupados == sum(len(c) for p in pacientes for c in p["consultas"].values()) > 0
+    assert all(p["nome_normalizado"] and p["cpf_digitos"] for p in pacientes)
+
+
+def test_gravar_mongo_em_lotes():
+    db = mongomock.MongoClient()["clinica"]
+    medicos, consultas = gerar_dados.gerar_medicos(3, 25, DE, ATE)
+    total = gerar_dados.gravar_mongo(db, medicos, gerar_dados.gerar_pacientes(25, consultas), lote=10)
+    assert total == {"medicos": 3, "pacientes": 25}
+    assert db["pacientes"].count_documents({}) == 25
+    assert "nome_normalizado_1" in db["pacientes"].index_information()
@@ -0,0 +1,129 @@
+# tests/test_grade.py
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+import estatisticas
+import grade
+import tarefas
+from app import app as flask_app
+
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+
+
+def _ocupado(paciente):
+    return {"status": "ocupado", "paciente": paciente}
+
+
+@pytest.fixture
+def compacto(monkeypatch):
+    monkeypatch.setattr(grade, "formato", "grade")
+
+
+def test_conversao_ida_e_volta():
+    dia = {"08:00": LIVRE, "08:30": _ocupado("Ana"), "09:00": {"status": "Livre", "paciente": "nenhum"},
+           "23:30": "Reservado"}
+    compactado = grade.compactar_dia(dia)
+    assert compactado["livres"] == (1 << 16) | (1 << 18)
+    assert compactado["ocupados"] == (1 << 17) | (1 << 47)
+    # o horário livre padrão não vai para os detalhes
+    assert sorted(compactado["detalhes"]) == ["08:30", "09:00", "23:30"]
+    assert grade.expandir_dia(compactado) == dia
+    assert list(grade.expandir_dia(compactado)) == ["08:00", "08:30", "09:00", "23:30"]
+
+    assert grade.compactar_dia({"08:15": LIVRE}) is None
+    assert grade.armazenar({"08:00": LIVRE}) == {"08:00": LIVRE}
+
+
+def test_grade_maior_que_53_horarios_e_recusada():
+    # Acima de 2**53 os bits contados por `contar_bits` (em double) saem errados
+    assert grade._slots(30) == 48
+    assert grade._slots(45) == 32
+    with pytest.raises(ValueError):
+        grade._slots(24)
+    with pytest.raises(ValueError):
+        grade._slots(25)
+
+
+def test_rotas_com_formato_compacto(db, compacto, headers):
+    id = db["medicos"].insert_one({"nome": "Dr. João", "horarios": {
+        "2025-11-04": {"08:00": LIVRE, "08:15": _ocupado("Bia")},
+    }}).inserted_id
+    url = f"/medicos/{id}/horarios"
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        dia = {"08:00": LIVRE, "08:30": LIVRE, "09:00": _ocupado("Ana")}
+        assert client.post(url, json={"2025-11-03": dia}, headers=headers).status_code == 201
+        armazenado = db["medicos"].find_one()["horarios"]
+        assert grade.compacto(armazenado["2025-11-03"])
+        # fora da grade, o dia continua no formato original
+        assert not grade.compacto(armazenado["2025-11-04"])
+
+        assert client.put(url, json={"data": "2025-11-03", "hora": "08:30", "info": _ocupado("Caio")},
+                          headers=headers).status_code == 200
+        assert client.delete(url, json={"data": "2025-11-03", "hora": "08:00"}, headers=headers).status_code == 200
+        assert client.put(url, json={"data": "2025-11-05", "hora": "10:00", "info": LIVRE},
+                          headers=headers).status_code == 200
+
+        horarios = client.get(url, headers=headers).get_json()["horarios"]
+        assert horarios["2025-11-03"] == {"08:30": _ocupado("Caio"), "09:00": _ocupado("Ana")}
+        assert horarios["2025-11-05"] == {"10:00": LIVRE}
+        assert horarios["2025-11-04"]["08:15"] == _ocupado("Bia")
+        assert client.get(f"/medicos/{id}", headers=headers).get_json()["medico"]["horarios"] == horarios
+        armazenado = db["medicos"].find_one()["horarios"]
+        assert armazenado["2025-11-03"]["ocupados"] == (1 << 17) | (1 << 18)
+        assert grade.compacto(armazenado["2025-11-05"])
+
+        outro = "507f1f77bcf86cd799439011"
+        assert client.put(f"/medicos/{outro}/horarios", json={"data": "2025-11-03", "hora": "08:30", "info": LIVRE},
+                          headers=headers).status_code == 404
+
+
+def test_estatisticas_e_expansao_sobre_dias_compactos(db):
+    dia = {"08:00": LIVRE, "08:30": _ocupado("Ana"), "09:00": _ocupado("Bia")}
+    db["medicos"].insert_many([
+        {"nome": "Dr. A", "especialidade": "Cardiologia", "especialidade_normalizada": "cardiologia",
+         "horarios": {"2025-11-03": dia}},
+        {"nome": "Dr. B", "especialidade": "Cardiologia", "especialidade_normalizada": "cardiologia",
+         "horarios": {"2025-11-03": grade.compactar_dia(dia)}},
+    ])
+    ocupacao = estatisticas.calcular_ocupacao(db["medicos"], date(2025, 11, 3), date(2025, 11, 3), hoje=date(2025, 11, 1))
+    assert [(m["oferecidos"], m["ocupados"]) for m in ocupacao["por_medico"]] == [(3, 2), (3, 2)]
+
+    compacto_id = db["medicos"].find_one({"nome": "Dr. B"})["_id"]
+    tarefas.enfileirar(db, "expandir_agenda", {"medico_id": str(compacto_id), "de": "2025-11-03", "ate": "2025-11-03",
+                                               "dias_semana": [0], "horas": ["08:00", "10:00"]})
+    assert tarefas.Trabalhadores(db, threads=0).executar_uma()
+    assert db["tarefas"].find_one()["resultado"] == {"dias": 1, "horarios_criados": 1}
+    expandido = db["medicos"].find_one({"_id": compacto_id})["horarios"]["2025-11-03"]
+    assert grade.compacto(expandido)
+    assert list(grade.expandir_dia(expandido)) == ["08:00", "08:30", "09:00", "10:00"]
+
+
+def test_horarios_livres_no_periodo(db, headers):
+    dia = {"08:00": LIVRE, "08:30": _ocupado("Ana"), "14:00": LIVRE}
+    db["medicos"].insert_many([
+        {"nome": "Dr. A", "especialidade": "Cardiologia", "especialidade_normalizada": "cardiologia",
+         "horarios": {"2025-11-03": dia, "2025-11-04": {"08:15": LIVRE}, "2025-12-01": dia}},
+        {"nome": "Dr. B", "especialidade": "Pediatria", "especialidade_normalizada": "pediatria",
+         "horarios": {"2025-11-03": grade.compactar_dia(dia), "2025-11-05": grade.compactar_dia({"09:00": _ocupado("Bia")})}},
+    ])
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        resp = client.get("/horarios/livres?de=2025-11-01&ate=2025-11-30", headers=headers)
+        assert resp.status_code == 200
+        medicos = resp.get_json()["medicos"]
+        assert [m["nome"] for m in medicos] == ["Dr. A", "Dr. B"]
+        assert medicos[0]["livres"] == {"2025-11-03": ["08:00", "14:00"], "2025-11-04": ["08:15"]}
+        assert (medicos[1]["livres"], medicos[1]["total"]) == ({"2025-11-03": ["08:00", "14:00"]}, 2)
+
+        manha = client.get("/horarios/livres?de=2025-11-01&ate=2025-11-30&hora_ate=12:00&especialidade=pediatria",
+                           headers=headers).get_json()["medicos"]
+        assert [(m["nome"], m["livres"]) for m in manha] == [("Dr. B", {"2025-11-03": ["08:00"]})]
+
+        assert client.get("/horarios/livres?de=2025-11-01", headers=headers).status_code == 400
+        assert client.get("/horarios/livres?de=2025-11-01&ate=2025-11-30&hora_de=8h",
+                          headers=headers).status_code == 400
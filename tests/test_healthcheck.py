@@ -0,0 +1,74 @@
+# tests/test_healthcheck.py
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import app as flask_app_module
+import healthcheck
+from app import app as flask_app
+
+
+@pytest.fixture
+def client():
+    flask_app.config["TESTING"] = True
+    flask_app_module.readiness.invalidar()
+    with flask_app.test_client() as client:
+        yield client
+    flask_app_module.readiness.invalidar()
+
+
+def test_health_live_does_not_touch_db(client):
+    with patch("app.connect_db") as mock_connect_db:
+        resp = client.get("/health/live")
+    assert resp.status_code == 200
+    assert resp.get_json()["status"] == "ok"
+    mock_connect_db.assert_not_called()
+
+
+@patch("app.connect_db")
+def test_health_ready_caches_ping(mock_connect_db, client):
+    mock_db = MagicMock()
+    mock_connect_db.return_value = mock_db
+    resp = client.get("/health/ready")
+    resp2 = client.get("/health/ready")
+    assert resp.status_code == 200 and resp2.status_code == 200
+    corpo = resp.get_json()
+    assert corpo["status"] == "ok"
+    assert corpo["mongo"]["ping_ms"] is not None
+    assert set(corpo["pool"]) == {"max", "abertas", "em_uso", "utilizacao"}
+    mock_db.command.assert_called_once_with("ping")
+
+
+@patch("app.connect_db")
+def test_health_ready_reports_unreachable_db(mock_connect_db, client):
+    mock_db = MagicMock()
+    mock_db.command.side_effect = Exception("No servers found")
+    mock_connect_db.return_value = mock_db
+    resp = client.get("/health/ready")
+    assert resp.status_code == 503
+    assert resp.get_json()["status"] == "indisponivel"
+    # /health também deixa de reportar ok quando o ping falha
+    assert client.get("/health").status_code == 500
+
+
+def test_readiness_reports_saturated_pool():
+    stats = healthcheck.PoolStats()
+    probe = healthcheck.ReadinessProbe(stats, max_pool_size=10, limite_saturacao=0.9)
+    primario = SimpleNamespace(address=("p", 27017))
+    secundario = SimpleNamespace(address=("s", 27017))
+    for _ in range(6):
+        stats.connection_checked_out(primario)
+        stats.connection_checked_out(secundario)
+    # maxPoolSize é por servidor: 12 em uso em dois pools de 10 não passam de 0.6
+    corpo, code = probe.verificar(MagicMock())
+    assert code == 200
+    assert (corpo["pool"]["em_uso"], corpo["pool"]["utilizacao"]) == (12, 0.6)
+
+    for _ in range(3):
+        stats.connection_checked_out(primario)
+    stats.connection_checked_in(secundario)
+    corpo, code = probe.verificar(MagicMock())
+    assert code == 503
+    assert corpo["status"] == "saturado"
+    assert corpo["pool"]["utilizacao"] == 0.9
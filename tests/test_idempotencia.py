@@ -0,0 +1,123 @@
+# tests/test_idempotencia.py
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from flask import Response
+
+import idempotencia
+from app import app as flask_app
+
+
+@pytest.fixture
+def registro(monkeypatch):
+    registro = idempotencia.RegistroIdempotencia(espera_s=2, prazo_execucao_s=60)
+    monkeypatch.setattr(idempotencia, "registro", registro)
+    return registro
+
+
+def _com_chave(headers, chave):
+    return dict(headers, **{"Idempotency-Key": chave})
+
+
+PACIENTE = {"nome": "Maria Silva", "cpf": "123.456.789-00", "celular": "(11) 99999-0000", "idade": 30}
+
+
+def test_repeticao_devolve_a_primeira_resposta(registro, db, headers):
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        primeira = client.post("/pacientes", json=PACIENTE, headers=_com_chave(headers, "k1"))
+        # sem o cache em memória a resposta vem da collection
+        registro.cache = idempotencia._CacheRespostas(10, 60)
+        segunda = client.post("/pacientes", json=PACIENTE, headers=_com_chave(headers, "k1"))
+        terceira = client.post("/pacientes", json=PACIENTE, headers=_com_chave(headers, "k1"))
+
+        assert primeira.status_code == segunda.status_code == terceira.status_code == 201
+        assert primeira.get_json() == segunda.get_json() == terceira.get_json()
+        assert "Idempotent-Replayed" not in primeira.headers
+        assert segunda.headers["Idempotent-Replayed"] == "true"
+        assert db["pacientes"].count_documents({}) == 1
+
+        # outra chave é outra requisição
+        assert client.post("/pacientes", json=PACIENTE, headers=_com_chave(headers, "k2")).status_code == 201
+        assert db["pacientes"].count_documents({}) == 2
+
+        outro = dict(PACIENTE, nome="Outra Pessoa")
+        assert client.post("/pacientes", json=outro, headers=_com_chave(headers, "k1")).status_code == 422
+
+
+def test_horarios_e_erros_do_servidor(registro, db, headers):
+    id = str(db["medicos"].insert_one({"nome": "Dr. João", "horarios": {}}).inserted_id)
+    novos = {"2025-11-05": {"08:00": {"status": "disponível", "paciente": "nenhum"}}}
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        url = f"/medicos/{id}/horarios"
+        assert client.post(url, json=novos, headers=_com_chave(headers, "h")).status_code == 201
+        assert client.post(url, json=novos, headers=_com_chave(headers, "h")).headers["Idempotent-Replayed"] == "true"
+        # a mesma chave em outra rota não colide
+        ausente = client.post(f"/medicos/{ObjectId()}/horarios", json=novos, headers=_com_chave(headers, "h"))
+        assert ausente.status_code == 404
+
+    # respostas 5xx não são guardadas: a repetição executa de novo
+    chamadas = []
+    def falha():
+        chamadas.append(1)
+        return Response("{}", status=500)
+    for _ in range(2):
+        assert registro.processar(db["idempotencia"], "x", b"", falha).status_code == 500
+    assert len(chamadas) == 2
+    assert db["idempotencia"].count_documents({"_id": "x"}) == 0
+
+
+def test_duplicatas_concorrentes_esperam_a_primeira(registro, db):
+    chamadas = []
+    def executar():
+        chamadas.append(1)
+        time.sleep(0.2)
+        return Response('{"id": 1}', status=201, content_type="application/json")
+
+    respostas = []
+    threads = [
+        threading.Thread(target=lambda: respostas.append(registro.processar(db["idempotencia"], "c", b"{}", executar)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(chamadas) == 1
+    assert sorted(r.status_code for r in respostas) == [201] * 5
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in respostas) == 4
+
+
+def test_duplicata_de_outro_processo(registro, db):
+    colecao = db["idempotencia"]
+    impressao = idempotencia.hashlib.sha256(b"{}").hexdigest()
+    colecao.insert_one({"_id": "p", "impressao": impressao, "estado": "em_andamento", "criado_em": datetime.utcnow()})
+
+    def concluir():
+        time.sleep(0.1)
+        colecao.update_one({"_id": "p"}, {"$set": {
+            "estado": "concluido", "status": 201, "corpo": "{}", "content_type": "application/json",
+        }})
+    threading.Thread(target=concluir).start()
+
+    resposta = registro.processar(colecao, "p", b"{}", lambda: pytest.fail("não deveria executar"))
+    assert resposta.status_code == 201
+    assert resposta.headers["Idempotent-Replayed"] == "true"
+
+    # registro abandonado por um processo que caiu é assumido após o prazo
+    registro.espera_s = 0.1
+    antigo = datetime.utcnow() - timedelta(minutes=5)
+    colecao.insert_one({"_id": "q", "impressao": impressao, "estado": "em_andamento", "criado_em": antigo})
+    resposta = registro.processar(colecao, "q", b"{}", lambda: Response("{}", status=201))
+    assert resposta.status_code == 201
+    assert colecao.find_one({"_id": "q"})["estado"] == "concluido"
+
+    colecao.insert_one({"_id": "r", "impressao": impressao, "estado": "em_andamento", "criado_em": datetime.utcnow()})
+    with pytest.raises(idempotencia.ChaveEmUso):
+        registro.processar(colecao, "r", b"{}", lambda: pytest.fail("não deveria executar"))
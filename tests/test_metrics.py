@@ -0,0 +1,66 @@
+# tests/test_metrics.py
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+import metrics
+
+
+def test_histogram_render_is_cumulative():
+    hist = metrics.Histogram("teste_duracao_seconds", "teste", ("rota",), buckets=(0.1, 1.0))
+    hist.observe(0.05, "/a")
+    hist.observe(0.5, "/a")
+    hist.observe(3.0, "/a")
+    linhas = dict(
+        (f"{nome}{labels}", valor) for nome, labels, valor in hist.samples()
+    )
+    assert linhas['teste_duracao_seconds_bucket{rota="/a",le="0.1"}'] == 1
+    assert linhas['teste_duracao_seconds_bucket{rota="/a",le="1"}'] == 2
+    assert linhas['teste_duracao_seconds_bucket{rota="/a",le="+Inf"}'] == 3
+    assert linhas['teste_duracao_seconds_count{rota="/a"}'] == 3
+    assert linhas['teste_duracao_seconds_sum{rota="/a"}'] == pytest.approx(3.55)
+
+
+def test_command_listener_labels_by_collection():
+    listener = metrics.CommandTimer()
+    antes = metrics.mongo_latency.count("pacientes", "find")
+    started = SimpleNamespace(
+        command_name="find", command={"find": "pacientes", "filter": {}},
+        connection_id=("localhost", 27017), request_id=42,
+    )
+    succeeded = SimpleNamespace(
+        command_name="find", connection_id=("localhost", 27017), request_id=42,
+        duration_micros=1500,
+    )
+    listener.started(started)
+    listener.succeeded(succeeded)
+    assert metrics.mongo_latency.count("pacientes", "find") == antes + 1
+    assert listener._pendentes == {}
+
+
+@patch("app.connect_db")
+def test_metrics_endpoint_exposes_route_and_auth_timings(mock_connect_db, client, headers):
+    mock_db = MagicMock()
+    mock_admins_coll = MagicMock()
+    mock_admins_coll.find_one.return_value = {"username": "admin", "role": "admin"}
+    mock_medicos_coll = MagicMock()
+    mock_medicos_coll.find.return_value = [{"_id": "1", "nome": "Dr. João"}]
+    def getitem(name):
+        if name == "admins":
+            return mock_admins_coll
+        if name == "medicos":
+            return mock_medicos_coll
+        return MagicMock()
+    mock_db.__getitem__.side_effect = getitem
+    mock_connect_db.return_value = mock_db
+
+    assert client.get("/medicos", headers=headers).status_code == 200
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain")
+    corpo = resp.get_data(as_text=True)
+    assert 'http_requests_total{method="GET",route="/medicos",status="200"}' in corpo
+    assert 'http_request_duration_seconds_count{method="GET",route="/medicos"}' in corpo
+    assert 'auth_check_duration_seconds_count{result="ok"}' in corpo
@@ -0,0 +1,112 @@
+# tests/test_migracoes.py
+from unittest.mock import patch
+
+import pytest
+
+import grade
+import migracoes
+from app import app as flask_app
+
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+OCUPADO = {"status": "ocupado", "paciente": "Ana"}
+COMPACTAR = migracoes.migracoes[1]
+
+
+@pytest.fixture
+def db(db):
+    db["medicos"].insert_many([
+        {"nome": f"Dr. {i}", "horarios": {
+            "2025-11-05": {"09:00": OCUPADO, "09:30": LIVRE},
+            "2025-11-06": {"08:15": LIVRE},
+        }}
+        for i in range(5)
+    ])
+    db["medicos"].insert_one({"nome": "Sem agenda"})
+    return db
+
+
+@pytest.fixture
+def temporaria():
+    """Uma migração de consultas registrada só durante o teste"""
+    @migracoes.migracao(99, "consultas em maiúsculas", 'pacientes', 'consultas',
+                        ler=lambda dia: {h: v.title() for h, v in dia.items()})
+    def maiusculas(dia):
+        return {hora: valor.upper() for hora, valor in dia.items()}
+
+    yield migracoes.migracoes[99]
+    del migracoes.migracoes[99]
+    del migracoes._leitores['consultas']
+
+
+def test_passada_em_lotes_retomavel(db):
+    documentos, dias, terminou = migracoes.migrar_colecao(db, COMPACTAR, lote=2, max_lotes=1)
+    assert (documentos, dias, terminou) == (2, 2, False)
+    checkpoint = db["migracoes"].find_one({"_id": 1})
+    assert checkpoint["estado"] == migracoes.EM_ANDAMENTO and checkpoint["apos_id"] is not None
+    assert migracoes.pendentes(db) == [COMPACTAR]
+
+    documentos, dias, terminou = migracoes.migrar_colecao(db, COMPACTAR, lote=2)
+    assert (documentos, dias, terminou) == (3, 3, True)
+    assert migracoes.status(db)[0] == {"versao": 1, "nome": COMPACTAR.nome, "estado": migracoes.CONCLUIDA,
+                                       "documentos": 5, "dias": 5}
+    assert migracoes.pendentes(db) == []
+    for medico in db["medicos"].find({"horarios": {"$exists": True}}):
+        # 08:15 não cabe na grade de 30 minutos e continua no formato original
+        assert grade.compacto(medico["horarios"]["2025-11-05"])
+        assert medico["horarios"]["2025-11-06"] == {"08:15": LIVRE}
+    # concluída, não roda de novo
+    assert migracoes.migrar_colecao(db, COMPACTAR) == (0, 0, True)
+
+
+def test_alteracao_concorrente_nao_se_perde(db):
+    lido = db["medicos"].find_one({}, {"horarios": 1})
+    # a API altera o dia entre a leitura da passada e a escrita
+    db["medicos"].update_one({"_id": lido["_id"]}, {"$set": {"horarios.2025-11-05.10:00": OCUPADO}})
+    assert migracoes._migrar_documento(db["medicos"], COMPACTAR, lido) == 1
+    dia = db["medicos"].find_one({"_id": lido["_id"]})["horarios"]["2025-11-05"]
+    assert grade.expandir_dia(dia) == {"09:00": OCUPADO, "09:30": LIVRE, "10:00": OCUPADO}
+
+
+def test_simular_nao_grava(db):
+    resumo = migracoes.simular(db, COMPACTAR, amostra=2, por_segundo=1)
+    assert resumo["documentos"] == 5 and resumo["amostra"] == 2
+    assert (resumo["documentos_alterados"], resumo["dias_convertidos"]) == (5, 5)
+    # limitado a 1 documento/s
+    assert resumo["duracao_estimada_s"] >= 5
+    assert db["migracoes"].count_documents({}) == 0
+    assert not grade.compacto(db["medicos"].find_one()["horarios"]["2025-11-05"])
+
+
+def test_limitador():
+    agora = [0.0]
+    dormido = []
+    limitador = migracoes.Limitador(100, relogio=lambda: agora[0], dormir=dormido.append)
+    limitador.aguardar(50)
+    agora[0] = 0.6
+    limitador.aguardar(50)
+    assert dormido == [0.5, pytest.approx(0.4)]
+    migracoes.Limitador(0, dormir=dormido.append).aguardar(1000)
+    assert len(dormido) == 2
+
+
+def test_versoes_em_ordem_e_leitura_dupla(db, temporaria, headers):
+    db["pacientes"].insert_one({"nome": "Ana", "consultas": {"2025-11-05": {"09:00": "dr. joão"}}})
+    resumo = migracoes.executar(db, ate=1)
+    assert [m["versao"] for m in resumo] == [1]
+    resumo = migracoes.executar(db, lote=1, max_lotes=1)
+    assert [(m["versao"], m["terminou"]) for m in resumo] == [(99, False)]
+
+    # com a migração em andamento, dias nos dois formatos são lidos do mesmo jeito
+    assert migracoes.ler('consultas', {"2025-11-05": {"09:00": "DR. JOÃO"}, "2025-11-06": {"10:00": "dra. maria"}}) == \
+        {"2025-11-05": {"09:00": "Dr. João"}, "2025-11-06": {"10:00": "Dra. Maria"}}
+    assert migracoes.executar(db)[0]["terminou"]
+    assert db["pacientes"].find_one()["consultas"] == {"2025-11-05": {"09:00": "DR. JOÃO"}}
+
+    flask_app.config["TESTING"] = True
+    id = str(db["medicos"].find_one()["_id"])
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        resp = client.get(f"/medicos/{id}/horarios", headers=headers)
+        assert resp.get_json()["horarios"]["2025-11-05"] == {"09:00": OCUPADO, "09:30": LIVRE}
+        paciente = str(db["pacientes"].find_one()["_id"])
+        resp = client.get(f"/pacientes/{paciente}/consultas", headers=headers)
+        assert resp.get_json()["consultas"] == {"2025-11-05": {"09:00": "Dr. João"}}
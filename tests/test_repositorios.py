@@ -0,0 +1,255 @@
+# tests/test_repositorios.py
+import sqlite3
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import mongomock
+import pytest
+from bson import ObjectId
+from flask import Response
+
+import busca
+import grade
+import idempotencia
+import repositorios
+import repositorios_sqlite
+from app import app as flask_app
+
+LIVRE = {"status": "disponível", "paciente": "nenhum"}
+OCUPADO = {"status": "ocupado", "paciente": "Ana"}
+
+
+@pytest.fixture(params=["mongo", "memoria", "sqlite"])
+def repo(request, tmp_path):
+    """Os mesmos testes em todos os motores: a semântica tem que ser a mesma"""
+    if request.param == "mongo":
+        return repositorios.Mongo(mongomock.MongoClient()["clinica"])
+    if request.param == "sqlite":
+        return repositorios_sqlite.Sqlite(str(tmp_path / "clinica.db"))
+    return repositorios.Memoria()
+
+
+def _medico(repo, cpf="1", crm="10", especialidade="Cardiologia"):
+    medico = {"nome": "Dr. João", "cpf": cpf, "crm": crm, "especialidade": especialidade, "horarios": {}, "versao": 1}
+    medico.update(busca.campos_de_busca_medico(medico))
+    return repo.medicos.criar(medico)
+
+
+def _paciente(repo, nome="Ana Souza"):
+    paciente = {"nome": nome, "cpf": "123", "celular": "11 9999", "idade": 30, "consultas": {}, "versao": 1}
+    paciente.update(busca.campos_de_busca(paciente))
+    return repo.pacientes.criar(paciente)
+
+
+def test_cadastro_de_medicos(repo):
+    id = _medico(repo)
+    _medico(repo, cpf="2", crm="20", especialidade="Pediatria")
+    with pytest.raises(repositorios.Duplicado) as e:
+        _medico(repo, crm="30")
+    assert e.value.campo == "cpf"
+    with pytest.raises(repositorios.Duplicado) as e:
+        _medico(repo, cpf="3")
+    assert e.value.campo == "crm"
+
+    assert [m["crm"] for m in repo.medicos.listar()] == ["10", "20"]
+    assert [m["crm"] for m in repo.medicos.listar("PEDIATRIA")] == ["20"]
+    medico = repo.medicos.obter(str(id))
+    assert medico["_id"] == id and "especialidade_normalizada" not in medico
+    # o documento lido é uma cópia
+    medico["horarios"]["2025-11-05"] = {}
+    assert repo.medicos.obter(id)["horarios"] == {}
+
+    assert repo.medicos.remover(id)
+    assert not repo.medicos.remover(id)
+    assert repo.medicos.obter(id) is None
+
+
+def test_versao_otimista(repo):
+    id = _paciente(repo)
+    paciente, versao = repo.pacientes.atualizar(str(id), {"idade": 31}, esperada=1)
+    assert (paciente["idade"], versao) == (31, 2)
+    assert "nome_normalizado" not in paciente
+    assert repo.pacientes.atualizar(id, {"idade": 32}, esperada=1) == (None, 2)
+    assert repo.pacientes.atualizar(id, {"idade": 33})[1] == 3
+    assert repo.pacientes.atualizar(ObjectId(), {"idade": 1}, esperada=1) == (None, None)
+
+
+def test_horarios_por_data_e_hora(repo):
+    id = _medico(repo)
+    assert repo.horarios.adicionar_dias(id, {"2025-11-05": {"09:00": LIVRE, "09:30": LIVRE}})
+    assert repo.horarios.alterar(id, "2025-11-05", "09:00", OCUPADO)
+    assert repo.horarios.alterar(id, "2025-11-06", "10:00", LIVRE)
+    assert repo.horarios.alterar(id, "2025-11-05", "09:30")
+    # remover de um dia que não existe não cria o dia
+    assert repo.horarios.alterar(id, "2025-11-07", "09:00")
+    assert repo.horarios.obter(id) == {"2025-11-05": {"09:00": OCUPADO}, "2025-11-06": {"10:00": LIVRE}}
+    # dias inteiros são substituídos
+    assert repo.horarios.adicionar_dias(id, {"2025-11-05": {"14:00": LIVRE}})
+    assert repo.horarios.obter(id)["2025-11-05"] == {"14:00": LIVRE}
+    assert repo.horarios.remover_dia(id, "2025-11-06")
+    assert list(repo.horarios.obter(id)) == ["2025-11-05"]
+
+    outro = ObjectId()
+    assert not repo.horarios.adicionar_dias(outro, {"2025-11-05": {}})
+    assert not repo.horarios.alterar(outro, "2025-11-05", "09:00", LIVRE)
+    assert not repo.horarios.remover_dia(outro, "2025-11-05")
+    assert repo.horarios.obter(outro) is None
+
+
+def test_horarios_em_dias_compactos(repo, monkeypatch):
+    id = _medico(repo)
+    monkeypatch.setattr(grade, "formato", "grade")
+    repo.horarios.adicionar_dias(id, {"2025-11-05": {"09:00": LIVRE, "09:30": LIVRE}})
+    assert repo.horarios.alterar(id, "2025-11-06", "10:00", OCUPADO)
+    monkeypatch.setattr(grade, "formato", "mapa")
+    assert repo.horarios.alterar(id, "2025-11-05", "09:00", OCUPADO)
+    assert repo.horarios.alterar(id, "2025-11-05", "09:30")
+
+    horarios = repo.horarios.obter(id)
+    if not isinstance(repo, repositorios_sqlite.Sqlite):
+        # o SQLite guarda os dias hora a hora, em qualquer formato
+        assert grade.compacto(horarios["2025-11-05"]) and grade.compacto(horarios["2025-11-06"])
+    assert grade.expandir(horarios) == {"2025-11-05": {"09:00": OCUPADO}, "2025-11-06": {"10:00": OCUPADO}}
+
+
+def test_busca_por_prefixo(repo):
+    ana = _paciente(repo)
+    _paciente(repo, nome="Anabela Lima")
+    _paciente(repo, nome="Bruno")
+    assert [p["nome"] for p in repo.pacientes.buscar("ANA")] == ["Ana Souza", "Anabela Lima"]
+    assert repo.pacientes.buscar("ana souza") == [
+        {"_id": str(ana), "nome": "Ana Souza", "cpf": "123", "celular": "11 9999", "idade": 30}
+    ]
+    assert [p["nome"] for p in repo.pacientes.buscar("11 99", limite=2)] == ["Ana Souza", "Anabela Lima"]
+    assert repo.pacientes.buscar("zé") == []
+
+
+def test_consultas_e_admins(repo):
+    id = _paciente(repo)
+    assert repo.consultas.adicionar_dias(id, {"2025-11-05": {"09:00": "Dr. João"}})
+    assert repo.consultas.alterar(id, "2025-11-05", "10:00", "Dra. Maria")
+    assert repo.consultas.alterar(id, "2025-11-05", "09:00")
+    assert repo.consultas.obter(id) == {"2025-11-05": {"10:00": "Dra. Maria"}}
+    assert repo.consultas.remover_dia(id, "2025-11-05")
+    assert repo.consultas.obter(id) == {}
+
+    repo.admins.criar({"username": "admin", "password": "hash", "role": "admin"})
+    repo.admins.criar({"username": "leitor", "password": "hash", "role": "leitor"})
+    with pytest.raises(repositorios.Duplicado):
+        repo.admins.criar({"username": "admin", "password": "outro", "role": "admin"})
+    assert repo.admins.buscar("admin")["password"] == "hash"
+    assert repo.admins.buscar("leitor") is None
+
+
+def test_sqlite_campos_unicos_e_filtros(tmp_path):
+    repo = repositorios_sqlite.Sqlite(str(tmp_path / "clinica.db"))
+    id = _medico(repo)
+    _medico(repo, cpf="2", crm="20")
+    # o índice UNIQUE vale também para quem grava direto na tabela
+    conexao = sqlite3.connect(tmp_path / "clinica.db")
+    with pytest.raises(sqlite3.IntegrityError):
+        conexao.execute("INSERT INTO medicos (id, cpf, crm) VALUES ('x', '1', '99')")
+    conexao.close()
+    with pytest.raises(repositorios.Duplicado) as e:
+        repo.medicos.atualizar(id, {"crm": "20"})
+    assert e.value.campo == "crm"
+    assert repo.medicos.obter(id)["crm"] == "10"
+
+    medico, versao = repo.medicos.atualizar(id, {"crm": "30"})
+    assert (medico["crm"], versao) == ("30", 2)
+    with pytest.raises(ValueError):
+        repo.pacientes.listar(**{"1 = 1 OR nome": "x"})
+
+
+def test_rotas_sem_banco(headers):
+    repo = repositorios.Memoria()
+    repo.admins.criar({"username": "admin", "role": "admin"})
+
+    flask_app.config["TESTING"] = True
+    with patch("app.repositorio", return_value=repo), flask_app.test_client() as client:
+        medico = {"nome": "Dr. João", "cpf": "1", "crm": "10", "especialidade": "Cardiologia"}
+        resp = client.post("/medicos", json=medico, headers=headers)
+        assert resp.status_code == 201
+        id = resp.get_json()["id"]
+        resp = client.post("/medicos", json=dict(medico, cpf="2"), headers=headers)
+        assert resp.get_json()["erro"] == "Já existe um médico com esse CRM"
+
+        url = f"/medicos/{id}/horarios"
+        assert client.post(url, json={"2025-11-05": {"09:00": LIVRE}}, headers=headers).status_code == 201
+        resp = client.put(url, json={"data": "2025-11-05", "hora": "09:00", "info": OCUPADO}, headers=headers)
+        assert resp.status_code == 200
+        assert client.get(url, headers=headers).get_json()["horarios"] == {"2025-11-05": {"09:00": OCUPADO}}
+
+        resp = client.put(f"/medicos/{id}", json={"especialidade": "Pediatria"}, headers=dict(headers, **{"If-Match": '"1"'}))
+        assert resp.status_code == 200 and resp.headers["ETag"] == '"2"'
+        resp = client.put(f"/medicos/{id}", json={"nome": "Dr. J."}, headers=dict(headers, **{"If-Match": '"1"'}))
+        assert resp.status_code == 412
+        assert client.get("/medicos?especialidade=pediatria", headers=headers).get_json()["medicos"][0]["_id"] == id
+
+        assert client.delete(f"/medicos/{id}", headers=headers).status_code == 200
+        assert client.get(url, headers=headers).status_code == 404
+
+
+def test_api_com_sqlite(tmp_path, monkeypatch):
+    import app as flask_app_module
+    import database
+
+    monkeypatch.setattr(database, "mongo_uri", f"sqlite:///{tmp_path}/clinica.db")
+    monkeypatch.setattr(database, "_sqlite", {})
+    monkeypatch.setattr(flask_app_module, "usa_sqlite", True)
+    senha = flask_app_module.bcrypt.generate_password_hash("Admin@123").decode("utf-8")
+    database.repositorio_sqlite().admins.criar({"username": "admin", "password": senha, "role": "admin"})
+    assert (tmp_path / "clinica.db").exists()
+
+    flask_app.config["TESTING"] = True
+    with flask_app.test_client() as client:
+        resp = client.post("/auth/login", json={"username": "admin", "password": "Admin@123"})
+        headers = {"Authorization": f"Bearer {resp.get_json()['token']}"}
+        resp = client.post("/pacientes", json={"nome": "Ana", "cpf": "1", "celular": "2", "idade": 30}, headers=headers)
+        assert resp.status_code == 201
+        url = f"/pacientes/{resp.get_json()['id']}/consultas"
+        resp = client.put(url, json={"data": "2025-11-05", "hora": "09:00", "detalhes": "Dr. João"}, headers=headers)
+        assert resp.status_code == 200
+        assert client.get(url, headers=headers).get_json()["consultas"] == {"2025-11-05": {"09:00": "Dr. João"}}
+
+        novo = {"nome": "Bia", "cpf": "2", "celular": "3", "idade": 40}
+        chave = dict(headers, **{"Idempotency-Key": "k1"})
+        primeira = client.post("/pacientes", json=novo, headers=chave)
+        repetida = client.post("/pacientes", json=novo, headers=chave)
+        assert (primeira.status_code, repetida.status_code) == (201, 201)
+        assert repetida.headers["Idempotent-Replayed"] == "true"
+        assert repetida.get_json()["id"] == primeira.get_json()["id"]
+
+        assert client.get("/health").status_code == 200
+        resp = client.get("/pacientes/busca?q=an&fuzzy=1", headers=headers)
+        assert resp.get_json()["modo"] == "prefixo"
+        assert [p["nome"] for p in resp.get_json()["pacientes"]] == ["Ana"]
+        # rotas que dependem do MongoDB
+        assert client.get("/especialidades", headers=headers).status_code == 501
+
+
+def test_idempotencia_no_sqlite(tmp_path):
+    colecao = repositorios_sqlite.Sqlite(str(tmp_path / "clinica.db")).idempotencia
+    registro = idempotencia.RegistroIdempotencia(espera_s=0.1, prazo_execucao_s=60)
+    criado = lambda: Response('{"id": 1}', status=201, content_type="application/json")
+
+    assert registro.processar(colecao, "a", b"{}", criado).status_code == 201
+    registro.cache = idempotencia._CacheRespostas(10, 60)
+    resposta = registro.processar(colecao, "a", b"{}", lambda: pytest.fail("não deveria executar"))
+    assert (resposta.status_code, resposta.headers["Idempotent-Replayed"]) == (201, "true")
+    with pytest.raises(idempotencia.ChaveReutilizada):
+        registro.processar(colecao, "a", b"outro", criado)
+
+    # 5xx não fica guardado
+    registro.processar(colecao, "b", b"{}", lambda: Response("{}", status=503))
+    assert colecao.find_one({"_id": "b"}) is None
+    # registro em andamento de um processo que caiu é assumido
+    colecao.insert_one({"_id": "c", "impressao": "x", "estado": "em_andamento",
+                        "criado_em": datetime.utcnow() - timedelta(seconds=120)})
+    assert registro.processar(colecao, "c", b"{}", criado).status_code == 201
+    assert colecao.find_one({"_id": "c"})["estado"] == "concluido"
+    # registros vencidos saem a cada registro novo, como no índice TTL
+    colecao.insert_one({"_id": "d", "impressao": "x", "estado": "concluido",
+                        "criado_em": datetime.utcnow() - timedelta(seconds=idempotencia.registro.ttl_s + 1)})
+    colecao.insert_one({"_id": "e", "impressao": "x", "estado": "em_andamento", "criado_em": datetime.utcnow()})
+    assert colecao.find_one({"_id": "d"}) is None
@@ -0,0 +1,92 @@
+# tests/test_slow_log.py
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import slow_log
+
+EXPLAIN_COLLSCAN = {
+    "queryPlanner": {
+        "winningPlan": {"stage": "COLLSCAN", "filter": {"cpf": {"$eq": "123"}}},
+    },
+    "ok": 1,
+}
+
+EXPLAIN_IXSCAN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "queryPlan": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "IXSCAN", "indexName": "cpf_1"},
+            }
+        }
+    },
+    "ok": 1,
+}
+
+
+def test_redigir_keeps_shape_and_hides_values():
+    filtro = {"cpf": "123.456.789-00", "idade": {"$gte": 30}, "_id": {"$in": [1, 2, 3]}}
+    assert slow_log.redigir(filtro) == {"cpf": "?", "idade": {"$gte": "?"}, "_id": {"$in": ["?"]}}
+
+
+def test_resumir_plano_detects_collscan_and_index():
+    assert slow_log.resumir_plano(EXPLAIN_COLLSCAN) == {"estagios": "COLLSCAN", "collscan": True}
+    assert slow_log.resumir_plano(EXPLAIN_IXSCAN) == {
+        "estagios": "FETCH <- IXSCAN(cpf_1)",
+        "collscan": False,
+    }
+
+
+def test_slow_command_is_logged_with_redacted_filter_and_plan(tmp_path):
+    arquivo = tmp_path / "slow.log"
+    log = slow_log.SlowOpLog(limite_ms=10, arquivo=str(arquivo), intervalo_s=60)
+    listener = slow_log.SlowCommandListener(log)
+
+    def evento(request_id, duracao_ms, cpf):
+        comando = {"find": "pacientes", "filter": {"cpf": cpf}, "lsid": {"id": "x"}, "$db": "clinica"}
+        started = SimpleNamespace(command_name="find", command=comando,
+                                  connection_id=("localhost", 27017), request_id=request_id)
+        succeeded = SimpleNamespace(command_name="find", connection_id=("localhost", 27017),
+                                    request_id=request_id, database_name="clinica",
+                                    duration_micros=int(duracao_ms * 1000))
+        listener.started(started)
+        listener.succeeded(succeeded)
+
+    with patch.object(slow_log.SlowOpLog, "_explicar", return_value=slow_log.resumir_plano(EXPLAIN_COLLSCAN)) as explicar:
+        evento(1, 2, "111")       # rápido: ignorado
+        evento(2, 50, "222")      # lento: registrado
+        evento(3, 80, "333")      # mesmo formato: suprimido pelo limite de frequência
+        log.aguardar()
+
+    linhas = arquivo.read_text(encoding="utf-8").strip().splitlines()
+    assert len(linhas) == 1
+    registro = json.loads(linhas[0])
+    assert registro["collection"] == "pacientes"
+    assert registro["formato"] == {"filter": {"cpf": "?"}}
+    assert registro["plano"]["collscan"] is True
+    assert "222" not in linhas[0]
+    # o explain recebe o filtro real, sem os campos de sessão
+    documento = explicar.call_args[0][1]
+    assert documento == {"find": "pacientes", "filter": {"cpf": "222"}}
+
+
+def test_comando_pendente_guarda_so_o_que_o_explain_usa():
+    listener = slow_log.SlowCommandListener(slow_log.SlowOpLog(limite_ms=10, arquivo="nao_usado.log"))
+    comandos = {
+        1: ("insert", {"insert": "pacientes", "documents": [{"nome": "Ana", "cpf": "111"}], "lsid": {"id": "x"}}),
+        2: ("update", {"update": "pacientes", "$db": "clinica", "updates": [
+            {"q": {"cpf": "111"}, "u": {"$set": {"telefone": "9999"}}, "upsert": True},
+        ]}),
+        3: ("delete", {"delete": "pacientes", "deletes": [{"q": {"cpf": "111"}, "limit": 1}]}),
+    }
+    for request_id, (nome, comando) in comandos.items():
+        listener.started(SimpleNamespace(command_name=nome, command=comando,
+                                         connection_id=("localhost", 27017), request_id=request_id))
+
+    pendentes = {request_id: documento for (_, request_id), documento in listener._pendentes.items()}
+    assert pendentes[1] == {"insert": "pacientes"}
+    assert pendentes[2] == {"update": "pacientes", "updates": [
+        {"q": {"cpf": "111"}, "u": {"$set": {"telefone": "?"}}, "upsert": True},
+    ]}
+    assert pendentes[3] == {"delete": "pacientes", "deletes": [{"q": {"cpf": "111"}, "limit": 1}]}
@@ -0,0 +1,165 @@
+# tests/test_tarefas.py
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+import tarefas
+from app import app as flask_app
+
+
+@pytest.fixture
+def registrar(monkeypatch):
+    def registrar(nome, funcao, **opcoes):
+        monkeypatch.setitem(tarefas.tipos, nome, tarefas.Tipo(nome, funcao, **opcoes))
+    return registrar
+
+
+def test_expandir_agenda_em_segundo_plano(db, headers):
+    id = db["medicos"].insert_one({"nome": "Dr. João", "horarios": {
+        "2025-11-03": {"08:00": {"status": "ocupado", "paciente": "Maria"}},
+    }}).inserted_id
+    modelo = {"de": "2025-11-03", "ate": "2025-11-16", "dias_semana": [0, 2], "horas": ["08:30", "08:00"]}
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        resp = client.post(f"/medicos/{id}/horarios/expandir", json=modelo, headers=headers)
+        assert resp.status_code == 202
+        tarefa_id = resp.get_json()["tarefa"]
+        assert resp.headers["Location"] == f"/tarefas/{tarefa_id}"
+        assert client.get(f"/tarefas/{tarefa_id}", headers=headers).get_json()["tarefa"]["estado"] == "pendente"
+
+        assert tarefas.Trabalhadores(db, threads=0).executar_uma()
+
+        tarefa = client.get(f"/tarefas/{tarefa_id}", headers=headers).get_json()["tarefa"]
+        assert (tarefa["estado"], tarefa["tentativas"]) == ("concluida", 1)
+        # 4 dias (duas segundas e duas quartas) x 2 horas, menos o horário já ocupado
+        assert tarefa["resultado"] == {"dias": 4, "horarios_criados": 7}
+        horarios = db["medicos"].find_one()["horarios"]
+        assert sorted(horarios) == ["2025-11-03", "2025-11-05", "2025-11-10", "2025-11-12"]
+        assert horarios["2025-11-03"]["08:00"]["paciente"] == "Maria"
+
+        assert client.get("/tarefas?estado=concluida", headers=headers).get_json()["tarefas"][0]["id"] == tarefa_id
+        invalido = dict(modelo, dias_semana=[7])
+        assert client.post(f"/medicos/{id}/horarios/expandir", json=invalido, headers=headers).status_code == 400
+        sem_ate = {k: v for k, v in modelo.items() if k != "ate"}
+        assert client.post(f"/medicos/{id}/horarios/expandir", json=sem_ate, headers=headers).status_code == 400
+
+
+def test_repeticoes_com_espera(db, registrar):
+    tentativas = []
+    def instavel(db, falhas):
+        tentativas.append(1)
+        if len(tentativas) <= falhas:
+            raise RuntimeError("rede")
+        return len(tentativas)
+    def sem_alvo(db):
+        raise tarefas.FalhaDefinitiva("não existe")
+    registrar("instavel", instavel, max_tentativas=3, espera_base_s=0)
+    registrar("sem_alvo", sem_alvo)
+
+    trabalhadores = tarefas.Trabalhadores(db, threads=0)
+    ok = tarefas.enfileirar(db, "instavel", {"falhas": 2})
+    while trabalhadores.executar_uma():
+        pass
+    tarefa = db["tarefas"].find_one()
+    assert (tarefa["estado"], tarefa["tentativas"], tarefa["resultado"]) == ("concluida", 3, 3)
+    assert tarefa["_id"] == ObjectId(ok)
+
+    tentativas.clear()
+    tarefas.enfileirar(db, "instavel", {"falhas": 5})
+    tarefas.enfileirar(db, "sem_alvo")
+    while trabalhadores.executar_uma():
+        pass
+    falhas = {t["tipo"]: t for t in db["tarefas"].find({"estado": "falhou"})}
+    assert (falhas["instavel"]["tentativas"], falhas["instavel"]["erro"]) == (3, "rede")
+    assert falhas["sem_alvo"]["tentativas"] == 1
+
+    # a espera cresce a cada tentativa
+    tipo = tarefas.Tipo("x", None, espera_base_s=10)
+    assert 5 <= tipo.espera(1) <= 15 and 20 <= tipo.espera(3) <= 60
+
+
+def test_limite_de_concorrencia_por_tipo(db, registrar):
+    liberar = threading.Event()
+    registrar("exportar", lambda db: liberar.wait(5), concorrencia=1)
+    registrar("limpar", lambda db: "ok")
+    tarefas.enfileirar(db, "exportar")
+    tarefas.enfileirar(db, "exportar")
+
+    trabalhadores = tarefas.Trabalhadores(db, threads=0)
+    primeira = threading.Thread(target=trabalhadores.executar_uma)
+    primeira.start()
+    while not db["tarefas"].count_documents({"estado": "executando"}):
+        pass
+
+    # a segunda exportação espera a vaga, mas outros tipos continuam rodando
+    tarefas.enfileirar(db, "limpar")
+    assert trabalhadores.executar_uma()
+    assert db["tarefas"].find_one({"tipo": "limpar"})["estado"] == "concluida"
+    assert not trabalhadores.executar_uma()
+
+    liberar.set()
+    primeira.join()
+    assert trabalhadores.executar_uma()
+    assert db["tarefas"].count_documents({"tipo": "exportar", "estado": "concluida"}) == 2
+
+
+def test_reserva_vencida_e_cancelamento(db, registrar, headers):
+    registrar("lenta", lambda db: "ok", timeout_s=60)
+    antiga = datetime.utcnow() - timedelta(minutes=5)
+    db["tarefas"].insert_one({
+        "tipo": "lenta", "parametros": {}, "estado": "executando", "tentativas": 1,
+        "criada_em": antiga, "executar_apos": antiga, "iniciada_em": antiga,
+    })
+    assert tarefas.Trabalhadores(db, threads=0).executar_uma()
+    assert db["tarefas"].find_one()["estado"] == "concluida"
+
+    id = tarefas.enfileirar(db, "lenta", atraso_s=60)
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        assert client.delete(f"/tarefas/{id}", headers=headers).status_code == 200
+        assert client.delete(f"/tarefas/{id}", headers=headers).status_code == 409
+        assert client.get(f"/tarefas/{ObjectId()}", headers=headers).status_code == 404
+
+
+def test_reserva_sem_o_lock_durante_a_consulta(db, registrar):
+    registrar("limpar", lambda db: "ok")
+    trabalhadores = tarefas.Trabalhadores(db, threads=0)
+    consultar = trabalhadores._reservar_em
+    com_lock = []
+    def reservar_em(db, disponiveis):
+        com_lock.append(trabalhadores._lock.locked())
+        return consultar(db, disponiveis)
+    trabalhadores._reservar_em = reservar_em
+
+    assert not trabalhadores.executar_uma()
+    tarefas.enfileirar(db, "limpar")
+    assert trabalhadores.executar_uma()
+    assert com_lock == [False, False]
+    # as vagas dos tipos que não vieram foram devolvidas
+    assert set(trabalhadores._em_execucao.values()) == {0}
+
+
+def test_enfileirar_unica_concorrente(db, registrar):
+    registrar("periodica", lambda db: "ok")
+    db["tarefas"].create_indexes(tarefas.INDICES)
+    assert tarefas.enfileirar_unica(db, "periodica") is not None
+    assert tarefas.enfileirar_unica(db, "periodica") is None
+    # o índice único recusa a segunda pendente de outro processo...
+    with pytest.raises(DuplicateKeyError):
+        db["tarefas"].insert_one({"unica": "periodica", "tipo": "periodica", "estado": "pendente"})
+    # ...e o upsert que perde a corrida não cria outra
+    tarefas_db = db["tarefas"]
+    with patch.object(tarefas_db, "update_one", side_effect=DuplicateKeyError("E11000")) as upsert:
+        assert tarefas.enfileirar_unica(db, "periodica") is None
+    assert upsert.called
+    assert db["tarefas"].count_documents({"tipo": "periodica"}) == 1
+
+    # reservada, deixa de ser a pendente única: a tarefa pode se reagendar
+    assert tarefas.Trabalhadores(db, threads=0).executar_uma()
+    assert tarefas.enfileirar_unica(db, "periodica") is not None
+    assert tarefas.enfileirar(db, "periodica") and tarefas.enfileirar(db, "periodica")
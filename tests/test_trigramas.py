@@ -0,0 +1,81 @@
+# tests/test_trigramas.py
+from unittest.mock import patch
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+import busca
+import trigramas
+from app import app as flask_app
+
+NOMES = ["João da Silva", "Joana Souza", "Maria Joaquina", "Silva Pereira", "Pedro Álvares Cabral"]
+
+
+@pytest.fixture
+def indice():
+    indice = trigramas.TrigramIndex()
+    ids = {}
+    for nome in NOMES:
+        id = str(ObjectId())
+        ids[nome] = id
+        indice.adicionar(id, nome)
+    indice.pronto = True
+    return indice, ids
+
+
+def test_trigramas_por_palavra():
+    assert trigramas.trigramas("ana") == {"  a", " an", "ana", "na "}
+
+
+def test_busca_tolera_erros_e_sobrenomes_trocados(indice):
+    indice, ids = indice
+    assert indice.buscar("Joao Slva")[0][0] == ids["João da Silva"]
+    melhor, similaridade = indice.buscar("silva joao")[0]
+    assert melhor == ids["João da Silva"] and similaridade > 0.7
+    assert indice.buscar("xyz") == []
+
+
+def test_remover_e_compactar(indice):
+    indice, ids = indice
+    indice.remover(ids["João da Silva"])
+    assert all(id != ids["João da Silva"] for id, _ in indice.buscar("joao silva"))
+    indice.adicionar(ids["Joana Souza"], "Joana Souza Lima")
+    indice._compactar()
+    assert len(indice) == 4
+    assert indice.buscar("joana lima")[0][0] == ids["Joana Souza"]
+    assert indice.buscar("pedro cabral")[0][0] == ids["Pedro Álvares Cabral"]
+
+
+def test_reconstruir_a_partir_do_cursor():
+    db = mongomock.MongoClient()["clinica"]
+    db["pacientes"].insert_many([{"nome": n} for n in NOMES])
+    indice = trigramas.TrigramIndex()
+    assert not indice.ativo
+    assert indice.reconstruir(db["pacientes"]) == len(NOMES)
+    assert indice.pronto
+
+
+def test_endpoint_fuzzy(headers):
+    db = mongomock.MongoClient()["clinica"]
+    db["admins"].insert_one({"username": "admin", "role": "admin"})
+    db["pacientes"].insert_many([dict(busca.campos_de_busca({"nome": n}), nome=n) for n in NOMES])
+    indice = trigramas.TrigramIndex()
+    indice.reconstruir(db["pacientes"])
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), patch.object(trigramas, "indice", indice), \
+            flask_app.test_client() as client:
+        resp = client.get("/pacientes/busca?q=Joao%20Slva&fuzzy=1", headers=headers)
+        assert resp.status_code == 200
+        corpo = resp.get_json()
+        assert corpo["modo"] == "aproximado"
+        assert corpo["pacientes"][0]["nome"] == "João da Silva"
+        assert 0 < corpo["pacientes"][0]["similaridade"] <= 1
+
+        # o POST atualiza o índice já carregado
+        resp = client.post("/pacientes", json={"nome": "Zuleica Prado", "cpf": "1", "celular": "2", "idade": 3},
+                           headers=headers)
+        assert resp.status_code == 201
+        resp = client.get("/pacientes/busca?q=zuleika&fuzzy=1", headers=headers)
+        assert resp.get_json()["pacientes"][0]["nome"] == "Zuleica Prado"
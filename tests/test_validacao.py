@@ -0,0 +1,59 @@
+# tests/test_validacao.py
+from unittest.mock import patch
+
+import pytest
+
+from app import app as flask_app
+
+ID = "507f1f77bcf86cd799439011"
+
+
+@pytest.fixture
+def client(db):
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        yield client
+
+
+@pytest.mark.parametrize("metodo, url, corpo, campo", [
+    ("post", "/pacientes", {"nome": "Ana", "cpf": "1", "celular": "2", "idade": "30"}, "$.idade"),
+    ("post", "/pacientes", {"nome": "Ana", "cpf": "1", "celular": "2"}, "$"),
+    ("put", f"/pacientes/{ID}", {"idade": -1}, "$.idade"),
+    ("post", "/medicos", {"nome": "", "cpf": "1", "crm": "2", "especialidade": "Cardiologia"}, "$.nome"),
+    ("post", f"/medicos/{ID}/horarios", {"2025-11-05": {"09:00.x": "livre"}}, "$[...]"),
+    ("post", f"/pacientes/{ID}/consultas", {"2025-13-05": {"09:00": "Dr. João"}}, "$"),
+    ("put", f"/medicos/{ID}/horarios", {"data": "2025-11-05", "hora": "9h", "info": "livre"}, "$.hora"),
+    ("put", f"/medicos/{ID}/horarios", {"data": "2025-02-31", "hora": "09:00", "info": "livre"}, "$.data"),
+    ("post", f"/medicos/{ID}/horarios", {"2025-02-29": {"09:00": "livre"}}, "$"),
+    ("put", f"/pacientes/{ID}/consultas", {"data": "2025-11-05", "hora": "09:00", "detalhes": {}}, "$.detalhes"),
+    ("delete", f"/medicos/{ID}/horarios", {"hora": "09:00"}, "$"),
+    ("post", f"/medicos/{ID}/horarios/expandir",
+     {"de": "2025-11-03", "ate": "2025-11-30", "dias_semana": [7], "horas": ["08:00"]}, "$.dias_semana[0]"),
+])
+def test_corpo_invalido_recusado_antes_do_banco(db, client, metodo, url, corpo, campo, headers):
+    with patch.object(db, "get_collection", wraps=db.get_collection) as colecoes:
+        resp = getattr(client, metodo)(url, json=corpo, headers=headers)
+    assert resp.status_code == 400
+    erro = resp.get_json()
+    assert (erro["erro"], erro["campo"]) == ("Dados inválidos", campo)
+    assert erro["detalhe"]
+    # o corpo é conferido antes do token: nem o admin é procurado
+    assert colecoes.call_args_list == []
+
+
+def test_corpo_ausente_ou_malformado(client, headers):
+    resp = client.put(f"/medicos/{ID}/horarios", headers=headers)
+    assert resp.status_code == 400
+    assert resp.get_json()["erro"] == "O corpo da requisição deve ser um JSON válido"
+    resp = client.post("/pacientes", data="{nome:", content_type="application/json", headers=headers)
+    assert resp.status_code == 400
+    assert client.post("/auth/login", json=None).status_code == 400
+
+
+def test_corpo_valido_chega_a_rota(db, client, headers):
+    resp = client.post("/pacientes", json={"nome": "Ana", "cpf": "1", "celular": "2", "idade": 0, "extra": True},
+                       headers=headers)
+    assert resp.status_code == 201
+    paciente = db["pacientes"].find_one()
+    assert paciente["idade"] == 0
+    assert "extra" not in paciente
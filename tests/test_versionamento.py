@@ -0,0 +1,70 @@
+# tests/test_versionamento.py
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+
+import versionamento
+from app import app as flask_app
+
+
+def test_versao_esperada():
+    assert versionamento.versao_esperada({}, {"nome": "x"}) is None
+    assert versionamento.versao_esperada({"If-Match": '"3"'}, {}) == 3
+    assert versionamento.versao_esperada({"If-Match": 'W/"4"'}, {"versao": 1}) == 4
+    assert versionamento.versao_esperada({"If-Match": "*"}, {}) is None
+    assert versionamento.versao_esperada({}, {"versao": 2}) == 2
+    for invalido in ({"If-Match": '"abc"'}, {"If-Match": '"0"'}):
+        with pytest.raises(versionamento.PrecondicaoInvalida):
+            versionamento.versao_esperada(invalido, {})
+    with pytest.raises(versionamento.PrecondicaoInvalida):
+        versionamento.versao_esperada({}, {"versao": True})
+
+
+def test_edicoes_concorrentes_de_paciente(db, headers):
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        criado = client.post("/pacientes", json={
+            "nome": "Ana Souza", "cpf": "111.222.333-44", "celular": "(11) 98888-7777", "idade": 30,
+        }, headers=headers)
+        id = criado.get_json()["id"]
+
+        lido = client.get(f"/pacientes/{id}", headers=headers)
+        assert lido.headers["ETag"] == '"1"'
+        assert lido.get_json()["paciente"]["versao"] == 1
+
+        # duas recepcionistas editam a partir da mesma versão
+        primeira = client.put(f"/pacientes/{id}", json={"idade": 31}, headers=dict(headers, **{"If-Match": lido.headers["ETag"]}))
+        assert primeira.status_code == 200
+        assert primeira.headers["ETag"] == '"2"'
+        paciente = primeira.get_json()["paciente"]
+        assert (paciente["idade"], paciente["versao"], paciente["_id"]) == (31, 2, id)
+        assert "nome_normalizado" not in paciente
+
+        segunda = client.put(f"/pacientes/{id}", json={"celular": "(11) 97777-6666", "versao": 1}, headers=headers)
+        assert segunda.status_code == 412
+        assert segunda.get_json()["versao"] == 2
+        assert db["pacientes"].find_one()["celular"] == "(11) 98888-7777"
+
+        # sem precondição a última escrita vence, como antes
+        assert client.put(f"/pacientes/{id}", json={"idade": 32}, headers=headers).get_json()["paciente"]["versao"] == 3
+
+        assert client.put(f"/pacientes/{ObjectId()}", json={"idade": 1, "versao": 1}, headers=headers).status_code == 404
+        assert client.put(f"/pacientes/{id}", json={"idade": 1}, headers=dict(headers, **{"If-Match": "x"})).status_code == 400
+
+
+def test_medico_e_documentos_antigos(db, headers):
+    id = db["medicos"].insert_one({"nome": "Dr. João", "crm": "123-SP", "especialidade": "Cardiologia"}).inserted_id
+    assert versionamento.preencher_versao(db["medicos"]) == 1
+
+    flask_app.config["TESTING"] = True
+    with patch("app.connect_db", return_value=db), flask_app.test_client() as client:
+        resp = client.put(f"/medicos/{id}", json={"especialidade": "Neurologia"}, headers=dict(headers, **{"If-Match": '"1"'}))
+        assert resp.status_code == 200
+        medico = resp.get_json()["medico"]
+        assert (medico["especialidade"], medico["versao"]) == ("Neurologia", 2)
+        assert "especialidade_normalizada" not in medico
+
+        conflito = client.put(f"/medicos/{id}", json={"nome": "Dr. J."}, headers=dict(headers, **{"If-Match": '"1"'}))
+        assert conflito.status_code == 412
+        assert conflito.headers["ETag"] == '"2"'
@@ -0,0 +1,226 @@
+"""
+Índice de trigramas em memória para busca aproximada de nomes de pacientes.
+
+Cada nome normalizado (sem acentos, minúsculo) é quebrado em trigramas por
+palavra, com o mesmo preenchimento do `pg_trgm` ('  j', ' jo', 'joa', 'oao',
+'ao '). A similaridade é o índice de Jaccard entre os conjuntos de
+trigramas, então erros de digitação ('Joao Slva') e sobrenomes trocados
+('Silva Joao') ainda pontuam alto. Para que uma consulta parcial ('zuleika')
+encontre o nome completo ('Zuleica Prado'), o corte é feito pela cobertura
+(fração dos trigramas da consulta presentes no nome); a similaridade só
+ordena os candidatos.
+
+Estrutura e orçamento de memória:
+
+- uma lista de postagens `array('i')` por trigrama (4 bytes por ocorrência;
+  um nome típico de três palavras tem ~20 trigramas distintos);
+- por documento: o ObjectId em binário (12 bytes), a quantidade de
+  trigramas (2 bytes), a marca de ativo (1 byte) e uma entrada no dicionário
+  id -> posição (~100 bytes).
+
+Na prática isso dá ~200 bytes por paciente: ~20 MB para 100 mil e ~200 MB
+para 1 milhão de nomes, por processo (medido por
+`python -m benchmarks.trigramas`). Os nomes não ficam em memória: a rota
+busca os documentos dos melhores candidatos no MongoDB.
+
+A contagem de trigramas em comum é vetorizada com numpy (`bincount` sobre
+as postagens dos trigramas da consulta). Remoções e alterações deixam a
+posição antiga marcada como inativa; quando as posições inativas passam de
+um quarto do total o índice é compactado.
+"""
+import os
+import threading
+import time
+from array import array
+
+import numpy as np
+from bson import ObjectId
+from dotenv import load_dotenv
+
+import clinicas
+from utils import normalizar_texto
+
+load_dotenv('.cred')
+
+# Fração mínima dos trigramas da consulta que o nome precisa conter
+LIMIAR_PADRAO = 0.5
+
+
+def trigramas(nome):
+    """Conjunto de trigramas de um nome já normalizado"""
+    resultado = set()
+    for palavra in nome.split():
+        preenchida = f'  {palavra} '
+        for i in range(len(preenchida) - 2):
+            resultado.add(preenchida[i:i + 3])
+    return resultado
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limpar()
+        self.pronto = False
+        self._pendentes = None
+
+    def _limpar(self):
+        self._postagens = {}
+        self._ids = bytearray()
+        self._tamanhos = array('H')
+        self._ativos = bytearray()
+        self._posicao = {}
+        self._inativos = 0
+
+    def __len__(self):
+        return len(self._posicao)
+
+    @property
+    def ativo(self):
+        """Carregado ou em carga: só então as escritas precisam ser aplicadas"""
+        return self.pronto or self._pendentes is not None
+
+    def _inserir(self, oid, nome):
+        posicao = len(self._tamanhos)
+        gramas = trigramas(nome)
+        for grama in gramas:
+            postagem = self._postagens.get(grama)
+            if postagem is None:
+                postagem = self._postagens[grama] = array('i')
+            postagem.append(posicao)
+        self._ids += oid.binary
+        self._tamanhos.append(min(len(gramas), 65535))
+        self._ativos.append(1)
+        self._posicao[oid.binary] = posicao
+
+    def _retirar(self, oid):
+        posicao = self._posicao.pop(oid.binary, None)
+        if posicao is not None:
+            self._ativos[posicao] = 0
+            self._inativos += 1
+
+    def adicionar(self, id, nome):
+        """Inclui ou substitui o nome de um paciente"""
+        oid = ObjectId(id)
+        nome = normalizar_texto(nome)
+        with self._lock:
+            if self._pendentes is not None:
+                self._pendentes.append((oid, nome))
+            self._retirar(oid)
+            if nome:
+                self._inserir(oid, nome)
+            self._compactar_se_necessario()
+
+    def remover(self, id):
+        oid = ObjectId(id)
+        with self._lock:
+            if self._pendentes is not None:
+                self._pendentes.append((oid, None))
+            self._retirar(oid)
+            self._compactar_se_necessario()
+
+    def _compactar_se_necessario(self):
+        if self._inativos > 1000 and self._inativos * 4 > len(self._tamanhos):
+            self._compactar()
+
+    def _compactar(self):
+        # Reconstrói as postagens só com as posições ativas
+        ativos = np.frombuffer(self._ativos, dtype=np.uint8).astype(bool)
+        novas_posicoes = np.cumsum(ativos, dtype=np.int64) - 1
+        postagens = {}
+        for grama, postagem in self._postagens.items():
+            atual = np.frombuffer(postagem, dtype=np.int32)
+            mantidas = atual[ativos[atual]]
+            if len(mantidas):
+                postagens[grama] = array('i', novas_posicoes[mantidas].astype(np.int32).tobytes())
+        ids = np.frombuffer(self._ids, dtype='S12')[ativos]
+        self._postagens = postagens
+        self._ids = bytearray(ids.tobytes())
+        self._tamanhos = array('H', np.frombuffer(self._tamanhos, dtype=np.uint16)[ativos].tobytes())
+        self._ativos = bytearray(b'\x01' * len(ids))
+        self._posicao = {bytes(oid): i for i, oid in enumerate(ids)}
+        self._inativos = 0
+
+    def buscar(self, consulta, limite=10, limiar=LIMIAR_PADRAO):
+        """Retorna [(id, similaridade)] ordenados da maior para a menor similaridade"""
+        gramas_consulta = trigramas(normalizar_texto(consulta))
+        if not gramas_consulta:
+            return []
+        with self._lock:
+            total = len(self._tamanhos)
+            listas = [self._postagens[g] for g in gramas_consulta if g in self._postagens]
+            if not total or not listas:
+                return []
+            postagens = np.concatenate([np.frombuffer(p, dtype=np.int32) for p in listas])
+            comuns = np.bincount(postagens, minlength=total)
+            tamanhos = np.frombuffer(self._tamanhos, dtype=np.uint16)
+            ativos = np.frombuffer(self._ativos, dtype=np.uint8)
+            candidatos = np.flatnonzero(comuns * ativos)
+            intersecao = comuns[candidatos]
+            acima = intersecao >= limiar * len(gramas_consulta)
+            candidatos, intersecao = candidatos[acima], intersecao[acima]
+            similaridade = intersecao / (len(gramas_consulta) + tamanhos[candidatos] - intersecao)
+            if len(candidatos) > limite:
+                melhores = np.argpartition(-similaridade, limite - 1)[:limite]
+                candidatos, similaridade = candidatos[melhores], similaridade[melhores]
+            ordem = np.argsort(-similaridade, kind='stable')
+            ids = self._ids
+            return [
+                (str(ObjectId(bytes(ids[p * 12:(p + 1) * 12]))), round(float(s), 4))
+                for p, s in zip(candidatos[ordem], similaridade[ordem])
+            ]
+
+    def reconstruir(self, collection, lote=10000):
+        """Recarrega o índice a partir de um cursor sobre todos os pacientes.
+
+        Escritas feitas durante a carga são guardadas e reaplicadas no fim,
+        então o índice antigo continua atendendo buscas até a troca.
+        """
+        with self._lock:
+            self._pendentes = []
+        novo = TrigramIndex()
+        try:
+            cursor = collection.find({}, {"nome_normalizado": 1, "nome": 1}).batch_size(lote)
+            for paciente in cursor:
+                nome = paciente.get("nome_normalizado") or normalizar_texto(paciente.get("nome"))
+                if nome:
+                    novo._inserir(ObjectId(paciente["_id"]), nome)
+        except Exception:
+            with self._lock:
+                self._pendentes = None
+            raise
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, None
+            self._postagens, self._ids = novo._postagens, novo._ids
+            self._tamanhos, self._ativos = novo._tamanhos, novo._ativos
+            self._posicao, self._inativos = novo._posicao, novo._inativos
+            for oid, nome in pendentes:
+                self._retirar(oid)
+                if nome:
+                    self._inserir(oid, nome)
+            self.pronto = True
+        return len(self)
+
+
+habilitado = os.getenv('BUSCA_FUZZY', '1') == '1'
+intervalo_reconstrucao_s = float(os.getenv('BUSCA_FUZZY_RECONSTRUIR_S', '600'))
+indice = TrigramIndex()
+# Um índice por clínica; `indice` é o da clínica padrão
+indices = clinicas.PorClinica(TrigramIndex, lambda: indice)
+
+
+def manter_atualizado(collection, indice=None):
+    """Carrega o índice e o reconstrói periodicamente (roda em thread própria).
+
+    Cada worker tem seu próprio índice; a reconstrução periódica incorpora
+    os pacientes gravados por outros workers.
+    """
+    if indice is None:
+        indice = indices.de(None)
+    while True:
+        try:
+            indice.reconstruir(collection)
+        except Exception as e:
+            print(f"Erro ao carregar o índice de trigramas: {e}")
+        if intervalo_reconstrucao_s <= 0:
+            return
+        time.sleep(intervalo_reconstrucao_s)
@@ -0,0 +1,25 @@
+"""Funções auxiliares compartilhadas pelas rotas."""
+import re
+import unicodedata
+
+_ESPACOS = re.compile(r'\s+')
+_NAO_DIGITOS = re.compile(r'\D')
+
+
+def normalizar_texto(texto):
+    """Remove acentos, converte para minúsculas e colapsa espaços.
+
+    Usado para os campos de busca (ex.: 'João  da Silva' -> 'joao da silva').
+    """
+    if not isinstance(texto, str):
+        return ''
+    sem_acentos = unicodedata.normalize('NFKD', texto)
+    sem_acentos = ''.join(c for c in sem_acentos if not unicodedata.combining(c))
+    return _ESPACOS.sub(' ', sem_acentos).strip().lower()
+
+
+def somente_digitos(texto):
+    """Mantém apenas os dígitos (ex.: '123.456.789-00' -> '12345678900')"""
+    if texto is None:
+        return ''
+    return _NAO_DIGITOS.sub('', str(texto))
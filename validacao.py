@@ -0,0 +1,139 @@
+"""
+Esquemas declarativos dos corpos das rotas de escrita.
+
+Cada rota de escrita recebe `@validar(Esquema)`, que decodifica e valida o
+JSON de uma vez com msgspec antes de qualquer acesso ao banco (o decorator
+fica acima de `@token_required`: um corpo inválido é recusado antes mesmo da
+busca do admin do token). O decoder de
+cada esquema é montado uma única vez, quando o módulo `app` é importado. O
+corpo já validado chega à rota no argumento `dados` (como dicionário, só com
+os campos enviados). Um corpo inválido recebe 400 com o caminho do primeiro
+campo com problema:
+
+    {"erro": "Dados inválidos", "campo": "$.idade", "detalhe": "Expected `int`, got `str`"}
+
+Datas (AAAA-MM-DD, só datas que existem no calendário) e horas (HH:MM) são
+conferidas também quando são chaves dos mapas de horários e consultas, porque
+viram caminhos de `$set`.
+"""
+import re
+from datetime import date
+from functools import wraps
+from typing import Annotated, Any, Optional, Union
+
+import msgspec
+from flask import request
+
+import grade
+
+Texto = Annotated[str, msgspec.Meta(min_length=1)]
+# Decodificada como `date` (recusa 2025-02-31, também nas chaves dos mapas) e devolvida em AAAA-MM-DD
+Data = date
+Hora = Annotated[str, msgspec.Meta(pattern=grade.HORA.pattern)]
+Idade = Annotated[int, msgspec.Meta(ge=0, le=150)]
+# Conteúdo de um horário ou consulta: texto livre ou objeto (ex.: {"status": ..., "paciente": ...})
+Conteudo = Union[Texto, Annotated[dict[str, Any], msgspec.Meta(min_length=1)]]
+# A versão esperada também é conferida por `versionamento.versao_esperada`
+Versao = Union[int, str]
+Agenda = Annotated[dict[Data, dict[Hora, Conteudo]], msgspec.Meta(min_length=1)]
+UNSET = msgspec.UNSET
+
+
+class Login(msgspec.Struct):
+    username: Texto
+    password: Texto
+
+
+class NovoMedico(msgspec.Struct):
+    nome: Texto
+    cpf: Texto
+    crm: Texto
+    especialidade: Texto
+
+
+class AlteracaoMedico(msgspec.Struct):
+    nome: Union[Texto, msgspec.UnsetType] = UNSET
+    cpf: Union[Texto, msgspec.UnsetType] = UNSET
+    crm: Union[Texto, msgspec.UnsetType] = UNSET
+    especialidade: Union[Texto, msgspec.UnsetType] = UNSET
+    versao: Union[Versao, msgspec.UnsetType] = UNSET
+
+
+class NovoPaciente(msgspec.Struct):
+    nome: Texto
+    cpf: Texto
+    celular: Texto
+    idade: Idade
+
+
+class AlteracaoPaciente(msgspec.Struct):
+    nome: Union[Texto, msgspec.UnsetType] = UNSET
+    cpf: Union[Texto, msgspec.UnsetType] = UNSET
+    celular: Union[Texto, msgspec.UnsetType] = UNSET
+    idade: Union[Idade, msgspec.UnsetType] = UNSET
+    versao: Union[Versao, msgspec.UnsetType] = UNSET
+
+
+class AlteracaoHorario(msgspec.Struct):
+    data: Data
+    hora: Hora
+    info: Conteudo
+
+
+class AlteracaoConsulta(msgspec.Struct):
+    data: Data
+    hora: Hora
+    detalhes: Conteudo
+
+
+class Remocao(msgspec.Struct):
+    """Remove um horário/consulta, ou o dia inteiro sem `hora`"""
+    data: Data
+    hora: Optional[Hora] = None
+
+
+class ModeloAgenda(msgspec.Struct):
+    de: Data
+    ate: Data
+    dias_semana: Annotated[list[Annotated[int, msgspec.Meta(ge=0, le=6)]], msgspec.Meta(min_length=1)]
+    horas: Annotated[list[Hora], msgspec.Meta(min_length=1)]
+
+
+def decoder(esquema):
+    return msgspec.json.Decoder(esquema)
+
+
+def decodificar(decodificador, corpo):
+    """Corpo validado como dicionário/lista, ou levanta msgspec.ValidationError/DecodeError"""
+    return msgspec.to_builtins(decodificador.decode(corpo))
+
+
+_LOCAL = re.compile(r'^(.*?)(?: - at (`key` in )?`(.*)`)?$', re.DOTALL)
+
+
+def erro(e):
+    """Resposta 400 de um corpo que não passou na validação"""
+    if isinstance(e, msgspec.ValidationError):
+        # "Expected `int`, got `str` - at `$.idade`" ou "... - at `key` in `$[...]`" (chave de mapa)
+        detalhe, chave, campo = _LOCAL.match(str(e)).groups()
+        if chave:
+            detalhe = f"chave inválida: {detalhe}"
+        return {"erro": "Dados inválidos", "campo": campo or "$", "detalhe": detalhe}, 400
+    return {"erro": "O corpo da requisição deve ser um JSON válido", "campo": "$", "detalhe": str(e)}, 400
+
+
+def validar(esquema):
+    """Decorator: valida o corpo JSON com `esquema` e o entrega à rota em `dados`"""
+    decodificador = decoder(esquema)
+
+    def decorador(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            try:
+                dados = decodificar(decodificador, request.get_data())
+            except msgspec.DecodeError as e:
+                # ValidationError é subclasse de DecodeError
+                return erro(e)
+            return f(*args, dados=dados, **kwargs)
+        return decorated
+    return decorador
@@ -0,0 +1,75 @@
+"""
+Controle de concorrência otimista para `PUT /medicos/<id>` e `PUT /pacientes/<id>`.
+
+Médicos e pacientes têm o campo `versao`, que começa em 1 e é incrementado a
+cada atualização cadastral. O cliente informa a versão que leu (header
+`If-Match`, com o `ETag` devolvido pelo GET, ou o campo `versao` no corpo) e
+a atualização é um único `find_one_and_update` condicionado a ela: se outra
+pessoa salvou antes, nada é gravado e a rota responde 412 em vez de
+sobrescrever a edição alheia. Sem precondição a atualização continua
+valendo sempre (a última escrita vence), para clientes antigos.
+"""
+from pymongo import ReturnDocument
+
+CAMPO = 'versao'
+
+
+class PrecondicaoInvalida(ValueError):
+    pass
+
+
+def etag(documento):
+    return f'"{documento.get(CAMPO, 1)}"'
+
+
+def versao_esperada(headers, dados):
+    """Versão exigida pela requisição, ou None se ela não impõe nenhuma"""
+    valor = headers.get('If-Match')
+    if valor is not None:
+        valor = valor.strip()
+        if valor == '*':
+            return None
+        if valor.startswith('W/'):
+            valor = valor[2:]
+        valor = valor.strip('"')
+    elif dados and CAMPO in dados:
+        valor = dados[CAMPO]
+    else:
+        return None
+
+    try:
+        versao = int(valor)
+    except (TypeError, ValueError):
+        raise PrecondicaoInvalida(f"Versão inválida: {valor!r}")
+    if isinstance(valor, bool) or versao < 1:
+        raise PrecondicaoInvalida(f"Versão inválida: {valor!r}")
+    return versao
+
+
+def atualizar(collection, id, atualizacoes, esperada, projecao=None):
+    """Aplica `$set` se a versão bate; retorna (documento_novo, versao_atual).
+
+    Em conflito o documento é None e `versao_atual` é a versão gravada
+    (None também se o documento não existe).
+    """
+    filtro = {"_id": id}
+    if esperada is not None:
+        filtro[CAMPO] = esperada
+    documento = collection.find_one_and_update(
+        filtro,
+        {"$set": atualizacoes, "$inc": {CAMPO: 1}},
+        projection=projecao,
+        return_document=ReturnDocument.AFTER,
+    )
+    if documento is not None:
+        return documento, documento.get(CAMPO)
+    if esperada is None:
+        return None, None
+    # Só no caminho de erro: distingue 404 de 412
+    atual = collection.find_one({"_id": id}, {CAMPO: 1})
+    return None, atual.get(CAMPO, 1) if atual else None
+
+
+def preencher_versao(collection):
+    """Documentos cadastrados antes do controle de versão começam na versão 1"""
+    return collection.update_many({CAMPO: {"$exists": False}}, {"$set": {CAMPO: 1}}).modified_count